@@ -1,25 +1,483 @@
 import openai
-from typing import List, Dict, Any
+import asyncio
+import heapq
+import itertools
+import random
+import time
+import email.utils
+from collections import deque
+from typing import List, Dict, Any, Optional, Callable, Awaitable
+from .ai_usage import AIUsageTracker
+from .text_utils import estimate_tokens
+from .message_compaction import compact_messages, format_message, format_report, get_compaction_settings
+from .near_duplicates import NearDuplicateFilter
+from .model_routing import ModelRouter
+from .batch_api import BatchRunner, build_batch_request, EXECUTION_MODE_ONLINE, EXECUTION_MODE_BATCH
+from .segmentation import segment_messages, pack_segments, CHUNKING_SEMANTIC
+from .participant_stats import compute_participant_stats, build_participants_prompt, DEFAULT_TOP_PARTICIPANTS
+from .semantic_cache import SemanticQueryCache, context_hash, DEFAULT_SIMILARITY_THRESHOLD
+from .retrieval import query_terms, rank_messages, pack_context, DEFAULT_RETRIEVAL_BUDGET, DEFAULT_RETRIEVAL_CANDIDATES
+from .extractive_summary import (
+    select_messages, DEFAULT_TOKEN_BUDGET,
+    SUMMARY_MODE_LLM, SUMMARY_MODE_EXTRACTIVE, SUMMARY_MODE_EXTRACTIVE_LLM
+)
+from .log_utils import get_logger, lazy
+# Классы приоритетов запросов (общие с задачами GUI): меньшее значение обслуживается раньше
+from .task_manager import PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+logger = get_logger('ai')
+
+# Ошибки, после которых запрос имеет смысл повторить
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+
+
+def is_error_response(text: str) -> bool:
+    """Является ли результат операции ИИ сообщением об ошибке (а не ответом модели)"""
+    return text.startswith('Ошибка при ')
+
+
+def is_chat_model(model: str) -> bool:
+    """Определяет, работает ли модель через chat.completions"""
+    # "realtime-preview" и другие префиксы указывают на не-чат модели
+    return not ("realtime-preview" in model or any(prefix in model for prefix in ["davinci", "curie", "babbage", "ada"]))
+
+
+class AIRequestScheduler:
+    """Общий планировщик запросов к OpenAI
+    
+    Ограничивает число запросов и токенов в минуту, количество одновременных
+    запросов, обслуживает запросы в порядке приоритета и повторяет запросы
+    с экспоненциальной задержкой с учетом заголовка Retry-After.
+    """
+    
+    WINDOW = 60.0  # Окно учета лимитов в секундах
+    
+    def __init__(self, rpm_limit: int = 500, tpm_limit: int = 200000, max_concurrency: int = 8,
+                 max_retries: int = 5, base_delay: float = 1.0, max_delay: float = 60.0, debug: bool = False):
+        self.rpm_limit = max(1, int(rpm_limit))
+        self.tpm_limit = max(1, int(tpm_limit))
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_retries = max(0, int(max_retries))
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.debug = debug
+        
+        self._waiters = []  # Куча [priority, seq, tokens]
+        self._seq = itertools.count()
+        self._active = 0
+        self._request_log = deque()  # Время отправки запросов в текущем окне
+        self._token_log = deque()  # [время, токены] в текущем окне
+        self._tokens_in_window = 0
+        self._paused_until = 0.0  # Глобальная пауза после ответа 429
+        self._event = None
+        self.stats = {'requests': 0, 'retries': 0, 'rate_limited': 0, 'failed': 0}
+    
+    def log(self, message, *args):
+        """Логирование сообщений"""
+        if self.debug:
+            logger.debug(message, *args)
+    
+    async def submit(self, request_factory: Callable[[Optional[float]], Awaitable[Any]],
+                     estimated_tokens: int = 0, priority: int = PRIORITY_INTERACTIVE,
+                     deadline: Optional[float] = None) -> Any:
+        """Выполнение запроса через планировщик
+        
+        Args:
+            request_factory: Функция, принимающая оставшийся таймаут и возвращающая корутину запроса
+            estimated_tokens: Оценка токенов запроса (промпт + ответ)
+            priority: Класс приоритета (PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND)
+            deadline: Крайний срок по time.monotonic(), после которого запрос отменяется
+        
+        Returns:
+            Any: Ответ API
+        """
+        attempt = 0
+        while True:
+            slot = await self._acquire(estimated_tokens, priority, deadline)
+            try:
+                response = await request_factory(self._remaining(deadline))
+            except RETRYABLE_ERRORS as e:
+                self._release(slot)
+                attempt += 1
+                if attempt > self.max_retries:
+                    self.stats['failed'] += 1
+                    raise
+                delay = self._retry_delay(e, attempt)
+                if isinstance(e, openai.RateLimitError):
+                    self.stats['rate_limited'] += 1
+                    # Притормаживаем все запросы, а не только текущий
+                    self._paused_until = max(self._paused_until, time.monotonic() + delay)
+                if deadline is not None and time.monotonic() + delay >= deadline:
+                    self.stats['failed'] += 1
+                    raise asyncio.TimeoutError(f"Истек срок выполнения запроса к ИИ после {attempt} попыток") from e
+                self.stats['retries'] += 1
+                self.log("Повтор запроса через %.2f сек. (попытка %s): %s", delay, attempt, e)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                self._release(slot)
+                self.stats['failed'] += 1
+                raise
+            self._release(slot, response)
+            self.stats['requests'] += 1
+            return response
+    
+    def _remaining(self, deadline: Optional[float]) -> Optional[float]:
+        """Оставшееся время до крайнего срока"""
+        if deadline is None:
+            return None
+        return max(0.0, deadline - time.monotonic())
+    
+    async def _acquire(self, tokens: int, priority: int, deadline: Optional[float]) -> list:
+        """Ожидание свободного слота и бюджета в порядке приоритета"""
+        entry = [priority, next(self._seq), tokens]
+        heapq.heappush(self._waiters, entry)
+        acquired = False
+        try:
+            while True:
+                wait = None
+                if self._waiters[0] is entry and self._active < self.max_concurrency:
+                    wait = self._budget_wait(tokens)
+                    if wait <= 0:
+                        heapq.heappop(self._waiters)
+                        acquired = True
+                        self._active += 1
+                        now = time.monotonic()
+                        self._request_log.append(now)
+                        slot = [now, tokens]
+                        self._token_log.append(slot)
+                        self._tokens_in_window += tokens
+                        # Следующий в очереди может тоже получить слот
+                        self._notify()
+                        return slot
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise asyncio.TimeoutError("Истек срок ожидания очереди запросов к ИИ")
+                    wait = remaining if wait is None else min(wait, remaining)
+                await self._wait(wait)
+        finally:
+            if not acquired:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._notify()
+    
+    def _release(self, slot: list, response: Any = None):
+        """Освобождение слота и учет фактически потраченных токенов"""
+        self._active -= 1
+        usage = getattr(response, 'usage', None)
+        total_tokens = getattr(usage, 'total_tokens', None)
+        if isinstance(total_tokens, int) and any(entry is slot for entry in self._token_log):
+            self._tokens_in_window += total_tokens - slot[1]
+            slot[1] = total_tokens
+        self._notify()
+    
+    def _trim(self, now: float):
+        """Удаление записей, вышедших за окно учета"""
+        while self._request_log and now - self._request_log[0] >= self.WINDOW:
+            self._request_log.popleft()
+        while self._token_log and now - self._token_log[0][0] >= self.WINDOW:
+            self._tokens_in_window -= self._token_log.popleft()[1]
+    
+    def _budget_wait(self, tokens: int) -> float:
+        """Время ожидания до появления бюджета под запрос"""
+        now = time.monotonic()
+        self._trim(now)
+        wait = self._paused_until - now
+        if len(self._request_log) >= self.rpm_limit:
+            wait = max(wait, self._request_log[0] + self.WINDOW - now)
+        if self._token_log and self._tokens_in_window + tokens > self.tpm_limit:
+            # Ищем момент, когда из окна выйдет достаточно токенов
+            freed = 0
+            for timestamp, used in self._token_log:
+                freed += used
+                if self._tokens_in_window - freed + tokens <= self.tpm_limit:
+                    break
+            wait = max(wait, timestamp + self.WINDOW - now)
+        return wait
+    
+    def _retry_delay(self, error: Exception, attempt: int) -> float:
+        """Задержка перед повтором: экспонента с джиттером, но не меньше Retry-After"""
+        backoff = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+        backoff *= random.uniform(0.5, 1.0)
+        retry_after = self._parse_retry_after(error)
+        if retry_after is not None:
+            return min(self.max_delay, max(backoff, retry_after))
+        return backoff
+    
+    @staticmethod
+    def _parse_retry_after(error: Exception) -> Optional[float]:
+        """Извлечение задержки из заголовков retry-after-ms / retry-after"""
+        response = getattr(error, 'response', None)
+        headers = getattr(response, 'headers', None)
+        if not headers:
+            return None
+        try:
+            retry_after_ms = headers.get('retry-after-ms')
+            if retry_after_ms is not None:
+                return float(retry_after_ms) / 1000
+            retry_after = headers.get('retry-after')
+            if retry_after is None:
+                return None
+            try:
+                return float(retry_after)
+            except ValueError:
+                # Заголовок может содержать HTTP-дату
+                retry_date = email.utils.parsedate_to_datetime(retry_after)
+                return max(0.0, retry_date.timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+    
+    def _notify(self):
+        """Пробуждение ожидающих запросов"""
+        if self._event is not None:
+            self._event.set()
+            self._event = None
+    
+    async def _wait(self, timeout: Optional[float]):
+        """Ожидание изменения состояния очереди или таймаута"""
+        if self._event is None:
+            self._event = asyncio.Event()
+        event = self._event
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
 
 class AIChatManager:
     def __init__(self, settings):
         self.settings = settings
         self.openai_client = None
+        # Единый планировщик для всех запросов этого менеджера
+        self.scheduler = AIRequestScheduler(
+            rpm_limit=settings.get('ai_rpm_limit', 500),
+            tpm_limit=settings.get('ai_tpm_limit', 200000),
+            max_concurrency=settings.get('ai_max_concurrency', 8),
+            max_retries=settings.get('ai_max_retries', 5),
+            debug=settings.get('debug', False)
+        )
+        # Выбор модели по операции и переключение на быструю модель при нарушении SLO
+        self.router = ModelRouter(settings, debug=settings.get('debug', False))
+        # Учет токенов, задержек и стоимости всех запросов
+        self.usage_tracker = AIUsageTracker(debug=settings.get('debug', False))
+        # Кеш ответов в БД подключается после инициализации клиента Telegram
+        self.db_handler = None
+        self.account_id = None
+        # Отчет о сжатии сообщений последнего саммари: этапы и сэкономленные токены
+        self.last_compaction_report = []
+        # Векторный индекс сообщений для семантического поиска, подключается GUI
+        self.semantic_index = None
+        # Кеш ответов на перефразированные запросы, создается при первом обращении
+        self.semantic_cache = None
+    
+    def attach_storage(self, db_handler, account_id: str):
+        """Подключение БД для кеширования ответов и сохранения статистики"""
+        self.db_handler = db_handler
+        self.account_id = account_id
+        self.usage_tracker.db_handler = db_handler
+        self.usage_tracker.account_id = account_id
+    
+    def attach_semantic_index(self, semantic_index):
+        """Подключение векторного индекса сообщений"""
+        self.semantic_index = semantic_index
+    
+    async def index_messages(self, messages: List[Dict[str, Any]], dialog_id: int = None) -> int:
+        """Добавление сообщений в векторный индекс, если он подключен"""
+        if self.semantic_index is None:
+            return 0
+        return await self.semantic_index.add(messages, dialog_id)
+    
+    async def search_semantic(self, query: str, dialog_ids: List[int] = None, k: int = 20) -> List[Dict[str, Any]]:
+        """Семантический поиск по индексу сообщений
+        
+        Args:
+            query: Текст запроса
+            dialog_ids: Ограничение поиска диалогами
+            k: Количество результатов
+        
+        Returns:
+            List[Dict[str, Any]]: Результаты по убыванию близости с полями dialog_id, message_id, score.
+            Если подключена БД, результаты дополняются полями сообщения из кеша.
+        """
+        if self.semantic_index is None:
+            return []
+        hits = await self.semantic_index.search(query, dialog_ids, k)
+        if hits and self.db_handler and self.account_id:
+            cached = await self.db_handler.get_cached_messages_by_ids(
+                [(h['dialog_id'], h['message_id']) for h in hits], self.account_id)
+            by_key = {(m['dialog_id'], m.get('id')): m for m in cached}
+            hits = [{**by_key.get((h['dialog_id'], h['message_id']), {}), **h} for h in hits]
+        return hits
+    
+    def _ensure_semantic_cache(self):
+        """Создание семантического кеша запросов, если он включен и доступен numpy"""
+        if self.semantic_cache is None and self.settings.get('semantic_cache_enabled', True):
+            try:
+                from .semantic_index import create_embedder
+                client = self._ensure_client() if self.settings.get('semantic_embedder') == 'openai' else None
+                self.semantic_cache = SemanticQueryCache(
+                    create_embedder(self.settings, client, self.scheduler),
+                    threshold=float(self.settings.get('semantic_cache_threshold', DEFAULT_SIMILARITY_THRESHOLD))
+                )
+            except RuntimeError as e:
+                logger.warning("Семантический кеш недоступен: %s", e)
+                self.settings['semantic_cache_enabled'] = False
+        return self.semantic_cache
+    
+    async def _lookup_cached_response(self, user_query: str, context: str, model: str,
+                                      system_prompt: str) -> Optional[str]:
+        """Поиск ответа в кеше: точное совпадение в БД, затем близкий по смыслу запрос"""
+        if self.db_handler and self.account_id:
+            cached_response = await self.db_handler.get_cached_ai_response(
+                user_query, context, model, system_prompt, self.account_id)
+            if cached_response is not None:
+                return cached_response
+        
+        semantic_cache = self._ensure_semantic_cache()
+        if semantic_cache is None:
+            return None
+        key = context_hash(context, model, system_prompt)
+        if key not in semantic_cache and self.db_handler and self.account_id:
+            # Прогреваем кеш запросами из БД по тому же контексту
+            previous = await self.db_handler.get_cached_ai_queries(context, model, system_prompt, self.account_id)
+            await semantic_cache.store_many(previous, key)
+        found = await semantic_cache.lookup(user_query, key)
+        if found is None:
+            return None
+        response, similarity = found
+        logger.debug("Семантический кеш: близость %.3f", similarity)
+        return response
+    
+    def _ensure_client(self):
+        """Инициализация клиента OpenAI при необходимости"""
+        if self.openai_client is None:
+            # Повторы выполняет планировщик, поэтому встроенные повторы клиента отключены
+            # openai_base_url позволяет направить запросы на совместимый сервер, например локальный mock
+            self.openai_client = openai.AsyncOpenAI(
+                api_key=self.settings.get('openai_api_key'),
+                base_url=self.settings.get('openai_base_url') or None,
+                max_retries=0
+            )
+        return self.openai_client
+    
+    def get_openai_client(self):
+        """Общий клиент OpenAI (создается при первом обращении)"""
+        return self._ensure_client()
+    
+    async def _create_completion(self, openai_client, model: str, system_prompt: str, prompt: str,
+                                 priority: int = PRIORITY_INTERACTIVE, deadline: Optional[float] = None,
+                                 max_tokens: int = 1000, operation: str = 'qa', dialog_id: int = None) -> str:
+        """Запрос к модели через планировщик с выбором эндпоинта по типу модели
+        
+        Каждый вызов регистрируется в статистике: токены из response.usage,
+        задержка с учетом очереди и повторов, оценка стоимости.
+        
+        Returns:
+            str: Текст ответа модели
+        """
+        chat_model = is_chat_model(model)
+        
+        async def request(timeout):
+            # Передаем оставшееся до дедлайна время в запрос к API
+            extra = {'timeout': timeout} if timeout is not None else {}
+            if chat_model:
+                # Для чат-моделей используем chat.completions.create
+                return await openai_client.chat.completions.create(
+                    model=model,
+                    messages=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt}
+                    ],
+                    **extra
+                )
+            # Для не-чат моделей используем completions.create
+            return await openai_client.completions.create(
+                model=model,
+                prompt=f"{system_prompt}\n\n{prompt}",
+                max_tokens=max_tokens,
+                **extra
+            )
+        
+        prompt_estimate = estimate_tokens(system_prompt) + estimate_tokens(prompt)
+        started = time.monotonic()
+        response = await self.scheduler.submit(request, prompt_estimate + max_tokens, priority, deadline)
+        latency = time.monotonic() - started
+        if chat_model:
+            text = response.choices[0].message.content
+        else:
+            text = response.choices[0].text.strip()
+        
+        # Если API не вернул usage, используем оценку
+        usage = getattr(response, 'usage', None)
+        prompt_tokens = getattr(usage, 'prompt_tokens', None)
+        completion_tokens = getattr(usage, 'completion_tokens', None)
+        if not isinstance(prompt_tokens, int):
+            prompt_tokens = prompt_estimate
+        if not isinstance(completion_tokens, int):
+            completion_tokens = estimate_tokens(text or '')
+        self.router.observe(operation, model, latency)
+        await self.usage_tracker.record(model, operation, prompt_tokens, completion_tokens,
+                                        latency=latency, dialog_id=dialog_id)
+        return text
 
-    async def get_response(self, user_query, context=""):
+    async def retrieve_context(self, user_query: str, dialog_ids: List[int] = None,
+                               candidates: List[Dict[str, Any]] = None) -> str:
+        """Поиск сообщений, относящихся к запросу, и упаковка их в контекст
+        
+        Сначала используется полнотекстовый поиск по кешу в БД, затем векторный индекс,
+        если ничего не найдено - ранжирование BM25 по переданным сообщениям.
+        
+        Args:
+            user_query: Запрос пользователя
+            dialog_ids: ID диалогов, по истории которых выполняется поиск
+            candidates: Загруженные сообщения для локального ранжирования
+        
+        Returns:
+            str: Контекст из полных текстов найденных сообщений в пределах бюджета токенов
+        """
+        budget = int(self.settings.get('retrieval_token_budget', DEFAULT_RETRIEVAL_BUDGET))
+        limit = int(self.settings.get('retrieval_candidates', DEFAULT_RETRIEVAL_CANDIDATES))
+        hits = None
+        if self.db_handler and self.account_id and dialog_ids:
+            hits = await self.db_handler.search_cached_messages(
+                query_terms(user_query), dialog_ids, self.account_id, limit)
+        if not hits and self.semantic_index is not None and dialog_ids:
+            # Семантический поиск полезен, только если известны тексты найденных сообщений
+            hits = [h for h in await self.search_semantic(user_query, dialog_ids, limit) if h.get('text')]
+        if not hits and candidates:
+            hits = rank_messages(user_query, candidates, limit)
+        return pack_context(hits or [], budget)
+    
+    async def get_response(self, user_query, context="", timeout: Optional[float] = None, dialog_id: int = None,
+                           retrieval_dialog_ids: List[int] = None, candidates: List[Dict[str, Any]] = None):
         """Получение ответа от модели ИИ на запрос пользователя
         
         Args:
             user_query: Запрос пользователя
             context: Контекст сообщений для анализа
+            timeout: Максимальное время ожидания ответа в секундах
+            dialog_id: ID диалога для учета статистики
+            retrieval_dialog_ids: Режим поиска по истории - контекст собирается из
+                сообщений этих диалогов, релевантных запросу
+            candidates: Загруженные сообщения для поиска, если кеш в БД недоступен
         
         Returns:
             str: Ответ от модели ИИ
         """
         try:
+            deadline = time.monotonic() + timeout if timeout else None
+            
+            if retrieval_dialog_ids or candidates:
+                retrieved = await self.retrieve_context(user_query, retrieval_dialog_ids, candidates)
+                context = "\n\n".join(part for part in (context, retrieved) if part)
             # Инициализируем клиент OpenAI при необходимости
-            if self.openai_client is None:
-                self.openai_client = openai.AsyncOpenAI(api_key=self.settings.get('openai_api_key'))
+            self._ensure_client()
             
             # Получаем выбранную модель и системный промпт из настроек
             model = self.settings.get('openai_model', 'gpt-3.5-turbo')
@@ -39,6 +497,9 @@ class AIChatManager:
                 except (json.JSONDecodeError, ValueError):
                     # Если строка не является валидным JSON, оставляем значение как есть
                     pass
+            
+            # Модель для вопросов может быть задана политикой маршрутизации
+            model = self.router.select('qa', model)
                     
             # Проверка, не является ли модель алиасом
             model_aliases = {
@@ -61,7 +522,7 @@ class AIChatManager:
             ]
             
             # Определяем, является ли выбранная модель чат-моделью
-            is_chat_model = not ("realtime-preview" in model or any(prefix in model for prefix in ["davinci", "curie", "babbage", "ada"]))
+            selected_is_chat = is_chat_model(model)
             
             # Проверяем, доступна ли выбранная модель
             if model not in available_model_ids and model not in known_available_models:
@@ -71,7 +532,7 @@ class AIChatManager:
                     fallback_models = []
                     for m in available_models:
                         # Проверяем, является ли модель чат-моделью
-                        model_is_chat = not ("realtime-preview" in m['id'] or any(prefix in m['id'] for prefix in ["davinci", "curie", "babbage", "ada"]))
+                        model_is_chat = is_chat_model(m['id'])
                         
                         # Исключаем модели, требующие аудио-контент или другие специализированные модели
                         is_specialized = (
@@ -90,7 +551,7 @@ class AIChatManager:
                                 has_special_requirements = True
                         
                         # Добавляем модель в список запасных, если она подходит
-                        if model_is_chat == is_chat_model and not is_specialized and not has_special_requirements:
+                        if model_is_chat == selected_is_chat and not is_specialized and not has_special_requirements:
                             fallback_models.append(m['id'])
                     
                     if fallback_models:
@@ -123,39 +584,34 @@ class AIChatManager:
 
             system_prompt = self.settings.get('system_prompt', 'Ты - помощник, который помагает анализировать чаты и сообщения')
 
-            # Определяем, является ли модель чат-моделью
-            is_chat_model = True
-            
-            # Проверяем, содержит ли ID модели ключевые слова, указывающие на не-чат модель
-            # "realtime-preview" указывает на модели, которые используют completions API вместо chat.completions
-            if "realtime-preview" in model or any(prefix in model for prefix in ["davinci", "curie", "babbage", "ada"]):
-                is_chat_model = False
+            if not is_chat_model(model):
                 print(f"Модель '{model}' определена как не-чат модель. Используется эндпоинт completions.")
             
-            # Формируем запрос к API в зависимости от типа модели
-            if is_chat_model:
-                # Для чат-моделей используем chat.completions.create
-                response = await self.openai_client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": f"Контекст сообщений:\n{context}\n\nЗапрос: {user_query}"}
-                    ]
-                )
-            else:
-                # Для не-чат моделей используем completions.create
-                prompt = f"{system_prompt}\n\nКонтекст сообщений:\n{context}\n\nЗапрос: {user_query}"
-                response = await self.openai_client.completions.create(
-                    model=model,
-                    prompt=prompt,
-                    max_tokens=1000
-                )
+            # Проверяем кеш ответов: точный и семантический
+            started = time.monotonic()
+            cached_response = await self._lookup_cached_response(user_query, context, model, system_prompt)
+            if cached_response is not None:
+                await self.usage_tracker.record(model, 'qa', latency=time.monotonic() - started,
+                                                cache_hit=True, dialog_id=dialog_id)
+                return cached_response
             
-            # Извлекаем ответ в зависимости от типа модели
-            if is_chat_model:
-                ai_response = response.choices[0].message.content
-            else:
-                ai_response = response.choices[0].text.strip()
+            # Интерактивный запрос пользователя обслуживается раньше фоновых задач
+            ai_response = await self._create_completion(
+                self.openai_client,
+                model,
+                system_prompt,
+                f"Контекст сообщений:\n{context}\n\nЗапрос: {user_query}",
+                priority=PRIORITY_INTERACTIVE,
+                deadline=deadline,
+                operation='qa',
+                dialog_id=dialog_id
+            )
+            
+            if self.db_handler and self.account_id:
+                await self.db_handler.cache_ai_interaction(
+                    user_query, context, model, system_prompt, ai_response, self.account_id)
+            if self.semantic_cache is not None:
+                await self.semantic_cache.store(user_query, context_hash(context, model, system_prompt), ai_response)
             
             return ai_response
             
@@ -165,71 +621,149 @@ class AIChatManager:
             print(traceback.format_exc())
             return f"Произошла ошибка при обработке запроса: {str(e)}"
 
-    async def generate_summary(self, messages: List[str], openai_client) -> str:
-        """Генерация саммари"""
+    async def _run_map_batch(self, openai_client, model: str, system_prompt: str, prompts: List[str],
+                             operation: str, dialog_id: int = None,
+                             deadline: Optional[float] = None) -> List[Optional[str]]:
+        """Выполнение запросов этапа map через Batch API
+
+        Returns:
+            List[Optional[str]]: Ответы в порядке промптов, None для неудачных запросов
+        """
+        runner = BatchRunner(
+            openai_client,
+            work_dir=self.settings.get('batch_dir'),
+            poll_interval=float(self.settings.get('batch_poll_interval', 30)),
+            timeout=float(self.settings.get('batch_timeout', 24 * 3600)),
+            debug=self.settings.get('debug', False)
+        )
+        chat = is_chat_model(model)
+        requests = [build_batch_request(f"{operation}-{i}", model, system_prompt, prompt, chat=chat)
+                    for i, prompt in enumerate(prompts)]
+        started = time.monotonic()
+        results = await runner.run(requests, metadata={'operation': operation, 'dialog_id': str(dialog_id or '')},
+                                   deadline=deadline)
+        latency = time.monotonic() - started
+        texts = []
+        for request in requests:
+            result = results[request['custom_id']]
+            if result['error']:
+                texts.append(None)
+                continue
+            await self.usage_tracker.record(model, operation, result['prompt_tokens'], result['completion_tokens'],
+                                            latency=latency, dialog_id=dialog_id, batch=True)
+            texts.append(result['text'])
+        return texts
+
+    async def _attach_signatures(self, messages: List[Any], dialog_id: int) -> List[Any]:
+        """Подписи MinHash из кеша для этапа near_dedupe
+
+        Недостающие подписи вычисляются и сохраняются, поэтому повторное саммари
+        того же чата не пересчитывает их.
+        """
+        config = get_compaction_settings(self.settings.get('compaction'))
+        if not (config['enabled'] and 'near_dedupe' in config['stages'] and self.db_handler and self.account_id):
+            return messages
+        dicts = [m for m in messages if isinstance(m, dict) and m.get('id') is not None]
+        if not dicts:
+            return messages
+        near_filter = NearDuplicateFilter(config['near_duplicate_threshold'],
+                                          db_handler=self.db_handler, account_id=self.account_id)
+        tagged = [{**m, 'dialog_id': m.get('dialog_id', dialog_id)} if isinstance(m, dict) else m for m in messages]
+        signatures = await near_filter.load_signatures([m for m in tagged if isinstance(m, dict) and m.get('id') is not None])
+        for message in tagged:
+            if isinstance(message, dict):
+                signature = signatures.get((message.get('dialog_id'), message.get('id')))
+                if signature is not None:
+                    message['minhash'] = signature
+        return tagged
+
+    async def generate_summary(self, messages: List[Any], openai_client, priority: int = PRIORITY_INTERACTIVE,
+                               timeout: Optional[float] = None, dialog_id: int = None,
+                               execution_mode: str = None) -> str:
+        """Генерация саммари
+        
+        Args:
+            messages: Сообщения в виде строк или словарей (sender_name, date, text)
+            execution_mode: online - запросы сразу; batch - саммари частей через Batch API
+                (дешевле, но результат может прийти через часы), затем объединение обычным запросом.
+                По умолчанию берется из настройки summary_execution
+        """
         if not messages:
             return "Нет сообщений для анализа"
 
-        def estimate_tokens(text: str) -> int:
-            return len(text) // 4
+        deadline = time.monotonic() + timeout if timeout else None
 
+        if dialog_id is not None:
+            messages = await self._attach_signatures(messages, dialog_id)
+        # Сжатие до разбиения на части: меньше токенов - быстрее и дешевле
+        compacted, self.last_compaction_report = compact_messages(messages, self.settings.get('compaction'))
+        logger.debug("%s", lazy(format_report, self.last_compaction_report))
+        if not compacted:
+            return "Нет сообщений для анализа"
+
+        # Экстрактивный отбор ограничивает вход модели независимо от размера чата
+        summary_mode = self.settings.get('summary_mode', SUMMARY_MODE_LLM)
+        if summary_mode in (SUMMARY_MODE_EXTRACTIVE, SUMMARY_MODE_EXTRACTIVE_LLM):
+            budget = int(self.settings.get('extractive_token_budget', DEFAULT_TOKEN_BUDGET))
+            compacted = select_messages(compacted, budget)
+            if summary_mode == SUMMARY_MODE_EXTRACTIVE:
+                return "\n".join(format_message(m) for m in compacted)
         MAX_TOKENS = 14000
-        current_chunk = []
-        chunks = []
-        current_tokens = 0
+        if self.settings.get('chunking', CHUNKING_SEMANTIC) == CHUNKING_SEMANTIC:
+            # Части собираются из целых разговоров, чтобы не разрезать обсуждения
+            segments = segment_messages(compacted, self.settings.get('segmentation'))
+            chunks = pack_segments(segments, MAX_TOKENS)
+        else:
+            messages = [format_message(m) for m in compacted]
+            current_chunk = []
+            chunks = []
+            current_tokens = 0
 
-        for message in messages:
-            message_tokens = estimate_tokens(message)
-            if current_tokens + message_tokens > MAX_TOKENS:
-                chunks.append(current_chunk)
-                current_chunk = [message]
-                current_tokens = message_tokens
-            else:
-                current_chunk.append(message)
-                current_tokens += message_tokens
+            for message in messages:
+                message_tokens = estimate_tokens(message)
+                if current_tokens + message_tokens > MAX_TOKENS:
+                    chunks.append(current_chunk)
+                    current_chunk = [message]
+                    current_tokens = message_tokens
+                else:
+                    current_chunk.append(message)
+                    current_tokens += message_tokens
 
-        if current_chunk:
-            chunks.append(current_chunk)
+            if current_chunk:
+                chunks.append(current_chunk)
 
-        summaries = []
         user_prompt = self.settings['user_prompt']
-        model = self.settings['openai_model']
         system_prompt = self.settings['system_prompt']
+        # Если часть одна, ее саммари и есть итоговое, поэтому используется модель этапа reduce
+        map_operation = 'map' if len(chunks) > 1 else 'reduce'
+        model = self.router.select(map_operation, self.settings['openai_model'])
         
-        # Определяем, является ли модель чат-моделью
-        is_chat_model = True
-        # "realtime-preview" и другие префиксы указывают на не-чат модели
-        if "realtime-preview" in model or any(prefix in model for prefix in ["davinci", "curie", "babbage", "ada"]):
-            is_chat_model = False
+        if not is_chat_model(model):
             print(f"Модель '{model}' определена как не-чат модель. Используется эндпоинт completions.")
 
-        for i, chunk in enumerate(chunks):
-            chunk_prompt = user_prompt + "\n\n"
-            chunk_prompt += "\n".join(chunk)
-            chunk_prompt += "\n\nКраткое содержание:"
+        chunk_prompts = [user_prompt + "\n\n" + "\n".join(chunk) + "\n\nКраткое содержание:" for chunk in chunks]
 
+        async def summarize_chunk(i, chunk_prompt):
             try:
-                if is_chat_model:
-                    # Для чат-моделей используем chat.completions.create
-                    response = await openai_client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": chunk_prompt}
-                        ]
-                    )
-                    summaries.append(response.choices[0].message.content)
-                else:
-                    # Для не-чат моделей используем completions.create
-                    full_prompt = f"{system_prompt}\n\n{chunk_prompt}"
-                    response = await openai_client.completions.create(
-                        model=model,
-                        prompt=full_prompt,
-                        max_tokens=1000
-                    )
-                    summaries.append(response.choices[0].text.strip())
+                return await self._create_completion(openai_client, model, system_prompt, chunk_prompt,
+                                                     priority=priority, deadline=deadline,
+                                                     operation=map_operation, dialog_id=dialog_id)
+            except Exception as e:
+                return f"Ошибка при генерации саммари части {i+1}: {str(e)}"
+
+        summaries = [None] * len(chunk_prompts)
+        execution_mode = execution_mode or self.settings.get('summary_execution', EXECUTION_MODE_ONLINE)
+        if execution_mode == EXECUTION_MODE_BATCH:
+            try:
+                summaries = await self._run_map_batch(openai_client, model, system_prompt, chunk_prompts,
+                                                      map_operation, dialog_id, deadline=deadline)
             except Exception as e:
-                summaries.append(f"Ошибка при генерации саммари части {i+1}: {str(e)}")
+                logger.warning("Ошибка Batch API, части обрабатываются обычными запросами: %s", e)
+
+        # Части без результата отправляются параллельно, темп задает планировщик
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        for i, summary in zip(missing, await asyncio.gather(*(summarize_chunk(i, chunk_prompts[i]) for i in missing))):
+            summaries[i] = summary
 
         if len(summaries) > 1:
             try:
@@ -240,69 +774,89 @@ class AIChatManager:
                 
                 final_prompt += "Общее краткое содержание:"
 
-                if is_chat_model:
-                    # Для чат-моделей используем chat.completions.create
-                    response = await openai_client.chat.completions.create(
-                        model=model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": final_prompt}
-                        ]
-                    )
-                    return response.choices[0].message.content
-                else:
-                    # Для не-чат моделей используем completions.create
-                    full_prompt = f"{system_prompt}\n\n{final_prompt}"
-                    response = await openai_client.completions.create(
-                        model=model,
-                        prompt=full_prompt,
-                        max_tokens=1000
-                    )
-                    return response.choices[0].text.strip()
+                reduce_model = self.router.select('reduce', self.settings['openai_model'])
+                return await self._create_completion(openai_client, reduce_model, system_prompt, final_prompt,
+                                                     priority=priority, deadline=deadline,
+                                                     operation='reduce', dialog_id=dialog_id)
             except Exception as e:
                 return f"Ошибка при генерации финального саммари: {str(e)}"
         else:
             return summaries[0]
 
-    async def analyze_participants(self, participants: List[Dict[str, Any]], openai_client) -> str:
-        """Анализ участников чата"""
+    async def summarize_sections(self, sections: List[Dict[str, str]], openai_client,
+                                 priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None,
+                                 dialog_id: int = None) -> str:
+        """Короткий общий обзор по готовым саммари разделов (например, тем форума)
+
+        Args:
+            sections: Список словарей с полями title и summary
+        """
+        sections = [s for s in sections if s.get('summary')]
+        if not sections:
+            return "Нет саммари для объединения"
+        try:
+            deadline = time.monotonic() + timeout if timeout else None
+            prompt = "Ниже саммари отдельных тем чата. Составь короткий общий обзор: главное по чату в 3-5 пунктах, " \
+                     "без пересказа каждой темы:\n\n"
+            prompt += "\n\n".join(f"{s['title']}:\n{s['summary']}" for s in sections)
+            prompt += "\n\nОбщий обзор:"
+            model = self.router.select('reduce', self.settings['openai_model'])
+            return await self._create_completion(openai_client, model, self.settings['system_prompt'], prompt,
+                                                 priority=priority, deadline=deadline,
+                                                 operation='reduce', dialog_id=dialog_id)
+        except Exception as e:
+            return f"Ошибка при составлении общего обзора: {str(e)}"
+
+    async def analyze_participants(self, participants: List[Dict[str, Any]], openai_client,
+                                   priority: int = PRIORITY_INTERACTIVE, timeout: Optional[float] = None,
+                                   dialog_id: int = None, messages: List[Dict[str, Any]] = None,
+                                   top_n: int = DEFAULT_TOP_PARTICIPANTS, total_members: Optional[int] = None,
+                                   names: Dict[Any, str] = None) -> str:
+        """Анализ участников чата
+
+        Если переданы сообщения, активность участников агрегируется локально
+        (compute_participant_stats), и модели отправляются только профили top_n
+        самых активных. Без сообщений в промпт попадает не более top_n участников
+        и их общее количество, поэтому размер промпта не растет с размером группы.
+
+        Args:
+            participants: Известные участники (можно только часть или пустой список)
+            total_members: Количество участников чата; по умолчанию len(participants)
+            names: Дополнительные имена участников по id
+        """
         try:
-            participants_info = "\n".join([f"{p['username']} ({p['first_name']} {p['last_name']})" for p in participants])
+            deadline = time.monotonic() + timeout if timeout else None
+            if total_members is None:
+                total_members = len(participants)
+            if messages:
+                names = dict(names or {})
+                for p in participants:
+                    name = ' '.join(filter(None, [p.get('first_name'), p.get('last_name')])) or p.get('username')
+                    if name:
+                        names[p['id']] = name
+                profiles = compute_participant_stats(messages, names=names)
+                participants_info = build_participants_prompt(profiles, total_members=total_members, top_n=top_n)
+            else:
+                shown = participants[:top_n]
+                participants_info = "\n".join([f"{p['username']} ({p['first_name']} {p['last_name']})" for p in shown])
+                participants_info = f"Всего участников: {total_members}\n{participants_info}"
+                if total_members > len(shown):
+                    participants_info += f"\n... и еще {total_members - len(shown)}"
             prompt = f"""Проанализируй участников чата и выдели ключевых участников:
 
 {participants_info}
 
 Ключевые участники:"""
             
-            model = self.settings['openai_model']
+            model = self.router.select('participants', self.settings['openai_model'])
             system_prompt = self.settings['system_prompt']
             
-            # Определяем, является ли модель чат-моделью
-            is_chat_model = True
-            # Проверка на не-чат модели по идентификаторам
-            if "realtime-preview" in model or any(prefix in model for prefix in ["davinci", "curie", "babbage", "ada"]):
-                is_chat_model = False
+            if not is_chat_model(model):
                 print(f"Модель '{model}' определена как не-чат модель. Используется эндпоинт completions.")
             
-            if is_chat_model:
-                # Для чат-моделей используем chat.completions.create
-                response = await openai_client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": prompt}
-                    ]
-                )
-                return response.choices[0].message.content
-            else:
-                # Для не-чат моделей используем completions.create
-                full_prompt = f"{system_prompt}\n\n{prompt}"
-                response = await openai_client.completions.create(
-                    model=model,
-                    prompt=full_prompt,
-                    max_tokens=1000
-                )
-                return response.choices[0].text.strip()
+            return await self._create_completion(openai_client, model, system_prompt, prompt,
+                                                 priority=priority, deadline=deadline,
+                                                 operation='participants', dialog_id=dialog_id)
         except Exception as e:
             return f"Ошибка при анализе участников чата: {str(e)}"
 
@@ -319,8 +873,7 @@ class AIChatManager:
         """
         try:
             # Инициализируем клиент OpenAI при необходимости
-            if self.openai_client is None:
-                self.openai_client = openai.AsyncOpenAI(api_key=self.settings.get('openai_api_key'))
+            self._ensure_client()
             
             # Получаем список моделей
             models = await self.openai_client.models.list()
@@ -0,0 +1,161 @@
+import json
+import datetime
+from collections import deque
+from typing import List, Dict, Any, Optional
+from .log_utils import get_logger
+
+logger = get_logger('ai.usage')
+
+# Цены моделей в долларах за 1M токенов: (промпт, ответ)
+# Поиск идет по самому длинному совпадающему префиксу ID модели
+MODEL_PRICES = {
+    'gpt-4.1-nano': (0.10, 0.40),
+    'gpt-4.1-mini': (0.40, 1.60),
+    'gpt-4.1': (2.00, 8.00),
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+    'chatgpt-4o': (5.00, 15.00),
+    'gpt-4-turbo': (10.00, 30.00),
+    'gpt-4': (30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 1.50),
+    'o1-mini': (1.10, 4.40),
+    'o1': (15.00, 60.00),
+    'o3-mini': (1.10, 4.40),
+}
+
+# Запросы через Batch API тарифицируются со скидкой
+BATCH_PRICE_FACTOR = 0.5
+
+# Допустимые способы группировки статистики
+GROUP_BY_FIELDS = {
+    'model': 'model',
+    'dialog': 'dialog_id',
+    'day': 'day',
+    'operation': 'operation',
+}
+
+
+def get_model_price(model: str) -> Optional[tuple]:
+    """Получение цены модели по самому длинному совпадающему префиксу"""
+    best = None
+    for prefix in MODEL_PRICES:
+        if model.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return MODEL_PRICES[best] if best else None
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, batch: bool = False) -> float:
+    """Оценка стоимости запроса в долларах"""
+    price = get_model_price(model or '')
+    if price is None:
+        return 0.0
+    cost = (prompt_tokens * price[0] + completion_tokens * price[1]) / 1_000_000
+    return cost * BATCH_PRICE_FACTOR if batch else cost
+
+
+class AIUsageTracker:
+    """Учет токенов, задержек и стоимости запросов к ИИ"""
+
+    def __init__(self, db_handler=None, account_id: str = None, max_records: int = 10000, debug: bool = False):
+        self.db_handler = db_handler
+        self.account_id = account_id
+        self.debug = debug
+        # В памяти храним только последние записи, полная история - в БД
+        self.records = deque(maxlen=max_records)
+
+    def log(self, message, *args):
+        """Логирование сообщений"""
+        if self.debug:
+            logger.debug(message, *args)
+
+    async def record(self, model: str, operation: str, prompt_tokens: int = 0, completion_tokens: int = 0,
+                     latency: float = 0.0, cache_hit: bool = False, dialog_id: int = None,
+                     batch: bool = False) -> Dict[str, Any]:
+        """Регистрация одного обращения к ИИ
+
+        Args:
+            model: Идентификатор модели
+            operation: Тип операции (qa, map, reduce, participants)
+            prompt_tokens: Токены промпта
+            completion_tokens: Токены ответа
+            latency: Время выполнения в секундах
+            cache_hit: Ответ получен из кеша
+            dialog_id: ID диалога, к которому относится запрос
+            batch: Запрос выполнен через Batch API
+
+        Returns:
+            Dict[str, Any]: Сохраненная запись
+        """
+        now = datetime.datetime.now()
+        record = {
+            'model': model,
+            'operation': operation,
+            'dialog_id': dialog_id,
+            'prompt_tokens': int(prompt_tokens or 0),
+            'completion_tokens': int(completion_tokens or 0),
+            'latency': round(latency, 4),
+            'cache_hit': bool(cache_hit),
+            # Ответ из кеша ничего не стоит
+            'cost': 0.0 if cache_hit else estimate_cost(model, prompt_tokens or 0, completion_tokens or 0, batch),
+            'created_at': now.isoformat(timespec='seconds'),
+            'day': now.strftime('%Y-%m-%d'),
+        }
+        self.records.append(record)
+        self.log("%s %s: %s+%s токенов, %.2f сек., $%.5f%s", operation, model,
+                 record['prompt_tokens'], record['completion_tokens'], record['latency'], record['cost'],
+                 ' (кеш)' if cache_hit else '')
+
+        if self.db_handler and self.account_id:
+            await self.db_handler.log_ai_usage(record, self.account_id)
+        return record
+
+    def aggregate(self, group_by: str = 'model') -> List[Dict[str, Any]]:
+        """Агрегация записей в памяти по модели, диалогу, дню или операции"""
+        field = GROUP_BY_FIELDS.get(group_by)
+        if field is None:
+            raise ValueError(f"Неизвестная группировка: {group_by}")
+
+        groups = {}
+        for record in self.records:
+            key = record.get(field)
+            group = groups.setdefault(key, {
+                'key': key,
+                'calls': 0,
+                'cache_hits': 0,
+                'prompt_tokens': 0,
+                'completion_tokens': 0,
+                'total_latency': 0.0,
+                'cost': 0.0,
+            })
+            group['calls'] += 1
+            group['cache_hits'] += int(record['cache_hit'])
+            group['prompt_tokens'] += record['prompt_tokens']
+            group['completion_tokens'] += record['completion_tokens']
+            group['total_latency'] += record['latency']
+            group['cost'] += record['cost']
+
+        result = []
+        for group in groups.values():
+            group['avg_latency'] = group.pop('total_latency') / group['calls']
+            result.append(group)
+        result.sort(key=lambda g: g['cost'], reverse=True)
+        return result
+
+    async def get_summary(self, group_by: str = 'model') -> List[Dict[str, Any]]:
+        """Сводка по всей истории: из БД, если она доступна, иначе из памяти"""
+        if self.db_handler and self.account_id:
+            rows = await self.db_handler.get_ai_usage_summary(self.account_id, group_by)
+            if rows is not None:
+                return rows
+        return self.aggregate(group_by)
+
+    async def export_json(self, path: str, group_by: str = 'model') -> None:
+        """Экспорт сводки и последних записей в JSON-файл"""
+        data = {
+            'exported_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'group_by': group_by,
+            'summary': await self.get_summary(group_by),
+            'records': list(self.records),
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2, default=str)
@@ -0,0 +1,182 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import datetime
+from typing import List, Dict, Any, Optional
+from .log_utils import get_logger
+
+logger = get_logger('ai.batch')
+
+# Режимы выполнения запросов этапа map
+EXECUTION_MODE_ONLINE = 'online'
+EXECUTION_MODE_BATCH = 'batch'
+
+# Конечные статусы пакета
+BATCH_FINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+
+DEFAULT_POLL_INTERVAL = 30.0
+DEFAULT_BATCH_TIMEOUT = 24 * 3600
+
+
+def build_batch_request(custom_id: str, model: str, system_prompt: str, prompt: str,
+                        max_tokens: int = 1000, chat: bool = True) -> Dict[str, Any]:
+    """Строка JSONL-файла пакета для chat.completions или completions"""
+    if chat:
+        return {
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': '/v1/chat/completions',
+            'body': {
+                'model': model,
+                'messages': [
+                    {'role': 'system', 'content': system_prompt},
+                    {'role': 'user', 'content': prompt},
+                ],
+                'max_tokens': max_tokens,
+            },
+        }
+    return {
+        'custom_id': custom_id,
+        'method': 'POST',
+        'url': '/v1/completions',
+        'body': {'model': model, 'prompt': f"{system_prompt}\n\n{prompt}", 'max_tokens': max_tokens},
+    }
+
+
+def parse_batch_output(content: str) -> Dict[str, Dict[str, Any]]:
+    """Разбор выходного файла пакета
+
+    Returns:
+        Dict[str, Dict[str, Any]]: custom_id -> {'text', 'prompt_tokens', 'completion_tokens', 'error'}
+    """
+    results = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get('response') or {}
+        body = response.get('body') or {}
+        result = {'text': None, 'prompt_tokens': 0, 'completion_tokens': 0, 'error': None}
+        if item.get('error') or response.get('status_code', 200) != 200:
+            error = item.get('error') or body.get('error') or {}
+            result['error'] = error.get('message') if isinstance(error, dict) else str(error)
+            result['error'] = result['error'] or f"HTTP {response.get('status_code')}"
+        else:
+            choice = (body.get('choices') or [{}])[0]
+            if 'message' in choice:
+                result['text'] = choice['message'].get('content')
+            else:
+                result['text'] = (choice.get('text') or '').strip()
+            usage = body.get('usage') or {}
+            result['prompt_tokens'] = usage.get('prompt_tokens', 0)
+            result['completion_tokens'] = usage.get('completion_tokens', 0)
+        results[item['custom_id']] = result
+    return results
+
+
+class BatchRunner:
+    """Выполнение запросов через OpenAI Batch API
+
+    Запросы записываются в JSONL-файл, файл загружается, создается пакет,
+    после чего его статус опрашивается до завершения. Пакеты выполняются
+    дешевле и не расходуют лимиты запросов интерактивного режима, но результат
+    может прийти только в пределах окна completion_window. Файл запросов
+    удаляется после разбора результатов (в режиме отладки сохраняется).
+    """
+
+    def __init__(self, openai_client, work_dir: str = None, poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 timeout: float = DEFAULT_BATCH_TIMEOUT, completion_window: str = '24h', debug: bool = False):
+        self.openai_client = openai_client
+        self.work_dir = work_dir or os.path.join(tempfile.gettempdir(), 'sammaryhelper_batches')
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.completion_window = completion_window
+        self.debug = debug
+
+    def log(self, message, *args):
+        """Логирование сообщений"""
+        if self.debug:
+            logger.debug(message, *args)
+
+    def write_requests(self, requests: List[Dict[str, Any]]) -> str:
+        """Запись запросов в JSONL-файл"""
+        os.makedirs(self.work_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        path = os.path.join(self.work_dir, f'batch_{stamp}.jsonl')
+        with open(path, 'w', encoding='utf-8') as f:
+            for request in requests:
+                f.write(json.dumps(request, ensure_ascii=False) + "\n")
+        return path
+
+    async def run(self, requests: List[Dict[str, Any]], metadata: Dict[str, str] = None,
+                  deadline: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Выполнение запросов одним пакетом
+
+        Все запросы должны обращаться к одному эндпоинту.
+
+        Args:
+            deadline: Крайний срок по time.monotonic(); если пакет не выполнен
+                к этому сроку (или за timeout), он отменяется
+
+        Returns:
+            Dict[str, Dict[str, Any]]: Результаты по custom_id (см. parse_batch_output)
+        """
+        if not requests:
+            return {}
+        endpoints = {request['url'] for request in requests}
+        if len(endpoints) != 1:
+            raise ValueError("Все запросы пакета должны обращаться к одному эндпоинту")
+
+        path = self.write_requests(requests)
+        try:
+            return await self._execute(path, requests, endpoints.pop(), metadata, deadline)
+        finally:
+            if not self.debug:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def _execute(self, path: str, requests: List[Dict[str, Any]], endpoint: str,
+                       metadata: Optional[Dict[str, str]], deadline: Optional[float]) -> Dict[str, Dict[str, Any]]:
+        with open(path, 'rb') as f:
+            input_file = await self.openai_client.files.create(file=(os.path.basename(path), f.read()),
+                                                               purpose='batch')
+        batch = await self.openai_client.batches.create(
+            input_file_id=input_file.id,
+            endpoint=endpoint,
+            completion_window=self.completion_window,
+            metadata=metadata,
+        )
+        self.log("Пакет %s: %s запросов, файл %s", batch.id, len(requests), path)
+
+        started = time.monotonic()
+        limit = started + self.timeout
+        if deadline is not None:
+            limit = min(limit, deadline)
+        while batch.status not in BATCH_FINAL_STATUSES:
+            remaining = limit - time.monotonic()
+            if remaining <= 0:
+                await self.openai_client.batches.cancel(batch.id)
+                raise TimeoutError(f"Пакет {batch.id} не выполнен за {time.monotonic() - started:.0f} сек.")
+            await asyncio.sleep(min(self.poll_interval, remaining))
+            batch = await self.openai_client.batches.retrieve(batch.id)
+            counts = getattr(batch, 'request_counts', None)
+            if counts is not None:
+                self.log("Пакет %s: %s, %s/%s", batch.id, batch.status, counts.completed, counts.total)
+
+        if batch.status != 'completed':
+            raise RuntimeError(f"Пакет {batch.id} завершился со статусом {batch.status}")
+
+        results = {}
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = await self.openai_client.files.content(file_id)
+                results.update(parse_batch_output(content.text))
+        for request in requests:
+            # Запрос, которого нет ни в выходном файле, ни в файле ошибок, считается неудачным
+            results.setdefault(request['custom_id'], {'text': None, 'prompt_tokens': 0, 'completion_tokens': 0,
+                                                      'error': 'Нет результата в выходном файле пакета'})
+        return results
@@ -0,0 +1,290 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import datetime
+from typing import List, Dict, Any, Optional, Callable
+from .ai_handler import PRIORITY_BACKGROUND, is_error_response
+from .batch_api import EXECUTION_MODE_BATCH
+from .log_utils import get_logger
+
+logger = get_logger('digest')
+
+# Статусы обработки диалога в задании
+STATUS_DONE = 'done'
+STATUS_EMPTY = 'empty'
+STATUS_FAILED = 'failed'
+
+# Форматы отчета
+REPORT_FORMATS = ('markdown', 'jsonl')
+
+DEFAULT_FETCH_CONCURRENCY = 8
+DEFAULT_SUMMARY_CONCURRENCY = 4
+# Окно первого дайджеста без окна времени, если по диалогу еще нет сохраненной позиции
+DEFAULT_FIRST_RUN_HOURS = 24
+
+
+def make_job_id(dialog_ids: List[int], since: Optional[datetime.datetime],
+                until: Optional[datetime.datetime]) -> str:
+    """Идентификатор задания по набору диалогов и окну времени
+
+    Повторный запуск с теми же параметрами получает тот же идентификатор
+    и продолжает прерванное задание. Без окна времени (since не задан)
+    продолжается только незавершенное задание, см. BatchDigestJob.run.
+    """
+    digest = hashlib.sha1()
+    digest.update(','.join(str(i) for i in sorted(dialog_ids)).encode('utf-8'))
+    for bound in (since, until):
+        digest.update(b'|' + (bound.isoformat() if bound else '').encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+class FileCheckpointStore:
+    """Хранение контрольных точек в JSON-файле, если БД недоступна"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._data = None
+
+    def _load(self) -> Dict[str, Any]:
+        if self._data is None:
+            self._data = {'jobs': {}, 'positions': {}}
+            if os.path.exists(self.path):
+                try:
+                    with open(self.path, 'r', encoding='utf-8') as f:
+                        self._data = json.load(f)
+                except (OSError, ValueError):
+                    pass
+        return self._data
+
+    def _flush(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._data, f, ensure_ascii=False)
+        # Атомарная замена: прерывание во время записи не портит файл
+        os.replace(tmp_path, self.path)
+
+    async def get_checkpoints(self, job_id: str) -> Dict[int, Dict[str, Any]]:
+        job = self._load()['jobs'].get(job_id, {})
+        return {int(dialog_id): result for dialog_id, result in job.items()}
+
+    async def save_checkpoint(self, job_id: str, result: Dict[str, Any]):
+        data = self._load()
+        data['jobs'].setdefault(job_id, {})[str(result['dialog_id'])] = result
+        if result['status'] in (STATUS_DONE, STATUS_EMPTY) and result.get('last_message_id'):
+            key = str(result['dialog_id'])
+            data['positions'][key] = max(data['positions'].get(key, 0), result['last_message_id'])
+        self._flush()
+
+    async def get_last_positions(self, dialog_ids: List[int]) -> Dict[int, int]:
+        positions = self._load()['positions']
+        return {dialog_id: positions[str(dialog_id)] for dialog_id in dialog_ids if str(dialog_id) in positions}
+
+
+class DatabaseCheckpointStore:
+    """Хранение контрольных точек в таблице digest_checkpoints"""
+
+    def __init__(self, db_handler, account_id: str):
+        self.db_handler = db_handler
+        self.account_id = account_id
+
+    async def get_checkpoints(self, job_id: str) -> Dict[int, Dict[str, Any]]:
+        return await self.db_handler.get_digest_checkpoints(job_id, self.account_id)
+
+    async def save_checkpoint(self, job_id: str, result: Dict[str, Any]):
+        await self.db_handler.save_digest_checkpoint(job_id, result, self.account_id)
+
+    async def get_last_positions(self, dialog_ids: List[int]) -> Dict[int, int]:
+        return await self.db_handler.get_digest_positions(dialog_ids, self.account_id)
+
+
+class BatchDigestJob:
+    """Дайджест по многим диалогам одним заданием
+
+    Сообщения диалогов загружаются параллельно (не более fetch_concurrency
+    одновременно), саммари строятся с ограничением summary_concurrency, а
+    результат по каждому диалогу сразу сохраняется как контрольная точка.
+    Повторный запуск того же задания пропускает уже обработанные диалоги.
+
+    Если since не задан, для каждого диалога берутся только сообщения новее
+    последнего сообщения, попавшего в предыдущий дайджест; для диалога без
+    такой позиции берутся сообщения за последние first_run_hours часов. В режиме
+    execution_mode='batch' саммари частей выполняются через Batch API.
+    С near_duplicate_filter (NearDuplicateFilter) пересылки и копии, уже
+    попавшие в дайджест другого диалога задания, не отправляются в модель повторно.
+    """
+
+    def __init__(self, client_manager, ai_manager, openai_client, dialogs: List[Dict[str, Any]],
+                 checkpoint_store, since: Optional[datetime.datetime] = None,
+                 until: Optional[datetime.datetime] = None, job_id: str = None,
+                 fetch_concurrency: int = DEFAULT_FETCH_CONCURRENCY,
+                 summary_concurrency: int = DEFAULT_SUMMARY_CONCURRENCY,
+                 message_limit: Optional[int] = None, first_run_hours: float = DEFAULT_FIRST_RUN_HOURS,
+                 dialog_timeout: Optional[float] = None,
+                 execution_mode: str = None, near_duplicate_filter=None,
+                 progress_callback: Callable[[int, int, Dict[str, Any]], None] = None,
+                 debug: bool = False):
+        self.client_manager = client_manager
+        self.ai_manager = ai_manager
+        self.openai_client = openai_client
+        self.dialogs = dialogs
+        self.store = checkpoint_store
+        self.since = since
+        self.until = until
+        self.job_id = job_id or make_job_id([d['id'] for d in dialogs], since, until)
+        self.fetch_semaphore = asyncio.Semaphore(fetch_concurrency)
+        if execution_mode == EXECUTION_MODE_BATCH:
+            # Пакет выполняется на стороне API часами: ограничение параллельности только задержало бы отправку
+            summary_concurrency = max(summary_concurrency, len(dialogs))
+        self.summary_semaphore = asyncio.Semaphore(summary_concurrency)
+        self.message_limit = message_limit
+        self.first_run_hours = first_run_hours
+        self.dialog_timeout = dialog_timeout
+        self.execution_mode = execution_mode
+        self.near_duplicate_filter = near_duplicate_filter
+        self.progress_callback = progress_callback
+        self.debug = debug
+        self.completed = 0
+
+    def log(self, message, *args):
+        """Логирование сообщений"""
+        if self.debug:
+            logger.debug("[%s] " + message, self.job_id, *args)
+
+    def _report_progress(self, result: Dict[str, Any]):
+        self.completed += 1
+        if self.progress_callback:
+            self.progress_callback(self.completed, len(self.dialogs), result)
+
+    async def _process_dialog(self, dialog: Dict[str, Any], min_id: int) -> Dict[str, Any]:
+        result = {
+            'dialog_id': dialog['id'],
+            'dialog_name': dialog.get('name', str(dialog['id'])),
+            'status': STATUS_FAILED,
+            'message_count': 0,
+            'last_message_id': min_id or None,
+            'summary': '',
+            'error': None,
+        }
+        started = time.monotonic()
+        since = self.since
+        if since is None and not min_id:
+            # Позиции прошлого дайджеста нет: без окна пришлось бы читать всю историю чата
+            since = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=self.first_run_hours)
+        try:
+            async with self.fetch_semaphore:
+                messages = await self.client_manager.get_messages_since(
+                    dialog['id'], since=since, until=self.until, min_id=min_id, limit=self.message_limit)
+            result['message_count'] = len(messages)
+            if not messages:
+                result['status'] = STATUS_EMPTY
+                return result
+            result['last_message_id'] = max(m['id'] for m in messages)
+            # Хронологический порядок для модели
+            messages.sort(key=lambda m: m['id'])
+            if self.near_duplicate_filter:
+                messages, dropped = await self.near_duplicate_filter.filter(messages, dialog['id'])
+                result['duplicates'] = len(dropped)
+                if not messages:
+                    result['status'] = STATUS_EMPTY
+                    return result
+
+            async with self.summary_semaphore:
+                summary = await self.ai_manager.generate_summary(
+                    messages, self.openai_client, priority=PRIORITY_BACKGROUND,
+                    timeout=self.dialog_timeout, dialog_id=dialog['id'],
+                    execution_mode=self.execution_mode)
+            if is_error_response(summary):
+                result['error'] = summary
+            else:
+                result['summary'] = summary
+                result['status'] = STATUS_DONE
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result['error'] = str(e)
+        finally:
+            result['elapsed'] = round(time.monotonic() - started, 3)
+        return result
+
+    def _is_finished(self, checkpoints: Dict[int, Dict[str, Any]]) -> bool:
+        return bool(checkpoints) and all(
+            checkpoints.get(d['id'], {}).get('status') in (STATUS_DONE, STATUS_EMPTY) for d in self.dialogs)
+
+    async def run(self) -> List[Dict[str, Any]]:
+        """Выполнение задания
+
+        Returns:
+            List[Dict[str, Any]]: Результаты по диалогам в исходном порядке
+        """
+        checkpoints = await self.store.get_checkpoints(self.job_id)
+        if self.since is None and self._is_finished(checkpoints):
+            # Без окна времени завершенное задание не переиспользуется: новый запуск
+            # строит дайджест по сообщениям, появившимся после него
+            self.log("Предыдущее задание завершено, выполняется новое")
+            checkpoints = {}
+        positions = {} if self.since else await self.store.get_last_positions([d['id'] for d in self.dialogs])
+        results = {}
+        pending = []
+        for dialog in self.dialogs:
+            checkpoint = checkpoints.get(dialog['id'])
+            if checkpoint and checkpoint['status'] in (STATUS_DONE, STATUS_EMPTY):
+                results[dialog['id']] = checkpoint
+                self._report_progress(checkpoint)
+            else:
+                pending.append(dialog)
+        self.log("Диалогов: %s, уже обработано: %s, осталось: %s", len(self.dialogs), len(results), len(pending))
+
+        async def worker(dialog):
+            result = await self._process_dialog(dialog, positions.get(dialog['id'], 0))
+            # Контрольная точка сохраняется сразу, чтобы прерванное задание не повторяло работу
+            await self.store.save_checkpoint(self.job_id, result)
+            results[dialog['id']] = result
+            self._report_progress(result)
+            if result['status'] == STATUS_FAILED:
+                self.log("%s: ошибка %s", result['dialog_name'], result['error'])
+
+        await asyncio.gather(*(worker(dialog) for dialog in pending))
+        return [results[d['id']] for d in self.dialogs if d['id'] in results]
+
+
+def format_markdown_report(results: List[Dict[str, Any]], title: str = None) -> str:
+    """Отчет дайджеста в Markdown"""
+    lines = [f"# {title or 'Дайджест'}", ""]
+    done = [r for r in results if r['status'] == STATUS_DONE]
+    failed = [r for r in results if r['status'] == STATUS_FAILED]
+    lines.append(f"Диалогов: {len(results)}, с новыми сообщениями: {len(done)}, ошибок: {len(failed)}")
+    lines.append("")
+    for result in done:
+        lines.append(f"## {result['dialog_name']}")
+        lines.append(f"_Сообщений: {result['message_count']}_")
+        lines.append("")
+        lines.append(result['summary'].strip())
+        lines.append("")
+    if failed:
+        lines.append("## Ошибки")
+        for result in failed:
+            lines.append(f"- {result['dialog_name']}: {result['error']}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def write_report(results: List[Dict[str, Any]], path: str, fmt: str = None, title: str = None) -> str:
+    """Запись отчета в файл; формат определяется по расширению, если не задан явно
+
+    Returns:
+        str: Путь к отчету
+    """
+    fmt = fmt or ('jsonl' if path.endswith('.jsonl') else 'markdown')
+    if fmt not in REPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат отчета: {fmt}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        if fmt == 'jsonl':
+            for result in results:
+                f.write(json.dumps(result, ensure_ascii=False) + "\n")
+        else:
+            f.write(format_markdown_report(results, title))
+    return path
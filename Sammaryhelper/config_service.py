@@ -0,0 +1,161 @@
+import os
+import time
+import threading
+import importlib.util
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .log_utils import get_logger
+
+logger = get_logger('config')
+
+# Как часто (сек.) проверяется время изменения файла конфига при обращении к нему
+DEFAULT_CHECK_INTERVAL = 1.0
+
+
+class _ConfigEntry:
+    __slots__ = ('config', 'stamp', 'checked')
+
+    def __init__(self, config: Any, stamp: Tuple[int, int], checked: float):
+        self.config = config
+        self.stamp = stamp
+        self.checked = checked
+
+
+class ConfigService:
+    """Конфиги configs/<name>.py, общие для клиента Telegram, БД и ИИ
+
+    Модуль конфига выполняется один раз и кешируется вместе с временем
+    изменения и размером файла. При обращении файл проверяется не чаще
+    check_interval секунд; если он изменился, конфиг выполняется заново,
+    а подписчики получают новый объект. Если новая версия не выполняется
+    (например, синтаксическая ошибка), остается прежний конфиг.
+    """
+
+    def __init__(self, app_dir: str, check_interval: float = DEFAULT_CHECK_INTERVAL):
+        self.app_dir = app_dir
+        self.check_interval = check_interval
+        self._entries = {}
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.stats = {'loads': 0, 'reloads': 0, 'hits': 0, 'checks': 0}
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.app_dir, "configs", f"{name}.py")
+
+    def get(self, name: str, force_check: bool = False) -> Any:
+        """Конфиг по имени
+
+        Raises:
+            FileNotFoundError: Файла конфига нет
+            Exception: Ошибка выполнения конфига при первой загрузке
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and not force_check and now - entry.checked < self.check_interval:
+                self.stats['hits'] += 1
+                return entry.config
+
+        path = self.path(name)
+        self.stats['checks'] += 1
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Файл конфига не найден: {path}")
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        if entry is not None and entry.stamp == stamp:
+            entry.checked = now
+            return entry.config
+
+        try:
+            config = self._execute(path)
+        except Exception as e:
+            if entry is None:
+                raise Exception(f"Ошибка загрузки конфига: {e}")
+            logger.warning("Конфиг %s не применен, используется прежний: %s", name, e)
+            entry.stamp = stamp
+            entry.checked = now
+            return entry.config
+
+        with self._lock:
+            self._entries[name] = _ConfigEntry(config, stamp, now)
+            subscribers = list(self._subscribers) if entry is not None else []
+        if entry is None:
+            self.stats['loads'] += 1
+            logger.debug("Конфиг %s загружен", name)
+        else:
+            self.stats['reloads'] += 1
+            logger.info("Конфиг %s изменен и перезагружен", name)
+        for callback in subscribers:
+            try:
+                callback(name, config)
+            except Exception as e:
+                logger.warning("Ошибка в обработчике изменения конфига %s: %s", name, e)
+        return config
+
+    def get_value(self, name: str, key: str, default: Any = None) -> Any:
+        """Значение из конфига; default, если конфига или ключа нет"""
+        try:
+            return getattr(self.get(name), key, default)
+        except Exception:
+            return default
+
+    def reload(self, name: str) -> Any:
+        """Проверка файла без ожидания check_interval (например, после сохранения из GUI)"""
+        return self.get(name, force_check=True)
+
+    def poll(self) -> List[str]:
+        """Проверка всех загруженных конфигов; возвращает имена перезагруженных"""
+        with self._lock:
+            names = list(self._entries)
+        changed = []
+        for name in names:
+            before = self._entries[name].config
+            try:
+                if self.get(name, force_check=True) is not before:
+                    changed.append(name)
+            except FileNotFoundError:
+                continue
+        return changed
+
+    def invalidate(self, name: str = None):
+        """Сброс кеша конфига (всех конфигов, если имя не указано)"""
+        with self._lock:
+            if name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+    def subscribe(self, callback: Callable[[str, Any], None]) -> Callable[[], None]:
+        """Подписка на изменение конфигов: callback(name, config) вызывается в потоке,
+        обнаружившем изменение. Возвращает функцию отписки."""
+        with self._lock:
+            self._subscribers.append(callback)
+
+        def unsubscribe():
+            with self._lock:
+                if callback in self._subscribers:
+                    self._subscribers.remove(callback)
+        return unsubscribe
+
+    @staticmethod
+    def _execute(path: str) -> Any:
+        spec = importlib.util.spec_from_file_location("config", path)
+        if spec is None:
+            raise ImportError(f"Не удалось создать spec для: {path}")
+        config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(config)
+        return config
+
+
+_services: Dict[str, ConfigService] = {}
+_services_lock = threading.Lock()
+
+
+def get_config_service(app_dir: Optional[str] = None) -> ConfigService:
+    """Общий сервис конфигов каталога приложения"""
+    app_dir = os.path.abspath(app_dir or os.path.dirname(os.path.abspath(__file__)))
+    with _services_lock:
+        service = _services.get(app_dir)
+        if service is None:
+            service = _services[app_dir] = ConfigService(app_dir)
+        return service
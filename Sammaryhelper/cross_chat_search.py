@@ -0,0 +1,267 @@
+import asyncio
+import datetime
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple
+from .message_compaction import parse_date
+from .retrieval import query_terms
+from .log_utils import get_logger
+
+logger = get_logger('search')
+
+# Источники результатов
+SOURCE_LOCAL = 'local'
+SOURCE_TELEGRAM = 'telegram'
+
+# Глобальный поиск Telegram используется, если выбрано не меньше стольких чатов
+DEFAULT_GLOBAL_MIN_DIALOGS = 8
+# Глобальный поиск просматривает не больше limit * число чатов * этот множитель сообщений
+GLOBAL_SCAN_FACTOR = 10
+# Одновременных поисков по отдельным чатам
+DEFAULT_PEER_CONCURRENCY = 4
+# Предел результатов локального индекса за один запрос
+MAX_LOCAL_HITS = 2000
+
+SearchBatch = Tuple[int, List[Dict[str, Any]]]
+
+
+class SearchQuery:
+    """Параметры поиска по нескольким чатам"""
+    __slots__ = ('text', 'sender', 'date', 'reply_status', 'limit', 'dialog_ids')
+
+    def __init__(self, dialog_ids: Iterable[int], text: str = '', sender: str = '', date: str = '',
+                 reply_status: str = 'all', limit: int = 100):
+        self.dialog_ids = list(dict.fromkeys(dialog_ids))
+        self.text = (text or '').strip()
+        self.sender = (sender or '').strip()
+        self.date = (date or '').strip()
+        self.reply_status = reply_status or 'all'
+        # Лимит результатов на один чат
+        self.limit = max(1, int(limit))
+
+    @classmethod
+    def from_params(cls, params: Dict[str, Any], dialog_ids: Iterable[int]) -> 'SearchQuery':
+        """Запрос из параметров формы поиска (text, sender, date, reply_status, limit)"""
+        return cls(dialog_ids, params.get('text', ''), params.get('sender', ''), params.get('date', ''),
+                   params.get('reply_status', 'all'), params.get('limit', 100))
+
+    def date_range(self) -> Optional[Tuple[datetime.datetime, datetime.datetime]]:
+        """Интервал дат [начало, конец) в UTC для ГГГГ, ГГГГ-ММ или ГГГГ-ММ-ДД"""
+        parts = self.date.split('-')
+        if len(parts[0]) != 4:
+            return None
+        try:
+            numbers = [int(part) for part in parts]
+        except ValueError:
+            return None
+        utc = datetime.timezone.utc
+        try:
+            if len(numbers) == 3:
+                start = datetime.datetime(numbers[0], numbers[1], numbers[2], tzinfo=utc)
+                return start, start + datetime.timedelta(days=1)
+            if len(numbers) == 2:
+                start = datetime.datetime(numbers[0], numbers[1], 1, tzinfo=utc)
+                end = datetime.datetime(numbers[0] + numbers[1] // 12, numbers[1] % 12 + 1, 1, tzinfo=utc)
+                return start, end
+            if len(numbers) == 1:
+                return (datetime.datetime(numbers[0], 1, 1, tzinfo=utc),
+                        datetime.datetime(numbers[0] + 1, 1, 1, tzinfo=utc))
+        except ValueError:
+            return None
+        return None
+
+    def from_user(self) -> Any:
+        """Отправитель для фильтра на стороне Telegram: @username или числовой ID,
+        иначе None (имя проверяется локально)"""
+        if self.sender.startswith('@') and len(self.sender) > 1:
+            return self.sender
+        if self.sender.isdigit():
+            return int(self.sender)
+        return None
+
+
+def message_matches(message: Dict[str, Any], query: SearchQuery, sender_checked: bool = False) -> bool:
+    """Проверка условий, которые не выполнил источник результата
+
+    Текст проверяет сам источник (фраза в кеше или поиск Telegram);
+    здесь - отправитель (если он не отфильтрован на сервере), дата и статус ответа.
+    """
+    if query.sender and not sender_checked:
+        needle = query.sender.lstrip('@').lower()
+        if needle.isdigit():
+            if str(message.get('sender_id')) != needle:
+                return False
+        elif needle not in (message.get('sender_name') or message.get('sender') or '').lower():
+            return False
+    if query.date:
+        date = message.get('date') or ''
+        date_str = date if isinstance(date, str) else date.isoformat()
+        if query.date not in date_str:
+            return False
+    if query.reply_status == 'replied' and not message.get('replied', False):
+        return False
+    if query.reply_status == 'not_replied' and message.get('replied', False):
+        return False
+    return True
+
+
+class SearchMerger:
+    """Результаты поиска по чатам без повторов
+
+    Сообщение, найденное обоими источниками, учитывается один раз (по паре
+    dialog_id, id); в каждом чате хранится не больше limit результатов.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.results: Dict[int, List[Dict[str, Any]]] = {}
+        self.sources = {SOURCE_LOCAL: 0, SOURCE_TELEGRAM: 0}
+        self._seen = set()
+
+    def add(self, dialog_id: int, messages: List[Dict[str, Any]], source: str) -> List[Dict[str, Any]]:
+        """Добавление найденных сообщений; возвращает новые"""
+        bucket = self.results.setdefault(dialog_id, [])
+        added = []
+        for message in messages:
+            key = (dialog_id, message['id'])
+            if key in self._seen or len(bucket) >= self.limit:
+                continue
+            self._seen.add(key)
+            message = dict(message, dialog_id=dialog_id, source=source)
+            bucket.append(message)
+            added.append(message)
+        self.sources[source] = self.sources.get(source, 0) + len(added)
+        return added
+
+    @property
+    def total(self) -> int:
+        return len(self._seen)
+
+    def sorted_results(self, by_score: bool = False) -> Dict[int, List[Dict[str, Any]]]:
+        """Результаты по чатам: от новых к старым или по убыванию близости (смысловой поиск)"""
+        def date_key(message):
+            return parse_date(message.get('date')) or datetime.datetime.min
+        results = {}
+        for dialog_id, messages in self.results.items():
+            if not messages:
+                continue
+            ordered = sorted(messages, key=date_key, reverse=True)
+            if by_score:
+                ordered.sort(key=lambda m: m.get('score', float('-inf')), reverse=True)
+            results[dialog_id] = ordered
+        return results
+
+
+async def merge_streams(streams: List[AsyncIterator[Any]],
+                        on_error: Callable[[int, BaseException], None] = None) -> AsyncIterator[Any]:
+    """Элементы нескольких асинхронных потоков в порядке поступления
+
+    Потоки читаются параллельно; ошибка одного потока передается в on_error
+    (номер потока, исключение) и не прерывает остальные. При закрытии
+    генератора незавершенные потоки отменяются.
+    """
+    queue = asyncio.Queue()
+    finished = object()
+
+    async def pump(number, stream):
+        try:
+            async for item in stream:
+                await queue.put(item)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if on_error:
+                on_error(number, e)
+            else:
+                logger.warning("Ошибка в потоке результатов %d: %s", number, e)
+        finally:
+            queue.put_nowait(finished)
+
+    tasks = [asyncio.ensure_future(pump(number, stream)) for number, stream in enumerate(streams)]
+    remaining = len(tasks)
+    try:
+        while remaining:
+            item = await queue.get()
+            if item is finished:
+                remaining -= 1
+                continue
+            yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def group_by_dialog(messages: List[Dict[str, Any]]) -> List[SearchBatch]:
+    """Группировка результатов с полем dialog_id по чатам с сохранением порядка"""
+    groups = {}
+    for message in messages:
+        groups.setdefault(message['dialog_id'], []).append(message)
+    return list(groups.items())
+
+
+async def local_index_hits(db_handler, account_id: str, query: SearchQuery) -> AsyncIterator[SearchBatch]:
+    """Поиск фразы по кешу сообщений в БД
+
+    Полнотекстовый индекс находит сообщения с любым из слов запроса (так он
+    нужен для подбора контекста ИИ), поэтому кандидаты проверяются на
+    вхождение всей фразы, как при поиске в загруженных сообщениях.
+    """
+    terms = query_terms(query.text)
+    if not (db_handler and account_id and terms):
+        return
+    limit = min(query.limit * len(query.dialog_ids), MAX_LOCAL_HITS)
+    hits = await db_handler.search_cached_messages(terms, query.dialog_ids, account_id, limit)
+    phrase = query.text.lower()
+    matched = [hit for hit in hits or [] if phrase in (hit.get('text') or '').lower()]
+    for batch in group_by_dialog(matched):
+        yield batch
+
+
+async def semantic_index_hits(ai_manager, query: SearchQuery) -> AsyncIterator[SearchBatch]:
+    """Смысловой поиск по векторному индексу (только сообщения с известным текстом)"""
+    if not query.text:
+        return
+    k = min(query.limit * len(query.dialog_ids), MAX_LOCAL_HITS)
+    hits = await ai_manager.search_semantic(query.text, query.dialog_ids, k=k)
+    messages = [dict(hit, id=hit['message_id']) for hit in hits if hit.get('text')]
+    for batch in group_by_dialog(messages):
+        yield batch
+
+
+class CrossChatSearch:
+    """Поиск по нескольким чатам из нескольких источников одновременно
+
+    Источники (локальный индекс, поиск Telegram) - асинхронные потоки пакетов
+    (dialog_id, сообщения). Пакеты объединяются по мере поступления, повторы
+    отбрасываются, условия, не выполненные источником, проверяются локально.
+    """
+
+    def __init__(self, query: SearchQuery, sources: Dict[str, AsyncIterator[SearchBatch]],
+                 server_side_sender: bool = False):
+        self.query = query
+        self.sources = sources
+        # Отправитель уже отфильтрован Telegram (from_user)
+        self.server_side_sender = server_side_sender
+        self.merger = SearchMerger(query.limit)
+        self.errors: Dict[str, BaseException] = {}
+
+    async def run(self) -> AsyncIterator[Tuple[str, int, List[Dict[str, Any]]]]:
+        """Новые результаты по мере поступления: (источник, dialog_id, сообщения)"""
+        names = list(self.sources)
+        wanted = set(self.query.dialog_ids)
+
+        async def tagged(name, stream):
+            async for dialog_id, messages in stream:
+                yield name, dialog_id, messages
+
+        def on_error(number, error):
+            self.errors[names[number]] = error
+            logger.warning("Источник поиска %s недоступен: %s", names[number], error)
+
+        async for source, dialog_id, messages in merge_streams(
+                [tagged(name, stream) for name, stream in self.sources.items()], on_error):
+            if dialog_id not in wanted:
+                continue
+            sender_checked = source == SOURCE_TELEGRAM and self.server_side_sender
+            matched = [m for m in messages if message_matches(m, self.query, sender_checked)]
+            added = self.merger.add(dialog_id, matched, source)
+            if added:
+                yield source, dialog_id, added
@@ -11,6 +11,10 @@ except ImportError:
     print("Для установки выполните: pip install asyncpg")
 
 from typing import Dict, List, Any, Optional, Tuple
+from .log_utils import get_logger, lazy
+from .config_service import get_config_service
+
+logger = get_logger('db')
 
 # Кастомный JSONEncoder для обработки datetime
 class DateTimeEncoder(json.JSONEncoder):
@@ -27,34 +31,29 @@ class DatabaseHandler:
         self.connection_pool = None
         self.debug = debug
         self.app_dir = app_dir or os.path.dirname(os.path.abspath(__file__))
-        self.config_name = config_name or 'config_0707'  # Используем имя конфига по умолчанию
+        self.config_name = config_name
         self.config = self._load_config()
         
-    def log(self, message):
+    def log(self, message, *args, sample: int = None):
         """Логирование сообщений"""
         if self.debug:
-            print(f"[DB] {message}")
+            logger.debug(message, *args, extra={'sample': sample})
     
     def _load_config(self) -> Dict[str, Any]:
         """Загрузка конфигурации подключения к БД из основного конфига"""
         try:
-            # Загружаем основной конфиг
-            config_path = os.path.join(self.app_dir, "configs", f"{self.config_name}.py")
-            if os.path.exists(config_path):
-                # Импортируем модуль конфигурации
-                import importlib.util
-                spec = importlib.util.spec_from_file_location("config", config_path)
-                config = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(config)
+            # Основной конфиг берется из общего кеша (тот же объект, что у клиента Telegram)
+            if self.config_name:
+                config = get_config_service(self.app_dir).get(self.config_name)
                 
                 # Проверяем, есть ли настройки базы данных в конфиге
                 if hasattr(config, 'db_settings'):
-                    self.log(f"Загружены настройки БД из конфига: {config_path}")
+                    self.log("Загружены настройки БД из конфига: %s", self.config_name)
                     return config.db_settings
                 else:
-                    self.log(f"В конфиге отсутствуют настройки БД, используем настройки по умолчанию")
+                    self.log("В конфиге отсутствуют настройки БД, используем настройки по умолчанию")
             else:
-                self.log(f"Файл конфига не найден: {config_path}")
+                self.log("Конфиг не указан, используем настройки БД по умолчанию")
             
             # Если не удалось загрузить настройки, возвращаем значения по умолчанию
             return {
@@ -65,7 +64,7 @@ class DatabaseHandler:
                 "password": "postgres"
             }
         except Exception as e:
-            self.log(f"Ошибка при загрузке конфигурации БД: {e}")
+            self.log("Ошибка при загрузке конфигурации БД: %s", e)
             return {
                 "host": "localhost",
                 "port": 5432,
@@ -81,7 +80,8 @@ class DatabaseHandler:
             return False
             
         try:
-            self.log(f"Подключение к базе данных: {self.config.get('host')}:{self.config.get('port')}/{self.config.get('database')}")
+            self.log("Подключение к базе данных: %s:%s/%s",
+                     self.config.get('host'), self.config.get('port'), self.config.get('database'))
             self.connection_pool = await asyncpg.create_pool(
                 host=self.config.get("host"),
                 port=self.config.get("port"),
@@ -96,7 +96,7 @@ class DatabaseHandler:
             await self._create_tables()
             return True
         except Exception as e:
-            self.log(f"Ошибка при подключении к базе данных: {e}")
+            self.log("Ошибка при подключении к базе данных: %s", e)
             return False
     
     async def _create_tables(self):
@@ -125,9 +125,9 @@ class DatabaseHandler:
                     WHERE table_name = 'messages' AND column_name = 'message_thread_id'
                 ''')
                 column_exists = column_check is not None
-                self.log(f"Проверка наличия колонки message_thread_id: {column_exists}")
+                self.log("Проверка наличия колонки message_thread_id: %s", column_exists)
             except Exception as e:
-                self.log(f"Ошибка при проверке колонки message_thread_id: {e}")
+                self.log("Ошибка при проверке колонки message_thread_id: %s", e)
             
             # Если таблица messages не существует, создаем её с нужной структурой
             if not column_exists:
@@ -149,7 +149,7 @@ class DatabaseHandler:
                         await connection.execute('ALTER TABLE messages ADD COLUMN message_thread_id BIGINT')
                         self.log("Колонка message_thread_id успешно добавлена")
                     except Exception as e:
-                        self.log(f"Не удалось добавить колонку message_thread_id: {e}")
+                        self.log("Не удалось добавить колонку message_thread_id: %s", e)
                 else:
                     # Таблица не существует, создаем с нужной структурой
                     self.log("Таблица messages не существует, создаем новую")
@@ -172,6 +172,12 @@ class DatabaseHandler:
             else:
                 self.log("Колонка message_thread_id уже существует в таблице messages")
             
+            # Полнотекстовый индекс по тексту сообщений для поиска контекста к вопросам
+            await connection.execute('''
+                CREATE INDEX IF NOT EXISTS messages_text_fts_idx
+                ON messages USING GIN (to_tsvector('russian', coalesce(text, '')))
+            ''')
+            
             # Таблица для кеширования тем
             await connection.execute('''
                 CREATE TABLE IF NOT EXISTS topics (
@@ -213,15 +219,85 @@ class DatabaseHandler:
                     UNIQUE (request_id)
                 )
             ''')
+            
+            # Таблица учета токенов, задержек и стоимости запросов к ИИ
+            await connection.execute('''
+                CREATE TABLE IF NOT EXISTS ai_usage (
+                    id SERIAL PRIMARY KEY,
+                    account_id TEXT NOT NULL,
+                    dialog_id BIGINT,
+                    model TEXT NOT NULL,
+                    operation TEXT NOT NULL,
+                    prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                    completion_tokens INTEGER NOT NULL DEFAULT 0,
+                    latency DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    cache_hit BOOLEAN NOT NULL DEFAULT FALSE,
+                    cost DOUBLE PRECISION NOT NULL DEFAULT 0,
+                    created_at TIMESTAMP NOT NULL DEFAULT NOW()
+                )
+            ''')
+            await connection.execute('''
+                CREATE INDEX IF NOT EXISTS ai_usage_account_created_idx ON ai_usage (account_id, created_at)
+            ''')
+
+            # Таблица для кеширования участников чатов
+            await connection.execute('''
+                CREATE TABLE IF NOT EXISTS participants (
+                    id BIGINT NOT NULL,
+                    dialog_id BIGINT NOT NULL,
+                    account_id TEXT NOT NULL,
+                    username TEXT,
+                    first_name TEXT,
+                    last_name TEXT,
+                    data JSONB NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (id, dialog_id, account_id)
+                )
+            ''')
+
+            # Время последней полной загрузки участников чата (UTC): по нему решается, свеж ли кеш
+            await connection.execute('''
+                CREATE TABLE IF NOT EXISTS participants_fetches (
+                    dialog_id BIGINT NOT NULL,
+                    account_id TEXT NOT NULL,
+                    fetched_at TIMESTAMP NOT NULL,
+                    PRIMARY KEY (dialog_id, account_id)
+                )
+            ''')
+
+            # Контрольные точки пакетного дайджеста: результат по каждому диалогу задания
+            await connection.execute('''
+                CREATE TABLE IF NOT EXISTS digest_checkpoints (
+                    job_id TEXT NOT NULL,
+                    dialog_id BIGINT NOT NULL,
+                    account_id TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    last_message_id BIGINT,
+                    data JSONB NOT NULL,
+                    updated_at TIMESTAMP NOT NULL DEFAULT NOW(),
+                    PRIMARY KEY (job_id, dialog_id, account_id)
+                )
+            ''')
+
+            # Подписи MinHash сообщений для поиска почти одинаковых текстов
+            await connection.execute('''
+                CREATE TABLE IF NOT EXISTS message_signatures (
+                    dialog_id BIGINT NOT NULL,
+                    message_id BIGINT NOT NULL,
+                    account_id TEXT NOT NULL,
+                    signature BYTEA NOT NULL,
+                    PRIMARY KEY (dialog_id, message_id, account_id)
+                )
+            ''')
     
     async def cache_dialogs(self, dialogs: List[Dict[str, Any]], account_id: str) -> bool:
         """Кеширование списка диалогов"""
         try:
-            self.log(f"Кеширование {len(dialogs)} диалогов для аккаунта {account_id}")
+            self.log("Кеширование %s диалогов для аккаунта %s", len(dialogs), account_id)
             async with self.connection_pool.acquire() as connection:
                 async with connection.transaction():
                     for dialog in dialogs:
-                        self.log(f"Кеширование диалога: {dialog['name']} (ID: {dialog['id']})")
+                        self.log("Кеширование диалога: %s (ID: %s)", dialog['name'], dialog['id'], sample=100)
                         await connection.execute('''
                             INSERT INTO dialogs (id, name, type, folder_id, account_id, data)
                             VALUES ($1, $2, $3, $4, $5, $6)
@@ -239,16 +315,16 @@ class DatabaseHandler:
                         dialog.get('folder_id'), 
                         account_id,
                         json.dumps(dialog))
-            self.log(f"Кеширование диалогов завершено успешно")
+            self.log("Кеширование диалогов завершено успешно")
             return True
         except Exception as e:
-            self.log(f"Ошибка при кешировании диалогов: {e}")
+            self.log("Ошибка при кешировании диалогов: %s", e)
             return False
     
     async def get_cached_dialogs(self, account_id: str, limit: int = None) -> List[Dict[str, Any]]:
         """Получение кешированных диалогов"""
         try:
-            self.log(f"Получение кешированных диалогов для аккаунта {account_id}, лимит: {limit}")
+            self.log("Получение кешированных диалогов для аккаунта %s, лимит: %s", account_id, limit)
             async with self.connection_pool.acquire() as connection:
                 # Добавляем LIMIT в SQL-запрос, если limit задан
                 query = '''
@@ -260,23 +336,23 @@ class DatabaseHandler:
                 # Добавляем ограничение, если указан limit
                 if limit:
                     query += f" LIMIT {limit}"
-                    self.log(f"SQL запрос с лимитом {limit}: {query}")
+                    self.log("SQL запрос с лимитом %s: %s", limit, query)
                 else:
-                    self.log(f"SQL запрос без лимита: {query}")
+                    self.log("SQL запрос без лимита: %s", query)
                     
                 rows = await connection.fetch(query, account_id)
                 
                 result = [json.loads(row['data']) for row in rows]
-                self.log(f"Получено {len(result)} кешированных диалогов из БД")
+                self.log("Получено %s кешированных диалогов из БД", len(result))
                 return result
         except Exception as e:
-            self.log(f"Ошибка при получении кешированных диалогов: {e}")
+            self.log("Ошибка при получении кешированных диалогов: %s", e)
             return []
     
     async def cache_messages(self, messages: List[Dict[str, Any]], dialog_id: int, account_id: str) -> bool:
         """Кеширование сообщений диалога"""
         try:
-            self.log(f"Кеширование {len(messages)} сообщений для диалога {dialog_id}")
+            self.log("Кеширование %s сообщений для диалога %s", len(messages), dialog_id)
             
             # Проверяем наличие колонки message_thread_id
             column_exists = False
@@ -287,9 +363,9 @@ class DatabaseHandler:
                         WHERE table_name = 'messages' AND column_name = 'message_thread_id'
                     ''')
                     column_exists = column_check is not None
-                    self.log(f"Проверка наличия колонки message_thread_id для кеширования: {column_exists}")
+                    self.log("Проверка наличия колонки message_thread_id для кеширования: %s", column_exists)
                 except Exception as e:
-                    self.log(f"Ошибка при проверке колонки message_thread_id: {e}")
+                    self.log("Ошибка при проверке колонки message_thread_id: %s", e)
                 
                 async with connection.transaction():
                     for message in messages:
@@ -310,7 +386,7 @@ class DatabaseHandler:
                                     message_date = datetime.datetime.fromisoformat(message_date)
                             except ValueError:
                                 # Если не удалось распарсить, используем текущую дату
-                                self.log(f"Не удалось распарсить дату: {message_date}, используем текущую")
+                                self.log("Не удалось распарсить дату: %s, используем текущую", message_date)
                                 message_date = datetime.datetime.now()
                         elif isinstance(message_date, datetime.datetime):
                             # Если это уже datetime объект, убедимся что у него нет tzinfo
@@ -320,9 +396,10 @@ class DatabaseHandler:
                         # Если date всё еще не datetime, используем текущее время
                         if not isinstance(message_date, datetime.datetime):
                             message_date = datetime.datetime.now()
-                            self.log(f"Дата не является объектом datetime, используем текущую: {message_date}")
+                            self.log("Дата не является объектом datetime, используем текущую: %s", message_date)
                         
-                        self.log(f"Дата для сообщения ID {message['id']}: {message_date} (тип: {type(message_date)})")
+                        self.log("Дата для сообщения ID %s: %s (тип: %s)", message['id'], message_date,
+                                 lazy(type, message_date), sample=100)
                         
                         # Получаем ID темы сообщения, если есть
                         message_thread_id = message.get('message_thread_id')
@@ -374,10 +451,10 @@ class DatabaseHandler:
                             account_id,
                             data_json)
             
-            self.log(f"Сообщения успешно кешированы")
+            self.log("Сообщения успешно кешированы")
             return True
         except Exception as e:
-            self.log(f"Ошибка при кешировании сообщений: {e}")
+            self.log("Ошибка при кешировании сообщений: %s", e)
             import traceback
             self.log(traceback.format_exc())
             return False
@@ -385,7 +462,7 @@ class DatabaseHandler:
     async def get_cached_messages(self, dialog_id: int, account_id: str) -> List[Dict[str, Any]]:
         """Получение кешированных сообщений диалога"""
         try:
-            self.log(f"Получение кешированных сообщений для диалога {dialog_id}")
+            self.log("Получение кешированных сообщений для диалога %s", dialog_id)
             async with self.connection_pool.acquire() as connection:
                 rows = await connection.fetch('''
                     SELECT data FROM messages 
@@ -394,16 +471,85 @@ class DatabaseHandler:
                 ''', dialog_id, account_id)
                 
                 result = [json.loads(row['data']) for row in rows]
-                self.log(f"Получено {len(result)} кешированных сообщений")
+                self.log("Получено %s кешированных сообщений", len(result))
+                return result
+        except Exception as e:
+            self.log("Ошибка при получении кешированных сообщений: %s", e)
+            return []
+    
+    async def search_cached_messages(self, terms: List[str], dialog_ids: List[int], account_id: str,
+                                     limit: int = 200) -> Optional[List[Dict[str, Any]]]:
+        """Полнотекстовый поиск по кешированным сообщениям выбранных диалогов
+        
+        Args:
+            terms: Слова запроса, совпадение любого из них (с учетом словоформ)
+            dialog_ids: ID диалогов для поиска
+            account_id: ID аккаунта
+            limit: Максимальное количество результатов
+            
+        Returns:
+            Optional[List[Dict[str, Any]]]: Сообщения с полями dialog_id и rank по убыванию релевантности,
+            None при ошибке
+        """
+        if not terms or not dialog_ids:
+            return []
+        tsquery = ' | '.join(f'{term}:*' for term in terms)
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch('''
+                    SELECT m.data, m.dialog_id, d.name AS dialog_name,
+                           ts_rank_cd(to_tsvector('russian', coalesce(m.text, '')), q) AS rank
+                    FROM messages m
+                    CROSS JOIN to_tsquery('russian', $1) q
+                    LEFT JOIN dialogs d ON d.id = m.dialog_id AND d.account_id = m.account_id
+                    WHERE m.account_id = $2
+                      AND m.dialog_id = ANY($3::BIGINT[])
+                      AND to_tsvector('russian', coalesce(m.text, '')) @@ q
+                    ORDER BY rank DESC, m.date DESC
+                    LIMIT $4
+                ''', tsquery, account_id, list(dialog_ids), limit)
+                
+                result = []
+                for row in rows:
+                    message = json.loads(row['data'])
+                    message['dialog_id'] = row['dialog_id']
+                    message['dialog_name'] = row['dialog_name']
+                    message['rank'] = row['rank']
+                    result.append(message)
+                self.log("Полнотекстовый поиск: найдено %s сообщений", len(result))
                 return result
         except Exception as e:
-            self.log(f"Ошибка при получении кешированных сообщений: {e}")
+            self.log("Ошибка при полнотекстовом поиске сообщений: %s", e)
+            return None
+    
+    async def get_cached_messages_by_ids(self, keys: List[Tuple[int, int]], account_id: str) -> List[Dict[str, Any]]:
+        """Получение кешированных сообщений по парам (dialog_id, message_id)"""
+        if not keys:
+            return []
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch('''
+                    SELECT m.data, m.dialog_id
+                    FROM messages m
+                    JOIN unnest($1::BIGINT[], $2::BIGINT[]) AS k(dialog_id, id)
+                      ON m.dialog_id = k.dialog_id AND m.id = k.id
+                    WHERE m.account_id = $3
+                ''', [k[0] for k in keys], [k[1] for k in keys], account_id)
+                
+                result = []
+                for row in rows:
+                    message = json.loads(row['data'])
+                    message['dialog_id'] = row['dialog_id']
+                    result.append(message)
+                return result
+        except Exception as e:
+            self.log("Ошибка при получении сообщений по ID: %s", e)
             return []
     
     async def cache_topics(self, topics: List[Dict[str, Any]], dialog_id: int, account_id: str) -> bool:
         """Кеширование тем для супергруппы"""
         try:
-            self.log(f"Кеширование {len(topics)} тем для диалога {dialog_id}")
+            self.log("Кеширование %s тем для диалога %s", len(topics), dialog_id)
             async with self.connection_pool.acquire() as connection:
                 async with connection.transaction():
                     for topic in topics:
@@ -432,10 +578,10 @@ class DatabaseHandler:
                         topic.get('unread_mentions_count', 0),
                         account_id,
                         data_json)
-            self.log(f"Темы успешно кешированы")
+            self.log("Темы успешно кешированы")
             return True
         except Exception as e:
-            self.log(f"Ошибка при кешировании тем: {e}")
+            self.log("Ошибка при кешировании тем: %s", e)
             import traceback
             self.log(traceback.format_exc())
             return False
@@ -443,7 +589,7 @@ class DatabaseHandler:
     async def get_cached_topics(self, dialog_id: int, account_id: str) -> List[Dict[str, Any]]:
         """Получение кешированных тем для супергруппы"""
         try:
-            self.log(f"Получение кешированных тем для диалога {dialog_id}")
+            self.log("Получение кешированных тем для диалога %s", dialog_id)
             async with self.connection_pool.acquire() as connection:
                 rows = await connection.fetch('''
                     SELECT data FROM topics 
@@ -452,18 +598,182 @@ class DatabaseHandler:
                 ''', dialog_id, account_id)
                 
                 result = [json.loads(row['data']) for row in rows]
-                self.log(f"Получено {len(result)} кешированных тем")
+                self.log("Получено %s кешированных тем", len(result))
                 return result
         except Exception as e:
-            self.log(f"Ошибка при получении кешированных тем: {e}")
+            self.log("Ошибка при получении кешированных тем: %s", e)
             import traceback
             self.log(traceback.format_exc())
             return []
             
+    async def cache_participants(self, participants: List[Dict[str, Any]], dialog_id: int, account_id: str,
+                                 fetched_at: datetime.datetime) -> bool:
+        """Замена кешированного списка участников чата результатом полной загрузки
+
+        Все записи получают updated_at = fetched_at (время начала загрузки, UTC), записи
+        участников, не попавших в загрузку (вышли из чата), удаляются, а время загрузки
+        сохраняется в participants_fetches. Все выполняется одной транзакцией.
+        """
+        try:
+            self.log("Кеширование %s участников для диалога %s", len(participants), dialog_id)
+            rows = [
+                (p['id'], dialog_id, account_id, p.get('username'), p.get('first_name'), p.get('last_name'),
+                 json.dumps(p, cls=DateTimeEncoder, ensure_ascii=False), fetched_at)
+                for p in participants
+            ]
+            async with self.connection_pool.acquire() as connection:
+                async with connection.transaction():
+                    await connection.executemany('''
+                        INSERT INTO participants (id, dialog_id, account_id, username, first_name, last_name,
+                                                  data, updated_at)
+                        VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+                        ON CONFLICT (id, dialog_id, account_id)
+                        DO UPDATE SET
+                            username = $4,
+                            first_name = $5,
+                            last_name = $6,
+                            data = $7,
+                            updated_at = $8
+                    ''', rows)
+                    await connection.execute('''
+                        DELETE FROM participants
+                        WHERE dialog_id = $1 AND account_id = $2 AND updated_at < $3
+                    ''', dialog_id, account_id, fetched_at)
+                    await connection.execute('''
+                        INSERT INTO participants_fetches (dialog_id, account_id, fetched_at)
+                        VALUES ($1, $2, $3)
+                        ON CONFLICT (dialog_id, account_id)
+                        DO UPDATE SET fetched_at = GREATEST(participants_fetches.fetched_at, $3)
+                    ''', dialog_id, account_id, fetched_at)
+            return True
+        except Exception as e:
+            self.log("Ошибка при кешировании участников: %s", e)
+            import traceback
+            self.log(traceback.format_exc())
+            return False
+
+    async def get_cached_participants(self, dialog_id: int, account_id: str,
+                                      max_age: Optional[float] = None) -> Optional[List[Dict[str, Any]]]:
+        """Получение кешированных участников чата
+
+        Args:
+            max_age: Максимальный возраст кеша в секундах; если последняя полная загрузка
+                старше, возвращается None и список нужно обновить из Telegram
+
+        Returns:
+            Optional[List[Dict[str, Any]]]: Участники или None, если кеша нет или он устарел
+        """
+        try:
+            async with self.connection_pool.acquire() as connection:
+                fetched_at = await connection.fetchval('''
+                    SELECT fetched_at FROM participants_fetches
+                    WHERE dialog_id = $1 AND account_id = $2
+                ''', dialog_id, account_id)
+                if fetched_at is None:
+                    return None
+                age = (datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) - fetched_at).total_seconds()
+                if max_age is not None and age > max_age:
+                    self.log("Кеш участников диалога %s устарел", dialog_id)
+                    return None
+                rows = await connection.fetch('''
+                    SELECT data FROM participants
+                    WHERE dialog_id = $1 AND account_id = $2
+                    ORDER BY id
+                ''', dialog_id, account_id)
+            result = [json.loads(row['data']) for row in rows]
+            self.log("Получено %s кешированных участников", len(result))
+            return result
+        except Exception as e:
+            self.log("Ошибка при получении кешированных участников: %s", e)
+            return None
+
+    async def save_digest_checkpoint(self, job_id: str, result: Dict[str, Any], account_id: str) -> bool:
+        """Сохранение результата обработки диалога в задании дайджеста"""
+        try:
+            async with self.connection_pool.acquire() as connection:
+                await connection.execute('''
+                    INSERT INTO digest_checkpoints (job_id, dialog_id, account_id, status, last_message_id, data)
+                    VALUES ($1, $2, $3, $4, $5, $6)
+                    ON CONFLICT (job_id, dialog_id, account_id)
+                    DO UPDATE SET
+                        status = $4,
+                        last_message_id = $5,
+                        data = $6,
+                        updated_at = NOW()
+                ''', job_id, result['dialog_id'], account_id, result['status'], result.get('last_message_id'),
+                json.dumps(result, cls=DateTimeEncoder, ensure_ascii=False))
+            return True
+        except Exception as e:
+            self.log("Ошибка при сохранении контрольной точки дайджеста: %s", e)
+            return False
+
+    async def get_digest_checkpoints(self, job_id: str, account_id: str) -> Dict[int, Dict[str, Any]]:
+        """Результаты уже обработанных диалогов задания дайджеста"""
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch('''
+                    SELECT dialog_id, data FROM digest_checkpoints
+                    WHERE job_id = $1 AND account_id = $2
+                ''', job_id, account_id)
+            return {row['dialog_id']: json.loads(row['data']) for row in rows}
+        except Exception as e:
+            self.log("Ошибка при получении контрольных точек дайджеста: %s", e)
+            return {}
+
+    async def get_digest_positions(self, dialog_ids: List[int], account_id: str) -> Dict[int, int]:
+        """ID последнего сообщения, вошедшего в дайджест, по каждому диалогу"""
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch('''
+                    SELECT dialog_id, MAX(last_message_id) AS last_message_id FROM digest_checkpoints
+                    WHERE dialog_id = ANY($1::bigint[]) AND account_id = $2
+                        AND status IN ('done', 'empty') AND last_message_id IS NOT NULL
+                    GROUP BY dialog_id
+                ''', dialog_ids, account_id)
+            return {row['dialog_id']: row['last_message_id'] for row in rows}
+        except Exception as e:
+            self.log("Ошибка при получении позиций дайджеста: %s", e)
+            return {}
+
+    async def get_message_signatures(self, keys: List[Tuple[int, int]], account_id: str) -> Dict[Tuple[int, int], bytes]:
+        """Сохраненные подписи MinHash по парам (dialog_id, message_id)"""
+        if not keys:
+            return {}
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch('''
+                    SELECT s.dialog_id, s.message_id, s.signature
+                    FROM message_signatures s
+                    JOIN unnest($1::BIGINT[], $2::BIGINT[]) AS k(dialog_id, id)
+                      ON s.dialog_id = k.dialog_id AND s.message_id = k.id
+                    WHERE s.account_id = $3
+                ''', [k[0] for k in keys], [k[1] for k in keys], account_id)
+            return {(row['dialog_id'], row['message_id']): bytes(row['signature']) for row in rows}
+        except Exception as e:
+            self.log("Ошибка при получении подписей сообщений: %s", e)
+            return {}
+
+    async def save_message_signatures(self, rows: List[Tuple[int, int, bytes]], account_id: str) -> bool:
+        """Сохранение подписей MinHash: строки (dialog_id, message_id, signature)"""
+        if not rows:
+            return True
+        try:
+            async with self.connection_pool.acquire() as connection:
+                await connection.executemany('''
+                    INSERT INTO message_signatures (dialog_id, message_id, account_id, signature)
+                    VALUES ($1, $2, $3, $4)
+                    ON CONFLICT (dialog_id, message_id, account_id)
+                    DO UPDATE SET signature = $4
+                ''', [(dialog_id, message_id, account_id, signature) for dialog_id, message_id, signature in rows])
+            return True
+        except Exception as e:
+            self.log("Ошибка при сохранении подписей сообщений: %s", e)
+            return False
+
     async def get_cached_messages_by_topic(self, dialog_id: int, topic_id: int, account_id: str) -> List[Dict[str, Any]]:
         """Получение кешированных сообщений по теме"""
         try:
-            self.log(f"Получение кешированных сообщений для темы {topic_id} в диалоге {dialog_id}")
+            self.log("Получение кешированных сообщений для темы %s в диалоге %s", topic_id, dialog_id)
             
             # Проверяем наличие колонки message_thread_id
             async with self.connection_pool.acquire() as connection:
@@ -484,11 +794,11 @@ class DatabaseHandler:
                 ''', dialog_id, account_id, topic_id)
                 
                 result = [json.loads(row['data']) for row in rows]
-                self.log(f"Получено {len(result)} кешированных сообщений для темы")
+                self.log("Получено %s кешированных сообщений для темы", len(result))
                 return result
                 
         except Exception as e:
-            self.log(f"Ошибка при получении кешированных сообщений темы: {e}")
+            self.log("Ошибка при получении кешированных сообщений темы: %s", e)
             import traceback
             self.log(traceback.format_exc())
             return []
@@ -538,6 +848,79 @@ class DatabaseHandler:
             print(f"Ошибка при получении кешированного ответа ИИ: {e}")
             return None
     
+    async def get_cached_ai_queries(self, context: str, model: str, system_prompt: str, account_id: str,
+                                    limit: int = 64) -> List[Tuple[str, str]]:
+        """Последние запросы и ответы ИИ для того же контекста, модели и промпта"""
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch('''
+                    SELECT q.user_query, r.response FROM ai_responses r
+                    JOIN ai_requests q ON r.request_id = q.id
+                    WHERE q.context = $1
+                    AND q.model = $2
+                    AND q.system_prompt = $3
+                    AND q.account_id = $4
+                    ORDER BY q.created_at DESC
+                    LIMIT $5
+                ''', context, model, system_prompt, account_id, limit)
+                return [(row['user_query'], row['response']) for row in rows]
+        except Exception as e:
+            self.log("Ошибка при получении кешированных запросов ИИ: %s", e)
+            return []
+    
+    async def log_ai_usage(self, record: Dict[str, Any], account_id: str) -> bool:
+        """Сохранение записи об использовании ИИ"""
+        try:
+            async with self.connection_pool.acquire() as connection:
+                await connection.execute('''
+                    INSERT INTO ai_usage (account_id, dialog_id, model, operation, prompt_tokens,
+                                          completion_tokens, latency, cache_hit, cost)
+                    VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+                ''',
+                account_id,
+                record.get('dialog_id'),
+                record['model'],
+                record['operation'],
+                record['prompt_tokens'],
+                record['completion_tokens'],
+                record['latency'],
+                record['cache_hit'],
+                record['cost'])
+            return True
+        except Exception as e:
+            self.log("Ошибка при сохранении статистики ИИ: %s", e)
+            return False
+    
+    async def get_ai_usage_summary(self, account_id: str, group_by: str = 'model') -> Optional[List[Dict[str, Any]]]:
+        """Агрегированная статистика использования ИИ по модели, диалогу, дню или операции"""
+        group_columns = {
+            'model': 'model',
+            'dialog': 'dialog_id',
+            'day': "to_char(created_at, 'YYYY-MM-DD')",
+            'operation': 'operation',
+        }
+        if group_by not in group_columns:
+            raise ValueError(f"Неизвестная группировка: {group_by}")
+        try:
+            async with self.connection_pool.acquire() as connection:
+                rows = await connection.fetch(f'''
+                    SELECT {group_columns[group_by]} AS key,
+                           COUNT(*) AS calls,
+                           COUNT(*) FILTER (WHERE cache_hit) AS cache_hits,
+                           SUM(prompt_tokens) AS prompt_tokens,
+                           SUM(completion_tokens) AS completion_tokens,
+                           AVG(latency) AS avg_latency,
+                           SUM(cost) AS cost
+                    FROM ai_usage
+                    WHERE account_id = $1
+                    GROUP BY 1
+                    ORDER BY cost DESC
+                ''', account_id)
+                return [dict(row) for row in rows]
+        except Exception as e:
+            self.log("Ошибка при получении статистики ИИ: %s", e)
+            return None
+    
     async def close(self):
         """Закрытие подключения к базе данных"""
         if self.connection_pool:
@@ -0,0 +1,147 @@
+import math
+from collections import Counter
+from typing import List, Dict, Any, Union
+from .text_utils import estimate_tokens, normalize_text, tokenize
+from .message_compaction import format_message
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Режимы генерации саммари
+SUMMARY_MODE_LLM = 'none'                # только LLM, без экстрактивного этапа
+SUMMARY_MODE_EXTRACTIVE = 'extractive'   # только экстрактивный отбор, без обращения к модели
+SUMMARY_MODE_EXTRACTIVE_LLM = 'extractive_llm'  # отбор сообщений, затем LLM
+SUMMARY_MODES = (SUMMARY_MODE_LLM, SUMMARY_MODE_EXTRACTIVE, SUMMARY_MODE_EXTRACTIVE_LLM)
+
+# Бюджет токенов по умолчанию для отобранных сообщений
+DEFAULT_TOKEN_BUDGET = 12000
+
+# Служебные слова, не влияющие на тему сообщения
+STOP_WORDS = {
+    'и', 'в', 'во', 'не', 'что', 'он', 'на', 'я', 'с', 'со', 'как', 'а', 'то', 'все', 'она', 'так', 'его',
+    'но', 'да', 'ты', 'к', 'у', 'же', 'вы', 'за', 'бы', 'по', 'только', 'ее', 'мне', 'было', 'вот', 'от',
+    'меня', 'еще', 'нет', 'о', 'из', 'ему', 'теперь', 'когда', 'даже', 'ну', 'ли', 'если', 'уже', 'или',
+    'быть', 'был', 'него', 'до', 'вас', 'там', 'потом', 'себя', 'это', 'этот', 'эта', 'эти', 'для', 'мы',
+    'они', 'тут', 'где', 'есть', 'надо', 'ней', 'чем', 'была', 'сам', 'чтоб', 'чтобы', 'без', 'будто', 'чего',
+    'the', 'a', 'an', 'and', 'or', 'of', 'to', 'in', 'is', 'it', 'for', 'on', 'that', 'this', 'with', 'be',
+}
+
+
+def message_terms(text: str) -> List[str]:
+    """Значимые слова сообщения"""
+    return [t for t in tokenize(text) if len(t) > 2 and t not in STOP_WORDS and not t.isdigit()]
+
+
+def score_messages(texts: List[str]) -> List[float]:
+    """Оценка информативности сообщений по TF-IDF
+
+    Оценка сообщения - косинусная близость его TF-IDF вектора к центроиду
+    всего диалога с небольшим бонусом за длину. Сообщения о главных темах
+    переписки получают наибольший вес.
+    """
+    documents = [message_terms(text) for text in texts]
+    if NUMPY_AVAILABLE:
+        return _score_numpy(documents)
+    return _score_python(documents)
+
+
+def _score_numpy(documents: List[List[str]]) -> List[float]:
+    """Векторизованный расчет оценок через разреженное представление (документ, термин)"""
+    vocabulary = {}
+    rows = []
+    cols = []
+    for doc_index, terms in enumerate(documents):
+        for term in terms:
+            rows.append(doc_index)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+    n_docs = len(documents)
+    if not cols:
+        return [0.0] * n_docs
+
+    vocab_size = len(vocabulary)
+    pairs, tf = np.unique(np.asarray(rows, dtype=np.int64) * vocab_size + np.asarray(cols, dtype=np.int64),
+                          return_counts=True)
+    doc_ids = pairs // vocab_size
+    term_ids = pairs % vocab_size
+
+    df = np.bincount(term_ids, minlength=vocab_size)
+    idf = np.log((n_docs + 1) / (df + 1)) + 1.0
+    weights = (1.0 + np.log(tf)) * idf[term_ids]
+
+    norms = np.sqrt(np.bincount(doc_ids, weights=weights ** 2, minlength=n_docs))
+    normalized = weights / norms[doc_ids]
+    centroid = np.bincount(term_ids, weights=normalized, minlength=vocab_size) / n_docs
+    centroid /= np.linalg.norm(centroid) or 1.0
+
+    similarity = np.bincount(doc_ids, weights=normalized * centroid[term_ids], minlength=n_docs)
+    lengths = np.array([len(terms) for terms in documents], dtype=np.float64)
+    return (similarity * (1.0 + 0.1 * np.log1p(lengths))).tolist()
+
+
+def _score_python(documents: List[List[str]]) -> List[float]:
+    """Расчет оценок без NumPy"""
+    n_docs = len(documents)
+    counts = [Counter(terms) for terms in documents]
+    df = Counter()
+    for counter in counts:
+        df.update(counter.keys())
+    idf = {term: math.log((n_docs + 1) / (freq + 1)) + 1.0 for term, freq in df.items()}
+
+    vectors = []
+    centroid = Counter()
+    for counter in counts:
+        vector = {term: (1.0 + math.log(tf)) * idf[term] for term, tf in counter.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        vector = {term: w / norm for term, w in vector.items()}
+        vectors.append(vector)
+        centroid.update(vector)
+    centroid_norm = math.sqrt(sum(w * w for w in centroid.values())) or 1.0
+
+    scores = []
+    for vector, terms in zip(vectors, documents):
+        similarity = sum(w * centroid[term] for term, w in vector.items()) / centroid_norm
+        scores.append(similarity * (1.0 + 0.1 * math.log1p(len(terms))))
+    return scores
+
+
+def select_messages(messages: List[Union[str, Dict[str, Any]]], token_budget: int = DEFAULT_TOKEN_BUDGET) -> List[Any]:
+    """Отбор самых информативных сообщений в пределах бюджета токенов
+
+    Args:
+        messages: Сообщения (строки или словари с полем text) в хронологическом порядке
+        token_budget: Максимальное количество токенов в отобранных сообщениях
+
+    Returns:
+        List: Отобранные сообщения в исходном хронологическом порядке
+    """
+    if not messages:
+        return []
+    lines = [format_message(m) for m in messages]
+    costs = [estimate_tokens(line) + 1 for line in lines]
+    if sum(costs) <= token_budget:
+        return list(messages)
+
+    texts = [m.get('text', '') if isinstance(m, dict) else m for m in messages]
+    scores = score_messages(texts)
+    order = sorted(range(len(messages)), key=lambda i: scores[i], reverse=True)
+
+    selected = []
+    seen = set()
+    used = 0
+    for index in order:
+        if scores[index] <= 0:
+            break
+        if used + costs[index] > token_budget:
+            continue
+        # Почти одинаковые сообщения не тратят бюджет повторно
+        key = normalize_text(texts[index])
+        if key in seen:
+            continue
+        seen.add(key)
+        selected.append(index)
+        used += costs[index]
+    selected.sort()
+    return [messages[i] for i in selected]
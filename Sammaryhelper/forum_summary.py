@@ -0,0 +1,91 @@
+import time
+import asyncio
+import datetime
+from typing import List, Dict, Any, Optional, Callable
+from .ai_handler import PRIORITY_INTERACTIVE, is_error_response
+
+DEFAULT_TOPIC_FETCH_CONCURRENCY = 4
+DEFAULT_TOPIC_MESSAGE_LIMIT = 500
+
+
+async def load_forum_topics(client_manager, chat_id: int, account_id: str = None) -> List[Dict[str, Any]]:
+    """Список тем форума из кеша БД или из Telegram (с сохранением в кеш)"""
+    db_handler = client_manager.db_handler if client_manager.use_cache else None
+    if db_handler and account_id:
+        cached = await db_handler.get_cached_topics(chat_id, account_id)
+        if cached:
+            return cached
+    topics = await client_manager.get_topics(chat_id)
+    if topics and db_handler and account_id:
+        await db_handler.cache_topics(topics, chat_id, account_id)
+    return topics
+
+
+async def summarize_forum(client_manager, ai_manager, openai_client, chat_id: int,
+                          topics: List[Dict[str, Any]], limit: int = DEFAULT_TOPIC_MESSAGE_LIMIT,
+                          since: Optional[datetime.datetime] = None,
+                          fetch_concurrency: int = DEFAULT_TOPIC_FETCH_CONCURRENCY,
+                          priority: int = PRIORITY_INTERACTIVE, rollup: bool = True,
+                          progress_callback: Callable[[int, int, Dict[str, Any]], None] = None) -> Dict[str, Any]:
+    """Саммари форума по темам
+
+    Сообщения тем загружаются параллельно (не более fetch_concurrency запросов к
+    Telegram одновременно), саммари всех тем запрашиваются одновременно, а общий
+    лимит параллельных запросов к ИИ задает планировщик AIChatManager. Поэтому время
+    для форума из десятков тем близко ко времени саммари одной темы.
+
+    Returns:
+        Dict[str, Any]: {'topics': [{topic_id, title, message_count, summary, error}], 'overview', 'elapsed'}
+    """
+    started = time.monotonic()
+    fetch_semaphore = asyncio.Semaphore(fetch_concurrency)
+    completed = 0
+
+    async def summarize_topic(topic: Dict[str, Any]) -> Dict[str, Any]:
+        nonlocal completed
+        result = {'topic_id': topic['id'], 'title': topic.get('title') or f"Тема #{topic['id']}",
+                  'message_count': 0, 'summary': '', 'error': None}
+        try:
+            async with fetch_semaphore:
+                messages = await client_manager.get_topic_messages(chat_id, topic['id'], limit=limit, since=since)
+            result['message_count'] = len(messages)
+            if messages:
+                messages.sort(key=lambda m: m['id'])
+                summary = await ai_manager.generate_summary(messages, openai_client, priority=priority,
+                                                            dialog_id=chat_id)
+                if is_error_response(summary):
+                    result['error'] = summary
+                else:
+                    result['summary'] = summary
+        except Exception as e:
+            result['error'] = str(e)
+        completed += 1
+        if progress_callback:
+            progress_callback(completed, len(topics), result)
+        return result
+
+    results = await asyncio.gather(*(summarize_topic(topic) for topic in topics))
+    overview = ''
+    if rollup and sum(1 for r in results if r['summary']) > 1:
+        overview = await ai_manager.summarize_sections(results, openai_client, priority=priority, dialog_id=chat_id)
+    return {'topics': list(results), 'overview': overview, 'elapsed': time.monotonic() - started}
+
+
+def format_forum_digest(result: Dict[str, Any], title: str = None) -> str:
+    """Дайджест форума: общий обзор и саммари по темам"""
+    lines = [f"# {title or 'Саммари форума'}", ""]
+    if result.get('overview'):
+        lines += ["## Общий обзор", result['overview'].strip(), ""]
+    # Сначала самые активные темы
+    for topic in sorted(result['topics'], key=lambda t: t['message_count'], reverse=True):
+        if topic['summary']:
+            lines += [f"## {topic['title']} ({topic['message_count']} сообщ.)", topic['summary'].strip(), ""]
+    failed = [t for t in result['topics'] if t['error']]
+    if failed:
+        lines.append("## Ошибки")
+        lines += [f"- {t['title']}: {t['error']}" for t in failed]
+        lines.append("")
+    empty = [t['title'] for t in result['topics'] if not t['message_count'] and not t['error']]
+    if empty:
+        lines.append(f"Без новых сообщений: {', '.join(empty)}")
+    return "\n".join(lines)
@@ -93,16 +93,37 @@ import threading
 import datetime
 from functools import partial
 from typing import List, Dict, Any
-from .telegram_client import TelegramClientManager
-from .ai_handler import AIChatManager
-from .utils import load_config, get_config_files, load_settings, save_settings
-import openai
-from telethon.tl.types import Channel  # Добавляем импорт в начало файла
-from telethon import TelegramClient
+from .ui_bus import UIUpdateBus
+from .task_manager import TaskManager, PRIORITY_BACKGROUND
+from .startup import (StartupTimer, snapshot_path, load_snapshot, save_snapshot, DEFAULT_SNAPSHOT_MESSAGES,
+                      STARTUP_FIRST_FRAME, STARTUP_INTERACTIVE, STARTUP_CONNECTED)
+from .log_utils import get_logger, configure_logging, DEFAULT_LOG_CAPACITY
+from .virtual_list import VirtualTreeview
+from .record_store import RecordStore
+from .utils import get_config_files, load_settings, save_settings
+from .config_service import get_config_service
 import json
 
+logger = get_logger('gui')
+
+# Ключи конфига, переносимые в настройки, и период проверки файлов конфигов на изменение
+CONFIG_SETTINGS_KEYS = ('api_id', 'api_hash', 'openai_api_key', 'use_proxy', 'proxy_settings', 'db_settings')
+CONFIG_POLL_MS = 2000
+
+# Период переноса накопленных записей лога в окно и предел строк в нем
+LOG_FLUSH_INTERVAL_MS = 200
+DEFAULT_LOG_WIDGET_LINES = 2000
+
 class TelegramSummarizerGUI:
-    def __init__(self, root):
+    def __init__(self, root, startup: StartupTimer = None, fast_start: bool = None):
+        """
+        Args:
+            root: Главное окно Tk
+            startup: Отметки этапов запуска (создается, если не передан)
+            fast_start: Быстрый запуск из снимка сессии с фоновым подключением
+                (по умолчанию - настройка fast_start, включена)
+        """
+        self.startup = startup or StartupTimer()
         self.root = root
         self.root.title("Telegram Channel Summarizer")
         self.root.geometry("900x700")
@@ -116,10 +137,16 @@ class TelegramSummarizerGUI:
         # Настройка стиля приложения
         self.setup_styles()
         
+        # Обновления виджетов из потока asyncio применяются в потоке Tk пачками
+        self.ui_bus = UIUpdateBus(self.root)
+        self.ui_bus.start()
+        
         self.app_dir = os.path.dirname(os.path.abspath(__file__))
         self.loop = asyncio.new_event_loop()
         self.running = True
         self.loop_thread = None
+        # Задачи в цикле asyncio: новая задача слота отменяет предыдущую
+        self.tasks = TaskManager(self.loop, on_error=self._on_task_error)
         # Удален избыточный вызов, так как loop уже создан выше
         # self._ensure_loop_created()
         
@@ -135,6 +162,9 @@ class TelegramSummarizerGUI:
         self.settings_frame = ttk.Frame(self.notebook, padding="10")
         self.notebook.add(self.settings_frame, text="Настройки")
         
+        self.usage_frame = ttk.Frame(self.notebook, padding="10")
+        self.notebook.add(self.usage_frame, text="Статистика ИИ")
+        
         # Загружаем настройки перед созданием интерфейса
         self.settings = {
             'openai_model': 'gpt-3.5-turbo',
@@ -155,22 +185,24 @@ class TelegramSummarizerGUI:
         self.settings.update(saved_settings)
         
         self.debug_var = tk.BooleanVar(value=self.settings.get('debug', False))
+        self.apply_log_settings()
+        self.debug_var.trace_add('write', lambda *args: self.apply_log_settings())
+        self.tasks.max_background = max(1, int(self.settings.get('max_background_tasks', 2)))
+        self.fast_start = self.settings.get('fast_start', True) if fast_start is None else fast_start
 
         # Определяем имя последнего использованного конфига
         config_name = self.settings.get('last_config', '')
 
+        # Конфиги выполняются один раз и общие для клиента, БД и ИИ; изменения файла
+        # конфига применяются к настройкам через подписку
+        self.config_service = get_config_service(self.app_dir)
+        self.config_service.subscribe(lambda name, config: self.ui_bus.call(self.on_config_file_changed, name, config))
+        self._config_poll_id = None
+
         # Загружаем настройки из выбранного файла конфига (*.py)
         # и добавляем их в self.settings перед инициализацией менеджеров
         try:
-            config_path = os.path.join(self.app_dir, "configs", f"{config_name}.py")
-            loaded_config = load_config(config_path)
-            # Добавляем ключи из конфига в settings, перезаписывая значения из sh_profile.json при совпадении
-            if hasattr(loaded_config, 'api_id'): self.settings['api_id'] = loaded_config.api_id
-            if hasattr(loaded_config, 'api_hash'): self.settings['api_hash'] = loaded_config.api_hash
-            if hasattr(loaded_config, 'openai_api_key'): self.settings['openai_api_key'] = loaded_config.openai_api_key
-            if hasattr(loaded_config, 'use_proxy'): self.settings['use_proxy'] = loaded_config.use_proxy
-            if hasattr(loaded_config, 'proxy_settings'): self.settings['proxy_settings'] = loaded_config.proxy_settings
-            if hasattr(loaded_config, 'db_settings'): self.settings['db_settings'] = loaded_config.db_settings
+            self.apply_config_settings(self.config_service.get(config_name))
             self.log(f"Настройки из конфига '{config_name}.py' загружены и добавлены в self.settings.")
         except FileNotFoundError:
             self.log(f"Файл конфига '{config_name}.py' не найден. Использование настроек из sh_profile.json.")
@@ -182,9 +214,12 @@ class TelegramSummarizerGUI:
         self.setup_main_tab()
         self.setup_config_tab()  # Добавляем настройку новой вкладки
         self.setup_settings_tab()
+        self.setup_usage_tab()
 
-        # Инициализируем client_manager и ai_manager с обновленными настройками
-        self.client_manager = TelegramClientManager({
+        # Менеджеры Telegram и ИИ создаются при первом обращении (см. client_manager, ai_manager):
+        # при быстром запуске Telethon и OpenAI импортируются в фоне после первого кадра
+        self._backend_lock = threading.Lock()
+        self._client_config = {
             'config_name': config_name, # config_name все еще нужен для client_manager
             'app_dir': self.app_dir,
             'debug': self.debug_var.get(),
@@ -192,12 +227,29 @@ class TelegramSummarizerGUI:
             'system_version': self.settings.get('system_version'),
             'device_model': self.settings.get('device_model'),
             'app_version': self.settings.get('app_version')
-        })
-        # Теперь self.settings содержит API ключ из конфига (если он был найден)
-        self.ai_manager = AIChatManager(self.settings)
+        }
+        self._client_manager = None
+        self._ai_manager = None
+        if not self.fast_start:
+            self.ensure_backend()
 
         self.dialogs = []
         self.messages = []  # Добавляем атрибут для хранения сообщений
+        # Индексы загруженных диалогов и сообщений, перестраиваются при замене списков
+        self._dialog_store = None
+        self._message_store = None
+        # Строки таблицы диалогов в порядке отображения: индекс в индексе диалогов -> элемент Treeview
+        self._dialog_view = {}
+        # Номер текущей загрузки сообщений: страницы прежних загрузок не применяются
+        self._message_load_generation = 0
+        # Диалог, которому принадлежат показанные сообщения (None - тема или результаты поиска)
+        self._messages_dialog_id = None
+        # Таблица сообщений показывает отфильтрованное или отсортированное представление,
+        # а не порядок потока загрузки
+        self._messages_view_filtered = False
+        # Выделение диалогов, установленное программно: его событие выбора не обрабатывается
+        self._quiet_selection = None
+        self._filter_jobs = {}
 
         # Устанавливаем значение config_var после загрузки настроек
         config_files = get_config_files(self.app_dir)
@@ -216,6 +268,130 @@ class TelegramSummarizerGUI:
 
         # Привязываем событие закрытия окна
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Снимок сессии и подключение - после того, как окно нарисовано
+        self.root.after_idle(self.finish_startup)
+        self._config_poll_id = self.root.after(int(self.settings.get('config_poll_ms', CONFIG_POLL_MS)),
+                                               self.poll_config_files)
+    
+    @property
+    def client_manager(self):
+        """Менеджер клиента Telegram (при первом обращении импортируется Telethon)"""
+        with self._backend_lock:
+            if self._client_manager is None:
+                from .telegram_client import TelegramClientManager
+                self._client_manager = TelegramClientManager(self._client_config)
+            return self._client_manager
+    
+    @client_manager.setter
+    def client_manager(self, manager):
+        self._client_manager = manager
+    
+    @property
+    def ai_manager(self):
+        """Менеджер ИИ (при первом обращении импортируется OpenAI)"""
+        with self._backend_lock:
+            if self._ai_manager is None:
+                from .ai_handler import AIChatManager
+                # self.settings содержит API ключ из конфига (если он был найден)
+                self._ai_manager = AIChatManager(self.settings)
+            return self._ai_manager
+    
+    @ai_manager.setter
+    def ai_manager(self, manager):
+        self._ai_manager = manager
+    
+    def ensure_backend(self):
+        """Создание менеджеров Telegram и ИИ"""
+        return self.client_manager, self.ai_manager
+    
+    def finish_startup(self):
+        """Окно нарисовано: восстановление снимка сессии и фоновое подключение"""
+        self.startup.mark(STARTUP_FIRST_FRAME)
+        restored = self.restore_snapshot() if self.fast_start else False
+        self.root.after_idle(self._mark_interactive)
+        if self.fast_start:
+            self.start_backend(connect=restored)
+    
+    def _mark_interactive(self):
+        self.startup.mark(STARTUP_INTERACTIVE)
+        self.log("Время запуска, мс: %s", self.startup.report())
+    
+    def get_snapshot_path(self):
+        return snapshot_path(self.app_dir, self.config_var.get())
+    
+    def restore_snapshot(self):
+        """Показ последнего списка диалогов и открытого чата из снимка сессии
+        
+        Returns:
+            bool: True, если снимок найден и показан
+        """
+        snapshot = load_snapshot(self.get_snapshot_path())
+        if not snapshot or not snapshot.get('dialogs'):
+            return False
+        
+        self.dialogs = snapshot['dialogs']
+        self.selected_dialogs = snapshot.get('selected_dialogs') or []
+        self.apply_filter_to_loaded_dialogs()
+        self.update_dialogs_selection_status()
+        
+        dialog_id = snapshot.get('dialog_id')
+        if dialog_id is not None:
+            from .message_stream import MessageMerger
+            self.selected_dialog_id = dialog_id
+            self.selected_dialog_name = snapshot.get('dialog_name') or ''
+            self.messages_filter_frame.configure(text=f"Фильтры сообщений: {self.selected_dialog_name}")
+            self.messages_frame.configure(text=f"Сообщения из: {self.selected_dialog_name}")
+            self.topics_frame.configure(text=f"Темы в: {self.selected_dialog_name}")
+            self.load_messages_btn.state(['!disabled'])
+            
+            # Порядок строк - как у потока сообщений, чтобы свежие страницы легли на свои места
+            merger = MessageMerger()
+            merger.apply(snapshot.get('messages') or [])
+            self.messages = list(merger.messages)
+            self._messages_dialog_id = dialog_id
+            self.messages_tree.set_rows([self.message_row(m) for m in self.messages])
+            self.messages_progress_var.set(
+                f"Из снимка от {snapshot.get('saved_at')}: {len(self.messages)}, подключение...")
+        
+        self.log("Восстановлен снимок сессии: диалогов %d, сообщений %d", len(self.dialogs), len(self.messages))
+        return True
+    
+    def start_backend(self, connect):
+        """Фоновая подготовка: импорт модулей Telegram и ИИ, при connect - подключение
+        и сверка показанного снимка с Telegram"""
+        async def run():
+            # Импорт и создание менеджеров выполняются в потоке asyncio, окно остается отзывчивым
+            self.ensure_backend()
+            if not connect:
+                return
+            if not await self.client_manager.init_client():
+                self.log("Фоновое подключение к Telegram не выполнено")
+                return
+            self.startup.mark(STARTUP_CONNECTED)
+            self.log("Подключено к Telegram через %.0f мс после запуска", self.startup.marks[STARTUP_CONNECTED] * 1000)
+            self.ui_bus.call(self.reconcile_snapshot)
+        
+        self.tasks.submit(run, 'Подключение к Telegram', slot='connect', priority=PRIORITY_BACKGROUND)
+    
+    def reconcile_snapshot(self):
+        """Обновление показанного снимка: диалоги загружаются заново с сохранением выбора,
+        свежие сообщения открытого чата применяются к уже показанным строкам"""
+        self.load_filtered_dialogs()
+        dialog_id = getattr(self, 'selected_dialog_id', None)
+        if dialog_id is not None and self._messages_dialog_id == dialog_id:
+            self.load_messages(seed=self.messages)
+    
+    def save_session_snapshot(self):
+        """Сохранение списка диалогов и открытого чата для быстрого запуска"""
+        if not self.dialogs:
+            return
+        selected_dialogs = getattr(self, 'selected_dialogs', None) or []
+        dialog_id = getattr(self, 'selected_dialog_id', None) if len(selected_dialogs) == 1 else None
+        messages = self.messages if dialog_id is not None and self._messages_dialog_id == dialog_id else []
+        save_snapshot(self.get_snapshot_path(), self.dialogs, selected_dialogs, dialog_id,
+                      getattr(self, 'selected_dialog_name', None), messages,
+                      max_messages=int(self.settings.get('snapshot_messages', DEFAULT_SNAPSHOT_MESSAGES)))
     
     def create_tooltip(self, widget, text):
         """Создание подсказки с учетом настроек"""
@@ -378,6 +554,10 @@ class TelegramSummarizerGUI:
         self.dialog_sort_combo['values'] = ['name', 'type', 'folder']
         self.dialog_sort_combo.grid(row=0, column=3, padx=5, sticky=tk.W)
         
+        # Фильтрация загруженных диалогов по мере ввода
+        self.dialog_search_var.trace_add("write", lambda *args: self.schedule_filter('dialogs', self.apply_filter_to_loaded_dialogs))
+        self.dialog_sort_var.trace_add("write", lambda *args: self.schedule_filter('dialogs', self.apply_filter_to_loaded_dialogs))
+        
         # Поле для ограничения количества диалогов
         ttk.Label(self.dialogs_filter_frame, text="Макс. диалогов:").grid(row=1, column=0, padx=5, sticky=tk.W)
         self.max_dialogs_var = tk.StringVar(value=self.settings.get('max_dialogs', '100'))
@@ -399,6 +579,18 @@ class TelegramSummarizerGUI:
         )
         self.update_cache_btn.grid(row=2, column=2, columnspan=2, padx=5, pady=5, sticky=tk.W)
         
+        # Пакетный дайджест по выбранным диалогам
+        ttk.Label(self.dialogs_filter_frame, text="Дайджест за, ч:").grid(row=3, column=0, padx=5, sticky=tk.W)
+        self.digest_hours_var = tk.StringVar(value=str(self.settings.get('digest_hours', 24)))
+        ttk.Entry(self.dialogs_filter_frame, textvariable=self.digest_hours_var, width=5).grid(row=3, column=1, padx=5, sticky=tk.W)
+        self.digest_btn = ttk.Button(
+            self.dialogs_filter_frame,
+            text="Дайджест",
+            command=self.run_batch_digest
+        )
+        self.digest_btn.grid(row=3, column=2, columnspan=2, padx=5, pady=5, sticky=tk.W)
+        self.create_tooltip(self.digest_btn, "Саммари новых сообщений во всех выделенных диалогах; 0 часов - с прошлого дайджеста")
+        
         # Добавляем обработчики нажатия кнопок
         self.load_dialogs_btn.bind("<Button-1>", lambda e: self.log("[КНОПКА] Нажата 'Загрузить диалоги'"), add="+")
         self.update_cache_btn.bind("<Button-1>", lambda e: self.log("[КНОПКА] Нажата 'Обновить кеш'"), add="+")
@@ -432,6 +624,11 @@ class TelegramSummarizerGUI:
         
         # === НАСТРОЙКА СЕКЦИИ ТЕМ ===
         
+        # Саммари всех тем форума
+        self.forum_summary_btn = ttk.Button(self.topics_container, text="Саммари форума", command=self.summarize_forum)
+        self.forum_summary_btn.pack(fill=tk.X, padx=5, pady=(5, 0))
+        self.create_tooltip(self.forum_summary_btn, "Саммари каждой темы выбранного форума и общий обзор")
+        
         # Фрейм для списка тем с заголовком
         self.topics_frame = ttk.LabelFrame(self.topics_container, text="Список тем")
         self.topics_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
@@ -486,6 +683,10 @@ class TelegramSummarizerGUI:
         self.message_sort_combo['values'] = ['date', 'sender']
         self.message_sort_combo.grid(row=1, column=1, padx=5, sticky=tk.W)
         
+        # Фильтрация загруженных сообщений по мере ввода
+        self.message_search_var.trace_add("write", lambda *args: self.schedule_filter('messages', self.apply_filter_to_loaded_messages))
+        self.message_sort_var.trace_add("write", lambda *args: self.schedule_filter('messages', self.apply_filter_to_loaded_messages))
+        
         # Поле для ограничения количества сообщений
         ttk.Label(self.messages_filter_frame, text="Макс. сообщений:").grid(row=1, column=2, padx=5, sticky=tk.W)
         self.max_messages_var = tk.StringVar(value=self.settings.get('max_messages', '100'))
@@ -517,6 +718,11 @@ class TelegramSummarizerGUI:
         )
         self.filter_messages_btn.grid(row=4, column=2, columnspan=2, padx=5, pady=5, sticky=tk.E)
         
+        # Ход загрузки сообщений: страницы показываются по мере получения
+        self.messages_progress_var = tk.StringVar(value="")
+        ttk.Label(self.messages_filter_frame, textvariable=self.messages_progress_var).grid(
+            row=5, column=0, columnspan=4, padx=5, sticky=tk.W)
+        
         # Добавляем обработчики нажатия кнопок
         self.load_messages_btn.bind("<Button-1>", lambda e: self.log("[КНОПКА] Нажата 'Сообщения'"), add="+")
         self.filter_messages_btn.bind("<Button-1>", lambda e: self.log("[КНОПКА] Нажата 'Применить фильтры'"), add="+")
@@ -529,22 +735,14 @@ class TelegramSummarizerGUI:
         self.messages_frame = ttk.LabelFrame(self.messages_content_paned, text="Список сообщений")
         self.messages_content_paned.add(self.messages_frame, weight=2)
         
-        # Treeview для отображения сообщений
-        self.messages_tree = ttk.Treeview(self.messages_frame, columns=('id', 'sender', 'text', 'date'), show='headings')
-        self.messages_tree.heading('id', text='ID', command=lambda: self.treeview_sort_column(self.messages_tree, 'id', False))
-        self.messages_tree.heading('sender', text='Отправитель', command=lambda: self.treeview_sort_column(self.messages_tree, 'sender', False))
-        self.messages_tree.heading('text', text='Сообщение', command=lambda: self.treeview_sort_column(self.messages_tree, 'text', False))
-        self.messages_tree.heading('date', text='Дата', command=lambda: self.treeview_sort_column(self.messages_tree, 'date', False))
-        self.messages_tree.column('id', width=50)
-        self.messages_tree.column('sender', width=150)
-        self.messages_tree.column('text', width=400)
-        self.messages_tree.column('date', width=150)
-        
-        scrollbar = ttk.Scrollbar(self.messages_frame, orient=tk.VERTICAL, command=self.messages_tree.yview)
-        self.messages_tree.configure(yscrollcommand=scrollbar.set)
-        
-        self.messages_tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        # Виртуальная таблица сообщений: в виджете только видимые строки, поэтому
+        # диалоги из сотен тысяч сообщений открываются и прокручиваются без задержек
+        self.messages_tree = VirtualTreeview(
+            self.messages_frame,
+            columns={'id': 'ID', 'sender': 'Отправитель', 'text': 'Сообщение', 'date': 'Дата'},
+            widths={'id': 50, 'sender': 150, 'text': 400, 'date': 150}
+        )
+        self.messages_tree.pack(fill=tk.BOTH, expand=True)
         
         # Добавляем обработчик выбора сообщения
         self.messages_tree.bind('<<TreeviewSelect>>', self.on_message_select)
@@ -596,13 +794,25 @@ class TelegramSummarizerGUI:
         self.send_to_ai_btn = ttk.Button(self.ai_input_frame, text="Отправить", command=self.send_to_ai)
         self.send_to_ai_btn.pack(side=tk.RIGHT, padx=5, pady=5)
         
+        # Режим поиска по истории выбранных чатов вместо выделенных сообщений
+        self.ai_retrieval_var = tk.BooleanVar(value=self.settings.get('ai_retrieval', False))
+        self.ai_retrieval_check = ttk.Checkbutton(self.ai_input_frame, text="По истории", variable=self.ai_retrieval_var)
+        self.ai_retrieval_check.pack(side=tk.RIGHT, padx=5, pady=5)
+        self.create_tooltip(self.ai_retrieval_check, "Искать ответ во всей кешированной истории выбранных чатов")
+        
         # Фрейм для логов (правая часть нижней панели)
         self.log_frame = ttk.LabelFrame(self.bottom_paned, text="Лог")
         self.bottom_paned.add(self.log_frame, weight=1)
         
+        # Список активных задач
+        ttk.Button(self.log_frame, text="Задачи", command=self.show_tasks_window).pack(anchor=tk.E, padx=5, pady=(5, 0))
+        
         # Текстовое поле для логов
         self.log_text = scrolledtext.ScrolledText(self.log_frame, wrap=tk.WORD, height=10)
         self.log_text.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        self._log_dropped_shown = 0
+        self.flush_log_widget()
+        
         # Добавляем фрейм для расширенного поиска в начале интерфейса
         self.setup_search_frame()
         
@@ -737,8 +947,17 @@ class TelegramSummarizerGUI:
         
         self.reply_status_var.trace_add("write", update_reply_status_description)
         
-        # Добавляем пустую строку для выравнивания с левой колонкой
-        ttk.Label(right_frame, text="").grid(row=1, column=0, padx=5, pady=2)
+        # Смысловой поиск по векторному индексу вместо поиска подстроки
+        self.semantic_search_var = tk.BooleanVar(value=self.settings.get('semantic_search', False))
+        semantic_check = ttk.Checkbutton(right_frame, text="Смысловой поиск", variable=self.semantic_search_var)
+        semantic_check.grid(row=1, column=0, columnspan=2, padx=5, pady=2, sticky=tk.W)
+        self.create_tooltip(semantic_check, "Искать сообщения, близкие по смыслу к тексту запроса, а не точное совпадение")
+        
+        # Пересылки и копии одного текста в разных чатах показываются один раз
+        self.search_near_dedupe_var = tk.BooleanVar(value=self.settings.get('search_near_dedupe', True))
+        near_dedupe_check = ttk.Checkbutton(right_frame, text="Скрывать копии", variable=self.search_near_dedupe_var)
+        near_dedupe_check.grid(row=2, column=0, columnspan=2, padx=5, pady=2, sticky=tk.W)
+        self.create_tooltip(near_dedupe_check, "Показывать только первое из почти одинаковых сообщений (пересылки, копии) во всех выбранных чатах")
         
         # Кнопка поиска с улучшенным стилем
         style.configure('Search.TButton', font=('Arial', 10, 'bold'))
@@ -958,20 +1177,18 @@ class TelegramSummarizerGUI:
                 self.log("[МОДЕЛИ] Получен пустой список моделей после фильтрации.")
             
             # Обновление UI должно происходить в основном потоке Tkinter
-            self.root.after(0, lambda: self.model_combo.config(values=model_ids))
+            self.ui_bus.call(lambda: self.model_combo.config(values=model_ids))
             self.log(f"[МОДЕЛИ] Список моделей успешно обновлен. Найдено {len(display_models)} моделей после фильтрации.")
         except Exception as e:
             self.log(f"[МОДЕЛИ] Ошибка при обновлении моделей: {str(e)}")
-            messagebox.showerror("Ошибка", f"Не удалось обновить модели: {str(e)}")
+            self.ui_bus.call(messagebox.showerror, "Ошибка", f"Не удалось обновить модели: {str(e)}")
 
     def _update_models_handler(self):
         """Обработчик кнопки обновления моделей с использованием asyncio"""
         try:
             self.log("[МОДЕЛИ] Запуск асинхронной задачи обновления моделей...") # Add logging
-            asyncio.run_coroutine_threadsafe(
-                self.update_models_list(),
-                self.loop
-            )
+            self.tasks.submit(self.update_models_list, 'Обновление списка моделей', slot='models',
+                              priority=PRIORITY_BACKGROUND)
         except Exception as e:
             self.log(f"[МОДЕЛИ] Ошибка при запуске асинхронной задачи обновления: {str(e)}") # Add logging in except
             messagebox.showerror("Ошибка", f"Ошибка при запуске обновления: {str(e)}")
@@ -1034,6 +1251,18 @@ class TelegramSummarizerGUI:
         # Дебаг
         ttk.Checkbutton(self.settings_frame, text="Дебаг", variable=self.debug_var).grid(row=2, column=0, columnspan=2, sticky=tk.W, pady=5)
         
+        # Режим саммари
+        ttk.Label(self.settings_frame, text="Режим саммари:").grid(row=3, column=0, sticky=tk.W, pady=5)
+        self.summary_mode_var = tk.StringVar(value=self.settings.get('summary_mode', 'none'))
+        self.summary_mode_combo = ttk.Combobox(
+            self.settings_frame,
+            textvariable=self.summary_mode_var,
+            values=['none', 'extractive', 'extractive_llm'],
+            state='readonly'
+        )
+        self.summary_mode_combo.grid(row=3, column=1, sticky=tk.W, padx=5, pady=5)
+        self.create_tooltip(self.summary_mode_combo, "none - только ИИ; extractive - отбор ключевых сообщений без ИИ; extractive_llm - отбор сообщений, затем ИИ")
+        
         # Добавляем разделитель
         ttk.Separator(self.settings_frame, orient='horizontal').grid(row=4, column=0, columnspan=2, sticky='ew', pady=10)
         
@@ -1100,6 +1329,8 @@ class TelegramSummarizerGUI:
             self.settings['openai_model'] = self.model_var.get()
             self.settings['system_prompt'] = self.system_prompt.get('1.0', tk.END).strip()
             self.settings['debug'] = self.debug_var.get()  # Обновляем состояние чекбокса "Дебаг"
+            if hasattr(self, 'summary_mode_var'):
+                self.settings['summary_mode'] = self.summary_mode_var.get()
             
             self.log(f"Настройки перед сохранением: {self.settings}")
             
@@ -1114,6 +1345,8 @@ class TelegramSummarizerGUI:
         """Проверяет, создан ли event loop, и создает его при необходимости"""
         if not hasattr(self, 'loop') or self.loop is None or self.loop.is_closed():
             self.loop = asyncio.new_event_loop()
+            if hasattr(self, 'tasks'):
+                self.tasks.loop = self.loop
             self.log("Создан новый event loop")
 
     def _ensure_loop_active(self):
@@ -1148,9 +1381,18 @@ class TelegramSummarizerGUI:
 
     def get_participants(self):
         """Получение участников чата"""
+        selected_items = self.dialogs_tree.selection()
+        if not selected_items:
+            self.log("Не выбран целевой чат")
+            return
+        dialog_id = self.dialogs_tree.item(selected_items[0])['values'][4]
+        # Загруженные сообщения подходят, только если открыт этот же чат
+        loaded = list(self.messages) if self._messages_dialog_id == dialog_id else None
+        
         self.log("Начало получения участников чата...")
         self.progress.start()
         self.get_participants_btn.state(['disabled'])
+        from .participant_stats import unnamed_top_senders, DEFAULT_TOP_PARTICIPANTS
         
         async def run():
             try:
@@ -1160,38 +1402,63 @@ class TelegramSummarizerGUI:
                     if not await self.client_manager.init_client():
                         self.log("Ошибка инициализации клиента")
                         return
-                        
-                selected_items = self.dialogs_tree.selection()
-                if not selected_items:
-                    self.log("Не выбран целевой чат")
-                    return
-                    
-                selected_item = selected_items[0]
-                dialog_id = self.dialogs_tree.item(selected_item)['values'][4]
-                self.log(f"Получение участников для чата с ID: {dialog_id}")
                 
-                participants = await self.client_manager.get_chat_participants(dialog_id)
-                self.log(f"Участники чата: {len(participants)}")
+                self.log("Получение участников для чата с ID: %s", dialog_id)
+                # Для промпта нужны только количество участников и имена самых активных,
+                # поэтому полный список участников не загружается
+                total_members = await self.client_manager.get_participants_count(dialog_id)
+                self.log("Участники чата: %d", total_members)
+                
+                messages = loaded
+                if messages is None:
+                    await self.attach_ai_storage()
+                    if self.ai_manager.db_handler:
+                        messages = await self.ai_manager.db_handler.get_cached_messages(
+                            dialog_id, self.ai_manager.account_id)
+                
+                participants, names = [], {}
+                if messages:
+                    names = await self.client_manager.get_user_names(
+                        unnamed_top_senders(messages, DEFAULT_TOP_PARTICIPANTS))
+                else:
+                    participants = await self.client_manager.get_chat_participants(
+                        dialog_id, limit=DEFAULT_TOP_PARTICIPANTS)
                 
-                # Анализ участников с помощью ИИ
-                self.log("Загрузка конфигурации для OpenAI...")
-                config = self.load_config(self.config_var.get())
-                openai_client = openai.AsyncOpenAI(api_key=config.openai_api_key)
                 self.log("Анализ участников с помощью ИИ...")
-                analysis = await self.ai_manager.analyze_participants(participants, openai_client)
-                self.log(f"Анализ участников:\n{analysis}")
+                analysis = await self.ai_manager.analyze_participants(
+                    participants, self.ai_manager.get_openai_client(), dialog_id=dialog_id, messages=messages,
+                    total_members=total_members, names=names)
+                self.log("Анализ участников:\n%s", analysis)
                 
             except Exception as e:
-                self.log(f"Ошибка: {e}")
+                self.log("Ошибка: %s", e)
             finally:
-                self.progress.stop()
-                self.get_participants_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.get_participants_btn.state, ['!disabled'])
                 self.log("Завершение получения участников чата")
                 
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Участники чата', slot='participants')
 
     def filter_messages(self):
         """Фильтрация сообщений"""
+        selected_items = self.dialogs_tree.selection()
+        if not selected_items:
+            self.log("Не выбран целевой чат")
+            return
+        dialog_id = self.dialogs_tree.item(selected_items[0])['values'][4]
+        
+        # Получаем фильтры от пользователя
+        filters = {
+            'search': self.search_var.get(),
+            'limit': int(self.max_messages_var.get()),
+            'filter': None
+        }
+        if self.photo_var.get():
+            filters['filter'] = 'photo'
+        elif self.video_var.get():
+            filters['filter'] = 'video'
+        sort_key = self.sort_var.get()
+        
         self.progress.start()
         self.filter_messages_btn.state(['disabled'])
         
@@ -1200,82 +1467,54 @@ class TelegramSummarizerGUI:
                 if not self.client_manager or not self.client_manager.client.is_connected():
                     if not await self.client_manager.init_client():
                         return
-                        
-                selected_items = self.dialogs_tree.selection()
-                if not selected_items:
-                    self.log("Не выбран целевой чат")
-                    return
-                    
-                selected_item = selected_items[0]
-                dialog_id = self.dialogs_tree.item(selected_item)['values'][4]
-                
-                # Получаем фильтры от пользователя
-                filters = {
-                    'search': self.search_var.get(),
-                    'limit': int(self.max_messages_var.get()),
-                    'filter': None
-                }
-                
-                if self.photo_var.get():
-                    filters['filter'] = 'photo'
-                elif self.video_var.get():
-                    filters['filter'] = 'video'
                 
                 if self.settings.get('debug', False):
-                    self.log(f"Фильтры: {filters}")
+                    self.log("Фильтры: %s", filters)
                 
                 messages = await self.client_manager.filter_messages(dialog_id, filters)
-                self.messages_tree.delete(*self.messages_tree.get_children())
                 
                 # Сортировка
-                sort_key = self.sort_var.get()
                 messages.sort(key=lambda x: x[sort_key])
                 
-                for message in messages:
-                    sender = message.get('sender_name', 'Неизвестно')
-                    text = message['text'].replace('\n', ' ')
-                    date = message['date'].strftime('%Y-%m-%d %H:%M:%S')
-                    self.messages_tree.insert('', 'end', values=(message['id'], sender, text, date))
+                rows = [(message['id'], message.get('sender_name', 'Неизвестно'), message['text'].replace('\n', ' '),
+                         message['date'].strftime('%Y-%m-%d %H:%M:%S')) for message in messages]
+                self.ui_bus.clear(self.messages_tree)
+                self.ui_bus.insert_rows(self.messages_tree, rows)
                 
                 self.log(f"Найдено сообщений: {len(messages)}")
                 
             except Exception as e:
                 self.log(f"Ошибка: {e}")
             finally:
-                self.progress.stop()
-                self.filter_messages_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.filter_messages_btn.state, ['!disabled'])
         
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Фильтрация сообщений', slot='messages')
 
     def on_config_change(self, event):
         """Обработчик изменения конфига"""
         self.progress.start()
         config_name = self.config_var.get()
+        debug = self.debug_var.get()
         
         # Сохраняем выбранный конфиг
         self.settings['last_config'] = config_name
         self.save_settings()
         
         async def reconnect():
+            from .telegram_client import TelegramClientManager
+            from .ai_handler import AIChatManager
             try:
                 # Отключаем старый клиент
-                if hasattr(self, 'client_manager') and self.client_manager is not None:
-                    if hasattr(self.client_manager, 'client') and self.client_manager.client is not None:
-                        if self.client_manager.client.is_connected():
-                            await self.client_manager.client.disconnect()
+                if self._client_manager is not None:
+                    if hasattr(self._client_manager, 'client') and self._client_manager.client is not None:
+                        if self._client_manager.client.is_connected():
+                            await self._client_manager.client.disconnect()
 
                 # Загружаем настройки из нового файла конфига (*.py)
                 # и обновляем self.settings перед инициализацией менеджеров
                 try:
-                    config_path = os.path.join(self.app_dir, "configs", f"{config_name}.py")
-                    loaded_config = load_config(config_path)
-                    # Обновляем self.settings с новыми значениями из конфига
-                    if hasattr(loaded_config, 'api_id'): self.settings['api_id'] = loaded_config.api_id
-                    if hasattr(loaded_config, 'api_hash'): self.settings['api_hash'] = loaded_config.api_hash
-                    if hasattr(loaded_config, 'openai_api_key'): self.settings['openai_api_key'] = loaded_config.openai_api_key
-                    if hasattr(loaded_config, 'use_proxy'): self.settings['use_proxy'] = loaded_config.use_proxy
-                    if hasattr(loaded_config, 'proxy_settings'): self.settings['proxy_settings'] = loaded_config.proxy_settings
-                    if hasattr(loaded_config, 'db_settings'): self.settings['db_settings'] = loaded_config.db_settings
+                    self.apply_config_settings(self.config_service.get(config_name))
                     self.log(f"Настройки из нового конфига '{config_name}.py' загружены и обновлены в self.settings.")
                 except FileNotFoundError:
                     self.log(f"Файл конфига '{config_name}.py' не найден. Использование текущих настроек из sh_profile.json.")
@@ -1286,7 +1525,7 @@ class TelegramSummarizerGUI:
                 self.client_manager = TelegramClientManager({
                     'config_name': config_name,
                     'app_dir': self.app_dir,
-                    'debug': self.debug_var.get(),
+                    'debug': debug,
                     # Передаем другие настройки клиента, если они есть в self.settings
                     'system_version': self.settings.get('system_version'),
                     'device_model': self.settings.get('device_model'),
@@ -1297,7 +1536,7 @@ class TelegramSummarizerGUI:
 
                 # Очищаем список диалогов
                 self.dialogs = []
-                self.dialogs_tree.delete(*self.dialogs_tree.get_children())
+                self.ui_bus.clear(self.dialogs_tree)
                 self.log(f"Выбран конфиг: {config_name}. Клиент и AI менеджер переинициализированы.")
 
                 # Пробуем инициализировать клиент
@@ -1306,27 +1545,97 @@ class TelegramSummarizerGUI:
             except Exception as e:
                 self.log(f"Ошибка при смене конфига: {e}")
             finally:
-                self.progress.stop()
+                self.ui_bus.call(self.progress.stop)
         
-        asyncio.run_coroutine_threadsafe(reconnect(), self.loop)
+        self.tasks.submit(reconnect, 'Переподключение', slot='connect')
 
-    def log(self, message):
-        """Логирование сообщений"""
-        if self.debug_var.get():
-            print(message)
+    def log(self, message, *args):
+        """Логирование сообщений (из любого потока)
         
-        # Добавляем сообщение в лог-виджет, если он существует
-        if hasattr(self, 'log_text') and self.log_text:
-            self.log_text.insert(tk.END, f"{message}\n")
-            self.log_text.see(tk.END)
+        Запись попадает в кольцевой буфер лога, окно лога забирает накопленные
+        записи пачкой раз в LOG_FLUSH_INTERVAL_MS; в консоль записи выводятся в режиме отладки.
+        """
+        logger.info(message, *args)
+
+    def apply_log_settings(self):
+        """Уровни логирования из настроек: общий по флагу "Дебаг" и уровни модулей из log_levels"""
+        self.log_buffer = configure_logging(
+            debug=self.debug_var.get(),
+            levels=self.settings.get('log_levels'),
+            capacity=int(self.settings.get('log_buffer_size', DEFAULT_LOG_CAPACITY)))
 
-    def _handle_async_result(self, future):
-        """Обрабатывает результат асинхронной операции"""
+    def flush_log_widget(self):
+        """Перенос новых записей лога в окно одной вставкой с ограничением числа строк"""
+        self._log_flush_id = None
         try:
-            future.result()
-        except Exception as e:
-            self.log(f"Ошибка в асинхронной задаче: {e}")
-            messagebox.showerror("Ошибка", f"Ошибка при выполнении задачи: {e}")
+            lines = self.log_buffer.drain()
+            dropped = self.log_buffer.dropped - self._log_dropped_shown
+            if dropped:
+                lines.insert(0, f"... пропущено записей лога: {dropped}")
+                self._log_dropped_shown += dropped
+            if lines:
+                self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+                max_lines = int(self.settings.get('log_widget_lines', DEFAULT_LOG_WIDGET_LINES))
+                excess = int(self.log_text.index('end-1c').split('.')[0]) - 1 - max_lines
+                if excess > 0:
+                    self.log_text.delete('1.0', f'{excess + 1}.0')
+                self.log_text.see(tk.END)
+        finally:
+            self._log_flush_id = self.root.after(LOG_FLUSH_INTERVAL_MS, self.flush_log_widget)
+
+    def _on_task_error(self, task, error):
+        """Необработанная ошибка задачи (вызывается в потоке asyncio)"""
+        self.log(f"Ошибка в задаче '{task.title}': {error}")
+        self.ui_bus.call(messagebox.showerror, "Ошибка", f"Ошибка при выполнении задачи '{task.title}': {error}")
+
+    def show_tasks_window(self):
+        """Окно активных задач с временем выполнения и отменой"""
+        if getattr(self, 'tasks_window', None) is not None and self.tasks_window.winfo_exists():
+            self.tasks_window.lift()
+            return
+        self.tasks_window = window = tk.Toplevel(self.root)
+        window.title("Задачи")
+        window.geometry("520x260")
+        
+        columns = {'title': 'Задача', 'priority': 'Приоритет', 'status': 'Состояние', 'elapsed': 'Время, сек.'}
+        tree = ttk.Treeview(window, columns=list(columns), show='headings', selectmode='browse')
+        for name, title in columns.items():
+            tree.heading(name, text=title)
+        tree.column('title', width=240)
+        for name in ('priority', 'status', 'elapsed'):
+            tree.column(name, width=80)
+        tree.pack(fill=tk.BOTH, expand=True, padx=5, pady=5)
+        
+        def cancel_selected():
+            for item in tree.selection():
+                self.tasks.cancel(int(item))
+        
+        buttons = ttk.Frame(window)
+        buttons.pack(fill=tk.X, padx=5, pady=(0, 5))
+        ttk.Button(buttons, text="Отменить", command=cancel_selected).pack(side=tk.LEFT)
+        ttk.Button(buttons, text="Отменить все", command=self.tasks.cancel_all).pack(side=tk.LEFT, padx=5)
+        
+        statuses = {'queued': 'в очереди', 'running': 'выполняется'}
+        
+        def refresh():
+            if not window.winfo_exists():
+                return
+            tasks = self.tasks.snapshot()
+            current = {str(task['id']) for task in tasks}
+            stale = [item for item in tree.get_children() if item not in current]
+            if stale:
+                tree.delete(*stale)
+            for task in tasks:
+                values = (task['title'], 'фон' if task['priority'] >= PRIORITY_BACKGROUND else 'интерактив',
+                          statuses.get(task['status'], task['status']), task['elapsed'])
+                item = str(task['id'])
+                if tree.exists(item):
+                    tree.item(item, values=values)
+                else:
+                    tree.insert('', 'end', iid=item, values=values)
+            window.after(500, refresh)
+        
+        refresh()
 
     def cleanup(self):
         """Очистка ресурсов при закрытии приложения"""
@@ -1334,10 +1643,10 @@ class TelegramSummarizerGUI:
         
         async def cleanup_async():
             try:
-                if hasattr(self, 'client_manager') and self.client_manager is not None:
-                    if hasattr(self.client_manager, 'client') and self.client_manager.client is not None:
-                        if self.client_manager.client.is_connected():
-                            await self.client_manager.client.disconnect()
+                if self._client_manager is not None:
+                    if hasattr(self._client_manager, 'client') and self._client_manager.client is not None:
+                        if self._client_manager.client.is_connected():
+                            await self._client_manager.client.disconnect()
             except Exception as e:
                 self.log(f"Ошибка при отключении клиента: {e}")
             finally:
@@ -1356,27 +1665,23 @@ class TelegramSummarizerGUI:
 
     def load_filtered_dialogs(self):
         """Загрузка и фильтрация диалогов"""
+        # Значения полей читаются в потоке Tk до запуска задачи
+        dialog_limit = self.max_dialogs_var.get()
+        dialog_search = self.dialog_search_var.get()
+        dialog_sort = self.dialog_sort_var.get()
+        debug = self.debug_var.get()
         self.progress.start()
         self.load_dialogs_btn.state(['disabled'])
         
         async def run():
             try:
                 # Проверяем и инициализируем клиент, если необходимо
-                if not self.client_manager:
-                    self.client_manager = TelegramClientManager({
-                        'config_name': self.config_var.get(),
-                        'app_dir': self.app_dir,
-                        'debug': self.debug_var.get()
-                    })
-                
                 if not hasattr(self.client_manager, 'client') or not self.client_manager.client or not self.client_manager.client.is_connected():
                     if not await self.client_manager.init_client():
                         self.log("Ошибка: клиент не инициализирован")
                         return
                 
-                # Получаем фильтры от пользователя
-                dialog_limit = self.max_dialogs_var.get()
-                if self.debug_var.get():
+                if debug:
                     self.log(f"Значение поля max_dialogs_var: {dialog_limit}")
                 
                 try:
@@ -1388,8 +1693,8 @@ class TelegramSummarizerGUI:
                     self.log(f"Установлено значение по умолчанию: {dialog_limit_int}")
                 
                 filters = {
-                    'search': self.dialog_search_var.get(),
-                    'sort': self.dialog_sort_var.get(),
+                    'search': dialog_search,
+                    'sort': dialog_sort,
                     'limit': dialog_limit_int,
                     'force_refresh': False  # Не обновляем кеш при обычной загрузке
                 }
@@ -1398,86 +1703,113 @@ class TelegramSummarizerGUI:
                 
                 self.dialogs = await self.client_manager.filter_dialogs(filters)
                 self.log(f"Получено диалогов после фильтрации: {len(self.dialogs)}")
-                if self.dialog_search_var.get().strip():
-                    search_text = self.dialog_search_var.get().lower()
+                if dialog_search.strip():
+                    search_text = dialog_search.lower()
                     original_count = len(self.dialogs)
                     self.dialogs = [dialog for dialog in self.dialogs if search_text in dialog['name'].lower()]
                     self.log(f"После локальной фильтрации по '{search_text}': {len(self.dialogs)} из {original_count}")
                 
-                self.dialogs_tree.delete(*self.dialogs_tree.get_children())
+                # Таблица заполняется в потоке Tk из индекса загруженных диалогов
+                self.ui_bus.call(self.apply_filter_to_loaded_dialogs)
                 
-                for dialog in self.dialogs:
-                    folder_name = f"Папка {dialog['folder_id']}" if dialog.get('folder_id') is not None else "Без папки"
-                    unread_count = dialog.get('unread_count', 0)
-                    
-                    # Выводим отладочную информацию
-                    if self.debug_var.get():
-                        self.log(f"Добавление диалога: {dialog['name']}, ID: {dialog['id']}")
-                    
-                    self.dialogs_tree.insert('', 'end', values=(
-                        dialog['name'], 
-                        dialog['type'], 
-                        folder_name, 
-                        unread_count,
-                        dialog['id']  # Важно: ID должен быть последним элементом
-                    ))
-                
-                if self.debug_var.get():
+                if debug:
                     self.log(f"Диалоги загружены: {len(self.dialogs)}")
             except Exception as e:
                 self.log(f"Ошибка при загрузке диалогов: {e}")
                 import traceback
                 self.log(traceback.format_exc())
             finally:
-                self.progress.stop()
-                self.load_dialogs_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.load_dialogs_btn.state, ['!disabled'])
         
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Загрузка диалогов', slot='dialogs')
+
+    def schedule_filter(self, name, callback):
+        """Отложенный запуск фильтрации: при быстром вводе выполняется только последний вызов"""
+        job = self._filter_jobs.pop(name, None)
+        if job is not None:
+            self.root.after_cancel(job)
+        delay = int(self.settings.get('filter_debounce_ms', 150))
+        self._filter_jobs[name] = self.root.after(delay, lambda: (self._filter_jobs.pop(name, None), callback()))
+
+    def get_dialog_store(self):
+        """Индекс загруженных диалогов (перестраивается, если список заменен)"""
+        if self._dialog_store is None or self._dialog_store.records is not self.dialogs:
+            self._dialog_store = RecordStore(self.dialogs, text_field='name', row_factory=self.dialog_row)
+        return self._dialog_store
+
+    def get_message_store(self):
+        """Индекс загруженных сообщений (перестраивается, если список заменен)"""
+        if self._message_store is None or self._message_store.records is not self.messages:
+            self._message_store = RecordStore(self.messages, row_factory=self.message_row)
+        return self._message_store
+
+    def dialog_row(self, dialog):
+        """Значения колонок таблицы диалогов"""
+        folder_name = f"Папка {dialog['folder_id']}" if dialog.get('folder_id') is not None else "Без папки"
+        return (
+            dialog['name'],
+            dialog['type'],
+            folder_name,
+            dialog.get('unread_count', 0),
+            dialog['id']  # Важно: ID должен быть последним элементом
+        )
 
     def apply_filter_to_loaded_dialogs(self):
         """Применение фильтра к уже загруженным диалогам"""
-        search_text = self.dialog_search_var.get().lower()
+        store = self.get_dialog_store()
+        indices = store.filter(self.dialog_search_var.get())
+        indices = store.sort(indices, self.dialog_sort_var.get())
         
-        # Очищаем список диалогов
+        # Заполняем список диалогов
         self.dialogs_tree.delete(*self.dialogs_tree.get_children())
+        self._dialog_view = {i: self.dialogs_tree.insert('', 'end', values=values)
+                             for i, values in zip(indices, store.rows(indices))}
         
-        # Фильтруем диалоги
-        filtered_dialogs = []
-        for dialog in self.dialogs:
-            if search_text and search_text not in dialog['name'].lower():
-                continue
-            filtered_dialogs.append(dialog)
-        
-        # Сортируем диалоги
-        sort_by = self.dialog_sort_var.get()
-        if sort_by == 'name':
-            filtered_dialogs.sort(key=lambda d: d['name'])
-        elif sort_by == 'type':
-            filtered_dialogs.sort(key=lambda d: d['type'])
-        elif sort_by == 'folder':
-            filtered_dialogs.sort(key=lambda d: d.get('folder_id', 0) or 0)
+        # Выбранные диалоги остаются выделенными, если они видны после фильтрации
+        selected_ids = {dialog['id'] for dialog in getattr(self, 'selected_dialogs', None) or []}
+        if selected_ids:
+            items = [item for i, item in self._dialog_view.items() if store.records[i]['id'] in selected_ids]
+            if items:
+                self.select_dialogs_quietly(items)
         
-        # Заполняем список диалогов
-        for dialog in filtered_dialogs:
-            folder_name = f"Папка {dialog['folder_id']}" if dialog.get('folder_id') is not None else "Без папки"
-            unread_count = dialog.get('unread_count', 0)
-            
-            self.dialogs_tree.insert('', 'end', values=(
-                dialog['name'], 
-                dialog['type'], 
-                folder_name, 
-                unread_count,
-                dialog['id']  # Важно: ID должен быть последним элементом
-            ))
-        
-        self.log(f"Диалоги отфильтрованы: {len(filtered_dialogs)}")
+        self.log(f"Диалоги отфильтрованы: {len(indices)}")
+
+    def apply_config_settings(self, config):
+        """Перенос ключей конфига в self.settings (значения конфига важнее sh_profile.json)"""
+        for key in CONFIG_SETTINGS_KEYS:
+            if hasattr(config, key):
+                self.settings[key] = getattr(config, key)
+
+    def on_config_file_changed(self, name, config):
+        """Файл конфига изменен: новые значения применяются к настройкам и клиенту ИИ;
+        параметры подключения к Telegram и БД вступают в силу при переподключении"""
+        if name != self.config_var.get():
+            return
+        api_key = self.settings.get('openai_api_key')
+        self.apply_config_settings(config)
+        if self._ai_manager is not None and self.settings.get('openai_api_key') != api_key:
+            self._ai_manager.openai_client = None
+        self.log(f"Конфиг {name} изменен, настройки обновлены")
+
+    def poll_config_files(self):
+        """Периодическая проверка загруженных конфигов на изменение"""
+        try:
+            self.config_service.poll()
+        except Exception as e:
+            self.log(f"Ошибка при проверке конфигов: {e}")
+        self._config_poll_id = self.root.after(int(self.settings.get('config_poll_ms', CONFIG_POLL_MS)),
+                                               self.poll_config_files)
+
+    def select_dialogs_quietly(self, items):
+        """Выделение строк диалогов без повторной загрузки тем и сообщений"""
+        self._quiet_selection = tuple(items)
+        self.dialogs_tree.selection_set(items)
 
     def load_current_config(self):
         """Загрузка текущего конфига"""
         try:
-            config_name = self.config_var.get()
-            config_path = os.path.join(self.app_dir, "configs", f"{config_name}.py")
-            config = load_config(config_path)
+            config = self.config_service.get(self.config_var.get())
             
             # Заполняем поля значениями из конфига
             self.api_id_var.set(str(getattr(config, 'api_id', '')))
@@ -1538,6 +1870,8 @@ db_settings = {{
                 f.write(config_content)
             
             self.log(f"Конфиг {config_name} успешно сохранен")
+            # Новая версия сразу становится общей для клиента, БД и ИИ
+            self.config_service.reload(config_name)
             
         except Exception as e:
             self.log(f"Ошибка при сохранении конфига: {e}")
@@ -1562,118 +1896,292 @@ db_settings = {{
         self.send_to_ai_btn.state(['disabled'])
         self.ai_input.state(['disabled'])
         
+        # Контекст из выбранных сообщений собирается здесь, в потоке Tk.
+        # В таблице текст обрезан для отображения, поэтому берем полный текст из загруженных сообщений
+        message_store = self.get_message_store()
+        selected_messages = []
+        for values in self.messages_tree.selected_rows():
+            if values and len(values) >= 3:
+                sender = values[1]
+                text = values[2]
+                date = values[3]
+                full_message = message_store.get(values[0])
+                if full_message is not None:
+                    text = full_message.get('text', text)
+                selected_messages.append(f"{sender} ({date}): {text}")
+        use_retrieval = self.ai_retrieval_var.get()
+        config_name = self.config_var.get()
+        
         async def process_ai_request():
             try:
-                # Проверяем, что client_manager существует и не равен None
-                if not self.client_manager:
-                    # Если client_manager не существует или равен None, создаем его
-                    self.client_manager = TelegramClientManager({
-                        'config_name': self.config_var.get(),
-                        'app_dir': self.app_dir,
-                        'debug': self.debug_var.get(),
-                        'system_version': self.settings.get('system_version'),
-                        'device_model': self.settings.get('device_model'),
-                        'app_version': self.settings.get('app_version')
-                    })
-                    self.log("Создан новый экземпляр TelegramClientManager в process_ai_request")
-                    
                 # Проверяем, что клиент инициализирован
                 if not hasattr(self.client_manager, 'client') or self.client_manager.client is None or not self.client_manager.client.is_connected():
                     if not await self.client_manager.init_client():
                         self.log("Ошибка: клиент не инициализирован")
                         return
                 
-                # Собираем контекст из выбранных сообщений
-                selected_messages = []
-                for item in self.messages_tree.selection():
-                    item_data = self.messages_tree.item(item)
-                    values = item_data['values']
-                    if values and len(values) >= 3:
-                        sender = values[1]
-                        text = values[2]
-                        date = values[3]
-                        selected_messages.append(f"{sender} ({date}): {text}")
+                # Подключаем БД для кеша ответов и статистики использования ИИ
+                await self.attach_ai_storage()
                 
                 context = "\n".join(selected_messages)
                 
+                # В режиме поиска по истории контекст подбирается по запросу
+                retrieval_dialog_ids = None
+                candidates = None
+                if use_retrieval:
+                    retrieval_dialog_ids = [d['id'] for d in getattr(self, 'selected_dialogs', [])]
+                    if not retrieval_dialog_ids and getattr(self, 'selected_dialog_id', None):
+                        retrieval_dialog_ids = [self.selected_dialog_id]
+                    candidates = self.messages
+                
                 self.log(f"Отправка запроса к ИИ: {message}")
                 self.log(f"Контекст (выбрано {len(selected_messages)} сообщений)")
+                if retrieval_dialog_ids:
+                    self.log(f"Поиск по истории {len(retrieval_dialog_ids)} чатов")
                 
                 # Используем AI-менеджер для получения ответа
                 # Проверяем, есть ли API ключ в настройках
                 if 'openai_api_key' not in self.settings:
                     # Получаем API ключ из конфига
-                    config_name = self.config_var.get()
-                    config_path = os.path.join(self.app_dir, "configs", f"{config_name}.py")
-                    config = load_config(config_path)
+                    config = self.config_service.get(config_name)
                     self.settings['openai_api_key'] = config.openai_api_key
                 
                 # Получаем ответ от ИИ
                 response = await self.ai_manager.get_response(
                     user_query=message, 
-                    context=context
+                    context=context,
+                    dialog_id=getattr(self, 'selected_dialog_id', None),
+                    retrieval_dialog_ids=retrieval_dialog_ids,
+                    candidates=candidates
                 )
                 
                 # Отображаем ответ в чате
-                self.ai_chat.insert(tk.END, f"ИИ: {response}\n\n")
-                self.ai_chat.see(tk.END)
+                self.ui_bus.append_text(self.ai_chat, f"ИИ: {response}\n\n")
                 
             except Exception as e:
                 self.log(f"Ошибка при отправке запроса к ИИ: {e}")
                 import traceback
                 self.log(traceback.format_exc())
-                self.ai_chat.insert(tk.END, f"Ошибка: {str(e)}\n\n")
-                self.ai_chat.see(tk.END)
+                self.ui_bus.append_text(self.ai_chat, f"Ошибка: {str(e)}\n\n")
             finally:
-                self.progress.stop()
-                self.send_to_ai_btn.state(['!disabled'])
-                self.ai_input.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.send_to_ai_btn.state, ['!disabled'])
+                self.ui_bus.call(self.ai_input.state, ['!disabled'])
+        
+        self.tasks.submit(process_ai_request, 'Запрос к ИИ', slot='ai')
+
+    async def attach_ai_storage(self):
+        """Подключение БД клиента к AI-менеджеру для кеша и статистики"""
+        if self.ai_manager.db_handler is not None:
+            return
+        if not (self.client_manager.use_cache and self.client_manager.db_handler):
+            return
+        me = await self.client_manager.client.get_me()
+        account_id = str(me.phone) if me.phone else str(me.id)
+        self.ai_manager.attach_storage(self.client_manager.db_handler, account_id)
+
+    async def attach_semantic_index(self, debug: bool = False):
+        """Создание векторного индекса сообщений текущего аккаунта"""
+        if self.ai_manager.semantic_index is not None:
+            return
+        try:
+            from .semantic_index import SemanticIndex, create_embedder
+            me = await self.client_manager.client.get_me()
+            account_id = str(me.phone) if me.phone else str(me.id)
+            openai_client = self.ai_manager.get_openai_client() if self.settings.get('semantic_embedder') == 'openai' else None
+            embedder = create_embedder(self.settings, openai_client, self.ai_manager.scheduler)
+            index = SemanticIndex(
+                os.path.join(self.app_dir, 'cache', 'semantic'),
+                account_id,
+                embedder,
+                debug=debug
+            )
+            self.ai_manager.attach_semantic_index(index)
+            self.log(f"Векторный индекс загружен: {len(index)} сообщений")
+        except Exception as e:
+            self.log(f"Семантический поиск недоступен: {e}")
+
+    def setup_usage_tab(self):
+        """Настройка вкладки статистики использования ИИ"""
+        controls = ttk.Frame(self.usage_frame)
+        controls.pack(fill='x', pady=(0, 5))
+        
+        ttk.Label(controls, text="Группировка:").pack(side='left', padx=(0, 5))
+        self.usage_group_var = tk.StringVar(value='model')
+        self.usage_group_combo = ttk.Combobox(
+            controls,
+            textvariable=self.usage_group_var,
+            values=['model', 'dialog', 'day', 'operation'],
+            state='readonly',
+            width=12
+        )
+        self.usage_group_combo.pack(side='left', padx=5)
+        self.usage_group_combo.bind('<<ComboboxSelected>>', lambda e: self.refresh_usage_stats())
+        
+        ttk.Button(controls, text="Обновить", command=self.refresh_usage_stats).pack(side='left', padx=5)
+        ttk.Button(controls, text="Экспорт в JSON", command=self.export_usage_stats).pack(side='left', padx=5)
+        
+        self.usage_total_label = ttk.Label(controls, text="")
+        self.usage_total_label.pack(side='right', padx=5)
+        
+        self.usage_cache_label = ttk.Label(self.usage_frame, text="")
+        self.usage_cache_label.pack(fill='x', pady=(0, 5))
+        
+        self.usage_routing_label = ttk.Label(self.usage_frame, text="", justify='left')
+        self.usage_routing_label.pack(fill='x', pady=(0, 5))
+        
+        columns = ('key', 'calls', 'cache_hits', 'prompt_tokens', 'completion_tokens', 'avg_latency', 'cost')
+        headings = ('Группа', 'Вызовы', 'Из кеша', 'Токены промпта', 'Токены ответа', 'Задержка, с', 'Стоимость, $')
+        self.usage_tree = ttk.Treeview(self.usage_frame, columns=columns, show='headings')
+        for column, heading in zip(columns, headings):
+            self.usage_tree.heading(column, text=heading)
+            self.usage_tree.column(column, width=180 if column == 'key' else 100,
+                                   anchor='w' if column == 'key' else 'e')
+        self.usage_tree.pack(fill='both', expand=True)
+
+    def refresh_usage_stats(self):
+        """Обновление таблицы статистики использования ИИ"""
+        group_by = self.usage_group_var.get()
+        
+        async def load_usage():
+            try:
+                summary = await self.ai_manager.usage_tracker.get_summary(group_by)
+                self.ui_bus.call(self.display_usage_stats, summary)
+            except Exception as e:
+                self.log(f"Ошибка при загрузке статистики ИИ: {e}")
         
-        asyncio.run_coroutine_threadsafe(process_ai_request(), self.loop)
+        self.tasks.submit(load_usage, 'Статистика использования ИИ', slot='usage', priority=PRIORITY_BACKGROUND)
 
-    def load_messages(self):
-        """Загрузка сообщений для выбранного диалога"""
+    def display_usage_stats(self, summary: List[Dict[str, Any]]):
+        """Отображение сводки использования ИИ в таблице"""
+        for item in self.usage_tree.get_children():
+            self.usage_tree.delete(item)
+        
+        total_cost = 0.0
+        total_tokens = 0
+        for row in summary:
+            total_cost += row['cost']
+            total_tokens += row['prompt_tokens'] + row['completion_tokens']
+            self.usage_tree.insert('', 'end', values=(
+                row['key'] if row['key'] is not None else '-',
+                row['calls'],
+                row['cache_hits'],
+                row['prompt_tokens'],
+                row['completion_tokens'],
+                f"{row['avg_latency']:.2f}",
+                f"{row['cost']:.4f}"
+            ))
+        self.usage_total_label.config(text=f"Всего: {total_tokens} токенов, ${total_cost:.4f}")
+        
+        # Эффективность семантического кеша и доля попаданий при других порогах
+        semantic_cache = self.ai_manager.semantic_cache
+        if semantic_cache is not None:
+            stats = semantic_cache.get_stats()
+            text = (f"Семантический кеш: {stats['hits']} из {stats['lookups']} запросов "
+                    f"({stats['hit_rate']:.0%}), порог {stats['threshold']}")
+            if 'hits_by_threshold' in stats:
+                text += "; при пороге " + ", ".join(
+                    f"{t}: {rate:.0%}" for t, rate in stats['hits_by_threshold'].items())
+            self.usage_cache_label.config(text=text)
+        
+        # Маршрутизация моделей по этапам и фактические задержки
+        routing_lines = []
+        for operation, stage in self.ai_manager.router.get_report().items():
+            line = f"{operation}: {stage['model']}"
+            if stage['slo']:
+                line += f", SLO {stage['slo']} сек."
+            if stage['degraded']:
+                line += f" (переключено на {self.ai_manager.router.fallback_model})"
+            for model, latency in stage['models'].items():
+                line += f"; {model}: p50 {latency['p50']:.2f} / p90 {latency['p90']:.2f} сек."
+            routing_lines.append(line)
+        self.usage_routing_label.config(text="\n".join(routing_lines))
+
+    def export_usage_stats(self):
+        """Экспорт статистики использования ИИ в JSON"""
+        from tkinter import filedialog
+        path = filedialog.asksaveasfilename(
+            defaultextension='.json',
+            filetypes=[('JSON', '*.json')],
+            initialfile='ai_usage.json'
+        )
+        if not path:
+            return
+        group_by = self.usage_group_var.get()
+        
+        async def export():
+            try:
+                await self.ai_manager.usage_tracker.export_json(path, group_by)
+                self.log(f"Статистика ИИ экспортирована в {path}")
+            except Exception as e:
+                self.log(f"Ошибка при экспорте статистики ИИ: {e}")
+        
+        self.tasks.submit(export, 'Экспорт статистики ИИ', priority=PRIORITY_BACKGROUND)
+
+    def message_filters(self) -> Dict[str, Any]:
+        """Фильтры загрузки сообщений из полей ввода; вызывается в потоке Tk"""
+        try:
+            limit = int(self.max_messages_var.get())
+        except ValueError:
+            self.log("Некорректный лимит сообщений, используется 100")
+            limit = 100
+        return {
+            'search': self.message_search_var.get(),
+            'limit': limit,
+            'filter': self.message_filter_var.get()
+        }
+
+    def load_messages(self, seed=None):
+        """Загрузка сообщений для выбранного диалога
+        
+        Args:
+            seed: Уже показанные сообщения этого диалога (снимок сессии); свежие
+                страницы применяются к ним без очистки таблицы
+        """
         if not hasattr(self, 'selected_dialog_id') or self.selected_dialog_id is None:
             self.log("Ошибка: не выбран диалог")
             return
         
         self.log(f"[СООБЩЕНИЯ] Загрузка сообщений для диалога ID: {self.selected_dialog_id}")
+        filters = self.message_filters()
+        show_all = self.show_all_messages_var.get()
         
         self.progress.start()
         self.load_messages_btn.state(['disabled'])
         
         async def run():
             try:
-                # Проверяем режим отображения всех сообщений
-                show_all = self.show_all_messages_var.get()
                 
                 # Если выбрана тема и не включен режим "показать все", используем загрузку сообщений для темы
                 if hasattr(self, 'selected_topic_id') and self.selected_topic_id is not None and not show_all:
                     self.log(f"[СООБЩЕНИЯ] Используем выбранную тему {self.selected_topic_id} для загрузки сообщений")
                     # Вызываем метод загрузки сообщений для темы
-                    await self.load_topic_messages_async()
+                    await self.load_topic_messages_async(filters)
                 else:
                     # Иначе загружаем все сообщения
                     if show_all:
                         self.log("[СООБЩЕНИЯ] Режим показа всех сообщений активен, игнорируем выбранную тему")
                     else:
                         self.log("[СООБЩЕНИЯ] Тема не выбрана, загружаем обычные сообщения")
-                    await self.load_messages_async()
+                    await self.load_messages_async(filters, seed)
             finally:
-                self.progress.stop()
-                self.load_messages_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.load_messages_btn.state, ['!disabled'])
                 self.log("[СООБЩЕНИЯ] Загрузка сообщений завершена")
         
         try:
             self._ensure_loop_active()
-            future = asyncio.run_coroutine_threadsafe(run(), self.loop)
-            future.add_done_callback(self._handle_async_result)
+            self.tasks.submit(run, 'Загрузка сообщений', slot='messages')
         except RuntimeError as e:
             self.log(f"Ошибка при запуске асинхронной задачи: {e}")
             messagebox.showerror("Ошибка", f"Не удалось запустить задачу: {e}")
     
-    async def load_topic_messages_async(self):
-        """Асинхронная загрузка сообщений для выбранной темы"""
+    async def load_topic_messages_async(self, filters: Dict[str, Any]):
+        """Асинхронная загрузка сообщений для выбранной темы
+
+        Args:
+            filters: Фильтры из message_filters()
+        """
         try:
             # Проверяем, что клиент инициализирован
             if not self.client_manager or not hasattr(self.client_manager, 'client') or not self.client_manager.client.is_connected():
@@ -1688,16 +2196,11 @@ db_settings = {{
             # Проверяем кеш, если клиент использует кеширование
             use_cache = self.client_manager.use_cache and self.client_manager.db_handler
             
-            # Получаем фильтры от пользователя и добавляем ID темы
-            limit = int(self.max_messages_var.get())
+            # Добавляем к фильтрам ID темы
+            limit = filters['limit']
             self.log(f"[ТЕМА_СООБЩЕНИЯ] Запрошен лимит: {limit} сообщений")
             
-            filters = {
-                'search': self.message_search_var.get(),
-                'limit': limit,
-                'filter': self.message_filter_var.get(),
-                'topic_id': self.selected_topic_id
-            }
+            filters = dict(filters, topic_id=self.selected_topic_id)
             
             # Логируем запрос для отладки
             self.log(f"[ТЕМА_СООБЩЕНИЯ] Загрузка сообщений для темы {self.selected_topic_id} в диалоге {self.selected_dialog_id} с фильтрами: {filters}")
@@ -1705,40 +2208,21 @@ db_settings = {{
             # Загружаем сообщения
             messages = await self.client_manager.filter_messages(self.selected_dialog_id, filters)
             
-            # Очищаем список сообщений
-            self.messages_tree.delete(*self.messages_tree.get_children())
-            
-            # Заполняем список сообщений
-            for i, message in enumerate(messages):
-                # Проверяем тип поля date и форматируем соответственно
-                if isinstance(message['date'], str):
-                    date_str = message['date']
-                else:
-                    date_str = message['date'].strftime('%Y-%m-%d %H:%M:%S')
-                
-                # Добавляем в Treeview
-                item_id = self.messages_tree.insert('', 'end', values=(
-                    message['id'],
-                    message['sender_name'],
-                    message['text'][:100] + ('...' if len(message['text']) > 100 else ''),
-                    date_str
-                ))
-                
-                # Логируем добавление для последних 2 сообщений
-                if i >= len(messages) - 2:
-                    self.log(f"[ТЕМА_СООБЩЕНИЯ] Добавлено в Treeview сообщение #{i+1}: id={message['id']}, item_id={item_id}")
-            
-            # Сохраняем сообщения для последующей фильтрации
+            # Сохраняем сообщения для последующей фильтрации, строки таблицы строит индекс
+            self._message_load_generation += 1
             self.messages = messages
+            self._messages_dialog_id = None
+            
+            # Заменяем список сообщений
+            self.ui_bus.clear(self.messages_tree)
+            self.ui_bus.insert_rows(self.messages_tree, self.get_message_store().rows(range(len(messages))))
             
             self.log(f"[ТЕМА_СООБЩЕНИЯ] Всего загружено сообщений темы: {len(messages)}")
-            self.log(f"[ТЕМА_СООБЩЕНИЯ] Количество отображаемых сообщений: {len(self.messages_tree.get_children())}")
             
-            # Отображаем последнее сообщение (прокручиваем список вниз)
-            if self.messages_tree.get_children():
-                last_item = self.messages_tree.get_children()[-1]
-                self.messages_tree.see(last_item)
-                self.log(f"[ТЕМА_СООБЩЕНИЯ] Прокручиваем к последнему сообщению ID: {self.messages_tree.item(last_item, 'values')[0]}")
+            # Отображаем последнее сообщение (прокручиваем список вниз) после вставки строк
+            if messages:
+                self.ui_bus.call(self.scroll_messages_to_end)
+                self.log(f"[ТЕМА_СООБЩЕНИЯ] Прокручиваем к последнему сообщению ID: {messages[-1]['id']}")
             
         except Exception as e:
             self.log(f"Ошибка при загрузке сообщений темы: {e}")
@@ -1772,40 +2256,35 @@ db_settings = {{
             self.messages_frame.configure(text=f"Сообщения из темы: {topic_title}")
             self.log(f"[ТЕМА_СООБЩЕНИЯ] Обновлен заголовок: Сообщения из темы: {topic_title}")
         
+        filters = self.message_filters()
         self.progress.start()
         self.load_messages_btn.state(['disabled'])
         
         async def run():
             try:
                 self.log(f"[ТЕМА_СООБЩЕНИЯ] Начинаем загрузку сообщений темы {self.selected_topic_id}")
-                await self.load_topic_messages_async()
+                await self.load_topic_messages_async(filters)
             finally:
-                self.progress.stop()
-                self.load_messages_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.load_messages_btn.state, ['!disabled'])
                 self.log(f"[ТЕМА_СООБЩЕНИЯ] Завершена загрузка сообщений темы {self.selected_topic_id}")
         
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Загрузка сообщений темы', slot='messages')
 
     def update_dialogs_cache(self):
         """Обновление кеша диалогов"""
+        dialog_limit = self.max_dialogs_var.get()
         self.progress.start()
         self.update_cache_btn.state(['disabled'])
         
         async def run():
             try:
-                if not self.client_manager:
-                    self.client_manager = TelegramClientManager({
-                        'config_name': self.config_var.get(),
-                        'app_dir': self.app_dir,
-                        'debug': self.debug_var.get()
-                    })
-                
                 if not await self.client_manager.init_client():
                     self.log("Ошибка: клиент не инициализирован")
                     return
                 
-                # Получаем лимит из настроек
-                dialog_limit = int(self.max_dialogs_var.get())
+                # Лимит из поля ввода
+                dialog_limit = int(dialog_limit)
                 
                 # Применяем фильтры с force_refresh=True для обновления кеша
                 filters = {
@@ -1820,57 +2299,170 @@ db_settings = {{
                 self.log("Кеш диалогов успешно обновлен")
                 
                 # Обновляем список диалогов
-                self.load_filtered_dialogs()
+                self.ui_bus.call(self.load_filtered_dialogs)
             except Exception as e:
                 self.log(f"Ошибка при обновлении кеша диалогов: {e}")
                 import traceback
                 self.log(traceback.format_exc())
             finally:
-                self.progress.stop()
-                self.update_cache_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.update_cache_btn.state, ['!disabled'])
         
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Обновление кеша диалогов', slot='dialogs_cache', priority=PRIORITY_BACKGROUND)
+        
+    def run_batch_digest(self):
+        """Пакетный дайджест по выделенным диалогам с отчетом в Markdown"""
+        selected = [self.dialogs_tree.item(item)['values'] for item in self.dialogs_tree.selection()]
+        if not selected:
+            self.log("Не выбраны диалоги для дайджеста")
+            return
+        dialogs = [{'id': int(values[4]), 'name': str(values[0])} for values in selected]
+        try:
+            hours = float(self.digest_hours_var.get() or 0)
+        except ValueError:
+            self.log("Некорректное количество часов для дайджеста")
+            return
+        debug = self.debug_var.get()
         
-    def apply_filter_to_loaded_messages(self):
-        """Применение фильтра к уже загруженным сообщениям"""
         self.progress.start()
-        self.filter_messages_btn.state(['disabled'])
+        self.digest_btn.state(['disabled'])
         
-        try:
-            # Получаем фильтры от пользователя
-            search_filter = self.message_search_var.get().lower()
-            sort_key = self.message_sort_var.get()
-            
-            filtered_messages = [
-                message for message in self.messages
-                if search_filter in message['text'].lower()
-            ]
-            
-            filtered_messages.sort(key=lambda x: x[sort_key])
-            
-            self.messages_tree.delete(*self.messages_tree.get_children())
-            
-            for message in filtered_messages:
-                sender = message.get('sender_name', 'Неизвестно')
-                text = message['text'].replace('\n', ' ')
+        async def run():
+            from .batch_digest import BatchDigestJob, DatabaseCheckpointStore, FileCheckpointStore, write_report
+            try:
+                if not self.client_manager or not self.client_manager.client.is_connected():
+                    self.log("Ошибка: клиент не инициализирован")
+                    return
                 
-                # Проверяем тип поля date и форматируем соответственно
-                if isinstance(message['date'], str):
-                    date = message['date']
+                since = None
+                if hours > 0:
+                    # Окно выравнивается по часу: повторный запуск в течение часа продолжает то же задание
+                    now = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+                    since = now - datetime.timedelta(hours=hours)
+                
+                digests_dir = os.path.join(self.app_dir, 'digests')
+                db_handler = self.client_manager.db_handler
+                if db_handler:
+                    me = await self.client_manager.client.get_me()
+                    account_id = str(me.phone) if me.phone else str(me.id)
+                    store = DatabaseCheckpointStore(db_handler, account_id)
                 else:
-                    date = message['date'].strftime('%Y-%m-%d %H:%M:%S')
+                    store = FileCheckpointStore(os.path.join(digests_dir, 'checkpoints.json'))
+                
+                def on_progress(done, total, result):
+                    self.log(f"Дайджест: {done}/{total} - {result['dialog_name']} ({result['status']})")
+                
+                job = BatchDigestJob(
+                    self.client_manager, self.ai_manager, self.ai_manager.get_openai_client(), dialogs, store,
+                    since=since,
+                    fetch_concurrency=int(self.settings.get('digest_fetch_concurrency', 8)),
+                    summary_concurrency=int(self.settings.get('digest_summary_concurrency', 4)),
+                    message_limit=self.settings.get('digest_message_limit'),
+                    first_run_hours=float(self.settings.get('digest_first_run_hours', 24)),
+                    dialog_timeout=self.settings.get('digest_dialog_timeout'),
+                    execution_mode=self.settings.get('digest_execution'),
+                    near_duplicate_filter=(self.make_near_duplicate_filter()
+                                           if self.settings.get('digest_near_dedupe', True) else None),
+                    progress_callback=on_progress,
+                    debug=debug
+                )
+                results = await job.run()
+                stamp = datetime.datetime.now().strftime('%Y%m%d_%H%M')
+                path = write_report(results, os.path.join(digests_dir, f'digest_{stamp}.md'),
+                                    title=f"Дайджест {stamp}")
+                self.log(f"Дайджест сохранен: {path}")
+            except Exception as e:
+                self.log(f"Ошибка при построении дайджеста: {e}")
+            finally:
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.digest_btn.state, ['!disabled'])
+        
+        self.tasks.submit(run, 'Дайджест по чатам', slot='digest', priority=PRIORITY_BACKGROUND)
+
+    def summarize_forum(self):
+        """Саммари по всем темам выбранного форума с выводом в чат ИИ"""
+        if getattr(self, 'selected_dialog_id', None) is None:
+            self.log("Ошибка: не выбран диалог")
+            return
+        chat_id = self.selected_dialog_id
+        limit = self.message_filters()['limit']
+        
+        self.progress.start()
+        self.forum_summary_btn.state(['disabled'])
+        
+        async def run():
+            from .forum_summary import load_forum_topics, summarize_forum, format_forum_digest
+            try:
+                if not self.client_manager or not self.client_manager.client.is_connected():
+                    self.log("Ошибка: клиент не инициализирован")
+                    return
+                await self.attach_ai_storage()
+                
+                me = await self.client_manager.client.get_me()
+                account_id = str(me.phone) if me.phone else str(me.id)
+                topics = await load_forum_topics(self.client_manager, chat_id, account_id)
+                if not topics:
+                    self.log("Чат не является форумом или темы не найдены")
+                    return
+                self.log(f"Саммари форума: {len(topics)} тем")
+                
+                def on_progress(done, total, result):
+                    self.log(f"Саммари форума: {done}/{total} - {result['title']} ({result['message_count']} сообщ.)")
                 
-                self.messages_tree.insert('', 'end', values=(message['id'], sender, text, date))
+                result = await summarize_forum(
+                    self.client_manager, self.ai_manager, self.ai_manager.get_openai_client(), chat_id, topics,
+                    limit=limit,
+                    progress_callback=on_progress
+                )
+                self.log(f"Саммари форума готово за {result['elapsed']:.1f} сек.")
+                digest = format_forum_digest(result)
+                self.ui_bus.append_text(self.ai_chat, f"ИИ: {digest}\n\n")
+            except Exception as e:
+                self.log(f"Ошибка при саммари форума: {e}")
+            finally:
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.forum_summary_btn.state, ['!disabled'])
+        
+        self.tasks.submit(run, 'Саммари форума', slot='forum')
+
+    def apply_filter_to_loaded_messages(self):
+        """Применение фильтра к уже загруженным сообщениям"""
+        try:
+            store = self.get_message_store()
+            indices = store.filter(self.message_search_var.get())
+            indices = store.sort(indices, self.message_sort_var.get())
+            self.messages_tree.set_rows(store.rows(indices))
+            self._messages_view_filtered = True
             
-            self.log(f"Сообщения отфильтрованы: {len(filtered_messages)}")
+            self.log(f"Сообщения отфильтрованы: {len(indices)}")
         except Exception as e:
             self.log(f"Ошибка при фильтрации сообщений: {e}")
-        finally:
-            self.progress.stop()
-            self.filter_messages_btn.state(['!disabled'])
 
-    async def load_messages_async(self):
-        """Асинхронная загрузка сообщений для выбранного диалога"""
+    def message_row(self, message):
+        """Значения колонок таблицы сообщений: текст обрезается для отображения"""
+        # Проверяем тип поля date и форматируем соответственно
+        if isinstance(message['date'], str):
+            date_str = message['date']
+        else:
+            date_str = message['date'].strftime('%Y-%m-%d %H:%M:%S')
+        return (
+            message['id'],
+            message['sender_name'],
+            message['text'][:100] + ('...' if len(message['text']) > 100 else ''),
+            date_str
+        )
+
+    def scroll_messages_to_end(self):
+        """Прокрутка таблицы сообщений к последнему сообщению"""
+        self.messages_tree.see_end()
+
+    async def load_messages_async(self, filters: Dict[str, Any], seed=None):
+        """Асинхронная загрузка сообщений для выбранного диалога
+
+        Args:
+            filters: Фильтры из message_filters()
+            seed: Уже показанные сообщения диалога
+        """
         try:
             # Проверяем, что клиент инициализирован
             if not self.client_manager or not hasattr(self.client_manager, 'client') or not self.client_manager.client.is_connected():
@@ -1878,64 +2470,84 @@ db_settings = {{
                     self.log("Ошибка: клиент не инициализирован")
                     return
             
-            # Получаем фильтры от пользователя
-            filters = {
-                'search': self.message_search_var.get(),
-                'limit': int(self.max_messages_var.get()),
-                'filter': self.message_filter_var.get()
-            }
-            
             # Логируем запрос для отладки
             self.log(f"Загрузка сообщений для диалога {self.selected_dialog_id} с фильтрами: {filters}")
             
-            # Загружаем сообщения
-            messages = await self.client_manager.filter_messages(self.selected_dialog_id, filters)
-            
-            # Очищаем список сообщений
-            self.messages_tree.delete(*self.messages_tree.get_children())
+            from .message_stream import MessageMerger
             
-            # Заполняем список сообщений
-            for message in messages:
-                # Проверяем тип поля date и форматируем соответственно
-                if isinstance(message['date'], str):
-                    date_str = message['date']
-                else:
-                    date_str = message['date'].strftime('%Y-%m-%d %H:%M:%S')
-                
-                self.messages_tree.insert('', 'end', values=(
-                    message['id'],
-                    message['sender_name'],
-                    message['text'][:100] + ('...' if len(message['text']) > 100 else ''),
-                    date_str
-                ))
-            
-            # Сохраняем сообщения для последующей фильтрации
-            self.messages = messages
+            # Новая загрузка отменяет применение страниц предыдущей
+            self._message_load_generation += 1
+            generation = self._message_load_generation
+            merger = MessageMerger()
+            if seed:
+                merger.apply(seed)
+            else:
+                self.ui_bus.call(self.reset_message_view)
             
-            self.log(f"Сообщения загружены: {len(messages)}")
+            # Кешированные сообщения показываются сразу, свежие страницы из Telegram -
+            # по мере получения. Страницы применяются в потоке Tk
+            async for page in self.client_manager.stream_messages(self.selected_dialog_id, filters):
+                self.ui_bus.call(self.apply_message_page, generation, merger, page)
+            self.ui_bus.call(self.finish_message_stream, generation, merger)
         except Exception as e:
             self.log(f"Ошибка при загрузке сообщений: {e}")
             import traceback
             self.log(traceback.format_exc())
 
+    def apply_message_page(self, generation, merger, page):
+        """Применение страницы потока сообщений: новые строки вставляются на свои места,
+        измененные обновляются без перерисовки остальных"""
+        from .message_stream import PAGE_CACHED, position_runs
+        if generation != self._message_load_generation:
+            return
+        inserted, updated = merger.apply(page.messages)
+        # Новый список, чтобы индекс загруженных сообщений перестроился
+        self.messages = list(merger.messages)
+        self._messages_dialog_id = self.selected_dialog_id
+        
+        if self.messages_tree.sort_state:
+            # Пользователь отсортировал таблицу во время загрузки: позиции не совпадают
+            self.messages_tree.set_rows([self.message_row(m) for m in self.messages], keep_sort=True)
+        elif self._messages_view_filtered:
+            # Показан фильтр или сортировка из панели фильтров: представление строится заново
+            self.apply_filter_to_loaded_messages()
+        else:
+            for start, count in position_runs(inserted):
+                self.messages_tree.insert_rows(start, [self.message_row(m) for m in self.messages[start:start + count]])
+            if updated:
+                self.messages_tree.update_rows({i: self.message_row(self.messages[i]) for i in updated})
+        
+        if page.kind == PAGE_CACHED:
+            self.messages_progress_var.set(f"Из кеша: {len(merger)}, проверка новых...")
+        else:
+            self.messages_progress_var.set(f"Загружено: {len(merger)} (из Telegram: {page.fetched})")
+
+    def reset_message_view(self):
+        """Очистка таблицы сообщений перед загрузкой: строки снова идут в порядке потока"""
+        self.messages_tree.clear()
+        self._messages_view_filtered = False
+
+    def finish_message_stream(self, generation, merger):
+        """Завершение потока сообщений: итог в строке состояния"""
+        if generation != self._message_load_generation:
+            return
+        self.messages_progress_var.set(f"Сообщений: {len(merger)}")
+        self.log(f"Сообщения загружены: {len(merger)}")
+
     def on_message_select(self, event):
         """Обработчик выбора сообщения"""
-        selected_items = self.messages_tree.selection()
-        if not selected_items:
+        selected_rows = self.messages_tree.selected_rows()
+        if not selected_rows:
             return
         
         # Получаем ID выбранного сообщения
-        message_id = self.messages_tree.item(selected_items[0])['values'][0]
+        message_id = selected_rows[0][0]
         
         # Логируем для отладки
         self.log(f"Выбрано сообщение с ID: {message_id}")
         
-        # Находим сообщение по ID в списке messages
-        selected_message = None
-        for message in self.messages:
-            if str(message['id']) == str(message_id):  # Преобразуем оба к строке для сравнения
-                selected_message = message
-                break
+        # Находим сообщение по ID в индексе загруженных сообщений
+        selected_message = self.get_message_store().get(message_id)
         
         # Отображаем полный текст сообщения
         if selected_message:
@@ -1973,6 +2585,9 @@ db_settings = {{
 
     def filter_dialogs(self):
         """Фильтрация диалогов"""
+        dialog_search = self.dialog_search_var.get()
+        dialog_limit = self.max_dialogs_var.get()
+        dialog_sort = self.dialog_sort_var.get()
         self.progress.start()
         self.filter_dialogs_btn.state(['disabled'])
         
@@ -1983,27 +2598,25 @@ db_settings = {{
                         self.log("Ошибка: клиент не инициализирован")
                         return
                 
-                # Получаем фильтры от пользователя
+                # Фильтры из полей ввода
                 filters = {
-                    'search': self.dialog_search_var.get(),
-                    'limit': int(self.max_dialogs_var.get()),
-                    'sort': self.dialog_sort_var.get()
+                    'search': dialog_search,
+                    'limit': int(dialog_limit),
+                    'sort': dialog_sort
                 }
                 
                 self.dialogs = await self.client_manager.filter_dialogs(filters)
-                self.dialogs_tree.delete(*self.dialogs_tree.get_children())
-                
-                for dialog in self.dialogs:
-                    self.dialogs_tree.insert('', 'end', text=dialog['name'], values=(dialog['type'], '', dialog['id']))
+                # Таблица заполняется в потоке Tk из индекса загруженных диалогов
+                self.ui_bus.call(self.apply_filter_to_loaded_dialogs)
                 
                 self.log(f"Диалоги загружены: {len(self.dialogs)}")
             except Exception as e:
                 self.log(f"Ошибка при фильтрации диалогов: {e}")
             finally:
-                self.progress.stop()
-                self.filter_dialogs_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.filter_dialogs_btn.state, ['!disabled'])
         
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Фильтрация диалогов', slot='dialogs')
 
     def load_window_state(self):
         """Загрузка состояния окна"""
@@ -2078,7 +2691,8 @@ db_settings = {{
         
         # Сохраняем настройки
         
-        # Корректно завершаем event loop
+        # Отменяем незавершенные задачи и корректно завершаем event loop
+        self.tasks.cancel_all()
         if hasattr(self, 'loop') and self.loop and not self.loop.is_closed():
             try:
                 self.log("Завершение event loop")
@@ -2089,6 +2703,14 @@ db_settings = {{
             except Exception as e:
                 self.log(f"Ошибка при завершении loop: {str(e)}")
         
+        # Снимок для быстрого следующего запуска
+        self.save_session_snapshot()
+        
+        self.ui_bus.stop()
+        if self._log_flush_id is not None:
+            self.root.after_cancel(self._log_flush_id)
+        if self._config_poll_id is not None:
+            self.root.after_cancel(self._config_poll_id)
         self.root.destroy()
         self.save_settings()
         
@@ -2100,29 +2722,31 @@ db_settings = {{
 
     def apply_client_version(self):
         """Применение новой версии клиента"""
+        client_config = {
+            'config_name': self.config_var.get(),
+            'app_dir': self.app_dir,
+            'system_version': self.system_version_var.get(),
+            'device_model': self.device_model_var.get(),
+            'app_version': self.app_version_var.get()
+        }
         self.progress.start()
         self.apply_version_btn.state(['disabled'])
         
         async def reconnect():
+            from .telegram_client import TelegramClientManager
             try:
                 # Отключаем старый клиент
-                if hasattr(self, 'client_manager') and self.client_manager is not None:
-                    if hasattr(self.client_manager, 'client') and self.client_manager.client is not None:
-                        if self.client_manager.client.is_connected():
-                            await self.client_manager.client.disconnect()
+                if self._client_manager is not None:
+                    if hasattr(self._client_manager, 'client') and self._client_manager.client is not None:
+                        if self._client_manager.client.is_connected():
+                            await self._client_manager.client.disconnect()
                 
                 # Создаем новый клиент с новыми параметрами
-                self.client_manager = TelegramClientManager({
-                    'config_name': self.config_var.get(),
-                    'app_dir': self.app_dir,
-                    'system_version': self.system_version_var.get(),
-                    'device_model': self.device_model_var.get(),
-                    'app_version': self.app_version_var.get()
-                })
+                self.client_manager = TelegramClientManager(client_config)
                 
                 # Очищаем список диалогов
                 self.dialogs = []
-                self.dialogs_tree.delete(*self.dialogs_tree.get_children())
+                self.ui_bus.clear(self.dialogs_tree)
                 
                 # Пробуем инициализировать клиент
                 await self.client_manager.init_client()
@@ -2131,30 +2755,38 @@ db_settings = {{
             except Exception as e:
                 self.log(f"Ошибка при обновлении версии клиента: {e}")
             finally:
-                self.progress.stop()
-                self.apply_version_btn.state(['!disabled'])
+                self.ui_bus.call(self.progress.stop)
+                self.ui_bus.call(self.apply_version_btn.state, ['!disabled'])
         
-        asyncio.run_coroutine_threadsafe(reconnect(), self.loop)
+        self.tasks.submit(reconnect, 'Переподключение', slot='connect')
 
     def treeview_sort_column(self, tv, col, reverse):
-        """Сортировка колонки в Treeview"""
-        l = [(tv.set(k, col), k) for k in tv.get_children('')]
-        
-        # Особая обработка для даты
-        if col == 'date':
-            # Пытаемся сортировать даты
-            l.sort(reverse=reverse)
+        """Сортировка колонки в Treeview
+
+        Сортировка устойчивая: строки с равными значениями сохраняют порядок
+        предыдущей сортировки. Строки переставляются одним вызовом set_children.
+        """
+        # Индекс диалогов используется, только если таблицу заполнил apply_filter_to_loaded_dialogs
+        if tv is self.dialogs_tree and self._dialog_view and self._dialog_store is not None \
+                and self._dialog_store.records is self.dialogs \
+                and set(self._dialog_view.values()) == set(tv.get_children('')):
+            # Типизированные ключи берутся из индекса диалогов, а не из ячеек таблицы
+            indices = self._dialog_store.sort_stable(list(self._dialog_view), col, reverse)
+            self._dialog_view = {i: self._dialog_view[i] for i in indices}
+            items = list(self._dialog_view.values())
         else:
+            items = tv.get_children('')
+            values = [tv.set(k, col) for k in items]
             try:
                 # Пробуем сортировать как числа
-                l.sort(key=lambda t: int(t[0]), reverse=reverse)
+                keys = [int(v) for v in values]
             except ValueError:
-                # Если не получилось, сортируем как строки
-                l.sort(reverse=reverse)
+                # Если не получилось, сортируем как строки без учета регистра
+                keys = [str(v).casefold() for v in values]
+            order = sorted(range(len(items)), key=keys.__getitem__, reverse=reverse)
+            items = [items[i] for i in order]
         
-        # Переупорядочиваем элементы
-        for index, (val, k) in enumerate(l):
-            tv.move(k, '', index)
+        tv.set_children('', *items)
         
         # Меняем направление сортировки при следующем клике
         tv.heading(col, command=lambda: self.treeview_sort_column(tv, col, not reverse))
@@ -2165,6 +2797,11 @@ db_settings = {{
         if not selected_items:
             return
         
+        # Событие от восстановления выделения: диалоги уже выбраны
+        quiet, self._quiet_selection = self._quiet_selection, None
+        if quiet is not None and tuple(selected_items) == quiet:
+            return
+        
         # Обработка множественного выбора диалогов
         self.selected_dialogs = []
         for item in selected_items:
@@ -2212,8 +2849,13 @@ db_settings = {{
                 # Обновляем UI
                 self.load_messages_btn.state(['!disabled'])
                 
+                # Загрузка сообщений прежнего диалога больше не нужна
+                self.tasks.cancel_slot('messages')
+                self._message_load_generation += 1
+                self._messages_dialog_id = None
+                
                 # Очищаем список сообщений при выборе нового диалога
-                self.messages_tree.delete(*self.messages_tree.get_children())
+                self.messages_tree.clear()
                 
                 # Очищаем список тем и проверяем, поддерживает ли чат темы
                 self.topics_tree.delete(*self.topics_tree.get_children())
@@ -2229,7 +2871,7 @@ db_settings = {{
         else:
             # При множественном выборе очищаем темы и сообщения
             self.topics_tree.delete(*self.topics_tree.get_children())
-            self.messages_tree.delete(*self.messages_tree.get_children())
+            self.messages_tree.clear()
             self.messages_filter_frame.configure(text=f"Фильтры сообщений: {len(selected_items)} чатов выбрано")
             self.messages_frame.configure(text=f"Сообщения из нескольких чатов")
             self.topics_frame.configure(text=f"Темы недоступны при выборе нескольких чатов")
@@ -2318,10 +2960,27 @@ db_settings = {{
         
         # Запускаем асинхронный поиск
         self.log("[ПОИСК] Запуск асинхронного поиска...")
-        asyncio.run_coroutine_threadsafe(self.search_messages_async(dialog_ids, search_params), self.loop)
+        self.tasks.submit(partial(self.search_messages_async, dialog_ids, search_params,
+                                  semantic=self.semantic_search_var.get(),
+                                  near_dedupe=self.search_near_dedupe_var.get(),
+                                  debug=self.debug_var.get()),
+                          'Поиск по чатам', slot='search')
     
-    async def search_messages_async(self, dialog_ids, search_params):
-        """Асинхронный поиск сообщений в нескольких чатах"""
+    def make_near_duplicate_filter(self):
+        """Фильтр почти одинаковых сообщений с порогом из настроек сжатия и подписями в кеше"""
+        from .message_compaction import get_compaction_settings
+        from .near_duplicates import NearDuplicateFilter
+        threshold = get_compaction_settings(self.settings.get('compaction'))['near_duplicate_threshold']
+        return NearDuplicateFilter(threshold, db_handler=self.ai_manager.db_handler,
+                                   account_id=self.ai_manager.account_id)
+
+    async def search_messages_async(self, dialog_ids, search_params, semantic=False, near_dedupe=False,
+                                    debug=False):
+        """Асинхронный поиск сообщений в нескольких чатах
+
+        Флаги семантического поиска, скрытия почти одинаковых сообщений и отладки
+        читаются из виджетов в потоке Tk и передаются сюда значениями.
+        """
         search_start_time = datetime.datetime.now()
         try:
             self.log("[ПОИСК] Начало асинхронного поиска сообщений...")
@@ -2331,7 +2990,7 @@ db_settings = {{
                 self.log("[ПОИСК] Клиент не подключен, инициализация...")
                 if not await self.client_manager.init_client():
                     self.log("[ПОИСК] ОШИБКА: Не удалось инициализировать клиент")
-                    messagebox.showerror("Ошибка", "Не удалось установить соединение с Telegram")
+                    self.ui_bus.call(messagebox.showerror, "Ошибка", "Не удалось установить соединение с Telegram")
                     return
                 else:
                     self.log("[ПОИСК] Клиент успешно инициализирован")
@@ -2339,53 +2998,59 @@ db_settings = {{
                 self.log("[ПОИСК] Клиент уже подключен, продолжаем...")
             
             # Очищаем существующие результаты
-            self.topics_tree.delete(*self.topics_tree.get_children())
-            self.messages_tree.delete(*self.messages_tree.get_children())
-            
-            # Логируем начало поиска
-            self.log(f"[ПОИСК] Вызов метода search_multiple_chats для {len(dialog_ids)} диалогов...")
-            self.log(f"[ПОИСК] Параметры поиска: текст='{search_params.get('text', '')}', отправитель='{search_params.get('sender', '')}', дата='{search_params.get('date', '')}'")
+            self.ui_bus.clear(self.topics_tree)
+            self.ui_bus.clear(self.messages_tree)
             
             # Обновляем интерфейс с сообщением о начале поиска
-            def update_ui_start():
-                self.ai_chat.config(state=tk.NORMAL)
-                self.ai_chat.insert(tk.END, f"Начало поиска: {datetime.datetime.now().strftime('%H:%M:%S')}\n")
-                self.ai_chat.see(tk.END)
-                self.ai_chat.config(state=tk.DISABLED)
-            
-            self.root.after(0, update_ui_start)
-            
-            # Вызываем метод поиска в нескольких чатах
-            results = {}
-            text_value = search_params.get('text', '').lower()
-            sender_value = search_params.get('sender', '').lower()
-            date_value = search_params.get('date', '')
-            reply_status = search_params.get('reply_status', 'all')
-            for did in dialog_ids:
-                messages = await self.client_manager.filter_messages(did, search_params)
-                filtered = []
-                for m in messages:
-                    # Фильтрация по тексту
-                    if text_value and text_value not in m['text'].lower():
-                        continue
-                    # Фильтрация по отправителю
-                    sender_field = m.get('sender_name') or m.get('sender') or ''
-                    if sender_value and sender_value not in sender_field.lower():
-                        continue
-                    # Фильтрация по дате (ожидается формат ГГГГ-ММ-ДД)
-                    if date_value:
-                        m_date = m['date'] if isinstance(m['date'], str) else m['date'].strftime('%Y-%m-%d')
-                        if date_value not in m_date:
-                            continue
-                    # Фильтрация по статусу ответа, если требуется
-                    if reply_status != 'all':
-                        if reply_status == 'replied' and not m.get('replied', False):
-                            continue
-                        if reply_status == 'not_replied' and m.get('replied', False):
-                            continue
-                    filtered.append(m)
-                results[did] = filtered
-            self.log(f"[ПОИСК] Получены результаты поиска для {len(results)} диалогов после локальной фильтрации")
+            self.ui_bus.append_text(self.ai_chat, f"Начало поиска: {datetime.datetime.now().strftime('%H:%M:%S')}\n")
+            self.ui_bus.call(self.begin_search_results)
+            
+            from .cross_chat_search import (
+                SearchQuery, CrossChatSearch, SOURCE_LOCAL, SOURCE_TELEGRAM,
+                local_index_hits, semantic_index_hits)
+            query = SearchQuery.from_params(search_params, dialog_ids)
+            semantic = semantic and bool(query.text)
+            if semantic:
+                await self.attach_semantic_index(debug)
+                semantic = self.ai_manager.semantic_index is not None
+            
+            # Два источника параллельно: локальный индекс (векторный или полнотекстовый по кешу)
+            # и поиск на стороне Telegram
+            if semantic:
+                local_source = semantic_index_hits(self.ai_manager, query)
+            else:
+                await self.attach_ai_storage()
+                local_source = local_index_hits(self.ai_manager.db_handler, self.ai_manager.account_id, query)
+            search = CrossChatSearch(query, {
+                SOURCE_LOCAL: local_source,
+                SOURCE_TELEGRAM: self.client_manager.search_chats(query),
+            }, server_side_sender=query.from_user() is not None)
+            self.log("[ПОИСК] Запрос: текст='%s', отправитель='%s', дата='%s', смысловой=%s",
+                     query.text, query.sender, query.date, semantic)
+            
+            to_index = {}
+            async for source, dialog_id, added in search.run():
+                # Результаты показываются по мере поступления
+                self.ui_bus.call(self.add_search_results, dialog_id, added)
+                if semantic and source == SOURCE_TELEGRAM:
+                    to_index.setdefault(dialog_id, []).extend(added)
+            
+            # Индекс пополняется найденными в Telegram сообщениями после поиска,
+            # чтобы векторизация не задерживала поступление результатов
+            for dialog_id, messages in to_index.items():
+                await self.ai_manager.index_messages(messages, dialog_id)
+            
+            for source, error in search.errors.items():
+                self.log("[ПОИСК] Источник '%s' недоступен: %s", source, error)
+                self.ui_bus.append_text(self.ai_chat, f"⚠️ Источник '{source}' недоступен: {error}\n")
+            self.log("[ПОИСК] Найдено в локальном индексе: %d, в Telegram: %d",
+                     search.merger.sources[SOURCE_LOCAL], search.merger.sources[SOURCE_TELEGRAM])
+            
+            results = search.merger.sorted_results(by_score=semantic)
+            if near_dedupe:
+                results, removed = await self.make_near_duplicate_filter().dedupe_results(results)
+                self.log(f"[ПОИСК] Скрыто почти одинаковых сообщений: {removed}")
+            self.log(f"[ПОИСК] Получены результаты поиска для {len(results)} диалогов")
             
             # Выводим отчет о результатах
             total_results = sum(len(chat_results) for chat_results in results.values())
@@ -2422,14 +3087,14 @@ db_settings = {{
                     self.messages_frame.configure(text="Список сообщений: нет результатов")
                     self.topics_frame.configure(text="Результаты поиска: ничего не найдено")
                 
-                self.root.after(0, update_ui_no_results)
-                messagebox.showinfo("Информация", "По вашему запросу ничего не найдено")
+                self.ui_bus.call(update_ui_no_results)
+                self.ui_bus.call(messagebox.showinfo, "Информация", "По вашему запросу ничего не найдено")
                 return
             
             # Обрабатываем и отображаем результаты
             self.log("[ПОИСК] Обработка результатов поиска...")
-            self.process_search_results(results)
-            self.log("[ПОИСК] Результаты успешно обработаны и отображены")
+            self.ui_bus.call(self.process_search_results, results)
+            self.log("[ПОИСК] Результаты переданы на отображение")
             
             # Обновляем интерфейс с сообщением о результатах
             search_time = datetime.datetime.now() - search_start_time
@@ -2442,7 +3107,7 @@ db_settings = {{
                 self.ai_chat.see(tk.END)
                 self.ai_chat.config(state=tk.DISABLED)
             
-            self.root.after(0, update_ui_results)
+            self.ui_bus.call(update_ui_results)
             
         except Exception as e:
             self.log(f"[ПОИСК] ОШИБКА при поиске сообщений: {e}")
@@ -2460,20 +3125,44 @@ db_settings = {{
                 self.messages_frame.configure(text="Список сообщений")
                 self.topics_frame.configure(text="Произошла ошибка при поиске")
             
-            self.root.after(0, update_ui_error)
-            messagebox.showerror("Ошибка", f"Ошибка при поиске: {e}")
+            self.ui_bus.call(update_ui_error)
+            self.ui_bus.call(messagebox.showerror, "Ошибка", f"Ошибка при поиске: {e}")
         finally:
-            self.progress.stop()
-            self.search_btn.state(['!disabled'])
+            self.ui_bus.call(self.progress.stop)
+            self.ui_bus.call(self.search_btn.state, ['!disabled'])
             self.log("[ПОИСК] Поиск завершен")
     
+    def begin_search_results(self):
+        """Подготовка списка тем к результатам, поступающим по мере поиска"""
+        self.search_results_topics = []
+        self._search_topic_items = {}
+        self.topics_frame.configure(text="Результаты поиска: идет поиск...")
+
+    def add_search_results(self, dialog_id, messages):
+        """Добавление очередной порции результатов поиска: строка чата создается или обновляется"""
+        entry = self._search_topic_items.get(dialog_id)
+        if entry is None:
+            dialog_name = next((d['name'] for d in self.dialogs if d['id'] == dialog_id), f"Чат ID: {dialog_id}")
+            topic = {'id': len(self.search_results_topics) + 1, 'dialog_id': dialog_id,
+                     'dialog_name': dialog_name, 'messages': []}
+            self.search_results_topics.append(topic)
+            item_id = self.topics_tree.insert('', 'end', values=(topic['id'], '', 0))
+            entry = self._search_topic_items[dialog_id] = (topic, item_id)
+        topic, item_id = entry
+        topic['messages'].extend(messages)
+        topic['title'] = f"Результаты в {topic['dialog_name']} ({len(topic['messages'])} сообщений)"
+        self.topics_tree.item(item_id, values=(topic['id'], topic['title'], len(topic['messages'])))
+        total = sum(len(t['messages']) for t in self.search_results_topics)
+        self.topics_frame.configure(
+            text=f"Результаты поиска: найдено {total} сообщений в {len(self.search_results_topics)} чатах...")
+
     def process_search_results(self, results):
         """Обработка и отображение результатов поиска"""
         self.log("[РЕЗУЛЬТАТЫ] Начало обработки результатов поиска")
         
         # Очистка текущих данных в списках
         self.topics_tree.delete(*self.topics_tree.get_children())
-        self.messages_tree.delete(*self.messages_tree.get_children())
+        self.messages_tree.clear()
         
         # Подготовка объединенного списка тем для отображения
         topics = []
@@ -2548,47 +3237,33 @@ db_settings = {{
     
     def display_search_results_messages(self, messages):
         """Отображение сообщений из результатов поиска"""
-        # Очищаем список сообщений
-        self.messages_tree.delete(*self.messages_tree.get_children())
+        dialog_names = {dialog['id']: dialog['name'] for dialog in self.dialogs}
         
-        # Заполняем список сообщений
-        for message in messages:
+        def search_row(message):
             # Проверяем тип поля date и форматируем соответственно
-            if isinstance(message['date'], str):
+            date = message.get('date') or ''
+            if isinstance(date, str):
                 try:
                     # Пробуем преобразовать ISO формат в datetime для форматирования
-                    date_obj = datetime.datetime.fromisoformat(message['date'].replace('Z', '+00:00'))
+                    date_obj = datetime.datetime.fromisoformat(date.replace('Z', '+00:00'))
                     date_str = date_obj.strftime('%Y-%m-%d %H:%M:%S')
                 except (ValueError, TypeError):
-                    date_str = message['date']
+                    date_str = date
             else:
-                date_str = message['date'].strftime('%Y-%m-%d %H:%M:%S')
+                date_str = date.strftime('%Y-%m-%d %H:%M:%S')
             
-            try:
-                # Получаем имя диалога, если оно есть в сообщении
-                dialog_info = ""
-                if 'dialog_id' in message:
-                    for dialog in self.dialogs:
-                        if dialog['id'] == message['dialog_id']:
-                            dialog_info = f"[{dialog['name']}] "
-                            break
-                
-                # Безопасная конкатенация строк
-                sender_name = message.get('sender_name', 'Неизвестно')
-                display_name = f"{dialog_info}{sender_name}" if dialog_info else sender_name
-                
-                # Добавляем в Treeview
-                self.messages_tree.insert('', 'end', values=(
-                    message['id'],
-                    display_name,
-                    message.get('text', '')[:100] + ('...' if len(message.get('text', '')) > 100 else ''),
-                    date_str
-                ))
-            except Exception as e:
-                self.log(f"Ошибка при отображении сообщения: {e}")
+            # К отправителю добавляется имя диалога, если оно известно
+            sender_name = message.get('sender_name', 'Неизвестно')
+            if message.get('dialog_id') in dialog_names:
+                sender_name = f"[{dialog_names[message['dialog_id']]}] {sender_name}"
+            text = message.get('text') or ''
+            return (message['id'], sender_name, text[:100] + ('...' if len(text) > 100 else ''), date_str)
         
         # Сохраняем сообщения для последующей фильтрации
         self.messages = messages
+        self._messages_dialog_id = None
+        self._message_store = RecordStore(messages, row_factory=search_row)
+        self.messages_tree.set_rows(self._message_store.rows(range(len(messages))))
         
         self.log(f"Отображено {len(messages)} сообщений из результатов поиска")
 
@@ -2661,6 +3336,7 @@ db_settings = {{
         """Проверка поддержки тем в выбранном диалоге и загрузка списка тем"""
         if not hasattr(self, 'selected_dialog_id') or self.selected_dialog_id is None:
             return
+        filters = self.message_filters()
             
         self.progress.start()
         
@@ -2699,12 +3375,8 @@ db_settings = {{
                         })
                     
                     # Заполняем список тем
-                    for topic in topics:
-                        self.topics_tree.insert('', 'end', values=(
-                            topic['id'],
-                            topic['title'],
-                            topic.get('unread_count', 0)
-                        ))
+                    self.ui_bus.insert_rows(self.topics_tree, [
+                        (topic['id'], topic['title'], topic.get('unread_count', 0)) for topic in topics])
                         
                     self.log(f"Загружено {len(topics)} тем")
                     
@@ -2713,23 +3385,23 @@ db_settings = {{
                         self.log("Найдена только общая тема, загружаем сообщения")
                         # Выбираем тему "Общее"
                         self.selected_topic_id = topics[0]['id']
-                        await self.load_messages_async()
+                        await self.load_messages_async(filters)
                     elif len(topics) == 0:
                         self.log("Темы поддерживаются, но не найдены. Загружаем общие сообщения.")
-                        await self.load_messages_async()
+                        await self.load_messages_async(filters)
                 else:
                     self.log(f"Диалог {self.selected_dialog_id} не поддерживает темы. Загружаем сообщения напрямую.")
                     # Загружаем сообщения напрямую
-                    await self.load_messages_async()
+                    await self.load_messages_async(filters)
                     
             except Exception as e:
                 self.log(f"Ошибка при проверке поддержки тем: {e}")
                 import traceback
                 self.log(traceback.format_exc())
             finally:
-                self.progress.stop()
+                self.ui_bus.call(self.progress.stop)
         
-        asyncio.run_coroutine_threadsafe(run(), self.loop)
+        self.tasks.submit(run, 'Загрузка тем', slot='topics')
 
     def toggle_show_all_messages(self):
         """Обработчик переключения режима отображения всех сообщений"""
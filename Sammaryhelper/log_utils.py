@@ -0,0 +1,154 @@
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+# Корневой логгер приложения; логгеры модулей - его потомки (sammaryhelper.db, sammaryhelper.gui, ...)
+APP_LOGGER = 'sammaryhelper'
+DEFAULT_LOG_CAPACITY = 5000
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+LOG_DATE_FORMAT = '%H:%M:%S'
+
+logging.getLogger(APP_LOGGER).addHandler(logging.NullHandler())
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Логгер модуля приложения"""
+    return logging.getLogger(f"{APP_LOGGER}.{name}")
+
+
+class lazy:
+    """Значение, вычисляемое только при форматировании записи лога
+
+    Пример: logger.debug("Атрибуты: %s", lazy(dir, obj)) не вызывает dir,
+    если уровень DEBUG выключен.
+    """
+    __slots__ = ('fn', 'args')
+
+    def __init__(self, fn: Callable[..., Any], *args):
+        self.fn = fn
+        self.args = args
+
+    def __str__(self) -> str:
+        return str(self.fn(*self.args))
+
+
+class SamplingFilter(logging.Filter):
+    """Прореживание частых записей (например, по одной на строку БД)
+
+    Запись с extra={'sample': n} пропускается первый раз и затем каждый n-й раз
+    для того же шаблона сообщения; записи без sample пропускаются всегда.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        sample = getattr(record, 'sample', None)
+        if not sample or sample <= 1:
+            return True
+        # Решение принимается один раз на запись, даже если фильтр стоит на нескольких обработчиках
+        decision = getattr(record, '_sample_passed', None)
+        if decision is None:
+            key = (record.name, record.msg)
+            with self._lock:
+                count = self._counts.get(key, 0)
+                self._counts[key] = count + 1
+            decision = count % sample == 0
+            record._sample_passed = decision
+        return decision
+
+
+class RingBufferHandler(logging.Handler):
+    """Обработчик, хранящий последние capacity записей
+
+    Записи сохраняются без форматирования; строки собираются только при выдаче
+    (drain), поэтому запись в лог из рабочих потоков стоит одного добавления в deque.
+    Если записи не забираются, самые старые вытесняются, а их число учитывается
+    в dropped.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_LOG_CAPACITY, level: int = logging.NOTSET):
+        super().__init__(level)
+        self.capacity = capacity
+        self.records = deque(maxlen=capacity)
+        self._pending = deque()
+        self.dropped = 0
+
+    def emit(self, record: logging.LogRecord):
+        with self.lock:
+            self.records.append(record)
+            if len(self._pending) >= self.capacity:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append(record)
+
+    def drain(self, limit: int = None) -> List[str]:
+        """Отформатированные строки записей, поступивших после прошлого вызова"""
+        with self.lock:
+            count = len(self._pending) if limit is None else min(limit, len(self._pending))
+            records = [self._pending.popleft() for _ in range(count)]
+        return [self._format(record) for record in records]
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def lines(self) -> List[str]:
+        """Все хранимые записи (например, для сохранения лога в файл)"""
+        with self.lock:
+            records = list(self.records)
+        return [self._format(record) for record in records]
+
+    def _format(self, record: logging.LogRecord) -> str:
+        try:
+            return self.format(record)
+        except Exception as e:
+            return f"{record.msg} (ошибка форматирования: {e})"
+
+
+_state = {'ring': None, 'console': None, 'sampling': SamplingFilter()}
+
+
+def configure_logging(debug: bool = False, levels: Optional[Dict[str, str]] = None,
+                      capacity: int = DEFAULT_LOG_CAPACITY, console: bool = None) -> RingBufferHandler:
+    """Настройка логирования приложения (повторный вызов меняет уровни)
+
+    Args:
+        debug: Уровень DEBUG для всех модулей, иначе INFO
+        levels: Уровни отдельных модулей, например {'db': 'WARNING', 'telegram': 'DEBUG'}
+        capacity: Размер кольцевого буфера записей
+        console: Вывод в консоль (по умолчанию - только в режиме отладки)
+
+    Returns:
+        RingBufferHandler: Буфер записей для окна лога
+    """
+    app_logger = logging.getLogger(APP_LOGGER)
+    app_logger.setLevel(logging.DEBUG if debug else logging.INFO)
+    app_logger.propagate = False
+    for name, level in (levels or {}).items():
+        get_logger(name).setLevel(logging.getLevelName(str(level).upper()))
+
+    formatter = logging.Formatter(LOG_FORMAT, LOG_DATE_FORMAT)
+    ring = _state['ring']
+    if ring is None or ring.capacity != capacity:
+        if ring is not None:
+            app_logger.removeHandler(ring)
+        ring = RingBufferHandler(capacity)
+        ring.setFormatter(formatter)
+        ring.addFilter(_state['sampling'])
+        app_logger.addHandler(ring)
+        _state['ring'] = ring
+
+    console = debug if console is None else console
+    if console and _state['console'] is None:
+        handler = logging.StreamHandler()
+        handler.setFormatter(formatter)
+        handler.addFilter(_state['sampling'])
+        app_logger.addHandler(handler)
+        _state['console'] = handler
+    elif not console and _state['console'] is not None:
+        app_logger.removeHandler(_state['console'])
+        _state['console'] = None
+    return ring
@@ -1,9 +1,17 @@
+import time
+
+# Отсчет времени запуска - до импорта интерфейса
+STARTED = time.perf_counter()
+
+from Sammaryhelper.startup import StartupTimer, STARTUP_IMPORTED
 from Sammaryhelper.gui import TelegramSummarizerGUI
 import tkinter as tk
 
 if __name__ == "__main__":
+    startup = StartupTimer(STARTED)
+    startup.mark(STARTUP_IMPORTED)
     root = tk.Tk()
-    app = TelegramSummarizerGUI(root)
+    app = TelegramSummarizerGUI(root, startup=startup)
     
     def on_closing():
         app.on_close()
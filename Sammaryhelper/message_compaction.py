@@ -0,0 +1,243 @@
+import re
+import datetime
+from typing import List, Dict, Any, Tuple, Union
+from urllib.parse import urlparse
+from .text_utils import URL_RE, estimate_tokens, normalize_text
+from .near_duplicates import DEFAULT_NEAR_DUPLICATE_THRESHOLD, filter_near_duplicates, message_key
+
+# Настройки сжатия по умолчанию, переопределяются ключом 'compaction' в настройках
+DEFAULT_COMPACTION_SETTINGS = {
+    'enabled': True,
+    'stages': ['drop_trivial', 'dedupe', 'near_dedupe', 'shorten', 'collapse'],
+    # Сообщения короче этого числа символов (после удаления ссылок) считаются тривиальными
+    'min_chars': 3,
+    # Типовые реплики без содержания
+    'trivial_phrases': [
+        '+', '+1', '++', '-', 'ок', 'ok', 'окей', 'ага', 'угу', 'да', 'нет', 'спасибо', 'спс',
+        'thanks', 'thx', 'лол', 'lol', 'ахах', 'хаха', 'понял', 'ясно', 'согласен',
+    ],
+    # Максимальная длина цитаты в символах
+    'max_quote_chars': 80,
+    # Максимальная длина одного сообщения в символах
+    'max_message_chars': 1500,
+    # Максимальный интервал между сообщениями одного автора для склейки
+    'collapse_window_minutes': 10,
+    # Оценка сходства (MinHash), начиная с которой сообщения считаются почти одинаковыми
+    'near_duplicate_threshold': DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+}
+
+# Строка без букв и цифр: эмодзи, стикеры, знаки препинания
+NO_WORDS_RE = re.compile(r'^[\W_]*$', re.UNICODE)
+QUOTE_LINE_RE = re.compile(r'^\s*(>|»)')
+
+
+def get_compaction_settings(settings: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Объединение пользовательских настроек сжатия с настройками по умолчанию"""
+    result = dict(DEFAULT_COMPACTION_SETTINGS)
+    if settings:
+        result.update(settings)
+    return result
+
+
+def to_message_dict(message: Union[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """Приведение сообщения к словарю с полями sender_name, date, text"""
+    if isinstance(message, dict):
+        return dict(message)
+    return {'text': str(message), 'sender_name': '', 'sender_id': None, 'date': ''}
+
+
+def parse_date(value) -> Union[datetime.datetime, None]:
+    """Разбор даты сообщения: datetime, '%Y-%m-%d %H:%M:%S' или ISO-строка"""
+    if isinstance(value, datetime.datetime):
+        return value.replace(tzinfo=None)
+    if not value:
+        return None
+    try:
+        return datetime.datetime.strptime(str(value)[:19].replace('T', ' '), '%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+
+
+def format_message(message: Union[str, Dict[str, Any]]) -> str:
+    """Форматирование сообщения в строку для промпта"""
+    if isinstance(message, str):
+        return message
+    sender = message.get('sender_name') or message.get('sender_id') or ''
+    date = message.get('date') or ''
+    text = message.get('text', '')
+    if message.get('duplicates'):
+        text = f"{text} [копий: {message['duplicates']}]"
+    if sender and date:
+        return f"{sender} ({date}): {text}"
+    if sender:
+        return f"{sender}: {text}"
+    return text
+
+
+def count_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Оценка токенов списка сообщений в том виде, в каком они уйдут в промпт"""
+    return sum(estimate_tokens(format_message(m)) + 1 for m in messages)
+
+
+def is_trivial(text: str, config: Dict[str, Any]) -> bool:
+    """Проверка, что сообщение не несет содержания"""
+    stripped = (text or '').strip()
+    if NO_WORDS_RE.match(stripped):
+        return True
+    if normalize_text(stripped) in config['trivial_phrases'] or stripped.lower() in config['trivial_phrases']:
+        return True
+    # Сообщение только из ссылки оставляем: ссылка может быть предметом обсуждения
+    if URL_RE.search(stripped):
+        return False
+    return len(normalize_text(stripped)) < config['min_chars']
+
+
+def shorten_url(match: re.Match) -> str:
+    """Замена ссылки на домен"""
+    url = match.group(0)
+    parsed = urlparse(url if '://' in url else f'http://{url}')
+    host = parsed.netloc.lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    return f'[{host}]' if host else '[ссылка]'
+
+
+def shorten_text(text: str, config: Dict[str, Any]) -> str:
+    """Сокращение ссылок, цитат и слишком длинных сообщений"""
+    text = URL_RE.sub(shorten_url, text)
+
+    lines = []
+    quote = []
+    for line in text.splitlines():
+        if QUOTE_LINE_RE.match(line):
+            quote.append(QUOTE_LINE_RE.sub('', line, count=1).strip())
+            continue
+        if quote:
+            lines.append(_shorten_quote(quote, config))
+            quote = []
+        lines.append(line)
+    if quote:
+        lines.append(_shorten_quote(quote, config))
+    text = '\n'.join(line for line in lines if line.strip())
+
+    max_chars = config['max_message_chars']
+    if max_chars and len(text) > max_chars:
+        text = text[:max_chars].rstrip() + '…'
+    return text
+
+
+def _shorten_quote(quote_lines: List[str], config: Dict[str, Any]) -> str:
+    """Сворачивание цитаты в одну короткую строку"""
+    quote = ' '.join(line for line in quote_lines if line)
+    max_chars = config['max_quote_chars']
+    if len(quote) > max_chars:
+        quote = quote[:max_chars].rstrip() + '…'
+    return f'> {quote}'
+
+
+def stage_drop_trivial(messages: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Удаление стикеров, эмодзи, "+1" и других реплик без содержания"""
+    return [m for m in messages if not is_trivial(m.get('text', ''), config)]
+
+
+def stage_shorten(messages: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Сокращение ссылок до домена и цитат до одной строки"""
+    result = []
+    for message in messages:
+        text = shorten_text(message.get('text', ''), config)
+        if text:
+            result.append({**message, 'text': text})
+    return result
+
+
+def stage_dedupe(messages: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Удаление повторов: одинаковые пересылки и копии одного текста"""
+    seen = set()
+    result = []
+    for message in messages:
+        key = normalize_text(message.get('text', ''))
+        if key in seen:
+            continue
+        seen.add(key)
+        result.append(message)
+    return result
+
+
+def stage_near_dedupe(messages: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Удаление почти одинаковых сообщений: пересылки с правками, копии с другими ссылками
+
+    Используются подписи из поля minhash, если они уже загружены из кеша.
+    """
+    signatures = {message_key(m, i): m['minhash'] for i, m in enumerate(messages) if m.get('minhash')}
+    result, _ = filter_near_duplicates(messages, config['near_duplicate_threshold'], signatures=signatures)
+    return result
+
+
+def stage_collapse(messages: List[Dict[str, Any]], config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Склейка идущих подряд сообщений одного автора"""
+    window = config['collapse_window_minutes'] * 60
+    result = []
+    last_date = None
+    for message in messages:
+        sender = message.get('sender_id') or message.get('sender_name')
+        date = parse_date(message.get('date'))
+        if result and sender:
+            previous = result[-1]
+            previous_sender = previous.get('sender_id') or previous.get('sender_name')
+            in_window = date is None or last_date is None or abs((date - last_date).total_seconds()) <= window
+            if previous_sender == sender and in_window:
+                result[-1] = {**previous, 'text': f"{previous.get('text', '')}\n{message.get('text', '')}"}
+                last_date = date or last_date
+                continue
+        result.append(dict(message))
+        last_date = date
+    return result
+
+
+COMPACTION_STAGES = {
+    'drop_trivial': stage_drop_trivial,
+    'shorten': stage_shorten,
+    'dedupe': stage_dedupe,
+    'near_dedupe': stage_near_dedupe,
+    'collapse': stage_collapse,
+}
+
+
+def compact_messages(messages: List[Union[str, Dict[str, Any]]],
+                     settings: Dict[str, Any] = None) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """Сжатие сообщений перед отправкой в модель
+
+    Args:
+        messages: Сообщения (словари или строки) в хронологическом порядке
+        settings: Настройки сжатия, см. DEFAULT_COMPACTION_SETTINGS
+
+    Returns:
+        Tuple: (сжатые сообщения, отчет по этапам с количеством сообщений и токенов)
+    """
+    config = get_compaction_settings(settings)
+    current = [to_message_dict(m) for m in messages]
+    tokens = count_tokens(current)
+    report = [{'stage': 'input', 'messages': len(current), 'tokens': tokens, 'saved': 0}]
+    if not config['enabled']:
+        return current, report
+
+    for name in config['stages']:
+        stage = COMPACTION_STAGES.get(name)
+        if stage is None:
+            raise ValueError(f"Неизвестный этап сжатия: {name}")
+        current = stage(current, config)
+        new_tokens = count_tokens(current)
+        report.append({'stage': name, 'messages': len(current), 'tokens': new_tokens, 'saved': tokens - new_tokens})
+        tokens = new_tokens
+    return current, report
+
+
+def format_report(report: List[Dict[str, Any]]) -> str:
+    """Текстовое представление отчета о сжатии"""
+    initial = report[0]['tokens'] or 1
+    lines = []
+    for row in report:
+        lines.append(f"{row['stage']}: {row['messages']} сообщ., {row['tokens']} токенов (-{row['saved']})")
+    final = report[-1]['tokens']
+    lines.append(f"Итого: -{100 * (initial - final) / initial:.1f}% токенов")
+    return '\n'.join(lines)
@@ -0,0 +1,89 @@
+from bisect import bisect_left
+from typing import List, Dict, Any, Tuple
+
+# Виды страниц потока сообщений
+PAGE_CACHED = 'cached'
+PAGE_FRESH = 'fresh'
+
+DEFAULT_PAGE_SIZE = 100
+# Поля, изменение которых означает, что строку нужно обновить
+COMPARED_FIELDS = ('text', 'sender_name', 'photo', 'video')
+
+
+class MessagePage:
+    """Страница потока сообщений чата"""
+    __slots__ = ('kind', 'messages', 'fetched')
+
+    def __init__(self, kind: str, messages: List[Dict[str, Any]], fetched: int = 0):
+        self.kind = kind
+        self.messages = messages
+        # Сколько сообщений получено из Telegram с начала загрузки
+        self.fetched = fetched
+
+
+def message_changed(old: Dict[str, Any], new: Dict[str, Any]) -> bool:
+    return any(old.get(field) != new.get(field) for field in COMPARED_FIELDS)
+
+
+class MessageMerger:
+    """Список сообщений чата, собираемый из страниц потока
+
+    Сообщения упорядочены от новых к старым (по убыванию id, как в кеше и в
+    Telegram). Страница добавляет новые сообщения на свои места и заменяет
+    изменившиеся, поэтому кешированные строки можно показать сразу, а свежие
+    страницы применять к уже отображенному списку.
+    """
+
+    def __init__(self):
+        self.messages = []
+        self._keys = []
+        self._by_id = {}
+
+    def __len__(self) -> int:
+        return len(self.messages)
+
+    def apply(self, messages: List[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+        """Применение страницы
+
+        Returns:
+            Tuple: (позиции добавленных сообщений, позиции измененных) в итоговом
+                списке, по возрастанию
+        """
+        inserted = set()
+        updated = set()
+        for message in messages:
+            message_id = message['id']
+            old = self._by_id.get(message_id)
+            if old is not None:
+                if message_id not in inserted and message_changed(old, message):
+                    updated.add(message_id)
+                old.update(message)
+                continue
+            key = -int(message_id)
+            position = bisect_left(self._keys, key)
+            self._keys.insert(position, key)
+            message = dict(message)
+            self.messages.insert(position, message)
+            self._by_id[message_id] = message
+            inserted.add(message_id)
+        if not inserted and not updated:
+            return [], []
+        positions_inserted = []
+        positions_updated = []
+        for position, message in enumerate(self.messages):
+            if message['id'] in inserted:
+                positions_inserted.append(position)
+            elif message['id'] in updated:
+                positions_updated.append(position)
+        return positions_inserted, positions_updated
+
+
+def position_runs(positions: List[int]) -> List[Tuple[int, int]]:
+    """Группировка возрастающих позиций в непрерывные отрезки: [(начало, длина), ...]"""
+    runs = []
+    for position in positions:
+        if runs and runs[-1][0] + runs[-1][1] == position:
+            runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+        else:
+            runs.append((position, 1))
+    return runs
@@ -0,0 +1,130 @@
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+from .log_utils import get_logger
+
+logger = get_logger('ai.routing')
+
+# Операции, для которых можно задать отдельную модель
+ROUTED_OPERATIONS = ('map', 'reduce', 'qa', 'participants')
+
+# Быстрая модель, на которую переключаются при нарушении SLO
+DEFAULT_FALLBACK_MODEL = 'gpt-4o-mini'
+
+
+def percentile(values, q: float) -> float:
+    """Перцентиль списка значений (q от 0 до 1)"""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+class ModelRouter:
+    """Выбор модели для каждой операции ИИ
+
+    Настройки:
+        model_routing: {'map': 'gpt-4o-mini', 'reduce': 'gpt-4o', ...} - модель для операции,
+            если не задана - используется openai_model
+        latency_slo: {'qa': 10, ...} - допустимая задержка p90 в секундах
+        fallback_model: модель, на которую переключается операция при нарушении SLO
+        slo_cooldown: сколько секунд держать переключение, прежде чем снова попробовать основную модель
+    """
+
+    def __init__(self, settings: Dict[str, Any], window: int = 20, min_samples: int = 5, debug: bool = False):
+        self.settings = settings
+        self.window = window
+        self.min_samples = min_samples
+        self.debug = debug
+        # (операция, модель) -> последние задержки
+        self._latencies = {}
+        # операция -> время, до которого действует переключение на запасную модель
+        self._degraded_until = {}
+
+    def log(self, message, *args):
+        """Логирование сообщений"""
+        if self.debug:
+            logger.debug(message, *args)
+
+    @property
+    def routes(self) -> Dict[str, str]:
+        return self.settings.get('model_routing') or {}
+
+    @property
+    def slos(self) -> Dict[str, float]:
+        return self.settings.get('latency_slo') or {}
+
+    @property
+    def fallback_model(self) -> str:
+        return self.settings.get('fallback_model') or DEFAULT_FALLBACK_MODEL
+
+    def primary_model(self, operation: str, default_model: str) -> str:
+        """Модель операции по политике маршрутизации без учета SLO"""
+        return self.routes.get(operation) or default_model
+
+    def is_degraded(self, operation: str) -> bool:
+        """Действует ли для операции переключение на запасную модель"""
+        until = self._degraded_until.get(operation)
+        if until is None:
+            return False
+        if time.monotonic() >= until:
+            # Период переключения истек: пробуем основную модель заново
+            del self._degraded_until[operation]
+            self.log("%s: возврат к основной модели", operation)
+            return False
+        return True
+
+    def select(self, operation: str, default_model: str) -> str:
+        """Выбор модели для операции
+
+        Args:
+            operation: Тип операции (map, reduce, qa, participants)
+            default_model: Модель из настроек openai_model
+
+        Returns:
+            str: Идентификатор модели
+        """
+        model = self.primary_model(operation, default_model)
+        if self.is_degraded(operation):
+            return self.fallback_model
+        return model
+
+    def observe(self, operation: str, model: str, latency: float):
+        """Учет задержки вызова и проверка SLO"""
+        key = (operation, model)
+        latencies = self._latencies.setdefault(key, deque(maxlen=self.window))
+        latencies.append(latency)
+
+        slo = self.slos.get(operation)
+        if not slo or model == self.fallback_model or len(latencies) < self.min_samples:
+            return
+        p90 = percentile(latencies, 0.9)
+        if p90 > slo and not self.is_degraded(operation):
+            cooldown = float(self.settings.get('slo_cooldown', 300))
+            self._degraded_until[operation] = time.monotonic() + cooldown
+            # После возврата к основной модели статистика собирается заново
+            latencies.clear()
+            self.log("%s: p90 %.2f сек. > SLO %s сек., переключение на %s на %.0f сек.",
+                     operation, p90, slo, self.fallback_model, cooldown)
+
+    def get_report(self) -> Dict[str, Dict[str, Any]]:
+        """Состояние маршрутизации и задержки по операциям"""
+        report = {}
+        default_model = self.settings.get('openai_model', '')
+        for operation in ROUTED_OPERATIONS:
+            report[operation] = {
+                'model': self.primary_model(operation, default_model),
+                'slo': self.slos.get(operation),
+                'degraded': self.is_degraded(operation),
+                'models': {},
+            }
+        for (operation, model), latencies in self._latencies.items():
+            stage = report.setdefault(operation, {'model': model, 'slo': None, 'degraded': False, 'models': {}})
+            if latencies:
+                stage['models'][model] = {
+                    'calls': len(latencies),
+                    'p50': percentile(latencies, 0.5),
+                    'p90': percentile(latencies, 0.9),
+                }
+        return report
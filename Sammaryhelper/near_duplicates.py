@@ -0,0 +1,253 @@
+import zlib
+import random
+from array import array
+from typing import List, Dict, Any, Optional, Tuple, Hashable
+from .text_utils import normalize_text
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Порог оценки сходства Жаккара, выше которого сообщения считаются почти одинаковыми
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.8
+DEFAULT_NUM_PERM = 64
+# Длина символьных шинглов
+SHINGLE_SIZE = 5
+# Более короткие тексты не сравниваются: для них достаточно точного совпадения
+MIN_TEXT_CHARS = 30
+
+_PRIME = 4294967311  # простое число больше 2^32
+_SEED = 20240501
+
+
+def shingle_hashes(text: str, size: int = SHINGLE_SIZE) -> List[int]:
+    """Хеши символьных шинглов нормализованного текста"""
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return [zlib.crc32(normalized.encode('utf-8'))] if normalized else []
+    return list({zlib.crc32(normalized[i:i + size].encode('utf-8')) for i in range(len(normalized) - size + 1)})
+
+
+def signature_to_bytes(signature: Tuple[int, ...]) -> bytes:
+    return array('I', signature).tobytes()
+
+
+def signature_from_bytes(data: bytes) -> Tuple[int, ...]:
+    values = array('I')
+    values.frombytes(data)
+    return tuple(values)
+
+
+def estimate_similarity(left: Tuple[int, ...], right: Tuple[int, ...]) -> float:
+    """Оценка сходства Жаккара по доле совпадающих компонент подписей"""
+    return sum(1 for a, b in zip(left, right) if a == b) / len(left)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """Число полос и строк в полосе, при которых вероятность совпадения
+    хотя бы одной полосы резко растет около порога: (1/b)^(1/r) ~ threshold"""
+    best = None
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        knee = (1 / bands) ** (1 / rows)
+        # Небольшой сдвиг в пользу полноты: пропущенный дубль дороже лишней проверки
+        error = abs(knee - threshold) + (0.05 if knee > threshold else 0.0)
+        if best is None or error < best[0]:
+            best = (error, bands, rows)
+    return best[1], best[2]
+
+
+class MinHasher:
+    """Подписи MinHash для текстов"""
+
+    def __init__(self, num_perm: int = DEFAULT_NUM_PERM, shingle_size: int = SHINGLE_SIZE):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = random.Random(_SEED)
+        self._a = [rng.randrange(1, 2 ** 32) for _ in range(num_perm)]
+        self._b = [rng.randrange(0, 2 ** 32) for _ in range(num_perm)]
+        if NUMPY_AVAILABLE:
+            self._a_np = np.array(self._a, dtype=np.uint64)
+            self._b_np = np.array(self._b, dtype=np.uint64)
+
+    def signature(self, text: str) -> Optional[Tuple[int, ...]]:
+        """Подпись текста или None для слишком коротких текстов"""
+        if len(normalize_text(text)) < MIN_TEXT_CHARS:
+            return None
+        hashes = shingle_hashes(text, self.shingle_size)
+        if NUMPY_AVAILABLE:
+            values = np.array(hashes, dtype=np.uint64)[:, None]
+            permuted = (values * self._a_np + self._b_np) % np.uint64(_PRIME)
+            return tuple((permuted.min(axis=0) & np.uint64(0xFFFFFFFF)).tolist())
+        return tuple(min((a * h + b) % _PRIME for h in hashes) & 0xFFFFFFFF
+                     for a, b in zip(self._a, self._b))
+
+
+class NearDuplicateIndex:
+    """LSH-индекс подписей для поиска почти одинаковых текстов"""
+
+    def __init__(self, threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM):
+        self.threshold = threshold
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._buckets = [{} for _ in range(self.bands)]
+        self._signatures = {}
+
+    def add(self, key: Hashable, signature: Tuple[int, ...]) -> Optional[Hashable]:
+        """Добавление подписи
+
+        Returns:
+            Optional[Hashable]: Ключ ранее добавленного почти одинакового текста
+                (тогда подпись не добавляется) или None
+        """
+        band_keys = [signature[i * self.rows:(i + 1) * self.rows] for i in range(self.bands)]
+        checked = set()
+        for band, band_key in zip(self._buckets, band_keys):
+            for candidate in band.get(band_key, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if estimate_similarity(signature, self._signatures[candidate]) >= self.threshold:
+                    return candidate
+        self._signatures[key] = signature
+        for band, band_key in zip(self._buckets, band_keys):
+            band.setdefault(band_key, []).append(key)
+        return None
+
+
+def message_key(message: Dict[str, Any], index: int) -> Hashable:
+    """Ключ сообщения: (dialog_id, id), если известны, иначе позиция в списке"""
+    if message.get('id') is not None:
+        return (message.get('dialog_id'), message['id'])
+    return ('#', index)
+
+
+def filter_near_duplicates(messages: List[Dict[str, Any]], threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                           hasher: MinHasher = None,
+                           signatures: Dict[Hashable, Tuple[int, ...]] = None,
+                           index: NearDuplicateIndex = None
+                           ) -> Tuple[List[Dict[str, Any]], Dict[Hashable, Hashable]]:
+    """Удаление почти одинаковых сообщений (пересылки, копии с правками)
+
+    Остается первое сообщение из группы похожих, у него заполняется поле
+    duplicates - сколько копий удалено.
+
+    Args:
+        messages: Сообщения в порядке приоритета (обычно хронологическом)
+        signatures: Готовые подписи по ключу message_key, недостающие вычисляются
+        index: Индекс уже просмотренных сообщений (например, других чатов), копии которых
+            тоже удаляются; пополняется оставшимися сообщениями
+
+    Returns:
+        Tuple: (оставшиеся сообщения, ключ удаленного -> ключ оставленного)
+    """
+    hasher = hasher or MinHasher()
+    signatures = signatures if signatures is not None else {}
+    index = index or NearDuplicateIndex(threshold, hasher.num_perm)
+    kept = []
+    kept_by_key = {}
+    duplicates = {}
+    for i, message in enumerate(messages):
+        key = message_key(message, i)
+        signature = signatures.get(key)
+        if signature is None or len(signature) != hasher.num_perm:
+            signature = hasher.signature(message.get('text') or '')
+            if signature is not None:
+                signatures[key] = signature
+        original = index.add(key, signature) if signature is not None else None
+        if original is not None:
+            duplicates[key] = original
+            kept_message = kept_by_key.get(original)
+            if kept_message is not None:
+                kept_message['duplicates'] = kept_message.get('duplicates', 0) + 1
+            continue
+        message = dict(message)
+        kept.append(message)
+        kept_by_key[key] = message
+    return kept, duplicates
+
+
+def dedupe_across_dialogs(results: Dict[int, List[Dict[str, Any]]],
+                          threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD,
+                          hasher: MinHasher = None,
+                          signatures: Dict[Hashable, Tuple[int, ...]] = None
+                          ) -> Tuple[Dict[int, List[Dict[str, Any]]], int]:
+    """Удаление почти одинаковых сообщений из результатов по нескольким чатам
+
+    Из группы копий остается самое раннее сообщение.
+
+    Returns:
+        Tuple: (результаты по чатам, количество удаленных сообщений)
+    """
+    flat = []
+    for dialog_id, messages in results.items():
+        flat.extend({**m, 'dialog_id': m.get('dialog_id', dialog_id)} for m in messages)
+    flat.sort(key=lambda m: str(m.get('date') or ''))
+    kept, duplicates = filter_near_duplicates(flat, threshold, hasher, signatures)
+    grouped = {dialog_id: [] for dialog_id in results}
+    for message in kept:
+        grouped[message['dialog_id']].append(message)
+    # Исходный порядок сообщений внутри чата сохраняется
+    for dialog_id, messages in results.items():
+        order = {message_key({**m, 'dialog_id': m.get('dialog_id', dialog_id)}, i): i for i, m in enumerate(messages)}
+        grouped[dialog_id].sort(key=lambda m: order.get(message_key(m, -1), 0))
+    return grouped, len(duplicates)
+
+
+class NearDuplicateFilter:
+    """Фильтр почти одинаковых сообщений с подписями, сохраняемыми в БД
+
+    Повторные прогоны по тем же сообщениям не пересчитывают подписи. Один
+    экземпляр помнит все пропущенные им сообщения, поэтому при последовательной
+    фильтрации нескольких чатов копия, уже встреченная в другом чате, удаляется.
+    """
+
+    def __init__(self, threshold: float = DEFAULT_NEAR_DUPLICATE_THRESHOLD, num_perm: int = DEFAULT_NUM_PERM,
+                 db_handler=None, account_id: str = None):
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.index = NearDuplicateIndex(threshold, num_perm)
+        self.db_handler = db_handler
+        self.account_id = account_id
+
+    async def load_signatures(self, messages: List[Dict[str, Any]]) -> Dict[Hashable, Tuple[int, ...]]:
+        """Подписи сообщений с dialog_id и id: сохраненные в БД и вычисленные для новых (с сохранением)"""
+        keys = [(m['dialog_id'], m['id']) for m in messages if m.get('dialog_id') is not None and m.get('id') is not None]
+        signatures = {}
+        if self.db_handler and self.account_id and keys:
+            stored = await self.db_handler.get_message_signatures(keys, self.account_id)
+            signatures = {key: signature_from_bytes(data) for key, data in stored.items()}
+        new_rows = []
+        for message in messages:
+            if message.get('dialog_id') is None or message.get('id') is None:
+                continue
+            key = (message['dialog_id'], message['id'])
+            signature = signatures.get(key)
+            if signature is not None and len(signature) == self.hasher.num_perm:
+                continue
+            signature = self.hasher.signature(message.get('text') or '')
+            if signature is not None:
+                signatures[key] = signature
+                new_rows.append((key[0], key[1], signature_to_bytes(signature)))
+        if new_rows and self.db_handler and self.account_id:
+            await self.db_handler.save_message_signatures(new_rows, self.account_id)
+        return signatures
+
+    async def filter(self, messages: List[Dict[str, Any]], dialog_id: int = None
+                     ) -> Tuple[List[Dict[str, Any]], Dict[Hashable, Hashable]]:
+        """Фильтрация сообщений чата dialog_id с учетом ранее отфильтрованных чатов"""
+        if dialog_id is not None:
+            messages = [{**m, 'dialog_id': m.get('dialog_id', dialog_id)} for m in messages]
+        signatures = await self.load_signatures(messages)
+        return filter_near_duplicates(messages, self.threshold, self.hasher, signatures, self.index)
+
+    async def dedupe_results(self, results: Dict[int, List[Dict[str, Any]]]
+                             ) -> Tuple[Dict[int, List[Dict[str, Any]]], int]:
+        """Удаление копий из результатов поиска по нескольким чатам (см. dedupe_across_dialogs)"""
+        flat = [{**m, 'dialog_id': m.get('dialog_id', dialog_id)} for dialog_id, messages in results.items()
+                for m in messages]
+        signatures = await self.load_signatures(flat)
+        return dedupe_across_dialogs(results, self.threshold, self.hasher, signatures)
@@ -0,0 +1,197 @@
+import math
+from collections import Counter
+from typing import List, Dict, Any, Optional
+from .extractive_summary import message_terms
+from .message_compaction import parse_date
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Сколько участников описывать в промпте по умолчанию
+DEFAULT_TOP_PARTICIPANTS = 30
+
+
+def _sender_key(message: Dict[str, Any]):
+    sender_id = message.get('sender_id')
+    return sender_id if sender_id is not None else message.get('sender_name') or None
+
+
+def unnamed_top_senders(messages: List[Dict[str, Any]], top_n: int = DEFAULT_TOP_PARTICIPANTS) -> List[Any]:
+    """id самых активных top_n отправителей, имени которых нет в сообщениях
+
+    В промпт попадают только top_n профилей, поэтому имена у Telegram имеет смысл
+    запрашивать лишь для них, а не загружать список всех участников группы.
+    """
+    counts = Counter()
+    named = set()
+    for message in messages:
+        sender_id = message.get('sender_id')
+        if sender_id is None:
+            continue
+        counts[sender_id] += 1
+        if message.get('sender_name'):
+            named.add(sender_id)
+    return [sender for sender, _ in counts.most_common(top_n) if sender not in named]
+
+
+def compute_participant_stats(messages: List[Dict[str, Any]], names: Dict[Any, str] = None,
+                              top_terms: int = 5) -> List[Dict[str, Any]]:
+    """Статистика активности участников по сообщениям
+
+    Для каждого отправителя считаются: количество сообщений и символов, часы активности,
+    первое и последнее сообщение, степень в графе ответов (кому отвечал и кто отвечал ему)
+    и характерные слова (частота у участника, взвешенная редкостью среди остальных).
+
+    Args:
+        messages: Сообщения с полями id, sender_id/sender_name, date, text, reply_to_msg_id
+        names: Отображаемые имена участников по sender_id
+        top_terms: Количество характерных слов на участника
+
+    Returns:
+        List[Dict[str, Any]]: Профили участников по убыванию количества сообщений
+    """
+    names = dict(names or {})
+    senders = []
+    sender_index = {}
+    rows = []
+    for message in messages:
+        key = _sender_key(message)
+        if key is None:
+            continue
+        if key not in sender_index:
+            sender_index[key] = len(senders)
+            senders.append(key)
+        if key not in names and message.get('sender_name'):
+            names[key] = message['sender_name']
+        rows.append((sender_index[key], message))
+    if not rows:
+        return []
+
+    n_senders = len(senders)
+    sender_ids = [row[0] for row in rows]
+    lengths = [len(row[1].get('text') or '') for row in rows]
+    dates = [parse_date(row[1].get('date')) for row in rows]
+    hours = [d.hour if d else -1 for d in dates]
+
+    # Граф ответов: автор ответа -> автор исходного сообщения
+    author_by_message = {row[1].get('id'): row[0] for row in rows if row[1].get('id') is not None}
+    edges = []
+    for sender, message in rows:
+        target = author_by_message.get(message.get('reply_to_msg_id'))
+        if target is not None and target != sender:
+            edges.append((sender, target))
+
+    if NUMPY_AVAILABLE:
+        sender_array = np.asarray(sender_ids, dtype=np.int64)
+        counts = np.bincount(sender_array, minlength=n_senders)
+        chars = np.bincount(sender_array, weights=np.asarray(lengths, dtype=np.float64), minlength=n_senders)
+        hour_array = np.asarray(hours, dtype=np.int64)
+        valid = hour_array >= 0
+        hour_matrix = np.bincount(sender_array[valid] * 24 + hour_array[valid],
+                                  minlength=n_senders * 24).reshape(n_senders, 24)
+        if edges:
+            edge_array = np.asarray(edges, dtype=np.int64)
+            replies_sent = np.bincount(edge_array[:, 0], minlength=n_senders)
+            replies_received = np.bincount(edge_array[:, 1], minlength=n_senders)
+        else:
+            replies_sent = replies_received = np.zeros(n_senders, dtype=np.int64)
+        counts, chars, hour_matrix = counts.tolist(), chars.tolist(), hour_matrix.tolist()
+        replies_sent, replies_received = replies_sent.tolist(), replies_received.tolist()
+    else:
+        counts = [0] * n_senders
+        chars = [0] * n_senders
+        hour_matrix = [[0] * 24 for _ in range(n_senders)]
+        for sender, length, hour in zip(sender_ids, lengths, hours):
+            counts[sender] += 1
+            chars[sender] += length
+            if hour >= 0:
+                hour_matrix[sender][hour] += 1
+        replies_sent = [0] * n_senders
+        replies_received = [0] * n_senders
+        for source, target in edges:
+            replies_sent[source] += 1
+            replies_received[target] += 1
+
+    partners = [set() for _ in range(n_senders)]
+    for source, target in edges:
+        partners[source].add(target)
+        partners[target].add(source)
+
+    # Характерные слова: частота у участника * редкость среди участников
+    term_counts = [Counter() for _ in range(n_senders)]
+    for sender, message in rows:
+        term_counts[sender].update(message_terms(message.get('text') or ''))
+    sender_df = Counter()
+    for counter in term_counts:
+        sender_df.update(counter.keys())
+
+    first_seen = [None] * n_senders
+    last_seen = [None] * n_senders
+    for sender, date in zip(sender_ids, dates):
+        if date is None:
+            continue
+        if first_seen[sender] is None or date < first_seen[sender]:
+            first_seen[sender] = date
+        if last_seen[sender] is None or date > last_seen[sender]:
+            last_seen[sender] = date
+
+    profiles = []
+    for index, key in enumerate(senders):
+        scored = sorted(term_counts[index].items(),
+                        key=lambda item: item[1] * math.log((n_senders + 1) / sender_df[item[0]]),
+                        reverse=True)
+        hour_counts = hour_matrix[index]
+        peak_hours = sorted((h for h in range(24) if hour_counts[h]), key=lambda h: hour_counts[h], reverse=True)[:3]
+        profiles.append({
+            'sender': key,
+            'name': names.get(key) or str(key),
+            'messages': int(counts[index]),
+            'chars': int(chars[index]),
+            'avg_length': chars[index] / counts[index] if counts[index] else 0.0,
+            'peak_hours': peak_hours,
+            'first_seen': first_seen[index].strftime('%Y-%m-%d') if first_seen[index] else None,
+            'last_seen': last_seen[index].strftime('%Y-%m-%d') if last_seen[index] else None,
+            'replies_sent': int(replies_sent[index]),
+            'replies_received': int(replies_received[index]),
+            'partners': len(partners[index]),
+            'top_terms': [term for term, _ in scored[:top_terms]],
+        })
+    profiles.sort(key=lambda p: p['messages'], reverse=True)
+    return profiles
+
+
+def build_participants_prompt(profiles: List[Dict[str, Any]], total_members: Optional[int] = None,
+                              top_n: int = DEFAULT_TOP_PARTICIPANTS) -> str:
+    """Компактное описание активности участников для модели
+
+    В промпт попадают только агрегаты по чату и профили top_n самых активных участников,
+    поэтому его размер не зависит от размера группы.
+    """
+    total_messages = sum(p['messages'] for p in profiles)
+    lines = []
+    if total_members is not None:
+        lines.append(f"Участников в чате: {total_members}")
+    lines.append(f"Писали сообщения: {len(profiles)}, всего сообщений: {total_messages}")
+
+    top = profiles[:top_n]
+    if total_messages and top:
+        share = sum(p['messages'] for p in top) / total_messages
+        lines.append(f"На {len(top)} самых активных приходится {share:.0%} сообщений")
+    lines.append("")
+    lines.append("Профили самых активных участников:")
+    for p in top:
+        hours = ', '.join(f'{h}:00' for h in p['peak_hours']) or '-'
+        terms = ', '.join(p['top_terms']) or '-'
+        lines.append(
+            f"- {p['name']}: {p['messages']} сообщ. (ср. длина {p['avg_length']:.0f} симв.), "
+            f"ответил {p['replies_sent']}, получил ответов {p['replies_received']}, "
+            f"собеседников {p['partners']}, активен в {hours}, "
+            f"период {p['first_seen'] or '?'} - {p['last_seen'] or '?'}, темы: {terms}"
+        )
+    silent = len(profiles) - len(top)
+    if silent > 0:
+        lines.append(f"... и еще {silent} участников с меньшей активностью")
+    return "\n".join(lines)
@@ -0,0 +1,172 @@
+import datetime
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from .message_compaction import parse_date
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# Типы ключей сортировки
+KEY_INT = 'int'
+KEY_DATETIME = 'datetime'
+KEY_TEXT = 'text'
+
+
+def _int_key(value) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def _datetime_key(value) -> datetime.datetime:
+    return parse_date(value) or datetime.datetime.min
+
+
+def _text_key(value) -> str:
+    return str(value if value is not None else '').casefold()
+
+
+_CONVERTERS = {KEY_INT: _int_key, KEY_DATETIME: _datetime_key, KEY_TEXT: _text_key}
+
+
+def make_key(field: str, kind: str = KEY_TEXT) -> Callable[[Dict[str, Any]], Any]:
+    """Ключ сортировки записей по полю: числа, даты или строки без учета регистра
+
+    Пустые и нечитаемые значения получают наименьший ключ своего типа, поэтому
+    ключи одного поля всегда сравнимы между собой.
+    """
+    convert = _CONVERTERS[kind]
+    return lambda record: convert(record.get(field))
+
+
+# Ключи сортировки по полям записей основного окна: сообщений и диалогов
+SORT_KEYS: Dict[str, Callable[[Dict[str, Any]], Any]] = {
+    'id': make_key('id', KEY_INT),
+    'date': make_key('date', KEY_DATETIME),
+    'sender': make_key('sender_name'),
+    'text': make_key('text'),
+    'name': make_key('name'),
+    'type': make_key('type'),
+    'folder': make_key('folder_id', KEY_INT),
+    'unread': make_key('unread_count', KEY_INT),
+}
+
+
+class RecordStore:
+    """Загруженные записи с индексом по id и подготовленными полями
+
+    Текст для поиска приводится к нижнему регистру один раз, ключи и порядок
+    сортировки вычисляются при первом обращении и кешируются. Фильтр по строке,
+    которая содержит предыдущий запрос (пользователь дописывает символы),
+    проверяет только предыдущий результат.
+    """
+
+    def __init__(self, records: List[Dict[str, Any]], text_field: str = 'text',
+                 row_factory: Callable[[Dict[str, Any]], Sequence[Any]] = None,
+                 sort_keys: Dict[str, Callable[[Dict[str, Any]], Any]] = None, id_field: str = 'id'):
+        self.records = records
+        self.text_field = text_field
+        self.row_factory = row_factory
+        self.sort_keys = sort_keys or SORT_KEYS
+        self.by_id = {str(r.get(id_field)): r for r in records}
+        self._texts = [str(r.get(text_field) or '').casefold() for r in records]
+        self._rows = None
+        self._positions = None
+        self._keys = {}
+        self._orders = {}
+        self._last_query = None
+        self._last_result = None
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def get(self, record_id) -> Optional[Dict[str, Any]]:
+        """Запись по id (число или строка из таблицы)"""
+        return self.by_id.get(str(record_id))
+
+    def indices_of(self, records: Sequence[Dict[str, Any]]) -> List[int]:
+        """Индексы переданных записей этого хранилища (записи сравниваются как объекты)"""
+        if self._positions is None:
+            self._positions = {id(r): i for i, r in enumerate(self.records)}
+        return [self._positions[id(r)] for r in records if id(r) in self._positions]
+
+    def filter(self, query: str) -> List[int]:
+        """Индексы записей, текст которых содержит query, в исходном порядке"""
+        query = (query or '').casefold()
+        if not query:
+            result = list(range(len(self.records)))
+        else:
+            texts = self._texts
+            if self._last_query and self._last_query in query:
+                result = [i for i in self._last_result if query in texts[i]]
+            else:
+                result = [i for i, text in enumerate(texts) if query in text]
+        self._last_query = query
+        self._last_result = result
+        return result
+
+    def keys(self, field: str) -> List[Any]:
+        """Типизированные ключи сортировки всех записей по полю (вычисляются один раз)"""
+        if field not in self._keys:
+            key = self.sort_keys[field]
+            self._keys[field] = [key(r) for r in self.records]
+        return self._keys[field]
+
+    def sort_stable(self, indices: List[int], field: str, reverse: bool = False) -> List[int]:
+        """Устойчивая сортировка текущего порядка по полю
+
+        Записи с равными ключами сохраняют прежний порядок, поэтому
+        последовательные щелчки по заголовкам дают сортировку по нескольким
+        колонкам: последняя колонка - главная, предыдущие уточняют ее.
+        """
+        keys = self.keys(field)
+        return sorted(indices, key=keys.__getitem__, reverse=reverse)
+
+    def sort_by(self, indices: List[int], columns: Sequence[Tuple[str, bool]]) -> List[int]:
+        """Сортировка по нескольким колонкам: [(поле, по убыванию), ...], первая - главная"""
+        result = list(indices)
+        for field, reverse in reversed(columns):
+            result = self.sort_stable(result, field, reverse)
+        return result
+
+    def order(self, field: str, reverse: bool = False) -> List[int]:
+        """Индексы всех записей, упорядоченные по полю (с кешированием; массив numpy, если доступен)"""
+        cache_key = (field, reverse)
+        if cache_key not in self._orders:
+            keys = self.keys(field)
+            order = sorted(range(len(keys)), key=keys.__getitem__, reverse=reverse)
+            self._orders[cache_key] = np.array(order, dtype=np.int64) if NUMPY_AVAILABLE else order
+        return self._orders[cache_key]
+
+    def sort(self, indices: List[int], field: str, reverse: bool = False) -> List[int]:
+        """Упорядочивание подмножества записей по полю
+
+        Готовый порядок всех записей фильтруется по маске, поэтому повторная
+        сортировка после каждого изменения фильтра линейна.
+        """
+        order = self.order(field, reverse)
+        if NUMPY_AVAILABLE:
+            if len(indices) == len(self.records):
+                return order.tolist()
+            mask = np.zeros(len(self.records), dtype=bool)
+            mask[np.fromiter(indices, dtype=np.int64, count=len(indices))] = True
+            return order[mask[order]].tolist()
+        if len(indices) == len(self.records):
+            return list(order)
+        mask = bytearray(len(self.records))
+        for i in indices:
+            mask[i] = 1
+        return [i for i in order if mask[i]]
+
+    def rows(self, indices: List[int]) -> List[Sequence[Any]]:
+        """Строки таблицы для записей (строятся один раз для всех записей)"""
+        if self._rows is None:
+            self._rows = [self.row_factory(r) for r in self.records]
+        return list(map(self._rows.__getitem__, indices))
+
+    def select(self, indices: List[int]) -> List[Dict[str, Any]]:
+        return list(map(self.records.__getitem__, indices))
@@ -0,0 +1,84 @@
+import math
+from collections import Counter
+from typing import List, Dict, Any
+from .text_utils import estimate_tokens, normalize_text
+from .message_compaction import format_message
+from .extractive_summary import message_terms
+
+# Бюджет токенов контекста по умолчанию для вопросов по истории
+DEFAULT_RETRIEVAL_BUDGET = 6000
+# Сколько кандидатов запрашивать из поиска перед упаковкой в бюджет
+DEFAULT_RETRIEVAL_CANDIDATES = 200
+
+
+def query_terms(query: str) -> List[str]:
+    """Значимые слова запроса для поиска"""
+    # Порядок сохраняется, повторы удаляются
+    return list(dict.fromkeys(message_terms(query)))
+
+
+def rank_messages(query: str, messages: List[Dict[str, Any]], limit: int = DEFAULT_RETRIEVAL_CANDIDATES,
+                  k1: float = 1.5, b: float = 0.75) -> List[Dict[str, Any]]:
+    """Ранжирование сообщений по запросу с помощью BM25
+
+    Используется, когда полнотекстовый поиск в БД недоступен.
+    Слова сравниваются по префиксу из 5 символов - грубая замена стемминга.
+
+    Returns:
+        List[Dict[str, Any]]: Сообщения с полем rank, по убыванию релевантности
+    """
+    terms = {term[:5] for term in query_terms(query)}
+    if not terms or not messages:
+        return []
+
+    documents = [[t[:5] for t in message_terms(m.get('text', ''))] for m in messages]
+    n_docs = len(documents)
+    avg_length = sum(len(d) for d in documents) / n_docs or 1.0
+    df = Counter()
+    for document in documents:
+        df.update(terms.intersection(document))
+    idf = {term: math.log(1 + (n_docs - df[term] + 0.5) / (df[term] + 0.5)) for term in terms}
+
+    scored = []
+    for message, document in zip(messages, documents):
+        counts = Counter(t for t in document if t in terms)
+        if not counts:
+            continue
+        norm = k1 * (1 - b + b * len(document) / avg_length)
+        score = sum(idf[t] * tf * (k1 + 1) / (tf + norm) for t, tf in counts.items())
+        scored.append({**message, 'rank': score})
+    scored.sort(key=lambda m: m['rank'], reverse=True)
+    return scored[:limit]
+
+
+def pack_context(hits: List[Dict[str, Any]], token_budget: int = DEFAULT_RETRIEVAL_BUDGET) -> str:
+    """Упаковка найденных сообщений в контекст с ограничением по токенам
+
+    Сообщения берутся по убыванию релевантности полным текстом,
+    а в контексте выводятся в хронологическом порядке, сгруппированные по диалогам.
+    """
+    selected = []
+    seen = set()
+    used = 0
+    for hit in hits:
+        line = format_message(hit)
+        cost = estimate_tokens(line) + 1
+        if used + cost > token_budget:
+            continue
+        key = normalize_text(hit.get('text', ''))
+        if not key or key in seen:
+            continue
+        seen.add(key)
+        selected.append(hit)
+        used += cost
+
+    selected.sort(key=lambda m: (str(m.get('dialog_id', '')), str(m.get('date', ''))))
+    lines = []
+    current_dialog = None
+    for message in selected:
+        dialog = message.get('dialog_name') or message.get('dialog_id')
+        if dialog and dialog != current_dialog:
+            lines.append(f"[Чат: {dialog}]")
+            current_dialog = dialog
+        lines.append(format_message(message))
+    return "\n".join(lines)
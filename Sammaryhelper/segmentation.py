@@ -0,0 +1,187 @@
+import math
+import statistics
+from collections import Counter
+from typing import List, Dict, Any, Callable
+from .text_utils import estimate_tokens
+from .extractive_summary import message_terms
+from .message_compaction import parse_date, format_message
+
+# Способы разбиения сообщений на части для саммари
+CHUNKING_SIZE = 'size'
+CHUNKING_SEMANTIC = 'semantic'
+
+DEFAULT_SEGMENTATION_SETTINGS = {
+    # Пауза, после которой начинается новый разговор
+    'gap_minutes': 60,
+    # Размер окна (в сообщениях) для сравнения лексики до и после границы
+    'window': 6,
+    # Ответ связывает сообщения в один разговор, если между ними не больше reply_window сообщений
+    'reply_window': 100,
+    # Минимальная длина сегмента в сообщениях
+    'min_segment': 4,
+    # Минимальная глубина провала близости: мелкие колебания внутри одной темы не считаются границей
+    'min_depth': 0.5,
+}
+
+
+def get_segmentation_settings(settings: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Настройки сегментации с подстановкой значений по умолчанию"""
+    result = dict(DEFAULT_SEGMENTATION_SETTINGS)
+    result.update(settings or {})
+    return result
+
+
+def _cosine(left: Counter, right: Counter, idf: Dict[str, float]) -> float:
+    if not left or not right:
+        return 0.0
+    if len(left) > len(right):
+        left, right = right, left
+    dot = sum(count * right[term] * idf[term] ** 2 for term, count in left.items() if term in right)
+    if not dot:
+        return 0.0
+    left_norm = math.sqrt(sum((count * idf[term]) ** 2 for term, count in left.items()))
+    right_norm = math.sqrt(sum((count * idf[term]) ** 2 for term, count in right.items()))
+    return dot / (left_norm * right_norm)
+
+
+def lexical_similarities(documents: List[List[str]], window: int) -> List[float]:
+    """Близость TF-IDF окон до и после каждой границы
+
+    Элемент i - косинус между сообщениями [i - window, i) и [i, i + window).
+    Окна сдвигаются инкрементально, поэтому расчет линеен по числу сообщений.
+    """
+    n = len(documents)
+    df = Counter()
+    for terms in documents:
+        df.update(set(terms))
+    idf = {term: math.log((n + 1) / (count + 1)) + 1.0 for term, count in df.items()}
+
+    def shift(counter: Counter, terms: List[str], sign: int):
+        for term in terms:
+            counter[term] += sign
+            if counter[term] <= 0:
+                del counter[term]
+
+    left = Counter()
+    right = Counter()
+    for terms in documents[:window]:
+        shift(right, terms, 1)
+    similarities = [0.0] * n
+    for i in range(1, n):
+        shift(left, documents[i - 1], 1)
+        if i - 1 - window >= 0:
+            shift(left, documents[i - 1 - window], -1)
+        shift(right, documents[i - 1], -1)
+        if i - 1 + window < n:
+            shift(right, documents[i - 1 + window], 1)
+        similarities[i] = _cosine(left, right, idf)
+    return similarities
+
+
+def depth_score(similarities: List[float], i: int) -> float:
+    """Глубина провала близости в точке i (как в TextTiling)
+
+    Глубина - насколько близость на границе ниже ближайших вершин слева и справа.
+    """
+    value = similarities[i]
+    left_peak = value
+    j = i - 1
+    while j >= 1 and similarities[j] >= left_peak:
+        left_peak = similarities[j]
+        j -= 1
+    right_peak = value
+    j = i + 1
+    while j < len(similarities) and similarities[j] >= right_peak:
+        right_peak = similarities[j]
+        j += 1
+    return (left_peak - value) + (right_peak - value)
+
+
+def segment_messages(messages: List[Dict[str, Any]], settings: Dict[str, Any] = None) -> List[List[Dict[str, Any]]]:
+    """Разбиение переписки на разговоры
+
+    Граница ставится после долгой паузы или в точке резкой смены лексики
+    (глубина провала TF-IDF близости выше среднего по провалам на половину
+    стандартного отклонения). Границы внутри цепочек ответов не ставятся.
+
+    Args:
+        messages: Сообщения в хронологическом порядке (словари с id, date, text, reply_to_msg_id)
+        settings: Параметры сегментации (см. DEFAULT_SEGMENTATION_SETTINGS)
+
+    Returns:
+        List[List[Dict[str, Any]]]: Сегменты в исходном порядке
+    """
+    settings = get_segmentation_settings(settings)
+    n = len(messages)
+    if n <= settings['min_segment']:
+        return [list(messages)] if messages else []
+
+    # Граница i проходит между сообщениями i - 1 и i
+    index_by_id = {m.get('id'): i for i, m in enumerate(messages) if m.get('id') is not None}
+    covered = [0] * (n + 1)
+    for i, message in enumerate(messages):
+        target = index_by_id.get(message.get('reply_to_msg_id'))
+        if target is not None and 0 < i - target <= settings['reply_window']:
+            covered[target + 1] += 1
+            covered[i + 1] -= 1
+    protected = [False] * n
+    running = 0
+    for i in range(n):
+        running += covered[i]
+        protected[i] = running > 0
+
+    dates = [parse_date(m.get('date')) for m in messages]
+    time_breaks = [False] * n
+    for i in range(1, n):
+        if dates[i] and dates[i - 1]:
+            time_breaks[i] = (dates[i] - dates[i - 1]).total_seconds() / 60 >= settings['gap_minutes']
+
+    similarities = lexical_similarities([message_terms(m.get('text') or '') for m in messages],
+                                        settings['window'])
+    # Кандидаты - локальные минимумы близости, глубина считается только для них
+    minima = [i for i in range(2, n - 1)
+              if similarities[i] <= similarities[i - 1] and similarities[i] <= similarities[i + 1]]
+    depths = {i: depth_score(similarities, i) for i in minima}
+    lexical_breaks = set()
+    if len(minima) > 1:
+        cutoff = statistics.fmean(depths.values()) + statistics.pstdev(depths.values()) / 2
+        lexical_breaks = {i for i in minima if depths[i] > cutoff and depths[i] >= settings['min_depth']}
+
+    segments = []
+    start = 0
+    for i in range(1, n):
+        if protected[i] or i - start < settings['min_segment']:
+            continue
+        if time_breaks[i] or i in lexical_breaks:
+            segments.append(messages[start:i])
+            start = i
+    segments.append(messages[start:])
+    return segments
+
+
+def pack_segments(segments: List[List[Dict[str, Any]]], max_tokens: int,
+                  render: Callable[[Dict[str, Any]], str] = format_message) -> List[List[str]]:
+    """Упаковка целых сегментов в части не больше max_tokens
+
+    Сегмент, который не помещается в текущую часть, начинает новую. Если текущая
+    часть заполнена меньше чем наполовину, сегмент дописывается в нее по сообщениям,
+    чтобы число частей не росло по сравнению с разбиением по размеру.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for segment in segments:
+        lines = [render(m) for m in segment]
+        tokens = [estimate_tokens(line) for line in lines]
+        if current and current_tokens + sum(tokens) > max_tokens and current_tokens >= max_tokens // 2:
+            chunks.append(current)
+            current, current_tokens = [], 0
+        for line, line_tokens in zip(lines, tokens):
+            if current and current_tokens + line_tokens > max_tokens:
+                chunks.append(current)
+                current, current_tokens = [], 0
+            current.append(line)
+            current_tokens += line_tokens
+    if current:
+        chunks.append(current)
+    return chunks
@@ -0,0 +1,147 @@
+import hashlib
+from collections import OrderedDict, deque
+from typing import List, Dict, Any, Optional, Tuple
+from .text_utils import normalize_text
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Порог близости запросов по умолчанию. Он рассчитан на смысловые векторы
+# (semantic_embedder='openai'): локальный HashingEmbedder сравнивает только общие
+# слова, и перефразировки с другими словами ("о чем чат сегодня" и "что обсуждали
+# сегодня") с ним не достигают порога - попадают лишь запросы, отличающиеся
+# порядком слов, регистром и пунктуацией
+DEFAULT_SIMILARITY_THRESHOLD = 0.9
+# Отрицания меняют смысл запроса, хотя почти не меняют его вектор
+NEGATION_WORDS = frozenset({'не', 'нет', 'ни', 'без', 'not', 'no'})
+
+
+def context_hash(context: str, model: str, system_prompt: str) -> str:
+    """Хеш контекста запроса: ответы переиспользуются только при том же контексте, модели и промпте"""
+    digest = hashlib.sha256()
+    for part in (model or '', system_prompt or '', context or ''):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def normalize_query(query: str) -> str:
+    """Нормализация запроса перед сравнением
+
+    Слова в нижнем регистре и алфавитном порядке, поэтому запросы, отличающиеся
+    порядком слов и пунктуацией, совпадают точно. Отрицания и числа сохраняются.
+    """
+    words = normalize_text((query or '').replace('ё', 'е').replace('Ё', 'Е')).split()
+    return ' '.join(sorted(set(words)))
+
+
+def key_terms(normalized: str) -> frozenset:
+    """Слова, которые должны совпадать у близких запросов: отрицания и числа"""
+    return frozenset(word for word in normalized.split() if word in NEGATION_WORDS or word.isdigit())
+
+
+class SemanticQueryCache:
+    """Кеш ответов ИИ для перефразированных запросов
+
+    Запрос векторизуется и сравнивается с предыдущими запросами по тому же
+    контексту. Если близость выше порога, возвращается сохраненный ответ.
+    Перефразировки другими словами распознаются только со смысловым
+    векторизатором (OpenAIEmbedder), см. DEFAULT_SIMILARITY_THRESHOLD.
+    """
+
+    def __init__(self, embedder, threshold: float = DEFAULT_SIMILARITY_THRESHOLD,
+                 max_contexts: int = 256, max_entries_per_context: int = 64):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("Для семантического кеша требуется numpy")
+        self.embedder = embedder
+        self.threshold = threshold
+        self.max_contexts = max_contexts
+        self.max_entries_per_context = max_entries_per_context
+        # context_hash -> список записей (вектор, нормализованный запрос, ответ)
+        self._entries = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        # Лучшая близость последних поисков - для подбора порога
+        self.recent_similarities = deque(maxlen=1000)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    async def lookup(self, query: str, key: str) -> Optional[Tuple[str, float]]:
+        """Поиск ответа на близкий запрос с тем же контекстом
+
+        Returns:
+            Optional[Tuple[str, float]]: (ответ, близость) или None
+        """
+        self.lookups += 1
+        entries = self._entries.get(key)
+        if not entries:
+            return None
+        self._entries.move_to_end(key)
+
+        normalized = normalize_query(query)
+        for _, entry_query, response in entries:
+            if entry_query == normalized:
+                self.hits += 1
+                self.recent_similarities.append(1.0)
+                return response, 1.0
+
+        # Запросы, отличающиеся отрицанием или числом ("за 2023 год" и "за 2024 год"),
+        # не считаются близкими при любой близости векторов
+        terms = key_terms(normalized)
+        candidates = [entry for entry in entries if key_terms(entry[1]) == terms]
+        if not candidates:
+            return None
+        vector = (await self.embedder.embed([normalized]))[0]
+        similarities = np.stack([entry[0] for entry in candidates]) @ vector
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        self.recent_similarities.append(similarity)
+        if similarity >= self.threshold:
+            self.hits += 1
+            return candidates[best][2], similarity
+        return None
+
+    async def store(self, query: str, key: str, response: str):
+        """Сохранение ответа на запрос"""
+        await self.store_many([(query, response)], key)
+
+    async def store_many(self, items: List[Tuple[str, str]], key: str):
+        """Сохранение нескольких пар (запрос, ответ) для одного контекста"""
+        # Пустой список тоже запоминается: контекст уже проверен и повторный прогрев не нужен
+        entries = self._entries.setdefault(key, [])
+        self._entries.move_to_end(key)
+        items = [(normalize_query(q), r) for q, r in items if q and r]
+        if not items:
+            return
+        vectors = await self.embedder.embed([q for q, _ in items])
+        known = {entry[1] for entry in entries}
+        for vector, (normalized, response) in zip(vectors, items):
+            if normalized in known:
+                continue
+            known.add(normalized)
+            entries.append((vector, normalized, response))
+        del entries[:-self.max_entries_per_context]
+        while len(self._entries) > self.max_contexts:
+            self._entries.popitem(last=False)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Статистика кеша: доля попаданий, порог и распределение близости"""
+        similarities = list(self.recent_similarities)
+        stats = {
+            'lookups': self.lookups,
+            'hits': self.hits,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            'threshold': self.threshold,
+            'contexts': len(self._entries),
+        }
+        if similarities:
+            # Сколько запросов попало бы в кеш при других порогах
+            stats['hits_by_threshold'] = {
+                t: sum(1 for s in similarities if s >= t) / len(similarities)
+                for t in (0.7, 0.75, 0.8, 0.85, 0.9, 0.95)
+            }
+        return stats
@@ -0,0 +1,280 @@
+import os
+import re
+import json
+import math
+import zlib
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable
+from .text_utils import estimate_tokens
+from .extractive_summary import message_terms
+from .log_utils import get_logger
+
+logger = get_logger('semantic_index')
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+class HashingEmbedder:
+    """Локальный векторизатор на основе хеширования признаков
+
+    Признаки - основы слов (первые 5 символов) и пары соседних слов.
+    Работает без сети и без обучения, вектор нормирован к единичной длине.
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dim: int = 128):
+        self.dim = dim
+
+    def _features(self, text: str) -> Counter:
+        stems = [term[:5] for term in message_terms(text)]
+        features = Counter(stems)
+        features.update(f'{a} {b}' for a, b in zip(stems, stems[1:]))
+        return features
+
+    def embed_sync(self, texts: List[str]) -> 'np.ndarray':
+        """Векторизация списка текстов"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                h = zlib.crc32(feature.encode('utf-8'))
+                # Старший бит хеша задает знак, чтобы коллизии взаимно гасились
+                sign = 1.0 if h & 0x80000000 else -1.0
+                vectors[row, h % self.dim] += sign * (1.0 + math.log(count))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
+
+    async def embed(self, texts: List[str]) -> 'np.ndarray':
+        return self.embed_sync(texts)
+
+
+class OpenAIEmbedder:
+    """Векторизатор через OpenAI Embeddings API
+
+    Запросы идут через общий планировщик, если он передан.
+    """
+
+    name = 'openai'
+
+    def __init__(self, client, model: str = 'text-embedding-3-small', dim: int = 512,
+                 batch_size: int = 256, scheduler=None):
+        self.client = client
+        self.model = model
+        self.dim = dim
+        self.batch_size = batch_size
+        self.scheduler = scheduler
+        self.name = f'openai-{model}'
+
+    async def _embed_batch(self, batch: List[str]) -> List[List[float]]:
+        async def request(timeout):
+            return await self.client.embeddings.create(
+                model=self.model, input=batch, dimensions=self.dim, timeout=timeout)
+
+        if self.scheduler is not None:
+            estimated = sum(estimate_tokens(text) for text in batch)
+            response = await self.scheduler.submit(request, estimated)
+        else:
+            response = await request(None)
+        return [item.embedding for item in response.data]
+
+    async def embed(self, texts: List[str]) -> 'np.ndarray':
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            # Пустую строку API не принимает
+            batch = [text or ' ' for text in texts[start:start + self.batch_size]]
+            vectors.extend(await self._embed_batch(batch))
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(texts), self.dim)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class SemanticIndex:
+    """Векторный индекс сообщений одного аккаунта
+
+    Векторы хранятся в отображаемой в память матрице float32, идентификаторы
+    (dialog_id, message_id) - в параллельной матрице int64. Новые сообщения
+    дописываются в конец, файл увеличивается удвоением.
+    """
+
+    def __init__(self, index_dir: str, account_id: str, embedder, initial_capacity: int = 4096,
+                 debug: bool = False):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("Для семантического поиска требуется numpy")
+        self.embedder = embedder
+        self.dim = embedder.dim
+        self.debug = debug
+        os.makedirs(index_dir, exist_ok=True)
+        safe_account = re.sub(r'[^\w.-]', '_', str(account_id))
+        safe_embedder = re.sub(r'[^\w.-]', '_', embedder.name)
+        base = os.path.join(index_dir, f'{safe_account}.{safe_embedder}.{self.dim}')
+        self.vectors_path = base + '.f32'
+        self.ids_path = base + '.ids'
+        self.meta_path = base + '.json'
+
+        self.count = 0
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.count = json.load(f).get('count', 0)
+        capacity = max(initial_capacity, self.count)
+        if os.path.exists(self.vectors_path):
+            capacity = max(capacity, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        self._open(capacity)
+        self._keys = {(int(d), int(m)) for d, m in self.ids[:self.count]}
+
+    def log(self, message, *args):
+        """Логирование сообщений"""
+        if self.debug:
+            logger.debug(message, *args)
+
+    def _open(self, capacity: int):
+        """Открытие файлов индекса с нужной емкостью"""
+        for path, row_bytes in ((self.vectors_path, 4 * self.dim), (self.ids_path, 16)):
+            with open(path, 'ab') as f:
+                if f.tell() < capacity * row_bytes:
+                    f.truncate(capacity * row_bytes)
+        self.capacity = capacity
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float32, mode='r+', shape=(capacity, self.dim))
+        self.ids = np.memmap(self.ids_path, dtype=np.int64, mode='r+', shape=(capacity, 2))
+
+    def _ensure_capacity(self, needed: int):
+        """Увеличение емкости файлов индекса"""
+        if needed <= self.capacity:
+            return
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        self.vectors.flush()
+        self.ids.flush()
+        del self.vectors, self.ids
+        self._open(capacity)
+        self.log("Емкость индекса увеличена до %s", capacity)
+
+    def _save_meta(self):
+        with open(self.meta_path, 'w', encoding='utf-8') as f:
+            json.dump({'count': self.count, 'dim': self.dim, 'embedder': self.embedder.name}, f)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, key) -> bool:
+        return key in self._keys
+
+    async def add(self, messages: Iterable[Dict[str, Any]], dialog_id: int = None) -> int:
+        """Добавление новых сообщений в индекс
+
+        Args:
+            messages: Сообщения с полями id, text и, при отсутствии dialog_id, полем dialog_id
+            dialog_id: ID диалога для всех сообщений
+
+        Returns:
+            int: Количество добавленных сообщений
+        """
+        new_keys = []
+        texts = []
+        batch_keys = set()
+        for message in messages:
+            text = message.get('text') or ''
+            did = dialog_id if dialog_id is not None else message.get('dialog_id')
+            if not text.strip() or did is None or message.get('id') is None:
+                continue
+            key = (int(did), int(message['id']))
+            if key in self._keys or key in batch_keys:
+                continue
+            batch_keys.add(key)
+            new_keys.append(key)
+            texts.append(text)
+        if not texts:
+            return 0
+
+        vectors = await self.embedder.embed(texts)
+        start = self.count
+        self._ensure_capacity(start + len(texts))
+        self.vectors[start:start + len(texts)] = vectors
+        self.ids[start:start + len(texts)] = np.asarray(new_keys, dtype=np.int64)
+        self.count += len(texts)
+        # Ключи учитываются только после записи векторов: при ошибке векторизации
+        # (например, 429) сообщения будут добавлены при следующем вызове
+        self._keys.update(new_keys)
+        self.vectors.flush()
+        self.ids.flush()
+        self._save_meta()
+        self.log("Добавлено %s сообщений, всего %s", len(texts), self.count)
+        return len(texts)
+
+    def search_vectors(self, queries: 'np.ndarray', dialog_ids: Optional[List[int]] = None, k: int = 10,
+                       block_size: int = 262144) -> List[List[tuple]]:
+        """Поиск ближайших векторов для пакета запросов
+
+        Матрица обрабатывается блоками, чтобы не загружать весь индекс в память.
+
+        Args:
+            queries: Нормированные векторы запросов, форма (q, dim)
+            dialog_ids: Ограничение поиска диалогами
+            k: Количество результатов на запрос
+
+        Returns:
+            List[List[tuple]]: Для каждого запроса список (строка индекса, близость) по убыванию
+        """
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        n_queries = queries.shape[0]
+        best_scores = np.full((n_queries, 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((n_queries, 0), dtype=np.int64)
+        allowed = np.asarray(sorted(set(dialog_ids)), dtype=np.int64) if dialog_ids else None
+
+        for start in range(0, self.count, block_size):
+            stop = min(start + block_size, self.count)
+            scores = queries @ np.asarray(self.vectors[start:stop]).T
+            if allowed is not None:
+                mask = np.isin(self.ids[start:stop, 0], allowed)
+                if not mask.any():
+                    continue
+                scores[:, ~mask] = -np.inf
+            take = min(k, stop - start)
+            top = np.argpartition(-scores, take - 1, axis=1)[:, :take]
+            best_scores = np.concatenate([best_scores, np.take_along_axis(scores, top, axis=1)], axis=1)
+            best_rows = np.concatenate([best_rows, top + start], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        results = []
+        for q in range(n_queries):
+            order = np.argsort(-best_scores[q])
+            results.append([(int(best_rows[q, i]), float(best_scores[q, i]))
+                            for i in order if np.isfinite(best_scores[q, i])])
+        return results
+
+    async def search(self, query: str, dialog_ids: Optional[List[int]] = None, k: int = 10) -> List[Dict[str, Any]]:
+        """Семантический поиск сообщений по тексту запроса
+
+        Returns:
+            List[Dict[str, Any]]: Результаты с полями dialog_id, message_id, score
+        """
+        if not self.count or not query.strip():
+            return []
+        query_vector = await self.embedder.embed([query])
+        hits = self.search_vectors(query_vector, dialog_ids, k)[0]
+        return [{'dialog_id': int(self.ids[row, 0]), 'message_id': int(self.ids[row, 1]), 'score': score}
+                for row, score in hits]
+
+
+def create_embedder(settings: Dict[str, Any], openai_client=None, scheduler=None):
+    """Создание векторизатора по настройкам
+
+    settings['semantic_embedder']: 'hashing' (по умолчанию) или 'openai'
+    """
+    if settings.get('semantic_embedder') == 'openai' and openai_client is not None:
+        return OpenAIEmbedder(
+            openai_client,
+            model=settings.get('semantic_embedding_model', 'text-embedding-3-small'),
+            dim=int(settings.get('semantic_dim', 512)),
+            scheduler=scheduler
+        )
+    return HashingEmbedder(dim=int(settings.get('semantic_dim', 128)))
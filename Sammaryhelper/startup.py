@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import datetime
+from typing import Any, Dict, List, Optional
+from .log_utils import get_logger
+
+logger = get_logger('startup')
+
+# Снимок сессии: последний список диалогов и открытый чат, показываемые при запуске
+# до подключения к Telegram
+SNAPSHOT_VERSION = 1
+DEFAULT_SNAPSHOT_MESSAGES = 200
+DEFAULT_SNAPSHOT_DIALOGS = 5000
+# Поля диалога, которые не сериализуются (объекты Telethon)
+SNAPSHOT_SKIPPED_FIELDS = ('entity',)
+
+# Этапы запуска
+STARTUP_STARTED = 'started'
+STARTUP_IMPORTED = 'imported'
+STARTUP_FIRST_FRAME = 'first_frame'
+STARTUP_INTERACTIVE = 'interactive'
+STARTUP_CONNECTED = 'connected'
+
+
+class StartupTimer:
+    """Отметки времени этапов запуска относительно старта процесса"""
+
+    def __init__(self, started: float = None):
+        self.started = time.perf_counter() if started is None else started
+        self.marks = {STARTUP_STARTED: 0.0}
+
+    def mark(self, name: str) -> float:
+        """Отметка этапа (повторная отметка того же этапа игнорируется)"""
+        if name not in self.marks:
+            self.marks[name] = time.perf_counter() - self.started
+        return self.marks[name]
+
+    def report(self) -> Dict[str, float]:
+        """Отметки в миллисекундах в порядке прохождения"""
+        return {name: round(seconds * 1000, 1)
+                for name, seconds in sorted(self.marks.items(), key=lambda item: item[1])}
+
+
+def snapshot_path(app_dir: str, config_name: str) -> str:
+    """Файл снимка сессии для конфига (рядом с файлом сессии Telethon)"""
+    return os.path.join(app_dir, 'sessions', f"{config_name or 'default'}.snapshot.json")
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return str(value)
+
+
+def save_snapshot(path: str, dialogs: List[Dict[str, Any]], selected_dialogs: List[Dict[str, Any]] = None,
+                  dialog_id: Optional[int] = None, dialog_name: str = None,
+                  messages: List[Dict[str, Any]] = None,
+                  max_dialogs: int = DEFAULT_SNAPSHOT_DIALOGS,
+                  max_messages: int = DEFAULT_SNAPSHOT_MESSAGES) -> bool:
+    """Сохранение снимка сессии
+
+    Файл записывается во временный и затем заменяется, поэтому при аварийном
+    завершении остается прежний снимок, а не обрезанный.
+
+    Args:
+        path: Путь к файлу снимка
+        dialogs: Загруженные диалоги
+        selected_dialogs: Выбранные диалоги [{'id': ..., 'name': ...}]
+        dialog_id: Открытый чат
+        dialog_name: Название открытого чата
+        messages: Сообщения открытого чата (сохраняются первые max_messages, т.е. самые новые)
+    """
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'saved_at': datetime.datetime.now().isoformat(timespec='seconds'),
+        'dialogs': [{key: value for key, value in dialog.items() if key not in SNAPSHOT_SKIPPED_FIELDS}
+                    for dialog in dialogs[:max_dialogs]],
+        'selected_dialogs': list(selected_dialogs or []),
+        'dialog_id': dialog_id,
+        'dialog_name': dialog_name,
+        'messages': list(messages or [])[:max_messages],
+    }
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False, default=_json_default)
+        os.replace(tmp_path, path)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning("Ошибка при сохранении снимка сессии: %s", e)
+        return False
+
+
+def load_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    """Загрузка снимка сессии; None, если снимка нет или он поврежден"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            snapshot = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning("Ошибка при чтении снимка сессии: %s", e)
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        return None
+    return snapshot
@@ -0,0 +1,139 @@
+import time
+import asyncio
+import itertools
+import threading
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# Классы приоритетов задач и запросов к ИИ: меньшее значение обслуживается раньше
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+# Состояния задач
+STATUS_QUEUED = 'queued'
+STATUS_RUNNING = 'running'
+
+# Сколько фоновых задач выполняется одновременно; интерактивные не ждут
+DEFAULT_MAX_BACKGROUND = 2
+
+
+class TaskInfo:
+    """Задача интерфейса в цикле asyncio"""
+    __slots__ = ('id', 'title', 'slot', 'priority', 'status', 'created', 'started', 'future')
+
+    def __init__(self, task_id: int, title: str, slot: Optional[str], priority: int):
+        self.id = task_id
+        self.title = title
+        self.slot = slot
+        self.priority = priority
+        self.status = STATUS_QUEUED
+        self.created = time.monotonic()
+        self.started = None
+        self.future = None
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self.created
+
+
+class TaskManager:
+    """Запуск и учет фоновых задач GUI в цикле asyncio
+
+    Задача со слотом (например, 'messages') отменяет предыдущую задачу того же
+    слота: при быстром переходе между диалогами выполняется только последняя
+    загрузка, а прежняя не тратит запросы к API и не перезаписывает результаты.
+    Отмена передается в ожидаемые вызовы Telethon и OpenAI как CancelledError.
+    Фоновые задачи (priority >= PRIORITY_BACKGROUND) выполняются не более
+    max_background одновременно, интерактивные запускаются сразу.
+    """
+
+    def __init__(self, loop, max_background: int = DEFAULT_MAX_BACKGROUND,
+                 on_error: Callable[[TaskInfo, BaseException], None] = None):
+        self.loop = loop
+        self.max_background = max(1, max_background)
+        self.on_error = on_error
+        self._tasks = {}
+        self._slots = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._background = None
+        self.stats = {'submitted': 0, 'superseded': 0, 'cancelled': 0, 'failed': 0}
+
+    def submit(self, factory: Callable[[], Awaitable[Any]], title: str, slot: str = None,
+               priority: int = PRIORITY_INTERACTIVE) -> TaskInfo:
+        """Запуск задачи из любого потока
+
+        Args:
+            factory: Функция без аргументов, возвращающая корутину (вызывается в цикле
+                asyncio, поэтому отмененная до запуска задача не создает корутину)
+            title: Название для списка задач
+            slot: Имя слота; предыдущая задача этого слота отменяется
+            priority: PRIORITY_INTERACTIVE или PRIORITY_BACKGROUND
+        """
+        with self._lock:
+            info = TaskInfo(next(self._ids), title, slot, priority)
+            previous = self._slots.get(slot) if slot else None
+            self._tasks[info.id] = info
+            if slot:
+                self._slots[slot] = info
+            self.stats['submitted'] += 1
+            info.future = asyncio.run_coroutine_threadsafe(self._run(info, factory), self.loop)
+        # Отмена вне блокировки: обработчики завершения могут вызываться сразу
+        if previous is not None:
+            self.stats['superseded'] += 1
+            previous.future.cancel()
+        info.future.add_done_callback(lambda future: self._finished(info, future))
+        return info
+
+    async def _run(self, info: TaskInfo, factory: Callable[[], Awaitable[Any]]) -> Any:
+        if info.priority >= PRIORITY_BACKGROUND:
+            if self._background is None:
+                self._background = asyncio.Semaphore(self.max_background)
+            async with self._background:
+                return await self._start(info, factory)
+        return await self._start(info, factory)
+
+    async def _start(self, info: TaskInfo, factory: Callable[[], Awaitable[Any]]) -> Any:
+        info.status = STATUS_RUNNING
+        info.started = time.monotonic()
+        return await factory()
+
+    def _finished(self, info: TaskInfo, future):
+        with self._lock:
+            self._tasks.pop(info.id, None)
+            if info.slot and self._slots.get(info.slot) is info:
+                del self._slots[info.slot]
+        if future.cancelled():
+            self.stats['cancelled'] += 1
+            return
+        error = future.exception()
+        if error is not None:
+            self.stats['failed'] += 1
+            if self.on_error:
+                self.on_error(info, error)
+
+    def cancel(self, task_id: int) -> bool:
+        """Отмена задачи по номеру"""
+        with self._lock:
+            info = self._tasks.get(task_id)
+        return bool(info and info.future.cancel())
+
+    def cancel_slot(self, slot: str) -> bool:
+        with self._lock:
+            info = self._slots.get(slot)
+        return bool(info and info.future.cancel())
+
+    def cancel_all(self):
+        with self._lock:
+            tasks = list(self._tasks.values())
+        for info in tasks:
+            info.future.cancel()
+
+    def is_active(self, slot: str) -> bool:
+        with self._lock:
+            return slot in self._slots
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Активные задачи для отображения: номер, название, слот, приоритет, состояние, время"""
+        with self._lock:
+            tasks = sorted(self._tasks.values(), key=lambda t: t.id)
+        return [{'id': t.id, 'title': t.title, 'slot': t.slot, 'priority': t.priority,
+                 'status': t.status, 'elapsed': round(t.elapsed(), 1)} for t in tasks]
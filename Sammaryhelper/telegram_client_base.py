@@ -4,7 +4,11 @@ from telethon.tl import functions
 import os
 from typing import List, Dict, Any
 from .db_handler import DatabaseHandler
+from .config_service import get_config_service
 import datetime
+from .log_utils import get_logger
+
+logger = get_logger('telegram')
 
 class TelegramClientBase:
     """Базовый класс для работы с Telegram API"""
@@ -23,10 +27,10 @@ class TelegramClientBase:
         self.db_handler = None
         self.use_cache = config.get('use_cache', True)
         
-    def log(self, message):
-        """Логирование сообщений"""
+    def log(self, message, *args, sample: int = None):
+        """Логирование сообщений; args подставляются в message, только если запись будет выведена"""
         if self.config.get('debug', False):
-            print(message)  # Выводим в консоль только если включен режим отладки
+            logger.debug(message, *args, extra={'sample': sample})
 
     async def init_client(self):
         """Инициализация клиента Telegram"""
@@ -36,16 +40,8 @@ class TelegramClientBase:
                     await self.client.disconnect()
                 self.client = None
 
-            # Загружаем конфиг
-            config_path = os.path.join(self.app_dir, "configs", f"{self.config['config_name']}.py")
-            if not os.path.exists(config_path):
-                raise FileNotFoundError(f"Файл конфига не найден: {config_path}")
-
-            # Импортируем конфиг
-            import importlib.util
-            spec = importlib.util.spec_from_file_location("config", config_path)
-            config = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(config)
+            # Конфиг из общего кеша: при переподключении файл не выполняется заново
+            config = get_config_service(self.app_dir).get(self.config['config_name'])
 
             # Создаем директорию для сессий
             sessions_dir = os.path.join(self.app_dir, "sessions")
@@ -81,7 +77,8 @@ class TelegramClientBase:
             if self.use_cache:
                 self.log("Начинаю инициализацию клиента...")
                 try:
-                    self.db_handler = DatabaseHandler(debug=self.config.get('debug', False))
+                    self.db_handler = DatabaseHandler(config_name=self.config['config_name'], app_dir=self.app_dir,
+                                                      debug=self.config.get('debug', False))
                     db_connected = await self.db_handler.init_connection()
                     if not db_connected:
                         self.log("Не удалось подключиться к базе данных. Кеширование отключено.")
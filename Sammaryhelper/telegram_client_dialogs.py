@@ -36,21 +36,66 @@ class TelegramClientDialogs(TelegramClientBase):
             })
         return dialogs
 
-    async def get_chat_participants(self, chat_id: int) -> List[Dict[str, Any]]:
-        """Получение списка участников чата"""
+    async def get_chat_participants(self, chat_id: int, limit: int = None,
+                                    force_refresh: bool = False) -> List[Dict[str, Any]]:
+        """Получение списка участников чата
+
+        Список берется из кеша БД, если последняя полная загрузка не старше
+        participants_cache_ttl секунд. Иначе участники загружаются из Telegram.
+        В кеш попадает только полная загрузка без limit: частичный список
+        (limit или ошибка посреди загрузки) не должен выдаваться за полный.
+        """
         try:
+            account_id = None
+            use_cache = self.use_cache and self.db_handler
+            if use_cache:
+                me = await self.client.get_me()
+                account_id = str(me.phone) if me.phone else str(me.id)
+                if not force_refresh:
+                    ttl = self.config.get('participants_cache_ttl', 24 * 3600)
+                    cached = await self.db_handler.get_cached_participants(chat_id, account_id, max_age=ttl)
+                    if cached is not None:
+                        self.log("Получено %s участников чата %s из кеша", len(cached), chat_id)
+                        return cached[:limit] if limit else cached
+
+            fetched_at = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
             participants = []
-            async for user in self.client.iter_participants(chat_id):
+            async for user in self.client.iter_participants(chat_id, limit=limit):
                 participants.append({
                     'id': user.id,
                     'username': user.username,
                     'first_name': user.first_name,
                     'last_name': user.last_name
                 })
+            if use_cache and limit is None:
+                await self.db_handler.cache_participants(participants, chat_id, account_id, fetched_at)
             return participants
         except Exception as e:
             raise Exception(f"Ошибка при получении участников чата: {e}")
 
+    async def get_participants_count(self, chat_id: int) -> int:
+        """Количество участников чата без загрузки самого списка"""
+        participants = await self.client.get_participants(chat_id, limit=0)
+        return participants.total
+
+    async def get_user_names(self, user_ids: List[int]) -> Dict[int, str]:
+        """Отображаемые имена пользователей по id (только для переданных id)
+
+        Пользователи, которых не удалось получить, в результат не попадают.
+        """
+        names = {}
+        for user_id in user_ids:
+            try:
+                user = await self.client.get_entity(user_id)
+            except Exception as e:
+                self.log("Не удалось получить пользователя %s: %s", user_id, e)
+                continue
+            name = ' '.join(filter(None, [getattr(user, 'first_name', None), getattr(user, 'last_name', None)]))
+            name = name or getattr(user, 'username', None) or getattr(user, 'title', None)
+            if name:
+                names[user_id] = name
+        return names
+
     async def get_dialog_folders(self) -> Dict[int, Dict[str, Any]]:
         """Получение структуры папок через Telegram API"""
         try:
@@ -89,7 +134,7 @@ class TelegramClientDialogs(TelegramClientBase):
     async def filter_dialogs(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Фильтрация диалогов по заданным критериям"""
         try:
-            self.log(f"Вызов filter_dialogs с фильтрами: {filters}")
+            self.log("Вызов filter_dialogs с фильтрами: %s", filters)
             
             # Проверяем лимит
             limit = filters.get('limit')
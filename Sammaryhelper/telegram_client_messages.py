@@ -1,9 +1,17 @@
 from telethon.tl.types import Channel, User
 from telethon.tl import functions
 from typing import List, Dict, Any
+import asyncio
 import datetime
 import traceback
 from .telegram_client_base import TelegramClientBase
+from .log_utils import lazy
+from .message_stream import MessagePage, PAGE_CACHED, PAGE_FRESH, DEFAULT_PAGE_SIZE
+from .cross_chat_search import (
+    SearchQuery, merge_streams, DEFAULT_GLOBAL_MIN_DIALOGS, DEFAULT_PEER_CONCURRENCY, GLOBAL_SCAN_FACTOR)
+
+# Сколько найденных сообщений отдается одним пакетом
+SEARCH_BATCH_SIZE = 20
 
 class TelegramClientMessages(TelegramClientBase):
     """Класс для работы с сообщениями в Telegram API"""
@@ -50,7 +58,10 @@ class TelegramClientMessages(TelegramClientBase):
                     
                     # Выводим информацию о результате
                     if hasattr(result, 'topics'):
-                        self.log(f"Атрибуты первой темы: {dir(result.topics[0])}" if result.topics else "Список тем пуст")
+                        if result.topics:
+                            self.log("Атрибуты первой темы: %s", lazy(dir, result.topics[0]))
+                        else:
+                            self.log("Список тем пуст")
                         
                         topics = []
                         for topic in result.topics:
@@ -90,15 +101,16 @@ class TelegramClientMessages(TelegramClientBase):
                 message_count += 1
                 
                 # Выводим отладочную информацию о сообщении
-                self.log(f"Сообщение #{message_count}: id={msg.id}, тип={type(msg).__name__}")
+                # Записи на каждое сообщение прореживаются
+                self.log("Сообщение #%s: id=%s, тип=%s", message_count, msg.id, type(msg).__name__, sample=50)
                 if hasattr(msg, 'forum_topic'):
-                    self.log(f"  forum_topic = {msg.forum_topic}")
+                    self.log("  forum_topic = %s", msg.forum_topic, sample=50)
                 if hasattr(msg, 'reply_to'):
-                    self.log(f"  reply_to присутствует: {dir(msg.reply_to)}")
+                    self.log("  reply_to присутствует: %s", lazy(dir, msg.reply_to), sample=50)
                     if hasattr(msg.reply_to, 'forum_topic'):
-                        self.log(f"  reply_to.forum_topic = {msg.reply_to.forum_topic}")
+                        self.log("  reply_to.forum_topic = %s", msg.reply_to.forum_topic, sample=50)
                     if hasattr(msg.reply_to, 'top_msg_id'):
-                        self.log(f"  reply_to.top_msg_id = {msg.reply_to.top_msg_id}")
+                        self.log("  reply_to.top_msg_id = %s", msg.reply_to.top_msg_id, sample=50)
                 
                 # Проверяем, является ли сообщение началом темы
                 if hasattr(msg, 'forum_topic') and msg.forum_topic:
@@ -110,7 +122,7 @@ class TelegramClientMessages(TelegramClientBase):
                         if hasattr(msg, 'topic') and msg.topic:
                             if hasattr(msg.topic, 'title'):
                                 title = msg.topic.title
-                            self.log(f"Информация о теме: {dir(msg.topic)}")
+                            self.log("Информация о теме: %s", lazy(dir, msg.topic))
                         
                         topics.append({
                             'id': msg.id,
@@ -127,7 +139,7 @@ class TelegramClientMessages(TelegramClientBase):
                 if hasattr(msg, 'reply_to') and hasattr(msg.reply_to, 'forum_topic') and msg.reply_to.forum_topic:
                     if hasattr(msg.reply_to, 'top_msg_id'):
                         topic_id = msg.reply_to.top_msg_id
-                        self.log(f"Найдено сообщение, относящееся к теме: id={msg.id}, topic_id={topic_id}")
+                        self.log("Найдено сообщение, относящееся к теме: id=%s, topic_id=%s", msg.id, topic_id, sample=50)
                         
                         # Если тема еще не в списке, добавляем ее
                         if topic_id not in topic_ids:
@@ -240,6 +252,7 @@ class TelegramClientMessages(TelegramClientBase):
                     'video': bool(message.video),
                     'sender_id': message.sender_id if message.sender else None,
                     'sender_name': '',
+                    'reply_to_msg_id': getattr(message, 'reply_to_msg_id', None),
                 }
                 
                 # Получить информацию об отправителе
@@ -264,6 +277,73 @@ class TelegramClientMessages(TelegramClientBase):
         self.log(f"Загружено {len(messages)} сообщений")
         return messages
 
+    def _message_to_dict(self, message) -> Dict[str, Any]:
+        """Словарь сообщения; имя отправителя берется из ответа API без дополнительных запросов"""
+        sender = message.sender
+        sender_name = ''
+        if sender is not None:
+            if hasattr(sender, 'first_name'):
+                sender_name = f"{sender.first_name or ''} {sender.last_name or ''}".strip() or (sender.username or '')
+            elif hasattr(sender, 'title'):
+                sender_name = sender.title
+        return {
+            'id': message.id,
+            'date': message.date.strftime('%Y-%m-%d %H:%M:%S'),
+            'text': message.text or '',
+            'photo': bool(message.photo),
+            'video': bool(message.video),
+            'sender_id': message.sender_id,
+            'sender_name': sender_name,
+            'reply_to_msg_id': getattr(message, 'reply_to_msg_id', None),
+        }
+
+    async def get_messages_since(self, chat_id: int, since: datetime.datetime = None,
+                                 until: datetime.datetime = None, min_id: int = 0,
+                                 limit: int = None) -> List[Dict[str, Any]]:
+        """
+        Получить сообщения чата за период или новее сообщения min_id.
+        """
+        messages = []
+        iter_params = {'limit': limit, 'offset_date': until}
+        if min_id:
+            iter_params['min_id'] = min_id
+        async for message in self.client.iter_messages(chat_id, **iter_params):
+            if since and message.date < since:
+                break
+            messages.append(self._message_to_dict(message))
+        self.log("Чат %s: получено %s новых сообщений", chat_id, len(messages))
+        return messages
+
+    async def get_topic_messages(self, chat_id: int, topic_id: int, limit: int = None,
+                                 since: datetime.datetime = None) -> List[Dict[str, Any]]:
+        """
+        Получить сообщения одной темы форума.
+        Сообщения темы запрашиваются напрямую (reply_to), без сканирования всей истории чата.
+        Общая тема (id 1) не является веткой ответов, поэтому для нее отбираются
+        сообщения чата, не относящиеся к другим темам.
+        """
+        messages = []
+        if topic_id == 1:
+            scanned = 0
+            async for message in self.client.iter_messages(chat_id):
+                scanned += 1
+                if since and message.date < since:
+                    break
+                reply_to = getattr(message, 'reply_to', None)
+                if reply_to is None or not getattr(reply_to, 'forum_topic', False):
+                    messages.append(self._message_to_dict(message))
+                if limit and (len(messages) >= limit or scanned >= limit * 5):
+                    break
+        else:
+            async for message in self.client.iter_messages(chat_id, reply_to=topic_id, limit=limit):
+                if since and message.date < since:
+                    break
+                messages.append(self._message_to_dict(message))
+        for message in messages:
+            message['message_thread_id'] = topic_id
+        self.log("Тема %s чата %s: получено %s сообщений", topic_id, chat_id, len(messages))
+        return messages
+
     async def get_raw_messages(self, chat_id: int, limit: int = 100) -> List[Any]:
         """
         Получить необработанные объекты сообщений из Telethon API.
@@ -294,6 +374,234 @@ class TelegramClientMessages(TelegramClientBase):
         self.log(f"Загружено {len(raw_messages)} raw-сообщений")
         return raw_messages
 
+    def _filter_cached_messages(self, messages: List[Dict[str, Any]], filters: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Применение фильтров (тема, текст, тип медиа, лимит) к кешированным сообщениям"""
+        filtered_messages = []
+        for message in messages:
+            # Применяем фильтр по теме, если указан topic_id
+            if filters.get('topic_id') and message.get('message_thread_id') != filters.get('topic_id'):
+                continue
+            
+            # Применяем фильтр по тексту
+            if filters.get('search') and filters['search'].lower() not in message.get('text', '').lower():
+                continue
+            
+            # Применяем фильтр по типу медиа
+            if filters.get('filter') == 'photo' and not message.get('photo'):
+                continue
+            if filters.get('filter') == 'video' and not message.get('video'):
+                continue
+            
+            filtered_messages.append(message)
+        
+        # Ограничиваем количество сообщений
+        if filters.get('limit'):
+            filtered_messages = filtered_messages[:filters.get('limit')]
+        return filtered_messages
+
+    async def _sender_name(self, sender_id, user_cache: Dict[int, str]) -> str:
+        """Имя отправителя с кешированием в user_cache"""
+        if not sender_id:
+            return "Неизвестно"
+        if sender_id in user_cache:
+            return user_cache[sender_id]
+        sender_name = "Неизвестно"
+        try:
+            sender = await self.client.get_entity(sender_id)
+            sender_name = self._entity_name(sender)
+            
+            # Кешируем результат
+            user_cache[sender_id] = sender_name
+        except Exception as e:
+            if 'wait of' in str(e).lower() and 'seconds is required' in str(e).lower():
+                # Если требуется ожидание, используем default имя и продолжаем
+                self.log("Лимит API на получение информации о пользователе %s, используем имя по умолчанию", sender_id)
+            else:
+                self.log("Ошибка при получении отправителя: %s", e)
+        return sender_name
+
+    @staticmethod
+    def _entity_name(entity) -> str:
+        if isinstance(entity, User):
+            return getattr(entity, 'username', entity.first_name or 'Неизвестно')
+        if isinstance(entity, Channel):
+            return entity.title
+        return "Неизвестно"
+
+    async def _message_data(self, message, user_cache: Dict[int, str]) -> Dict[str, Any]:
+        """Словарь сообщения Telethon; date - строка ISO, date_obj - исходный datetime"""
+        # Преобразуем date в строку ISO для безопасной сериализации
+        message_date = message.date
+        date_str = message_date.isoformat() if isinstance(message_date, datetime.datetime) else str(message_date)
+        return {
+            'id': message.id,
+            'text': message.text or '',
+            'date': date_str,  # Используем строку вместо объекта datetime
+            'date_obj': message_date,  # Временный объект datetime для сортировки и т.д.
+            'sender_id': message.sender_id,
+            'sender_name': await self._sender_name(message.sender_id, user_cache),
+            'photo': bool(message.photo),
+            'video': bool(message.video),
+            'reply_to_msg_id': getattr(message, 'reply_to_msg_id', None),
+            'message_thread_id': getattr(message, 'message_thread_id', None)  # Добавляем ID темы, если есть
+        }
+
+    async def _cache_fetched_messages(self, messages: List[Dict[str, Any]], chat_id: int, account_id: str):
+        """Кеширование полученных из Telegram сообщений и восстановление date в виде datetime"""
+        if self.use_cache and self.db_handler and messages:
+            # Создаем копию списка для кеширования без временного поля с объектом datetime
+            messages_to_cache = [{k: v for k, v in message.items() if k != 'date_obj'} for message in messages]
+            try:
+                self.log("Кеширование %s сообщений", len(messages_to_cache))
+                await self.db_handler.cache_messages(messages_to_cache, chat_id, account_id)
+            except Exception as e:
+                self.log("Ошибка при кешировании сообщений: %s", e)
+        
+        # Восстанавливаем объекты datetime для каждого сообщения в возвращаемом списке
+        for message in messages:
+            if 'date_obj' in message:
+                message['date'] = message.pop('date_obj')
+
+    async def stream_messages(self, chat_id: int, filters: Dict[str, Any], page_size: int = DEFAULT_PAGE_SIZE):
+        """Сообщения диалога страницами по мере получения (без тем)
+        
+        Сначала отдается страница кешированных сообщений, затем страницы из
+        Telegram (от новых к старым), каждая кешируется сразу после получения.
+        Если свежая страница целиком совпала с кешем, более старые сообщения
+        уже есть в кеше и загрузка останавливается.
+        
+        Yields:
+            MessagePage: Страницы вида PAGE_CACHED и PAGE_FRESH
+        """
+        if not isinstance(chat_id, int):
+            raise ValueError(f"Некорректный ID диалога: {chat_id}")
+        
+        me = await self.client.get_me()
+        account_id = str(me.phone) if me.phone else str(me.id)
+        
+        cached_by_id = {}
+        if self.use_cache and self.db_handler and not filters.get('force_refresh'):
+            cached = self._filter_cached_messages(await self.db_handler.get_cached_messages(chat_id, account_id), filters)
+            if cached:
+                cached_by_id = {message['id']: message for message in cached}
+                yield MessagePage(PAGE_CACHED, cached)
+        
+        user_cache = {}
+        page = []
+        fetched = 0
+        iter_params = {'limit': filters.get('limit'), 'search': filters.get('search')}
+        async for message in self.client.iter_messages(chat_id, **iter_params):
+            # Применяем фильтр по типу медиа
+            if filters.get('filter') == 'photo' and not message.photo:
+                continue
+            if filters.get('filter') == 'video' and not message.video:
+                continue
+            page.append(await self._message_data(message, user_cache))
+            if len(page) < page_size:
+                continue
+            fetched += len(page)
+            await self._cache_fetched_messages(page, chat_id, account_id)
+            yield MessagePage(PAGE_FRESH, page, fetched)
+            if cached_by_id and all(m['id'] in cached_by_id and m['text'] == cached_by_id[m['id']].get('text')
+                                    for m in page):
+                self.log("Страница совпала с кешем, загрузка остановлена после %s сообщений", fetched)
+                return
+            page = []
+        if page:
+            fetched += len(page)
+            await self._cache_fetched_messages(page, chat_id, account_id)
+            yield MessagePage(PAGE_FRESH, page, fetched)
+
+    async def _search_hit(self, message, user_cache: Dict[int, str]) -> Dict[str, Any]:
+        """Словарь найденного сообщения; отправитель берется из ответа поиска без запроса get_entity"""
+        sender = getattr(message, 'sender', None)
+        if sender is not None and message.sender_id not in user_cache:
+            user_cache[message.sender_id] = self._entity_name(sender)
+        data = await self._message_data(message, user_cache)
+        data['date'] = data.pop('date_obj')
+        return data
+
+    async def _search_peer(self, chat_id: int, query: SearchQuery, semaphore: asyncio.Semaphore,
+                           user_cache: Dict[int, str]):
+        """Поиск в одном чате на стороне Telegram (текст, отправитель, дата)"""
+        date_range = query.date_range()
+        async with semaphore:
+            batch = []
+            async for message in self.client.iter_messages(
+                    chat_id, limit=query.limit, search=query.text or None, from_user=query.from_user(),
+                    offset_date=date_range[1] if date_range else None):
+                if date_range and message.date < date_range[0]:
+                    break
+                batch.append(await self._search_hit(message, user_cache))
+                if len(batch) >= SEARCH_BATCH_SIZE:
+                    yield chat_id, batch
+                    batch = []
+            if batch:
+                yield chat_id, batch
+
+    async def _search_global(self, query: SearchQuery, user_cache: Dict[int, str]):
+        """Глобальный поиск Telegram по тексту (SearchGlobalRequest) с отбором выбранных чатов"""
+        wanted = set(query.dialog_ids)
+        date_range = query.date_range()
+        # Глобальный поиск идет по всем чатам аккаунта, поэтому просмотр ограничен
+        scan_limit = query.limit * len(wanted) * GLOBAL_SCAN_FACTOR
+        counts = {}
+        batch = []
+        async for message in self.client.iter_messages(
+                None, limit=scan_limit, search=query.text,
+                offset_date=date_range[1] if date_range else None):
+            if date_range and message.date < date_range[0]:
+                break
+            chat_id = message.chat_id
+            if chat_id not in wanted or counts.get(chat_id, 0) >= query.limit:
+                continue
+            counts[chat_id] = counts.get(chat_id, 0) + 1
+            batch.append((chat_id, await self._search_hit(message, user_cache)))
+            if len(batch) >= SEARCH_BATCH_SIZE:
+                for item in self._group_hits(batch):
+                    yield item
+                batch = []
+            if len(counts) == len(wanted) and min(counts.values()) >= query.limit:
+                break
+        for item in self._group_hits(batch):
+            yield item
+
+    @staticmethod
+    def _group_hits(hits):
+        groups = {}
+        for chat_id, message in hits:
+            groups.setdefault(chat_id, []).append(message)
+        return list(groups.items())
+
+    async def search_chats(self, query: SearchQuery, global_min_dialogs: int = DEFAULT_GLOBAL_MIN_DIALOGS,
+                           concurrency: int = DEFAULT_PEER_CONCURRENCY):
+        """Поиск по выбранным чатам на стороне Telegram
+        
+        Сообщения не скачиваются целиком: текст, отправитель (@username или ID)
+        и дата передаются в запрос поиска. При большом числе выбранных чатов
+        текстовый запрос выполняется одним глобальным поиском, иначе - поиском
+        в каждом чате (до concurrency чатов одновременно).
+        
+        Yields:
+            Tuple: (dialog_id, найденные сообщения) по мере получения
+        """
+        user_cache = {}
+        if query.text and query.from_user() is None and len(query.dialog_ids) >= global_min_dialogs:
+            self.log("Глобальный поиск Telegram по %d чатам", len(query.dialog_ids))
+            async for item in self._search_global(query, user_cache):
+                yield item
+            return
+        
+        self.log("Поиск Telegram в %d чатах", len(query.dialog_ids))
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        streams = [self._search_peer(chat_id, query, semaphore, user_cache) for chat_id in query.dialog_ids]
+        
+        def on_error(number, error):
+            self.log("Ошибка поиска в чате %s: %s", query.dialog_ids[number], error)
+        
+        async for item in merge_streams(streams, on_error):
+            yield item
+
     async def filter_messages(self, chat_id: int, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Фильтрация сообщений по заданным критериям"""
         try:
@@ -301,7 +609,7 @@ class TelegramClientMessages(TelegramClientBase):
             if not isinstance(chat_id, int):
                 raise ValueError(f"Некорректный ID диалога: {chat_id}")
             
-            self.log(f"Фильтрация сообщений для диалога {chat_id} с фильтрами: {filters}")
+            self.log("Фильтрация сообщений для диалога %s с фильтрами: %s", chat_id, filters)
             
             # Получаем аккаунт ID
             me = await self.client.get_me()
@@ -316,30 +624,7 @@ class TelegramClientMessages(TelegramClientBase):
                     self.log(f"Найдено {len(cached_messages)} кешированных сообщений")
                     
                     # Применяем фильтры к кешированным данным
-                    filtered_messages = []
-                    for message in cached_messages:
-                        # Применяем фильтр по теме, если указан topic_id
-                        if filters.get('topic_id'):
-                            # Проверяем, есть ли message_thread_id в сообщении
-                            message_thread_id = message.get('message_thread_id')
-                            if message_thread_id != filters.get('topic_id'):
-                                continue
-                            
-                        # Применяем фильтр по тексту
-                        if filters.get('search') and filters['search'].lower() not in message.get('text', '').lower():
-                            continue
-                        
-                        # Применяем фильтр по типу медиа
-                        if filters.get('filter') == 'photo' and not message.get('photo'):
-                            continue
-                        if filters.get('filter') == 'video' and not message.get('video'):
-                            continue
-                        
-                        filtered_messages.append(message)
-                    
-                    # Ограничиваем количество сообщений
-                    if filters.get('limit'):
-                        filtered_messages = filtered_messages[:filters.get('limit')]
+                    filtered_messages = self._filter_cached_messages(cached_messages, filters)
                     
                     self.log(f"После применения фильтров осталось {len(filtered_messages)} кешированных сообщений")
                     
@@ -456,34 +741,6 @@ class TelegramClientMessages(TelegramClientBase):
                     # if len(messages) >= filters.get('limit', 100):
                     #    break
                     
-                    sender_name = "Неизвестно"
-                    sender_id = message.sender_id
-                    
-                    if sender_id:
-                        # Проверяем, есть ли информация о пользователе в кеше
-                        if sender_id in user_cache:
-                            sender_name = user_cache[sender_id]
-                        else:
-                            try:
-                                sender = await self.client.get_entity(sender_id)
-                                if isinstance(sender, User):
-                                    sender_name = getattr(sender, 'username', sender.first_name or 'Неизвестно')
-                                elif isinstance(sender, Channel):
-                                    sender_name = sender.title
-                                
-                                # Кешируем результат
-                                user_cache[sender_id] = sender_name
-                            except Exception as e:
-                                if 'wait of' in str(e).lower() and 'seconds is required' in str(e).lower():
-                                    # Если требуется ожидание, используем default имя и продолжаем
-                                    self.log(f"Лимит API на получение информации о пользователе {sender_id}, используем имя по умолчанию")
-                                else:
-                                    self.log(f"Ошибка при получении отправителя: {e}")
-                    
-                    # Преобразуем date в строку ISO для безопасной сериализации
-                    message_date = message.date
-                    date_str = message_date.isoformat() if isinstance(message_date, datetime.datetime) else str(message_date)
-                    
                     # Применяем фильтр по типу медиа
                     if filters.get('filter') == 'photo' and not message.photo:
                         continue
@@ -494,18 +751,8 @@ class TelegramClientMessages(TelegramClientBase):
                     if filters.get('search') and filters.get('search').lower() not in (message.text or '').lower():
                         continue
                     
-                    message_data = {
-                        'id': message.id,
-                        'text': message.text or '',
-                        'date': date_str,  # Используем строку вместо объекта datetime
-                        'date_obj': message_date,  # Временный объект datetime для сортировки и т.д.
-                        'sender_id': sender_id,
-                        'sender_name': sender_name,
-                        'photo': bool(message.photo),
-                        'video': bool(message.video),
-                        'message_thread_id': topic_id  # Сохраняем ID темы
-                    }
-                    
+                    message_data = await self._message_data(message, user_cache)
+                    message_data['message_thread_id'] = topic_id  # Сохраняем ID темы
                     messages.append(message_data)
                 
                 # Теперь ограничиваем количество сообщений после обработки всех
@@ -520,27 +767,7 @@ class TelegramClientMessages(TelegramClientBase):
                 self.log(f"ID последних 5 сообщений: {[msg['id'] for msg in messages[-5:] if len(messages) >= 5]}")
                 
                 # Кешируем результаты, если используется кеширование
-                if self.use_cache and self.db_handler and messages:
-                    # Создаем копию списка для кеширования
-                    messages_to_cache = []
-                    for message in messages:
-                        message_copy = message.copy()
-                        # Удаляем временное поле с объектом datetime
-                        if 'date_obj' in message_copy:
-                            del message_copy['date_obj']
-                        messages_to_cache.append(message_copy)
-                    
-                    try:
-                        self.log(f"Кеширование {len(messages_to_cache)} сообщений темы")
-                        await self.db_handler.cache_messages(messages_to_cache, chat_id, account_id)
-                    except Exception as e:
-                        self.log(f"Ошибка при кешировании сообщений: {e}")
-                
-                # Восстанавливаем объекты datetime для каждого сообщения в возвращаемом списке
-                for message in messages:
-                    if 'date_obj' in message:
-                        message['date'] = message['date_obj']
-                        del message['date_obj']
+                await self._cache_fetched_messages(messages, chat_id, account_id)
                 
                 return messages
             
@@ -555,78 +782,18 @@ class TelegramClientMessages(TelegramClientBase):
             
             messages = []
             async for message in self.client.iter_messages(chat_id, **iter_params):
-                sender_name = "Неизвестно"
-                sender_id = message.sender_id
-                
-                if sender_id:
-                    # Проверяем, есть ли информация о пользователе в кеше
-                    if sender_id in user_cache:
-                        sender_name = user_cache[sender_id]
-                    else:
-                        try:
-                            sender = await self.client.get_entity(sender_id)
-                            if isinstance(sender, User):
-                                sender_name = getattr(sender, 'username', sender.first_name or 'Неизвестно')
-                            elif isinstance(sender, Channel):
-                                sender_name = sender.title
-                            
-                            # Кешируем результат
-                            user_cache[sender_id] = sender_name
-                        except Exception as e:
-                            if 'wait of' in str(e).lower() and 'seconds is required' in str(e).lower():
-                                # Если требуется ожидание, используем default имя и продолжаем
-                                self.log(f"Лимит API на получение информации о пользователе {sender_id}, используем имя по умолчанию")
-                            else:
-                                self.log(f"Ошибка при получении отправителя: {e}")
-                
-                # Преобразуем date в строку ISO для безопасной сериализации
-                message_date = message.date
-                date_str = message_date.isoformat() if isinstance(message_date, datetime.datetime) else str(message_date)
-                
                 # Применяем фильтр по типу медиа
                 if filters.get('filter') == 'photo' and not message.photo:
                     continue
                 if filters.get('filter') == 'video' and not message.video:
                     continue
                 
-                message_data = {
-                    'id': message.id,
-                    'text': message.text or '',
-                    'date': date_str,  # Используем строку вместо объекта datetime
-                    'date_obj': message_date,  # Временный объект datetime для сортировки и т.д.
-                    'sender_id': sender_id,
-                    'sender_name': sender_name,
-                    'photo': bool(message.photo),
-                    'video': bool(message.video),
-                    'message_thread_id': getattr(message, 'message_thread_id', None)  # Добавляем ID темы, если есть
-                }
-                
-                messages.append(message_data)
+                messages.append(await self._message_data(message, user_cache))
             
             self.log(f"Получено {len(messages)} сообщений из Telegram API")
             
             # Кешируем результаты, если используется кеширование
-            if self.use_cache and self.db_handler:
-                # Создаем копию списка для кеширования
-                messages_to_cache = []
-                for message in messages:
-                    message_copy = message.copy()
-                    # Удаляем временное поле с объектом datetime
-                    if 'date_obj' in message_copy:
-                        del message_copy['date_obj']
-                    messages_to_cache.append(message_copy)
-                
-                try:
-                    self.log(f"Кеширование {len(messages_to_cache)} сообщений")
-                    await self.db_handler.cache_messages(messages_to_cache, chat_id, account_id)
-                except Exception as e:
-                    self.log(f"Ошибка при кешировании сообщений: {e}")
-            
-            # Восстанавливаем объекты datetime для каждого сообщения в возвращаемом списке
-            for message in messages:
-                if 'date_obj' in message:
-                    message['date'] = message['date_obj']
-                    del message['date_obj']
+            await self._cache_fetched_messages(messages, chat_id, account_id)
             
             return messages
         except Exception as e:
@@ -0,0 +1,21 @@
+import re
+
+# Ссылки в тексте сообщений
+URL_RE = re.compile(r'https?://[^\s<>()]+|www\.[^\s<>()]+', re.IGNORECASE)
+# Слова: буквы и цифры, включая кириллицу
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def estimate_tokens(text: str) -> int:
+    """Грубая оценка количества токенов в тексте"""
+    return len(text) // 4
+
+
+def normalize_text(text: str) -> str:
+    """Нормализация текста для сравнения: нижний регистр, только слова"""
+    return ' '.join(WORD_RE.findall((text or '').lower()))
+
+
+def tokenize(text: str) -> list:
+    """Разбиение текста на слова в нижнем регистре"""
+    return WORD_RE.findall((text or '').lower())
@@ -0,0 +1,199 @@
+import time
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, List, Sequence
+from .log_utils import get_logger
+
+logger = get_logger('ui')
+
+# Типы событий обновления интерфейса
+EVENT_INSERT_ROWS = 'insert_rows'
+EVENT_CLEAR = 'clear'
+EVENT_APPEND_TEXT = 'append_text'
+EVENT_CALL = 'call'
+
+DEFAULT_DRAIN_INTERVAL_MS = 30
+# Время на применение обновлений за один проход, чтобы окно успевало перерисовываться
+DEFAULT_FRAME_BUDGET_MS = 15
+DEFAULT_MAX_ROWS_PER_BATCH = 500
+
+
+class UIEvent:
+    """Событие обновления виджета"""
+    __slots__ = ('kind', 'target', 'payload')
+
+    def __init__(self, kind: str, target: Any = None, payload: Any = None):
+        self.kind = kind
+        self.target = target
+        self.payload = payload
+
+
+class UIUpdateBus:
+    """Шина обновлений интерфейса между потоком asyncio и Tk
+
+    Tk не потокобезопасен, поэтому рабочие корутины не обращаются к виджетам
+    напрямую, а кладут события в потокобезопасную очередь. Поток Tk забирает
+    их каждые interval_ms и применяет пачками: идущие подряд вставки строк в одну
+    таблицу и строки в один текстовый виджет объединяются, очистка таблицы
+    отменяет еще не примененные вставки в нее. Таблица с методами clear и
+    append_rows (VirtualTreeview) получает вставку одним вызовом. Порядок событий для одного виджета
+    сохраняется; EVENT_CALL применяется строго после всех предшествующих событий.
+    """
+
+    def __init__(self, root, interval_ms: int = DEFAULT_DRAIN_INTERVAL_MS,
+                 frame_budget_ms: int = DEFAULT_FRAME_BUDGET_MS,
+                 max_rows_per_batch: int = DEFAULT_MAX_ROWS_PER_BATCH):
+        self.root = root
+        self.interval_ms = interval_ms
+        self.frame_budget = frame_budget_ms / 1000
+        self.max_rows_per_batch = max_rows_per_batch
+        self._queue = queue.SimpleQueue()
+        self._pending = deque()
+        self._ui_thread = threading.get_ident()
+        self._after_id = None
+        self.stats = {'events': 0, 'batches': 0, 'widget_calls': 0}
+
+    def start(self):
+        """Запуск периодической обработки очереди (вызывается из потока Tk)"""
+        self._ui_thread = threading.get_ident()
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def is_ui_thread(self) -> bool:
+        return threading.get_ident() == self._ui_thread
+
+    def post(self, kind: str, target: Any = None, payload: Any = None):
+        """Добавление события из любого потока"""
+        self._queue.put(UIEvent(kind, target, payload))
+
+    def insert_rows(self, tree, rows: Sequence[Sequence[Any]]):
+        """Вставка строк (значений колонок) в конец таблицы"""
+        if rows:
+            self.post(EVENT_INSERT_ROWS, tree, list(rows))
+
+    def clear(self, tree):
+        """Удаление всех строк таблицы"""
+        self.post(EVENT_CLEAR, tree)
+
+    def append_text(self, widget, text: str):
+        """Добавление текста в конец текстового виджета с прокруткой вниз"""
+        self.post(EVENT_APPEND_TEXT, widget, text)
+
+    def call(self, fn: Callable, *args):
+        """Выполнение функции в потоке Tk после всех ранее добавленных событий"""
+        self.post(EVENT_CALL, payload=(fn, args))
+
+    def _tick(self):
+        self._after_id = None
+        try:
+            self.drain()
+        finally:
+            self._after_id = self.root.after(self.interval_ms, self._tick)
+
+    def drain(self, budget: float = None) -> int:
+        """Применение накопленных событий в пределах бюджета времени
+
+        Returns:
+            int: Количество примененных событий
+        """
+        while True:
+            try:
+                self._pending.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            self.stats['events'] += 1
+        budget = self.frame_budget if budget is None else budget
+        started = time.perf_counter()
+        applied = 0
+        while self._pending:
+            groups = self._take_segment()
+            for group in groups:
+                applied += self._apply(group)
+            if self._pending and time.perf_counter() - started >= budget:
+                break
+        return applied
+
+    def _take_segment(self) -> List[UIEvent]:
+        """События до ближайшего EVENT_CALL, объединенные по виджетам
+
+        Возвращает по одному событию на каждую серию однотипных событий виджета;
+        вставки сверх max_rows_per_batch возвращаются в очередь.
+        """
+        if self._pending[0].kind == EVENT_CALL:
+            return [self._pending.popleft()]
+        by_target = {}
+        while self._pending and self._pending[0].kind != EVENT_CALL:
+            event = self._pending.popleft()
+            ops = by_target.setdefault(id(event.target), [])
+            if event.kind == EVENT_CLEAR:
+                # Очистка делает ненужными еще не выполненные вставки и очистки
+                ops[:] = [op for op in ops if op.kind not in (EVENT_INSERT_ROWS, EVENT_CLEAR)]
+                ops.append(event)
+            elif ops and ops[-1].kind == event.kind and event.kind in (EVENT_INSERT_ROWS, EVENT_APPEND_TEXT):
+                ops[-1].payload.extend(event.payload if event.kind == EVENT_INSERT_ROWS else [event.payload])
+            elif event.kind == EVENT_INSERT_ROWS:
+                # Собственная копия списка, чтобы дописывать в нее следующие вставки
+                ops.append(UIEvent(EVENT_INSERT_ROWS, event.target, list(event.payload)))
+            elif event.kind == EVENT_APPEND_TEXT:
+                ops.append(UIEvent(EVENT_APPEND_TEXT, event.target, [event.payload]))
+            else:
+                ops.append(event)
+        groups = []
+        deferred = []
+        for ops in by_target.values():
+            for op in ops:
+                if (op.kind == EVENT_INSERT_ROWS and len(op.payload) > self.max_rows_per_batch
+                        and not hasattr(op.target, 'append_rows')):
+                    groups.append(UIEvent(EVENT_INSERT_ROWS, op.target, op.payload[:self.max_rows_per_batch]))
+                    deferred.append(UIEvent(EVENT_INSERT_ROWS, op.target, op.payload[self.max_rows_per_batch:]))
+                else:
+                    groups.append(op)
+        # Остаток больших вставок применяется в следующих проходах, раньше остальных событий
+        self._pending.extendleft(reversed(deferred))
+        return groups
+
+    def _apply(self, event: UIEvent) -> int:
+        self.stats['batches'] += 1
+        try:
+            if event.kind == EVENT_CALL:
+                fn, args = event.payload
+                fn(*args)
+            elif event.kind == EVENT_CLEAR:
+                if hasattr(event.target, 'clear'):
+                    event.target.clear()
+                else:
+                    children = event.target.get_children()
+                    if children:
+                        event.target.delete(*children)
+                self.stats['widget_calls'] += 1
+            elif event.kind == EVENT_INSERT_ROWS:
+                # Виртуальный список принимает все строки одним вызовом
+                if hasattr(event.target, 'append_rows'):
+                    event.target.append_rows(event.payload)
+                    self.stats['widget_calls'] += 1
+                else:
+                    for values in event.payload:
+                        event.target.insert('', 'end', values=values)
+                    self.stats['widget_calls'] += len(event.payload)
+            elif event.kind == EVENT_APPEND_TEXT:
+                self._append_text(event.target, ''.join(event.payload))
+        except Exception as e:
+            # Ошибка одного обновления не должна останавливать обработку очереди
+            logger.warning("Ошибка при обновлении интерфейса: %s", e, exc_info=True)
+        return 1
+
+    def _append_text(self, widget, text: str):
+        disabled = str(widget.cget('state')) == 'disabled'
+        if disabled:
+            widget.config(state='normal')
+        widget.insert('end', text)
+        widget.see('end')
+        if disabled:
+            widget.config(state='disabled')
+        self.stats['widget_calls'] += 1
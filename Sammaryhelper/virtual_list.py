@@ -0,0 +1,327 @@
+import tkinter as tk
+from tkinter import ttk
+from typing import Any, Dict, List, Sequence, Tuple
+
+DEFAULT_ROW_HEIGHT = 20
+# Высота заголовков колонок относительно высоты строки
+HEADER_EXTRA_PX = 6
+
+
+class ColumnarRows:
+    """Строки таблицы, хранящиеся по колонкам
+
+    Список значений на колонку занимает меньше памяти, чем кортеж на строку,
+    и позволяет сортировать таблицу одной перестановкой индексов.
+    """
+
+    def __init__(self, column_count: int):
+        self.columns = [[] for _ in range(column_count)]
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def clear(self):
+        for column in self.columns:
+            column.clear()
+
+    def extend(self, rows: Sequence[Sequence[Any]]):
+        if not rows:
+            return
+        for column, values in zip(self.columns, zip(*rows)):
+            column.extend(values)
+
+    def insert(self, index: int, rows: Sequence[Sequence[Any]]):
+        """Вставка строк перед строкой index"""
+        if not rows:
+            return
+        for column, values in zip(self.columns, zip(*rows)):
+            column[index:index] = values
+
+    def set_row(self, index: int, values: Sequence[Any]):
+        for column, value in zip(self.columns, values):
+            column[index] = value
+
+    def row(self, index: int) -> Tuple[Any, ...]:
+        return tuple(column[index] for column in self.columns)
+
+    def rows(self, start: int, stop: int) -> List[Tuple[Any, ...]]:
+        return list(zip(*(column[start:stop] for column in self.columns)))
+
+    def sort(self, column_index: int, reverse: bool = False) -> List[int]:
+        """Устойчивая сортировка строк по колонке: числа как числа, остальное как
+        строки без учета регистра
+
+        Returns:
+            List[int]: Новый порядок - старые индексы строк
+        """
+        values = self.columns[column_index]
+        try:
+            keys = [int(v) for v in values]
+        except (TypeError, ValueError):
+            keys = [str(v).casefold() for v in values]
+        order = sorted(range(len(values)), key=keys.__getitem__, reverse=reverse)
+        for i, column in enumerate(self.columns):
+            self.columns[i] = [column[j] for j in order]
+        return order
+
+
+class VirtualListModel:
+    """Состояние виртуального списка без привязки к Tk: данные, окно и выделение"""
+
+    def __init__(self, column_count: int, window: int = 20):
+        self.store = ColumnarRows(column_count)
+        self.window = max(1, window)
+        self.offset = 0
+        self.selected = set()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    @property
+    def max_offset(self) -> int:
+        return max(0, len(self.store) - self.window)
+
+    def set_rows(self, rows: Sequence[Sequence[Any]]):
+        self.store.clear()
+        self.store.extend(rows)
+        self.offset = 0
+        self.selected.clear()
+
+    def append_rows(self, rows: Sequence[Sequence[Any]]):
+        self.store.extend(rows)
+
+    def insert_rows(self, index: int, rows: Sequence[Sequence[Any]]):
+        """Вставка строк перед index; выделение и окно (если вставка выше него) сдвигаются вместе со строками"""
+        count = len(rows)
+        if not count:
+            return
+        self.store.insert(index, rows)
+        self.selected = {i + count if i >= index else i for i in self.selected}
+        if index < self.offset:
+            self.scroll_to(self.offset + count)
+
+    def update_rows(self, rows: Dict[int, Sequence[Any]]):
+        """Замена значений строк по индексам"""
+        for index, values in rows.items():
+            self.store.set_row(index, values)
+
+    def clear(self):
+        self.set_rows([])
+
+    def set_window(self, window: int):
+        self.window = max(1, window)
+        self.scroll_to(self.offset)
+
+    def scroll_to(self, offset: int):
+        self.offset = min(max(0, int(offset)), self.max_offset)
+
+    def scroll_by(self, rows: int):
+        self.scroll_to(self.offset + rows)
+
+    def moveto(self, fraction: float):
+        self.scroll_to(round(float(fraction) * len(self.store)))
+
+    def fractions(self) -> Tuple[float, float]:
+        """Положение окна для полосы прокрутки"""
+        total = len(self.store)
+        if not total:
+            return 0.0, 1.0
+        return self.offset / total, min(1.0, (self.offset + self.window) / total)
+
+    def is_visible(self, index: int) -> bool:
+        return self.offset <= index < self.offset + self.window
+
+    def ensure_visible(self, index: int):
+        if index < self.offset:
+            self.scroll_to(index)
+        elif index >= self.offset + self.window:
+            self.scroll_to(index - self.window + 1)
+
+    def visible_rows(self) -> List[Tuple[Any, ...]]:
+        return self.store.rows(self.offset, self.offset + self.window)
+
+    def sort(self, column_index: int, reverse: bool = False):
+        order = self.store.sort(column_index, reverse)
+        if self.selected:
+            position = {old: new for new, old in enumerate(order)}
+            self.selected = {position[i] for i in self.selected}
+        self.offset = 0
+
+    def selected_rows(self) -> List[Tuple[Any, ...]]:
+        return [self.store.row(i) for i in sorted(self.selected) if i < len(self.store)]
+
+
+class VirtualTreeview:
+    """Таблица с виртуальной прокруткой поверх ttk.Treeview
+
+    В Treeview живет только столько строк, сколько помещается на экране; при
+    прокрутке меняются их значения, а данные берутся из ColumnarRows. Поэтому
+    открытие и прокрутка списка из сотен тысяч строк занимают постоянное время.
+    """
+
+    def __init__(self, parent, columns: Dict[str, str], widths: Dict[str, int] = None):
+        self.columns = list(columns)
+        self.frame = ttk.Frame(parent)
+        self.model = VirtualListModel(len(self.columns))
+        self.tree = ttk.Treeview(self.frame, columns=self.columns, show='headings',
+                                 height=self.model.window, selectmode='extended')
+        self._sort_reverse = {}
+        # Последняя сортировка (колонка, по убыванию) или None, если строки в порядке добавления
+        self.sort_state = None
+        for name, title in columns.items():
+            self.tree.heading(name, text=title, command=lambda c=name: self.sort_by(c))
+            if widths and name in widths:
+                self.tree.column(name, width=widths[name])
+        self.scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.yview)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+
+        self._slots = []
+        self._attached = 0
+        self._resize_slots(self.model.window)
+
+        self.tree.bind('<<TreeviewSelect>>', self._on_select)
+        self.tree.bind('<Button-1>', self._on_click)
+        self.tree.bind('<Configure>', self._on_configure)
+        self.tree.bind('<MouseWheel>', self._on_mousewheel)
+        self.tree.bind('<Button-4>', lambda e: self._scroll_and_refresh(-3))
+        self.tree.bind('<Button-5>', lambda e: self._scroll_and_refresh(3))
+        self.tree.bind('<Up>', lambda e: self._move_cursor(-1))
+        self.tree.bind('<Down>', lambda e: self._move_cursor(1))
+        self.tree.bind('<Prior>', lambda e: self._move_cursor(-self.model.window))
+        self.tree.bind('<Next>', lambda e: self._move_cursor(self.model.window))
+        self.tree.bind('<Home>', lambda e: self._move_cursor(-len(self.model)))
+        self.tree.bind('<End>', lambda e: self._move_cursor(len(self.model)))
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def bind(self, sequence: str, func):
+        """Привязка обработчика к таблице после внутренних обработчиков"""
+        return self.tree.bind(sequence, func, add='+')
+
+    def __len__(self) -> int:
+        return len(self.model)
+
+    # Данные
+
+    def set_rows(self, rows: Sequence[Sequence[Any]], keep_sort: bool = False):
+        """Замена всех строк; keep_sort - отсортировать их как было отсортировано до замены"""
+        self.model.set_rows(rows)
+        if keep_sort and self.sort_state:
+            column, reverse = self.sort_state
+            self.model.sort(self.columns.index(column), reverse)
+        else:
+            self.sort_state = None
+        self.refresh()
+
+    def append_rows(self, rows: Sequence[Sequence[Any]]):
+        self.model.append_rows(rows)
+        self.refresh()
+
+    def insert_rows(self, index: int, rows: Sequence[Sequence[Any]]):
+        self.model.insert_rows(index, rows)
+        self.refresh()
+
+    def update_rows(self, rows: Dict[int, Sequence[Any]]):
+        self.model.update_rows(rows)
+        self.refresh()
+
+    def clear(self):
+        self.model.clear()
+        self.sort_state = None
+        self.refresh()
+
+    def selected_rows(self) -> List[Tuple[Any, ...]]:
+        return self.model.selected_rows()
+
+    def see_end(self):
+        self.model.scroll_to(self.model.max_offset)
+        self.refresh()
+
+    def sort_by(self, column: str):
+        """Сортировка по колонке; повторный щелчок меняет направление"""
+        reverse = self._sort_reverse.get(column, False)
+        self.model.sort(self.columns.index(column), reverse)
+        self._sort_reverse[column] = not reverse
+        self.sort_state = (column, reverse)
+        self.refresh()
+
+    # Отображение
+
+    def refresh(self):
+        """Перерисовка видимых строк"""
+        rows = self.model.visible_rows()
+        for slot, values in zip(self._slots, rows):
+            self.tree.item(slot, values=values)
+        # Лишние строки скрываются, а не удаляются, чтобы переиспользовать их
+        if len(rows) < self._attached:
+            self.tree.detach(*self._slots[len(rows):self._attached])
+        for position in range(self._attached, len(rows)):
+            self.tree.move(self._slots[position], '', position)
+        self._attached = len(rows)
+
+        wanted = tuple(self._slots[i - self.model.offset] for i in sorted(self.model.selected)
+                       if self.model.is_visible(i) and i - self.model.offset < self._attached)
+        if tuple(self.tree.selection()) != wanted:
+            self.tree.selection_set(wanted)
+        self.scrollbar.set(*self.model.fractions())
+
+    def yview(self, *args):
+        """Команда полосы прокрутки: moveto <доля> или scroll <n> units|pages"""
+        if args and args[0] == 'moveto':
+            self.model.moveto(args[1])
+        elif args and args[0] == 'scroll':
+            step = int(args[1])
+            self.model.scroll_by(step * self.model.window if args[2] == 'pages' else step)
+        self.refresh()
+
+    def _resize_slots(self, count: int):
+        while len(self._slots) < count:
+            self._slots.append(self.tree.insert('', 'end', values=()))
+            self._attached += 1
+        if len(self._slots) > count:
+            self.tree.delete(*self._slots[count:])
+            del self._slots[count:]
+            self._attached = min(self._attached, count)
+        self.tree.configure(height=count)
+
+    def _on_configure(self, event):
+        style = ttk.Style()
+        row_height = int(style.lookup('Treeview', 'rowheight') or DEFAULT_ROW_HEIGHT)
+        window = max(1, (event.height - row_height - HEADER_EXTRA_PX) // row_height)
+        if window != self.model.window:
+            self.model.set_window(window)
+            self._resize_slots(window)
+            self.refresh()
+
+    def _on_mousewheel(self, event):
+        # На Windows delta кратна 120, на macOS - небольшие значения
+        step = -event.delta // 120 if abs(event.delta) >= 120 else -event.delta
+        return self._scroll_and_refresh(step * 3)
+
+    def _scroll_and_refresh(self, rows: int):
+        self.model.scroll_by(rows)
+        self.refresh()
+        return 'break'
+
+    def _on_click(self, event):
+        # Щелчок без Shift и Ctrl снимает выделение и со строк за пределами экрана
+        if not event.state & 0x0005:
+            self.model.selected = {i for i in self.model.selected if self.model.is_visible(i)}
+
+    def _on_select(self, event):
+        visible = {self.model.offset + self._slots.index(item) for item in self.tree.selection()
+                   if item in self._slots}
+        hidden = {i for i in self.model.selected if not self.model.is_visible(i)}
+        self.model.selected = hidden | visible
+
+    def _move_cursor(self, delta: int):
+        if not len(self.model):
+            return 'break'
+        current = max(self.model.selected) if self.model.selected else self.model.offset - 1
+        target = min(max(0, current + delta), len(self.model) - 1)
+        self.model.selected = {target}
+        self.model.ensure_visible(target)
+        self.refresh()
+        return 'break'
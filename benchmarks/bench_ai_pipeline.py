@@ -0,0 +1,187 @@
+"""Бенчмарк конвейера ИИ на локальном mock-сервере OpenAI
+
+Прогоняет generate_summary, get_response и analyze_participants на диалогах
+разного размера и выводит задержку и пропускную способность. Результаты можно
+сохранить в JSON и сравнить с эталоном, чтобы ловить регрессии без платного API.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_ai_pipeline.py --sizes 100 1000 10000 --output bench.json
+    python benchmarks/bench_ai_pipeline.py --baseline bench.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Sammaryhelper.ai_handler import AIChatManager, PRIORITY_BACKGROUND
+from benchmarks.mock_openai_server import MockOpenAIServer, MockServerConfig
+
+SENDERS = ['Анна', 'Иван', 'Петр', 'Мария', 'Олег', 'Светлана']
+PHRASES = [
+    'предлагаю перенести релиз на следующую неделю',
+    'сервер опять упал ночью, смотрю логи',
+    'кто проверит документацию к новой версии?',
+    '+1',
+    'ок',
+    'вот ссылка на задачу https://tracker.example.com/issues/12345',
+    '> сервер опять упал ночью\nда, перезапустил вручную',
+    'бюджет на тестирование согласовали',
+    '👍',
+    'давайте созвонимся в пятницу и обсудим план',
+]
+
+
+def make_dialog(size: int, seed: int = 0):
+    """Синтетический диалог заданного размера"""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(size):
+        text = rng.choice(PHRASES)
+        if rng.random() < 0.3:
+            text += ' ' + ' '.join(rng.choice(PHRASES) for _ in range(rng.randint(1, 4)))
+        messages.append({
+            'id': i + 1,
+            'sender_id': rng.randint(1, len(SENDERS)),
+            'sender_name': rng.choice(SENDERS),
+            'date': f'2024-05-{1 + i * 28 // max(size, 1):02d} {10 + i % 12:02d}:{i % 60:02d}:00',
+            'text': text,
+        })
+    return messages
+
+
+def summarize(latencies):
+    """Статистика по списку задержек"""
+    ordered = sorted(latencies)
+    return {
+        'runs': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))],
+    }
+
+
+async def timed(coro_factory, repeat: int):
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await coro_factory()
+        latencies.append(time.perf_counter() - started)
+    return summarize(latencies)
+
+
+async def run_benchmarks(args):
+    config = MockServerConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        rate_limit_probability=args.rate_limit,
+        seed=args.seed,
+    )
+    results = {'config': vars(args), 'benchmarks': {}}
+    async with MockOpenAIServer(config) as server:
+        settings = {
+            'openai_api_key': 'mock',
+            'openai_base_url': server.base_url,
+            'openai_model': 'gpt-4o-mini',
+            'system_prompt': 'Ты - помощник, который создает краткие саммари.',
+            'user_prompt': 'Сделай краткое содержание переписки:',
+            'semantic_cache_enabled': False,
+            'ai_max_concurrency': args.concurrency,
+        }
+
+        for size in args.sizes:
+            dialog = make_dialog(size, args.seed)
+            manager = AIChatManager(dict(settings))
+            client = manager.get_openai_client()
+            stats = await timed(lambda: manager.generate_summary(dialog, client, priority=PRIORITY_BACKGROUND),
+                                args.repeat)
+            usage = manager.usage_tracker.aggregate('operation')
+            stats['calls'] = sum(row['calls'] for row in usage) / args.repeat
+            stats['prompt_tokens'] = sum(row['prompt_tokens'] for row in usage) / args.repeat
+            stats['messages_per_second'] = size / stats['mean'] if stats['mean'] else 0.0
+            results['benchmarks'][f'generate_summary[{size}]'] = stats
+
+        manager = AIChatManager(dict(settings))
+        context = '\n'.join(f"{m['sender_name']}: {m['text']}" for m in make_dialog(50, args.seed))
+        counter = iter(range(10 ** 9))
+        stats = await timed(lambda: manager.get_response(f'вопрос {next(counter)}', context=context), args.repeat)
+        results['benchmarks']['get_response'] = stats
+
+        # Параллельные вопросы: пропускная способность планировщика
+        started = time.perf_counter()
+        await asyncio.gather(*(manager.get_response(f'параллельный вопрос {i}', context=context)
+                               for i in range(args.parallel)))
+        elapsed = time.perf_counter() - started
+        results['benchmarks']['get_response_parallel'] = {
+            'runs': args.parallel, 'mean': elapsed, 'requests_per_second': args.parallel / elapsed,
+        }
+
+        participants = [{'username': f'user{i}', 'first_name': SENDERS[i % len(SENDERS)], 'last_name': ''}
+                        for i in range(200)]
+        client = manager.get_openai_client()
+        stats = await timed(lambda: manager.analyze_participants(participants, client), args.repeat)
+        results['benchmarks']['analyze_participants'] = stats
+        results['server'] = dict(server.stats)
+    return results
+
+
+def compare(results, baseline, tolerance: float):
+    """Сравнение со значениями эталона, возвращает список регрессий"""
+    regressions = []
+    for name, stats in results['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if not reference or not reference.get('mean'):
+            continue
+        change = stats['mean'] / reference['mean'] - 1
+        if change > tolerance:
+            regressions.append(f"{name}: {reference['mean']:.3f} -> {stats['mean']:.3f} сек. (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк конвейера ИИ на mock-сервере')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--parallel', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', default='lognormal:0.05:0.3')
+    parser.add_argument('--tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--completion-tokens', type=int, default=80)
+    parser.add_argument('--rate-limit', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='Сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='JSON с эталонными результатами')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое замедление относительно эталона')
+    args = parser.parse_args()
+
+    results = asyncio.run(run_benchmarks(args))
+    for name, stats in results['benchmarks'].items():
+        extra = ', '.join(f'{k}={v:.1f}' for k, v in stats.items()
+                          if k in ('calls', 'prompt_tokens', 'messages_per_second', 'requests_per_second'))
+        print(f"{name:32} mean={stats['mean']:.3f}s p50={stats.get('p50', stats['mean']):.3f}s "
+              f"p95={stats.get('p95', stats['mean']):.3f}s {extra}")
+    print(f"server: {results['server']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Регрессии:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == '__main__':
+    main()
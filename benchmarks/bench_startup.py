@@ -0,0 +1,136 @@
+"""Бенчмарк запуска интерфейса
+
+Каждый прогон - отдельный процесс (холодный импорт модулей). Замеряются этапы
+запуска TelegramSummarizerGUI: импорт, первый кадр (окно нарисовано) и
+готовность к работе (показан снимок сессии), а также полное время процесса.
+Подключение к Telegram не выполняется: цикл asyncio в прогоне не запускается.
+Нужен дисплей (на сервере - например, xvfb-run).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_startup.py --repeat 5 --output startup.json
+    python benchmarks/bench_startup.py --baseline startup.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код дочернего процесса: отметки этапов выводятся в JSON, окно закрывается после готовности
+CHILD = r'''
+import sys, json, time
+started = time.perf_counter()
+from Sammaryhelper.startup import StartupTimer, STARTUP_IMPORTED, STARTUP_INTERACTIVE
+from Sammaryhelper.gui import TelegramSummarizerGUI
+import tkinter as tk
+
+startup = StartupTimer(started)
+startup.mark(STARTUP_IMPORTED)
+root = tk.Tk()
+app = TelegramSummarizerGUI(root, startup=startup, fast_start=sys.argv[1] == 'fast')
+
+def poll():
+    if STARTUP_INTERACTIVE not in startup.marks:
+        root.after(5, poll)
+        return
+    app.tasks.cancel_all()
+    print(json.dumps({'marks': startup.report(), 'dialogs': len(app.dialogs), 'messages': len(app.messages)}))
+    root.destroy()
+
+root.after(5, poll)
+root.mainloop()
+'''
+
+
+def summarize(values):
+    """Статистика по списку значений в миллисекундах"""
+    ordered = sorted(values)
+    return {
+        'runs': len(ordered),
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'max': ordered[-1],
+    }
+
+
+def run_once(mode: str, timeout: float):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', CHILD, mode], cwd=ROOT, capture_output=True,
+                               text=True, timeout=timeout)
+    wall = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise RuntimeError(f"Прогон '{mode}' завершился с ошибкой:\n{completed.stderr}")
+    # Последняя строка вывода - результат; остальное - лог приложения
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result['marks']['process'] = wall
+    return result
+
+
+def run_benchmarks(args):
+    results = {'config': vars(args), 'benchmarks': {}}
+    for mode in args.modes:
+        samples = {}
+        restored = None
+        for _ in range(args.repeat):
+            result = run_once(mode, args.timeout)
+            restored = {'dialogs': result['dialogs'], 'messages': result['messages']}
+            for name, value in result['marks'].items():
+                samples.setdefault(name, []).append(value)
+        for name, values in samples.items():
+            if name != 'started':
+                results['benchmarks'][f'{mode}.{name}'] = summarize(values)
+        results[f'{mode}.restored'] = restored
+    return results
+
+
+def compare(results, baseline, tolerance: float):
+    """Сравнение со значениями эталона, возвращает список регрессий"""
+    regressions = []
+    for name, stats in results['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name)
+        if not reference or not reference.get('mean'):
+            continue
+        change = stats['mean'] / reference['mean'] - 1
+        if change > tolerance:
+            regressions.append(f"{name}: {reference['mean']:.0f} -> {stats['mean']:.0f} мс (+{change:.0%})")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк запуска интерфейса')
+    parser.add_argument('--modes', nargs='+', choices=['fast', 'eager'], default=['fast', 'eager'],
+                        help='fast - быстрый запуск из снимка, eager - импорт всех модулей при старте')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--output', help='Сохранить результаты в JSON')
+    parser.add_argument('--baseline', help='JSON с эталонными результатами')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое замедление относительно эталона')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args)
+    for name, stats in results['benchmarks'].items():
+        print(f"{name:24} mean={stats['mean']:.0f}ms p50={stats['p50']:.0f}ms max={stats['max']:.0f}ms")
+    for mode in args.modes:
+        print(f"{mode}: восстановлено {results[f'{mode}.restored']}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("Регрессии:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("Регрессий нет")
+
+
+if __name__ == '__main__':
+    main()
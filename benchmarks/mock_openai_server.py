@@ -0,0 +1,524 @@
+"""Локальный сервер, совместимый с OpenAI API, для тестов и бенчмарков
+
+Поддерживаются эндпоинты:
+    GET  /v1/models
+    POST /v1/chat/completions (в том числе stream=true)
+    POST /v1/completions
+    POST /v1/embeddings
+    POST /v1/files, GET /v1/files/{id}/content
+    POST /v1/batches, GET /v1/batches/{id}, POST /v1/batches/{id}/cancel
+
+Ответы детерминированы: текст зависит только от промпта и seed.
+Задержка, скорость генерации токенов и доля ответов 429 настраиваются.
+
+Запуск из корня репозитория:
+    python benchmarks/mock_openai_server.py --port 8765 --latency lognormal:0.3:0.5 --rate-limit 0.1
+"""
+import os
+import sys
+import asyncio
+import argparse
+import email.parser
+import email.policy
+import hashlib
+import json
+import math
+import random
+import time
+from typing import Dict, Any, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Sammaryhelper.text_utils import estimate_tokens
+
+DEFAULT_MODELS = ['gpt-4o-mini', 'gpt-4o', 'gpt-4.1-mini', 'gpt-3.5-turbo', 'text-embedding-3-small']
+
+# Слова для детерминированной генерации ответов
+WORDS = [
+    'обсуждение', 'участники', 'решили', 'перенести', 'релиз', 'сервер', 'вопрос', 'предложение',
+    'договорились', 'проверить', 'задача', 'срок', 'итог', 'проблема', 'ошибка', 'исправление',
+    'встреча', 'план', 'документ', 'ссылка', 'версия', 'тест', 'отчет', 'бюджет',
+]
+
+REASON_PHRASES = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    429: 'Too Many Requests',
+    500: 'Internal Server Error',
+}
+
+
+class MockServerConfig:
+    """Параметры поведения сервера
+
+    Args:
+        latency: Распределение задержки до первого токена:
+            'fixed:<сек>', 'uniform:<мин>:<макс>' или 'lognormal:<медиана>:<sigma>'
+        tokens_per_second: Скорость генерации ответа, 0 - мгновенно
+        completion_tokens: Длина ответа в токенах
+        rate_limit_probability: Доля запросов, на которые возвращается 429
+        rate_limit_every: Возвращать 429 на каждый N-й запрос (0 - отключено)
+        retry_after: Значение заголовка Retry-After в секундах
+        error_probability: Доля запросов с ответом 500
+        seed: Зерно генератора случайных чисел
+        models: Список моделей для /v1/models
+        batch_delay: Через сколько секунд после создания пакет Batch API выполняется
+    """
+
+    def __init__(self, latency: str = 'fixed:0', tokens_per_second: float = 0.0, completion_tokens: int = 60,
+                 rate_limit_probability: float = 0.0, rate_limit_every: int = 0, retry_after: float = 0.05,
+                 error_probability: float = 0.0, seed: int = 0, models=None, batch_delay: float = 0.0):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.rate_limit_probability = rate_limit_probability
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.error_probability = error_probability
+        self.seed = seed
+        self.models = list(models or DEFAULT_MODELS)
+        self.batch_delay = batch_delay
+        self._latency = parse_latency(latency)
+
+
+def parse_latency(spec: str):
+    """Разбор описания распределения задержки в функцию от генератора"""
+    kind, *params = spec.split(':')
+    values = [float(p) for p in params]
+    if kind == 'fixed':
+        value = values[0] if values else 0.0
+        return lambda rng: value
+    if kind == 'uniform':
+        low, high = values
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'lognormal':
+        median, sigma = values
+        return lambda rng: rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    raise ValueError(f"Неизвестное распределение задержки: {spec}")
+
+
+def deterministic_text(prompt: str, tokens: int, seed: int = 0) -> str:
+    """Детерминированный текст ответа заданной длины"""
+    digest = hashlib.sha256(f'{seed}:{prompt}'.encode('utf-8')).digest()
+    rng = random.Random(digest)
+    words = []
+    length = 0
+    while length < tokens * 4:
+        word = rng.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).capitalize() + '.'
+
+
+def deterministic_embedding(text: str, dim: int, seed: int = 0):
+    """Детерминированный нормированный вектор текста"""
+    rng = random.Random(hashlib.sha256(f'{seed}:{text}'.encode('utf-8')).digest())
+    vector = [rng.gauss(0, 1) for _ in range(dim)]
+    norm = math.sqrt(sum(v * v for v in vector)) or 1.0
+    return [v / norm for v in vector]
+
+
+class MockOpenAIServer:
+    """HTTP-сервер на asyncio, имитирующий OpenAI API"""
+
+    def __init__(self, config: MockServerConfig = None, host: str = '127.0.0.1', port: int = 0):
+        self.config = config or MockServerConfig()
+        self.host = host
+        self.port = port
+        self._server = None
+        self._rng = random.Random(self.config.seed)
+        self._request_counter = 0
+        # Открытые соединения, чтобы закрыть keep-alive клиентов при остановке
+        self._connections = set()
+        # Загруженные файлы и пакеты Batch API
+        self._files = {}
+        self._batches = {}
+        self._batch_tasks = set()
+        self.stats = {'requests': 0, 'rate_limited': 0, 'errors': 0, 'prompt_tokens': 0, 'completion_tokens': 0,
+                      'batches': 0, 'batch_requests': 0}
+
+    @property
+    def base_url(self) -> str:
+        return f'http://{self.host}:{self.port}/v1'
+
+    async def start(self) -> 'MockOpenAIServer':
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            for task in list(self._connections) + list(self._batch_tasks):
+                task.cancel()
+            await asyncio.gather(*self._connections, *self._batch_tasks, return_exceptions=True)
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"Mock OpenAI API: {self.base_url}")
+        async with self._server:
+            await self._server.serve_forever()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обработка соединения с поддержкой keep-alive"""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request = await self._read_request(reader)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                await self._dispatch(method, path, headers, body, writer)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # Клиент отключился или сервер остановлен
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _read_request(self, reader: asyncio.StreamReader) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+        request_line = await reader.readline()
+        if not request_line:
+            return None
+        method, path, _ = request_line.decode('latin-1').split(' ', 2)
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        length = int(headers.get('content-length', 0))
+        body = await reader.readexactly(length) if length else b''
+        return method, path.split('?', 1)[0], headers, body
+
+    def _write_json(self, writer: asyncio.StreamWriter, status: int, payload: Dict[str, Any],
+                    extra_headers: Dict[str, str] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        headers = {
+            'Content-Type': 'application/json',
+            'Content-Length': str(len(body)),
+            **(extra_headers or {}),
+        }
+        head = f'HTTP/1.1 {status} {REASON_PHRASES.get(status, "")}\r\n'
+        head += ''.join(f'{k}: {v}\r\n' for k, v in headers.items()) + '\r\n'
+        writer.write(head.encode('latin-1') + body)
+
+    def _write_bytes(self, writer: asyncio.StreamWriter, status: int, body: bytes,
+                     content_type: str = 'application/octet-stream'):
+        head = (f'HTTP/1.1 {status} {REASON_PHRASES.get(status, "")}\r\n'
+                f'Content-Type: {content_type}\r\nContent-Length: {len(body)}\r\n\r\n')
+        writer.write(head.encode('latin-1') + body)
+
+    def _error(self, writer, status: int, message: str, error_type: str, extra_headers=None):
+        self._write_json(writer, status, {'error': {'message': message, 'type': error_type, 'code': None}},
+                         extra_headers)
+
+    async def _dispatch(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+                        writer: asyncio.StreamWriter):
+        self.stats['requests'] += 1
+        self._request_counter += 1
+
+        if method == 'GET' and path == '/v1/models':
+            self._write_json(writer, 200, {
+                'object': 'list',
+                'data': [{'id': m, 'object': 'model', 'created': 1700000000, 'owned_by': 'mock'}
+                         for m in self.config.models],
+            })
+            await writer.drain()
+            return
+
+        # Файлы и пакеты не имитируют лимиты и задержки: они важны только для запросов внутри пакета
+        if path.startswith('/v1/files') or path.startswith('/v1/batches'):
+            self._batch_api(method, path, headers, body, writer)
+            await writer.drain()
+            return
+
+        handlers = {
+            '/v1/chat/completions': self._chat_completions,
+            '/v1/completions': self._completions,
+            '/v1/embeddings': self._embeddings,
+        }
+        handler = handlers.get(path)
+        if method != 'POST' or handler is None:
+            self._error(writer, 404, f'Unknown endpoint {method} {path}', 'invalid_request_error')
+            await writer.drain()
+            return
+
+        if self._should_rate_limit():
+            self.stats['rate_limited'] += 1
+            self._error(writer, 429, 'Rate limit reached (mock)', 'rate_limit_error',
+                        {'Retry-After': str(self.config.retry_after),
+                         'retry-after-ms': str(int(self.config.retry_after * 1000))})
+            await writer.drain()
+            return
+        if self.config.error_probability and self._rng.random() < self.config.error_probability:
+            self.stats['errors'] += 1
+            self._error(writer, 500, 'Internal error (mock)', 'server_error')
+            await writer.drain()
+            return
+
+        try:
+            payload = json.loads(body or b'{}')
+        except json.JSONDecodeError:
+            self._error(writer, 400, 'Invalid JSON', 'invalid_request_error')
+            await writer.drain()
+            return
+
+        await asyncio.sleep(max(0.0, self.config._latency(self._rng)))
+        await handler(payload, writer)
+        await writer.drain()
+
+    def _should_rate_limit(self) -> bool:
+        if self.config.rate_limit_every and self._request_counter % self.config.rate_limit_every == 0:
+            return True
+        return bool(self.config.rate_limit_probability) and self._rng.random() < self.config.rate_limit_probability
+
+    def _completion_tokens(self, payload: Dict[str, Any]) -> int:
+        limit = payload.get('max_tokens') or payload.get('max_completion_tokens')
+        return min(self.config.completion_tokens, limit) if limit else self.config.completion_tokens
+
+    async def _generation_delay(self, tokens: int):
+        if self.config.tokens_per_second > 0:
+            await asyncio.sleep(tokens / self.config.tokens_per_second)
+
+    def _usage(self, prompt: str, text: str) -> Dict[str, int]:
+        prompt_tokens = estimate_tokens(prompt)
+        completion_tokens = estimate_tokens(text)
+        self.stats['prompt_tokens'] += prompt_tokens
+        self.stats['completion_tokens'] += completion_tokens
+        return {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                'total_tokens': prompt_tokens + completion_tokens}
+
+    async def _chat_completions(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        if payload.get('stream'):
+            prompt = '\n'.join(str(m.get('content', '')) for m in payload.get('messages', []))
+            text = deterministic_text(prompt, self._completion_tokens(payload), self.config.seed)
+            completion_id = 'chatcmpl-' + hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:24]
+            await self._stream_chat(writer, completion_id, int(time.time()),
+                                    payload.get('model', 'gpt-4o-mini'), text)
+            self._usage(prompt, text)
+            return
+
+        body = self._chat_body(payload)
+        await self._generation_delay(body['usage']['completion_tokens'])
+        self._write_json(writer, 200, body)
+
+    def _chat_body(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Тело ответа chat.completions без потоковой передачи"""
+        prompt = '\n'.join(str(m.get('content', '')) for m in payload.get('messages', []))
+        text = deterministic_text(prompt, self._completion_tokens(payload), self.config.seed)
+        return {
+            'id': 'chatcmpl-' + hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:24],
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-4o-mini'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': self._usage(prompt, text),
+        }
+
+    async def _stream_chat(self, writer, completion_id: str, created: int, model: str, text: str):
+        """Потоковый ответ в формате server-sent events"""
+        head = ('HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n'
+                'Cache-Control: no-cache\r\nTransfer-Encoding: chunked\r\n\r\n')
+        writer.write(head.encode('latin-1'))
+
+        def send(data: str):
+            event = f'data: {data}\n\n'.encode('utf-8')
+            writer.write(f'{len(event):x}\r\n'.encode('latin-1') + event + b'\r\n')
+
+        words = text.split(' ')
+        for i, word in enumerate(words):
+            delta = {'content': word if i == 0 else ' ' + word}
+            if i == 0:
+                delta['role'] = 'assistant'
+            send(json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}],
+            }, ensure_ascii=False))
+            await self._generation_delay(estimate_tokens(delta['content']) or 1)
+            await writer.drain()
+        send(json.dumps({
+            'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}],
+        }))
+        send('[DONE]')
+        writer.write(b'0\r\n\r\n')
+
+    async def _completions(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        body = self._completion_body(payload)
+        await self._generation_delay(body['usage']['completion_tokens'])
+        self._write_json(writer, 200, body)
+
+    def _completion_body(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Тело ответа completions"""
+        prompt = payload.get('prompt', '')
+        if isinstance(prompt, list):
+            prompt = '\n'.join(str(p) for p in prompt)
+        text = deterministic_text(prompt, self._completion_tokens(payload), self.config.seed)
+        return {
+            'id': 'cmpl-' + hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:24],
+            'object': 'text_completion',
+            'created': int(time.time()),
+            'model': payload.get('model', 'gpt-3.5-turbo-instruct'),
+            'choices': [{'index': 0, 'text': ' ' + text, 'finish_reason': 'stop', 'logprobs': None}],
+            'usage': self._usage(prompt, text),
+        }
+
+    async def _embeddings(self, payload: Dict[str, Any], writer: asyncio.StreamWriter):
+        inputs = payload.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+        dim = int(payload.get('dimensions') or 256)
+        prompt_tokens = sum(estimate_tokens(str(text)) for text in inputs)
+        self.stats['prompt_tokens'] += prompt_tokens
+        self._write_json(writer, 200, {
+            'object': 'list',
+            'data': [{'object': 'embedding', 'index': i,
+                      'embedding': deterministic_embedding(str(text), dim, self.config.seed)}
+                     for i, text in enumerate(inputs)],
+            'model': payload.get('model', 'text-embedding-3-small'),
+            'usage': {'prompt_tokens': prompt_tokens, 'total_tokens': prompt_tokens},
+        })
+
+    def _store_file(self, content: bytes, filename: str, purpose: str) -> Dict[str, Any]:
+        file_id = f'file-mock{len(self._files) + 1}'
+        meta = {'id': file_id, 'object': 'file', 'bytes': len(content), 'created_at': int(time.time()),
+                'filename': filename, 'purpose': purpose, 'status': 'processed'}
+        self._files[file_id] = {'meta': meta, 'content': content}
+        return meta
+
+    def _batch_api(self, method: str, path: str, headers: Dict[str, str], body: bytes,
+                   writer: asyncio.StreamWriter):
+        """Эндпоинты файлов и пакетов Batch API"""
+        parts = path.strip('/').split('/')
+        if method == 'POST' and parts == ['v1', 'files']:
+            message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+                f"Content-Type: {headers.get('content-type', '')}\r\n\r\n".encode('latin-1') + body)
+            fields = {}
+            content, filename = b'', 'upload.jsonl'
+            for part in message.iter_parts():
+                name = part.get_param('name', header='content-disposition')
+                if part.get_filename():
+                    content, filename = part.get_payload(decode=True), part.get_filename()
+                else:
+                    fields[name] = part.get_content().strip()
+            self._write_json(writer, 200, self._store_file(content, filename, fields.get('purpose', 'batch')))
+            return
+        if method == 'GET' and len(parts) == 4 and parts[1] == 'files' and parts[3] == 'content':
+            stored = self._files.get(parts[2])
+            if stored is None:
+                self._error(writer, 404, f'No such file {parts[2]}', 'invalid_request_error')
+                return
+            self._write_bytes(writer, 200, stored['content'])
+            return
+        if method == 'POST' and parts == ['v1', 'batches']:
+            payload = json.loads(body or b'{}')
+            if payload.get('input_file_id') not in self._files:
+                self._error(writer, 400, 'Unknown input_file_id', 'invalid_request_error')
+                return
+            batch_id = f'batch_mock{len(self._batches) + 1}'
+            batch = {
+                'id': batch_id, 'object': 'batch', 'endpoint': payload.get('endpoint'), 'errors': None,
+                'input_file_id': payload['input_file_id'], 'completion_window': payload.get('completion_window', '24h'),
+                'status': 'validating', 'output_file_id': None, 'error_file_id': None,
+                'created_at': int(time.time()), 'completed_at': None, 'metadata': payload.get('metadata'),
+                'request_counts': {'total': 0, 'completed': 0, 'failed': 0},
+            }
+            self._batches[batch_id] = batch
+            self.stats['batches'] += 1
+            task = asyncio.ensure_future(self._process_batch(batch))
+            self._batch_tasks.add(task)
+            task.add_done_callback(self._batch_tasks.discard)
+            self._write_json(writer, 200, batch)
+            return
+        if len(parts) >= 3 and parts[1] == 'batches' and parts[2] in self._batches:
+            batch = self._batches[parts[2]]
+            if method == 'POST' and parts[3:] == ['cancel'] and batch['status'] not in ('completed', 'failed'):
+                batch['status'] = 'cancelled'
+            self._write_json(writer, 200, batch)
+            return
+        self._error(writer, 404, f'Unknown endpoint {method} {path}', 'invalid_request_error')
+
+    async def _process_batch(self, batch: Dict[str, Any]):
+        """Выполнение пакета: ответы на все запросы входного файла после задержки batch_delay"""
+        lines = self._files[batch['input_file_id']]['content'].decode('utf-8').splitlines()
+        requests = [json.loads(line) for line in lines if line.strip()]
+        batch['status'] = 'in_progress'
+        batch['request_counts']['total'] = len(requests)
+        await asyncio.sleep(self.config.batch_delay)
+        if batch['status'] == 'cancelled':
+            return
+        builders = {'/v1/chat/completions': self._chat_body, '/v1/completions': self._completion_body}
+        output, errors = [], []
+        for i, request in enumerate(requests):
+            builder = builders.get(request.get('url'))
+            item = {'id': f"{batch['id']}-req-{i}", 'custom_id': request.get('custom_id'), 'error': None}
+            if builder is None or request.get('url') != batch['endpoint']:
+                item['response'] = {'status_code': 400, 'request_id': item['id'],
+                                    'body': {'error': {'message': 'Invalid url', 'type': 'invalid_request_error'}}}
+                errors.append(item)
+            elif self.config.error_probability and self._rng.random() < self.config.error_probability:
+                item['response'] = {'status_code': 500, 'request_id': item['id'],
+                                    'body': {'error': {'message': 'Internal error (mock)', 'type': 'server_error'}}}
+                errors.append(item)
+            else:
+                item['response'] = {'status_code': 200, 'request_id': item['id'], 'body': builder(request.get('body', {}))}
+                output.append(item)
+        self.stats['batch_requests'] += len(requests)
+        for items, field in ((output, 'output_file_id'), (errors, 'error_file_id')):
+            if items:
+                content = ''.join(json.dumps(item, ensure_ascii=False) + '\n' for item in items).encode('utf-8')
+                batch[field] = self._store_file(content, f"{batch['id']}_{field}.jsonl", 'batch_output')['id']
+        batch['request_counts'].update(completed=len(output), failed=len(errors))
+        batch['status'] = 'completed'
+        batch['completed_at'] = int(time.time())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Локальный сервер, совместимый с OpenAI API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', default='fixed:0', help="fixed:<сек>, uniform:<мин>:<макс> или lognormal:<медиана>:<sigma>")
+    parser.add_argument('--tokens-per-second', type=float, default=0.0)
+    parser.add_argument('--completion-tokens', type=int, default=60)
+    parser.add_argument('--rate-limit', type=float, default=0.0, help='Доля ответов 429')
+    parser.add_argument('--rate-limit-every', type=int, default=0, help='Ответ 429 на каждый N-й запрос')
+    parser.add_argument('--retry-after', type=float, default=0.05)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Доля ответов 500')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--batch-delay', type=float, default=0.0, help='Время выполнения пакета Batch API, сек.')
+    args = parser.parse_args()
+
+    config = MockServerConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        rate_limit_probability=args.rate_limit,
+        rate_limit_every=args.rate_limit_every,
+        retry_after=args.retry_after,
+        error_probability=args.error_rate,
+        seed=args.seed,
+        batch_delay=args.batch_delay,
+    )
+    try:
+        asyncio.run(MockOpenAIServer(config, args.host, args.port).serve_forever())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -11,5 +11,9 @@ setup(
         "python-socks",
         "asyncio"
     ],
+    extras_require={
+        # Тесты используют @pytest.mark.asyncio
+        "test": ["pytest>=7.0", "pytest-asyncio>=0.23"]
+    },
     author="TIP"
 )
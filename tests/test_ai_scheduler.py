@@ -0,0 +1,80 @@
+import asyncio
+import time
+import httpx
+import openai
+import pytest
+from Sammaryhelper.ai_handler import AIRequestScheduler, PRIORITY_INTERACTIVE, PRIORITY_BACKGROUND
+
+
+def make_rate_limit_error(retry_after: str) -> openai.RateLimitError:
+    """Создание ошибки 429 с заголовком Retry-After"""
+    request = httpx.Request('POST', 'http://localhost/v1/chat/completions')
+    response = httpx.Response(429, headers={'retry-after': retry_after}, request=request)
+    return openai.RateLimitError("Rate limit", response=response, body=None)
+
+
+@pytest.mark.asyncio
+async def test_retry_honors_retry_after():
+    """Повтор после 429 выполняется не раньше Retry-After"""
+    scheduler = AIRequestScheduler(base_delay=0.001, max_delay=1.0)
+    calls = []
+
+    async def request(timeout):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise make_rate_limit_error('0.05')
+        return 'ok'
+
+    assert await scheduler.submit(request) == 'ok'
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.05
+    assert scheduler.stats['rate_limited'] == 1
+
+
+@pytest.mark.asyncio
+async def test_interactive_priority_served_first():
+    """Интерактивные запросы обходят фоновые в очереди"""
+    scheduler = AIRequestScheduler(max_concurrency=1)
+    order = []
+    gate = asyncio.Event()
+
+    async def blocker(timeout):
+        await gate.wait()
+        return 'blocker'
+
+    def make_request(name):
+        async def request(timeout):
+            order.append(name)
+            return name
+        return request
+
+    first = asyncio.create_task(scheduler.submit(blocker))
+    await asyncio.sleep(0)
+    background = asyncio.create_task(scheduler.submit(make_request('background'), priority=PRIORITY_BACKGROUND))
+    interactive = asyncio.create_task(scheduler.submit(make_request('interactive'), priority=PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0.01)
+    gate.set()
+    await asyncio.gather(first, background, interactive)
+    assert order == ['interactive', 'background']
+
+
+@pytest.mark.asyncio
+async def test_deadline_expires_while_waiting_for_budget():
+    """Запрос с истекшим дедлайном не ждет освобождения бюджета бесконечно"""
+    scheduler = AIRequestScheduler(rpm_limit=1)
+
+    async def request(timeout):
+        return 'ok'
+
+    await scheduler.submit(request)
+    with pytest.raises(asyncio.TimeoutError):
+        await scheduler.submit(request, deadline=time.monotonic() + 0.05)
+
+
+def test_token_budget_wait():
+    """Запрос, не влезающий в бюджет токенов, ждет освобождения окна"""
+    scheduler = AIRequestScheduler(tpm_limit=1000)
+    scheduler._token_log.append([time.monotonic(), 900])
+    scheduler._tokens_in_window = 900
+    assert scheduler._budget_wait(50) <= 0
+    assert scheduler._budget_wait(200) > 0
@@ -0,0 +1,54 @@
+import json
+import pytest
+from types import SimpleNamespace
+from Sammaryhelper.ai_usage import AIUsageTracker, estimate_cost
+from Sammaryhelper.ai_handler import AIChatManager
+
+
+def test_estimate_cost_uses_longest_prefix():
+    """Цена выбирается по самому длинному префиксу ID модели"""
+    assert estimate_cost('gpt-4o-mini-2024-07-18', 1_000_000, 0) == pytest.approx(0.15)
+    assert estimate_cost('gpt-4o-2024-08-06', 0, 1_000_000) == pytest.approx(10.0)
+    assert estimate_cost('unknown-model', 1000, 1000) == 0.0
+
+
+@pytest.mark.asyncio
+async def test_aggregate_by_operation(tmp_path):
+    """Агрегация суммирует токены и не учитывает стоимость ответов из кеша"""
+    tracker = AIUsageTracker()
+    await tracker.record('gpt-4o-mini', 'map', 1000, 100, latency=1.0)
+    await tracker.record('gpt-4o-mini', 'map', 500, 50, latency=3.0)
+    await tracker.record('gpt-4o-mini', 'qa', 800, 80, cache_hit=True)
+
+    summary = {row['key']: row for row in tracker.aggregate('operation')}
+    assert summary['map']['calls'] == 2
+    assert summary['map']['prompt_tokens'] == 1500
+    assert summary['map']['avg_latency'] == pytest.approx(2.0)
+    assert summary['qa']['cache_hits'] == 1
+    assert summary['qa']['cost'] == 0.0
+
+    path = tmp_path / 'usage.json'
+    await tracker.export_json(str(path), 'operation')
+    data = json.loads(path.read_text(encoding='utf-8'))
+    assert len(data['records']) == 3
+
+
+@pytest.mark.asyncio
+async def test_completion_records_usage():
+    """Каждый вызов модели регистрируется с токенами из response.usage"""
+    manager = AIChatManager({'openai_api_key': 'test'})
+
+    async def submit(request, estimated_tokens, priority, deadline):
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content='ответ'))],
+            usage=SimpleNamespace(prompt_tokens=120, completion_tokens=30)
+        )
+
+    manager.scheduler.submit = submit
+    result = await manager._create_completion(None, 'gpt-4o-mini', 'system', 'prompt',
+                                              operation='reduce', dialog_id=42)
+    assert result == 'ответ'
+    record = manager.usage_tracker.records[-1]
+    assert record['operation'] == 'reduce'
+    assert record['dialog_id'] == 42
+    assert (record['prompt_tokens'], record['completion_tokens']) == (120, 30)
@@ -0,0 +1,115 @@
+import json
+import time
+import logging
+import openai
+import pytest
+from Sammaryhelper.ai_handler import AIChatManager
+from Sammaryhelper.ai_usage import estimate_cost
+from Sammaryhelper.batch_api import BatchRunner, build_batch_request, parse_batch_output
+from Sammaryhelper.log_utils import get_logger
+from benchmarks.mock_openai_server import MockOpenAIServer, MockServerConfig
+
+
+def make_manager(server, tmp_path):
+    return AIChatManager({
+        'openai_api_key': 'test', 'openai_base_url': server.base_url, 'openai_model': 'gpt-4o-mini',
+        'system_prompt': 's', 'user_prompt': 'Сделай краткое содержание переписки:',
+        'semantic_cache_enabled': False, 'summary_execution': 'batch',
+        'batch_dir': str(tmp_path), 'batch_poll_interval': 0.01,
+    })
+
+
+@pytest.mark.asyncio
+async def test_batch_runner_round_trip(tmp_path):
+    """Запросы проходят через файл, пакет и выходной файл; ошибки попадают в результат"""
+    config = MockServerConfig(batch_delay=0.05, error_probability=0.3, seed=3)
+    async with MockOpenAIServer(config) as server:
+        client = openai.AsyncOpenAI(api_key='test', base_url=server.base_url, max_retries=0)
+        requests = [build_batch_request(f'r{i}', 'gpt-4o-mini', 's', f'промпт {i}') for i in range(20)]
+        results = await BatchRunner(client, work_dir=str(tmp_path), poll_interval=0.01).run(requests)
+        assert set(results) == {f'r{i}' for i in range(20)}
+        ok = [r for r in results.values() if r['error'] is None]
+        assert ok and all(r['text'] and r['prompt_tokens'] for r in ok)
+        assert len(ok) < 20
+        assert server.stats['batches'] == 1
+        # JSONL-файл пакета удаляется после разбора результатов
+        assert list(tmp_path.glob('batch_*.jsonl')) == []
+
+        # В режиме отладки файл сохраняется для разбора проблем
+        await BatchRunner(client, work_dir=str(tmp_path), poll_interval=0.01, debug=True).run(requests[:2])
+        written = list(tmp_path.glob('batch_*.jsonl'))
+        assert len(written) == 1
+        assert json.loads(written[0].read_text(encoding='utf-8').splitlines()[0])['custom_id'] == 'r0'
+
+
+@pytest.mark.asyncio
+async def test_batch_runner_honours_deadline(tmp_path):
+    """Пакет, не выполненный к крайнему сроку вызывающего, отменяется"""
+    async with MockOpenAIServer(MockServerConfig(batch_delay=5)) as server:
+        client = openai.AsyncOpenAI(api_key='test', base_url=server.base_url, max_retries=0)
+        requests = [build_batch_request('r0', 'gpt-4o-mini', 's', 'промпт')]
+        runner = BatchRunner(client, work_dir=str(tmp_path), poll_interval=1.0)
+        started = time.monotonic()
+        with pytest.raises(TimeoutError):
+            await runner.run(requests, deadline=started + 0.2)
+        assert time.monotonic() - started < 1.0
+        assert list(tmp_path.glob('batch_*.jsonl')) == []
+
+
+def test_parse_batch_output_reports_errors():
+    content = '\n'.join([
+        json.dumps({'custom_id': 'a', 'response': {'status_code': 200, 'body': {
+            'choices': [{'message': {'content': 'ответ'}}], 'usage': {'prompt_tokens': 5, 'completion_tokens': 2}}}}),
+        json.dumps({'custom_id': 'b', 'response': {'status_code': 500, 'body': {'error': {'message': 'сбой'}}}}),
+    ])
+    results = parse_batch_output(content)
+    assert results['a']['text'] == 'ответ' and results['a']['prompt_tokens'] == 5
+    assert results['b']['error'] == 'сбой'
+
+
+@pytest.mark.asyncio
+async def test_summary_map_stage_runs_in_batch(tmp_path):
+    """Саммари частей выполняются одним пакетом со скидкой, объединение - обычным запросом"""
+    messages = [{'id': i, 'sender_name': f'user{i % 7}', 'date': '2024-05-01 10:00:00',
+                 'text': f'обсуждение задачи {i} ' * 30} for i in range(600)]
+    async with MockOpenAIServer(MockServerConfig(batch_delay=0.02)) as server:
+        manager = make_manager(server, tmp_path)
+        summary = await manager.generate_summary(messages, manager.get_openai_client())
+        assert summary and not summary.startswith('Ошибка')
+        assert server.stats['batches'] == 1
+        assert server.stats['batch_requests'] > 1
+
+        records = manager.usage_tracker.records
+        map_records = [r for r in records if r['operation'] == 'map']
+        assert len(map_records) == server.stats['batch_requests']
+        record = map_records[0]
+        assert record['cost'] == pytest.approx(
+            estimate_cost('gpt-4o-mini', record['prompt_tokens'], record['completion_tokens']) / 2)
+        assert [r['operation'] for r in records].count('reduce') == 1
+
+
+@pytest.mark.asyncio
+async def test_batch_failure_falls_back_to_online_with_warning(tmp_path):
+    """Сбой Batch API виден в логе, а части обрабатываются обычными запросами"""
+    records = []
+    handler = logging.Handler()
+    handler.emit = records.append
+    logger = get_logger('ai')
+    logger.addHandler(handler)
+    messages = [{'id': i, 'sender_name': 'user', 'date': '2024-05-01 10:00:00',
+                 'text': f'обсуждение задачи {i} ' * 30} for i in range(300)]
+    try:
+        async with MockOpenAIServer(MockServerConfig()) as server:
+            manager = make_manager(server, tmp_path)
+
+            async def broken_batch(*args, **kwargs):
+                raise RuntimeError('пакет отклонен')
+
+            manager._run_map_batch = broken_batch
+            summary = await manager.generate_summary(messages, manager.get_openai_client())
+            assert summary and not summary.startswith('Ошибка')
+            assert server.stats['batches'] == 0
+    finally:
+        logger.removeHandler(handler)
+    warnings = [r.getMessage() for r in records if r.levelno == logging.WARNING]
+    assert any('пакет отклонен' in message for message in warnings)
@@ -0,0 +1,116 @@
+import json
+import asyncio
+import datetime
+import pytest
+from Sammaryhelper.batch_digest import BatchDigestJob, FileCheckpointStore, write_report, STATUS_DONE, STATUS_EMPTY
+
+
+class FakeClient:
+    def __init__(self, messages_by_dialog):
+        self.messages_by_dialog = messages_by_dialog
+        self.calls = []
+        self.since = {}
+        self.active = 0
+        self.max_active = 0
+
+    async def get_messages_since(self, chat_id, since=None, until=None, min_id=0, limit=None):
+        self.calls.append((chat_id, min_id))
+        self.since[chat_id] = since
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+        return [dict(m) for m in self.messages_by_dialog.get(chat_id, []) if m['id'] > min_id]
+
+
+class FakeAI:
+    def __init__(self, fail_dialogs=()):
+        self.fail_dialogs = set(fail_dialogs)
+        self.summarized = []
+
+    async def generate_summary(self, messages, openai_client, priority=0, timeout=None, dialog_id=None,
+                               execution_mode=None):
+        if dialog_id in self.fail_dialogs:
+            raise RuntimeError('сбой API')
+        self.summarized.append(dialog_id)
+        return f"саммари {dialog_id}: {len(messages)}"
+
+
+def make_dialogs(n):
+    dialogs = [{'id': i, 'name': f'чат {i}'} for i in range(1, n + 1)]
+    messages = {i: [{'id': j, 'sender_name': 'user', 'date': '2024-05-01 10:00:00', 'text': f'сообщение {j}'}
+                    for j in range(1, i % 4 + 1)] for i in range(1, n + 1)}
+    return dialogs, messages
+
+
+@pytest.mark.asyncio
+async def test_interrupted_job_resumes_without_redoing_work(tmp_path):
+    """Повторный запуск обрабатывает только диалоги без успешной контрольной точки"""
+    dialogs, messages = make_dialogs(12)
+    store_path = str(tmp_path / 'checkpoints.json')
+
+    ai = FakeAI(fail_dialogs={2, 6})
+    client = FakeClient(messages)
+    results = await BatchDigestJob(client, ai, None, dialogs, FileCheckpointStore(store_path),
+                                   job_id='job', fetch_concurrency=3).run()
+    assert client.max_active <= 3
+    assert [r['dialog_id'] for r in results] == [d['id'] for d in dialogs]
+    assert {r['dialog_id'] for r in results if r['status'] == 'failed'} == {2, 6}
+    assert all(r['status'] == STATUS_EMPTY for r in results if r['dialog_id'] % 4 == 0)
+
+    ai = FakeAI()
+    client = FakeClient(messages)
+    results = await BatchDigestJob(client, ai, None, dialogs, FileCheckpointStore(store_path), job_id='job').run()
+    assert sorted(ai.summarized) == [2, 6]
+    assert all(r['status'] in (STATUS_DONE, STATUS_EMPTY) for r in results)
+
+
+@pytest.mark.asyncio
+async def test_next_job_fetches_only_new_messages(tmp_path):
+    """Без окна времени загружаются только сообщения новее прошлого дайджеста"""
+    dialogs, messages = make_dialogs(3)
+    store = FileCheckpointStore(str(tmp_path / 'checkpoints.json'))
+    await BatchDigestJob(FakeClient(messages), FakeAI(), None, dialogs, store, job_id='first').run()
+
+    client = FakeClient(messages)
+    results = await BatchDigestJob(client, FakeAI(), None, dialogs, store, job_id='second').run()
+    assert dict(client.calls) == {1: 1, 2: 2, 3: 3}
+    assert client.since == {1: None, 2: None, 3: None}
+    assert all(r['status'] == STATUS_EMPTY for r in results)
+
+
+@pytest.mark.asyncio
+async def test_finished_job_without_window_is_not_reused(tmp_path):
+    """Повторный запуск завершенного задания без окна времени берет новые сообщения"""
+    dialogs, messages = make_dialogs(3)
+    store = FileCheckpointStore(str(tmp_path / 'checkpoints.json'))
+    await BatchDigestJob(FakeClient(messages), FakeAI(), None, dialogs, store, job_id='job').run()
+
+    messages[1].append({'id': 5, 'sender_name': 'user', 'date': '2024-05-02 10:00:00', 'text': 'новое'})
+    ai = FakeAI()
+    client = FakeClient(messages)
+    results = await BatchDigestJob(client, ai, None, dialogs, store, job_id='job').run()
+    assert dict(client.calls) == {1: 1, 2: 2, 3: 3}
+    assert ai.summarized == [1]
+    assert results[0]['summary'] == 'саммари 1: 1'
+
+
+@pytest.mark.asyncio
+async def test_first_job_without_window_reads_default_window(tmp_path):
+    """Для диалога без позиции прошлого дайджеста вся история не загружается"""
+    dialogs, messages = make_dialogs(2)
+    client = FakeClient(messages)
+    await BatchDigestJob(client, FakeAI(), None, dialogs, FileCheckpointStore(str(tmp_path / 'c.json')),
+                         first_run_hours=6).run()
+    expected = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=6)
+    assert all(abs((since - expected).total_seconds()) < 60 for since in client.since.values())
+
+
+def test_report_formats(tmp_path):
+    """Отчет пишется в Markdown или JSONL по расширению файла"""
+    results = [{'dialog_id': 1, 'dialog_name': 'чат', 'status': STATUS_DONE, 'message_count': 3,
+                'summary': 'итоги', 'error': None}]
+    markdown = open(write_report(results, str(tmp_path / 'digest.md')), encoding='utf-8').read()
+    assert '## чат' in markdown and 'итоги' in markdown
+    lines = open(write_report(results, str(tmp_path / 'digest.jsonl')), encoding='utf-8').read().splitlines()
+    assert json.loads(lines[0])['summary'] == 'итоги'
@@ -0,0 +1,58 @@
+import os
+import pytest
+from Sammaryhelper.config_service import ConfigService, get_config_service
+from Sammaryhelper.db_handler import DatabaseHandler
+
+
+def write_config(app_dir, name, body):
+    path = os.path.join(app_dir, 'configs', f'{name}.py')
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(body)
+    return path
+
+
+def test_config_is_executed_once_and_shared(tmp_path):
+    write_config(str(tmp_path), 'main', "api_id = 1\ndb_settings = {'host': 'db.local'}\n")
+    service = ConfigService(str(tmp_path), check_interval=60)
+    first = service.get('main')
+    for _ in range(100):
+        assert service.get('main') is first
+    assert service.stats['loads'] == 1 and service.stats['checks'] == 1
+    assert service.get_value('main', 'api_id') == 1
+    assert service.get_value('missing', 'api_id', 'нет') == 'нет'
+    with pytest.raises(FileNotFoundError):
+        service.get('missing')
+
+
+def test_changed_file_is_reloaded_and_subscribers_notified(tmp_path):
+    path = write_config(str(tmp_path), 'main', "api_id = 1\n")
+    service = ConfigService(str(tmp_path), check_interval=0)
+    changes = []
+    unsubscribe = service.subscribe(lambda name, config: changes.append((name, config.api_id)))
+    assert service.get('main').api_id == 1
+    # Без изменений файл не выполняется повторно
+    assert service.poll() == []
+
+    write_config(str(tmp_path), 'main', "api_id = 22\n")
+    os.utime(path, ns=(1, 1))
+    assert service.poll() == ['main']
+    assert service.get('main').api_id == 22
+    assert changes == [('main', 22)]
+
+    # Ошибочная версия не заменяет рабочую
+    write_config(str(tmp_path), 'main', "api_id = \n")
+    assert service.get('main').api_id == 22
+    unsubscribe()
+    write_config(str(tmp_path), 'main', "api_id = 333\n")
+    assert service.reload('main').api_id == 333
+    assert changes == [('main', 22)]
+
+
+def test_database_handler_uses_shared_config(tmp_path):
+    write_config(str(tmp_path), 'account', "db_settings = {'host': 'db.local', 'port': 5433}\n")
+    service = get_config_service(str(tmp_path))
+    handler = DatabaseHandler(config_name='account', app_dir=str(tmp_path))
+    assert handler.config is service.get('account').db_settings
+    # Без имени конфига - настройки по умолчанию, а не чужой конфиг
+    assert DatabaseHandler(app_dir=str(tmp_path)).config['host'] == 'localhost'
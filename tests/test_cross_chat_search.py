@@ -0,0 +1,164 @@
+import asyncio
+import datetime
+import pytest
+from telethon.tl.types import User
+from Sammaryhelper.cross_chat_search import (
+    SearchQuery, SearchMerger, CrossChatSearch, merge_streams, message_matches, local_index_hits,
+    SOURCE_LOCAL, SOURCE_TELEGRAM)
+from Sammaryhelper.telegram_client import TelegramClientManager
+
+UTC = datetime.timezone.utc
+
+
+def msg(message_id, text='текст', sender='ivan', date='2024-05-01T10:00:00+00:00', **fields):
+    return dict({'id': message_id, 'text': text, 'sender_name': sender, 'sender_id': 5, 'date': date}, **fields)
+
+
+async def batches(items, delay=0):
+    for item in items:
+        await asyncio.sleep(delay)
+        yield item
+
+
+def test_query_date_range_and_server_side_sender():
+    assert SearchQuery([1], date='2024-05-31').date_range() == (
+        datetime.datetime(2024, 5, 31, tzinfo=UTC), datetime.datetime(2024, 6, 1, tzinfo=UTC))
+    assert SearchQuery([1], date='2024-12').date_range()[1] == datetime.datetime(2025, 1, 1, tzinfo=UTC)
+    assert SearchQuery([1], date='2024').date_range()[0] == datetime.datetime(2024, 1, 1, tzinfo=UTC)
+    assert SearchQuery([1], date='05-01').date_range() is None
+    assert SearchQuery([1], date='май').date_range() is None
+    assert SearchQuery([1], sender='@ivan').from_user() == '@ivan'
+    assert SearchQuery([1], sender='12345').from_user() == 12345
+    # Часть имени Telegram не ищет, она проверяется локально
+    assert SearchQuery([1], sender='Иван').from_user() is None
+    assert SearchQuery([1, 2, 1]).dialog_ids == [1, 2]
+
+
+def test_message_matches_checks_what_source_did_not():
+    query = SearchQuery([1], sender='iv', date='2024-05', reply_status='not_replied')
+    assert message_matches(msg(1), query)
+    assert not message_matches(msg(1, sender='petr'), query)
+    assert message_matches(msg(1, sender='petr'), query, sender_checked=True)
+    assert not message_matches(msg(1, date=datetime.datetime(2024, 6, 1, tzinfo=UTC)), query)
+    assert not message_matches(msg(1, replied=True), query)
+    assert message_matches(msg(1, sender='x'), SearchQuery([1], sender='5'))
+
+
+def test_merger_dedupes_across_sources_and_limits_per_dialog():
+    merger = SearchMerger(limit=2)
+    assert [m['id'] for m in merger.add(1, [msg(1), msg(2)], SOURCE_LOCAL)] == [1, 2]
+    assert merger.add(1, [msg(2), msg(3)], SOURCE_TELEGRAM) == []
+    added = merger.add(2, [msg(2, date='2024-05-02T10:00:00+00:00'), msg(9)], SOURCE_TELEGRAM)
+    assert [(m['dialog_id'], m['source']) for m in added] == [(2, SOURCE_TELEGRAM)] * 2
+    assert merger.total == 4 and merger.sources == {SOURCE_LOCAL: 2, SOURCE_TELEGRAM: 2}
+    assert [m['id'] for m in merger.sorted_results()[2]] == [2, 9]
+
+
+@pytest.mark.asyncio
+async def test_merge_streams_interleaves_and_isolates_errors():
+    async def broken():
+        yield 'b1'
+        raise RuntimeError('сеть')
+
+    errors = []
+    items = [item async for item in merge_streams(
+        [batches(['a1', 'a2'], delay=0.01), broken()], lambda number, e: errors.append((number, str(e))))]
+    assert sorted(items) == ['a1', 'a2', 'b1']
+    # Быстрый поток не ждет медленный
+    assert items[0] == 'b1'
+    assert errors == [(1, 'сеть')]
+
+
+@pytest.mark.asyncio
+async def test_cross_chat_search_merges_streams_as_they_arrive():
+    query = SearchQuery([1, 2], text='отчет', sender='@ivan', limit=10)
+    local = batches([(1, [msg(1), msg(2, sender='petr')]), (3, [msg(7)])])
+    telegram = batches([(1, [msg(1), msg(3, sender='Иван Петров')]), (2, [msg(4)])], delay=0.01)
+    search = CrossChatSearch(query, {SOURCE_LOCAL: local, SOURCE_TELEGRAM: telegram}, server_side_sender=True)
+
+    events = [(source, dialog_id, [m['id'] for m in added]) async for source, dialog_id, added in search.run()]
+    # Локальный результат с другим отправителем отброшен, чат 3 не выбран, повтор 1 учтен один раз
+    assert events == [(SOURCE_LOCAL, 1, [1]), (SOURCE_TELEGRAM, 1, [3]), (SOURCE_TELEGRAM, 2, [4])]
+    assert search.errors == {}
+
+
+class FakeIndex:
+    """Полнотекстовый индекс: совпадение любого из слов запроса"""
+
+    def __init__(self, messages):
+        self.messages = messages
+
+    async def search_cached_messages(self, terms, dialog_ids, account_id, limit=200):
+        return [m for m in self.messages
+                if m['dialog_id'] in dialog_ids and any(t in m['text'].lower() for t in terms)][:limit]
+
+
+@pytest.mark.asyncio
+async def test_local_index_hits_require_whole_phrase():
+    index = FakeIndex([msg(1, 'Релиз завтра в 10', dialog_id=1), msg(2, 'завтра будет дождь', dialog_id=1),
+                       msg(3, 'релиз отложен', dialog_id=2)])
+    query = SearchQuery([1, 2], text='релиз завтра')
+    found = [(dialog_id, [m['id'] for m in messages])
+             async for dialog_id, messages in local_index_hits(index, '100', query)]
+    assert found == [(1, [1])]
+
+
+class FakeSearchMessage:
+    def __init__(self, message_id, chat_id, minutes, sender=None):
+        self.id = message_id
+        self.chat_id = chat_id
+        self.text = f'отчет {message_id}'
+        self.date = datetime.datetime(2024, 5, 1, 12, 0, tzinfo=UTC) - datetime.timedelta(minutes=minutes)
+        self.sender = sender
+        self.sender_id = sender.id if sender else None
+        self.photo = None
+        self.video = None
+
+
+class FakeSearchTelethon:
+    def __init__(self, messages):
+        self.messages = messages
+        self.calls = []
+
+    async def get_entity(self, entity_id):
+        raise AssertionError('отправитель должен браться из результата поиска')
+
+    async def iter_messages(self, entity, limit=None, search=None, from_user=None, offset_date=None):
+        self.calls.append((entity, search, from_user, offset_date))
+        found = [m for m in self.messages if entity is None or m.chat_id == entity]
+        for message in found[:limit]:
+            if offset_date is None or message.date < offset_date:
+                yield message
+
+
+@pytest.mark.asyncio
+async def test_search_chats_uses_global_search_for_many_dialogs():
+    sender = User(id=5, username='ivan', first_name='Иван')
+    telegram = FakeSearchTelethon([FakeSearchMessage(i, i % 3, i, sender) for i in range(1, 30)])
+    manager = TelegramClientManager({})
+    manager.client = telegram
+    query = SearchQuery([0, 1], text='отчет', date='2024-05-01', limit=4)
+
+    found = {}
+    async for dialog_id, messages in manager.search_chats(query, global_min_dialogs=2):
+        found.setdefault(dialog_id, []).extend(messages)
+    assert len(telegram.calls) == 1 and telegram.calls[0][:2] == (None, 'отчет')
+    assert telegram.calls[0][3] == datetime.datetime(2024, 5, 2, tzinfo=UTC)
+    assert sorted(found) == [0, 1] and all(len(messages) == 4 for messages in found.values())
+    assert found[1][0]['sender_name'] == 'ivan'
+    assert isinstance(found[1][0]['date'], datetime.datetime)
+
+
+@pytest.mark.asyncio
+async def test_search_chats_passes_sender_to_per_peer_search():
+    telegram = FakeSearchTelethon([FakeSearchMessage(i, i % 2, i) for i in range(1, 11)])
+    manager = TelegramClientManager({})
+    manager.client = telegram
+    query = SearchQuery([0, 1], sender='@ivan', limit=3)
+
+    found = {}
+    async for dialog_id, messages in manager.search_chats(query, global_min_dialogs=2):
+        found.setdefault(dialog_id, []).extend(messages)
+    assert sorted(call[0] for call in telegram.calls) == [0, 1]
+    assert all(call[1] is None and call[2] == '@ivan' for call in telegram.calls)
+    assert {dialog_id: len(messages) for dialog_id, messages in found.items()} == {0: 3, 1: 3}
@@ -0,0 +1,38 @@
+import time
+import random
+from Sammaryhelper.extractive_summary import select_messages, score_messages
+from Sammaryhelper.text_utils import estimate_tokens
+
+
+def test_topical_messages_score_higher():
+    """Сообщения на главную тему диалога получают большую оценку, чем случайные"""
+    texts = [
+        'обсуждаем релиз новой версии сервера',
+        'релиз сервера переносим, версия не готова',
+        'кто проверит сборку сервера перед релизом',
+        'у меня кот заболел',
+    ]
+    scores = score_messages(texts)
+    assert scores[3] < min(scores[:3])
+
+
+def test_selection_respects_budget_and_order():
+    """Отбор укладывается в бюджет и сохраняет хронологический порядок"""
+    messages = [{'id': i, 'sender_name': 'user', 'date': '', 'text': f'сообщение про базу данных номер {i} ' * 5}
+                for i in range(200)]
+    selected = select_messages(messages, token_budget=300)
+    assert selected
+    assert sum(estimate_tokens(f"user: {m['text']}") + 1 for m in selected) <= 300
+    ids = [m['id'] for m in selected]
+    assert ids == sorted(ids)
+
+
+def test_selection_is_fast_for_large_dialogs():
+    """10 тысяч сообщений обрабатываются быстрее секунды"""
+    rng = random.Random(0)
+    words = [f'слово{i}' for i in range(3000)]
+    messages = [' '.join(rng.choice(words) for _ in range(rng.randint(3, 30))) for _ in range(10000)]
+    started = time.perf_counter()
+    selected = select_messages(messages, token_budget=5000)
+    assert time.perf_counter() - started < 1.0
+    assert 0 < len(selected) < len(messages)
@@ -0,0 +1,39 @@
+import asyncio
+import pytest
+from Sammaryhelper.ai_handler import AIChatManager
+from Sammaryhelper.forum_summary import summarize_forum, format_forum_digest
+from benchmarks.mock_openai_server import MockOpenAIServer, MockServerConfig
+
+
+class FakeForumClient:
+    def __init__(self, topics):
+        self.topics = topics
+
+    async def get_topic_messages(self, chat_id, topic_id, limit=None, since=None):
+        await asyncio.sleep(0.01)
+        if topic_id == 99:
+            return []
+        return [{'id': i, 'sender_name': 'user', 'date': '2024-05-01 10:00:00',
+                 'text': f'обсуждение темы {topic_id}, сообщение {i}', 'message_thread_id': topic_id}
+                for i in range(topic_id * 100, topic_id * 100 + 20)]
+
+
+@pytest.mark.asyncio
+async def test_topics_are_summarized_concurrently():
+    """Время саммари форума близко ко времени одной темы"""
+    topics = [{'id': i, 'title': f'Тема {i}'} for i in range(1, 21)] + [{'id': 99, 'title': 'Пустая'}]
+    async with MockOpenAIServer(MockServerConfig(latency='fixed:0.2')) as server:
+        manager = AIChatManager({'openai_api_key': 'test', 'openai_base_url': server.base_url,
+                                 'openai_model': 'gpt-4o-mini', 'system_prompt': 's', 'user_prompt': 'u',
+                                 'semantic_cache_enabled': False, 'ai_max_concurrency': 32})
+        result = await summarize_forum(FakeForumClient(topics), manager, manager.get_openai_client(), 1, topics)
+
+    summarized = [t for t in result['topics'] if t['summary']]
+    assert len(summarized) == 20
+    assert result['overview']
+    # 20 тем по 0.2 сек. и общий обзор: последовательно заняло бы больше 4 сек.
+    assert result['elapsed'] < 1.5
+
+    digest = format_forum_digest(result, 'Форум')
+    assert '## Общий обзор' in digest and '## Тема 1 ' in digest
+    assert 'Без новых сообщений: Пустая' in digest
@@ -0,0 +1,82 @@
+import time
+import logging
+import pytest
+from Sammaryhelper.log_utils import (
+    configure_logging, get_logger, lazy, RingBufferHandler, SamplingFilter)
+
+
+@pytest.fixture
+def ring():
+    ring = configure_logging(debug=False, capacity=100, console=False)
+    ring.drain()
+    ring.records.clear()
+    ring.dropped = 0
+    yield ring
+    configure_logging(debug=False, levels={'test': 'NOTSET'}, capacity=100, console=False)
+
+
+def test_ring_buffer_keeps_last_records_and_counts_dropped():
+    handler = RingBufferHandler(capacity=3)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    logger = logging.getLogger('test_ring_buffer')
+    logger.propagate = False
+    logger.addHandler(handler)
+    for i in range(5):
+        logger.warning("строка %d", i)
+    assert handler.pending() == 3
+    assert handler.drain(limit=2) == ['строка 2', 'строка 3']
+    assert handler.drain() == ['строка 4']
+    assert handler.dropped == 2
+    assert handler.lines() == ['строка 2', 'строка 3', 'строка 4']
+    logger.removeHandler(handler)
+
+
+def test_lazy_is_not_evaluated_when_level_disabled(ring):
+    calls = []
+
+    def expensive():
+        calls.append(1)
+        return 'дамп'
+
+    logger = get_logger('test')
+    logger.debug("Атрибуты: %s", lazy(expensive))
+    assert calls == [] and ring.pending() == 0
+
+    configure_logging(debug=True, capacity=100, console=False)
+    logger.debug("Атрибуты: %s", lazy(expensive))
+    # В буфере хранится запись, строка собирается только при выдаче
+    assert isinstance(ring.records[-1].args[0], lazy)
+    assert ring.drain()[0].endswith('[sammaryhelper.test] Атрибуты: дамп')
+    assert calls
+
+
+def test_module_levels_override_global(ring):
+    configure_logging(debug=True, levels={'test': 'WARNING'}, capacity=100, console=False)
+    get_logger('test').info("скрыто")
+    get_logger('test').warning("видно")
+    get_logger('other').debug("отладка")
+    lines = ring.drain()
+    assert len(lines) == 2
+    assert lines[0].endswith('видно') and lines[1].endswith('отладка')
+
+
+def test_sampling_passes_first_and_every_nth():
+    sampling = SamplingFilter()
+    passed = []
+    for i in range(10):
+        record = logging.LogRecord('x', logging.DEBUG, __file__, 1, "дата %s", (i,), None)
+        record.sample = 4
+        if sampling.filter(record):
+            passed.append(i)
+        # Повторная проверка той же записи другим обработчиком дает то же решение
+        assert sampling.filter(record) == (i in passed)
+    assert passed == [0, 4, 8]
+
+
+def test_disabled_debug_calls_are_cheap(ring):
+    logger = get_logger('test')
+    started = time.perf_counter()
+    for i in range(100000):
+        logger.debug("Сообщение %s: %s", i, lazy(dir, logger))
+    assert time.perf_counter() - started < 1.0
+    assert ring.pending() == 0
@@ -0,0 +1,47 @@
+from Sammaryhelper.message_compaction import compact_messages, shorten_text, get_compaction_settings
+
+
+def make_message(sender, text, date='2024-05-01 10:00:00'):
+    return {'sender_id': sender, 'sender_name': f'user{sender}', 'date': date, 'text': text}
+
+
+def test_drop_trivial_and_dedupe():
+    """Тривиальные реплики и повторы удаляются, содержательные сообщения остаются"""
+    messages = [
+        make_message(1, 'Предлагаю перенести релиз на пятницу'),
+        make_message(2, '+1'),
+        make_message(3, '👍👍'),
+        make_message(4, 'Предлагаю перенести релиз на пятницу!'),
+        make_message(5, 'ок'),
+    ]
+    compacted, report = compact_messages(messages, {'stages': ['drop_trivial', 'dedupe']})
+    assert [m['sender_id'] for m in compacted] == [1]
+    assert [row['stage'] for row in report] == ['input', 'drop_trivial', 'dedupe']
+    assert report[1]['saved'] > 0 and report[2]['saved'] > 0
+
+
+def test_shorten_urls_and_quotes():
+    """Ссылки сокращаются до домена, цитаты - до одной строки"""
+    config = get_compaction_settings({'max_quote_chars': 10})
+    text = "> очень длинная цитата из предыдущего сообщения\nСмотри https://www.github.com/org/repo/issues/1?x=1"
+    assert shorten_text(text, config) == "> очень длин…\nСмотри [github.com]"
+
+
+def test_collapse_consecutive_messages():
+    """Идущие подряд сообщения одного автора склеиваются в пределах окна"""
+    messages = [
+        make_message(1, 'первая мысль', '2024-05-01 10:00:00'),
+        make_message(1, 'продолжение', '2024-05-01 10:01:00'),
+        make_message(1, 'через час', '2024-05-01 11:30:00'),
+        make_message(2, 'ответ', '2024-05-01 11:31:00'),
+    ]
+    compacted, report = compact_messages(messages, {'stages': ['collapse']})
+    assert [m['text'] for m in compacted] == ['первая мысль\nпродолжение', 'через час', 'ответ']
+    assert report[-1]['tokens'] < report[0]['tokens']
+
+
+def test_disabled_compaction_keeps_messages():
+    """Отключенное сжатие возвращает сообщения без изменений"""
+    compacted, report = compact_messages(['+1', 'текст'], {'enabled': False})
+    assert [m['text'] for m in compacted] == ['+1', 'текст']
+    assert len(report) == 1
@@ -0,0 +1,95 @@
+import datetime
+import pytest
+from Sammaryhelper.message_stream import MessageMerger, position_runs, PAGE_CACHED, PAGE_FRESH
+from Sammaryhelper.telegram_client import TelegramClientManager
+
+
+def msg(message_id, text='текст'):
+    return {'id': message_id, 'text': text, 'sender_name': 'user', 'date': '2024-05-01 10:00:00'}
+
+
+def test_merger_inserts_in_place_and_reports_updates():
+    merger = MessageMerger()
+    assert merger.apply([msg(9), msg(7), msg(5)]) == ([0, 1, 2], [])
+    # Более новое, пропущенное в середине и измененное сообщения
+    inserted, updated = merger.apply([msg(10), msg(9), msg(8), msg(7, 'исправлено')])
+    assert inserted == [0, 2] and updated == [3]
+    assert [m['id'] for m in merger.messages] == [10, 9, 8, 7, 5]
+    assert merger.messages[3]['text'] == 'исправлено'
+    assert merger.apply([msg(9)]) == ([], [])
+    assert position_runs([0, 1, 2, 5, 7, 8]) == [(0, 3), (5, 1), (7, 2)]
+
+
+class FakeTelegramMessage:
+    def __init__(self, message_id, text):
+        self.id = message_id
+        self.text = text
+        self.date = datetime.datetime(2024, 5, 1, 10, 0) + datetime.timedelta(minutes=message_id)
+        self.sender_id = None
+        self.photo = None
+        self.video = None
+
+
+class FakeTelethon:
+    def __init__(self, messages):
+        self.messages = messages
+        self.fetched = 0
+
+    async def get_me(self):
+        return type('Me', (), {'phone': '100', 'id': 1})()
+
+    async def iter_messages(self, chat_id, limit=None, search=None):
+        for message in self.messages[:limit]:
+            self.fetched += 1
+            yield message
+
+
+class FakeCache:
+    def __init__(self, cached):
+        self.cached = cached
+        self.saved = []
+
+    async def get_cached_messages(self, dialog_id, account_id):
+        return list(self.cached)
+
+    async def cache_messages(self, messages, dialog_id, account_id):
+        self.saved.append(messages)
+        return True
+
+
+def make_manager(telegram, cache):
+    manager = TelegramClientManager({'use_cache': True})
+    manager.client = telegram
+    manager.db_handler = cache
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_stream_shows_cache_first_then_fresh_pages():
+    telegram = FakeTelethon([FakeTelegramMessage(i, f'сообщение {i}') for i in range(250, 0, -1)])
+    cache = FakeCache([msg(i, f'сообщение {i}') for i in range(100, 0, -1)])
+    manager = make_manager(telegram, cache)
+
+    pages = [page async for page in manager.stream_messages(1, {'limit': 250}, page_size=50)]
+    assert pages[0].kind == PAGE_CACHED and len(pages[0].messages) == 100
+    assert all(page.kind == PAGE_FRESH for page in pages[1:])
+    assert [page.fetched for page in pages[1:]] == [50, 100, 150, 200]
+    # Четвертая страница (100..51) целиком совпала с кешем, дальше загрузка не идет
+    assert telegram.fetched == 200
+    assert len(cache.saved) == 4
+    assert isinstance(pages[1].messages[0]['date'], datetime.datetime)
+    assert 'date_obj' not in cache.saved[0][0]
+
+    merger = MessageMerger()
+    for page in pages:
+        merger.apply(page.messages)
+    assert [m['id'] for m in merger.messages] == list(range(250, 0, -1))
+
+
+@pytest.mark.asyncio
+async def test_stream_without_cache_yields_all_pages():
+    telegram = FakeTelethon([FakeTelegramMessage(i, f'сообщение {i}') for i in range(120, 0, -1)])
+    manager = make_manager(telegram, FakeCache([]))
+    pages = [page async for page in manager.stream_messages(1, {'limit': 500}, page_size=50)]
+    assert [len(page.messages) for page in pages] == [50, 50, 20]
+    assert pages[-1].fetched == 120
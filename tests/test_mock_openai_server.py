@@ -0,0 +1,45 @@
+import openai
+import pytest
+from Sammaryhelper.ai_handler import AIChatManager
+from benchmarks.mock_openai_server import MockOpenAIServer, MockServerConfig
+
+
+@pytest.mark.asyncio
+async def test_chat_completion_is_deterministic():
+    """Одинаковый промпт дает одинаковый ответ, usage заполнен"""
+    async with MockOpenAIServer(MockServerConfig(completion_tokens=20)) as server:
+        client = openai.AsyncOpenAI(api_key='test', base_url=server.base_url, max_retries=0)
+        messages = [{'role': 'user', 'content': 'привет'}]
+        first = await client.chat.completions.create(model='gpt-4o-mini', messages=messages)
+        second = await client.chat.completions.create(model='gpt-4o-mini', messages=messages)
+        assert first.choices[0].message.content == second.choices[0].message.content
+        assert first.usage.completion_tokens > 0
+
+        models = await client.models.list()
+        assert 'gpt-4o-mini' in [m.id for m in models.data]
+
+
+@pytest.mark.asyncio
+async def test_streaming_matches_full_response():
+    """Потоковый ответ собирается в тот же текст"""
+    async with MockOpenAIServer() as server:
+        client = openai.AsyncOpenAI(api_key='test', base_url=server.base_url, max_retries=0)
+        messages = [{'role': 'user', 'content': 'поток'}]
+        full = await client.chat.completions.create(model='gpt-4o-mini', messages=messages)
+        stream = await client.chat.completions.create(model='gpt-4o-mini', messages=messages, stream=True)
+        parts = [chunk.choices[0].delta.content or '' async for chunk in stream]
+        assert ''.join(parts) == full.choices[0].message.content
+
+
+@pytest.mark.asyncio
+async def test_scheduler_retries_injected_rate_limits():
+    """Ответы 429 от сервера повторяются планировщиком, ответ получен"""
+    config = MockServerConfig(rate_limit_every=2, retry_after=0.01)
+    async with MockOpenAIServer(config) as server:
+        manager = AIChatManager({'openai_api_key': 'test', 'openai_base_url': server.base_url,
+                                 'openai_model': 'gpt-4o-mini', 'system_prompt': 's',
+                                 'semantic_cache_enabled': False})
+        response = await manager.get_response('вопрос', context='контекст')
+        assert response and not response.startswith('Ошибка')
+        assert server.stats['rate_limited'] >= 1
+        assert manager.scheduler.stats['rate_limited'] >= 1
@@ -0,0 +1,55 @@
+import pytest
+from types import SimpleNamespace
+from Sammaryhelper.model_routing import ModelRouter
+from Sammaryhelper.ai_handler import AIChatManager
+
+
+def test_routes_by_operation():
+    """Для операции без политики используется модель из настроек"""
+    router = ModelRouter({'model_routing': {'map': 'gpt-4o-mini', 'reduce': 'gpt-4o'}})
+    assert router.select('map', 'gpt-4.1') == 'gpt-4o-mini'
+    assert router.select('reduce', 'gpt-4.1') == 'gpt-4o'
+    assert router.select('qa', 'gpt-4.1') == 'gpt-4.1'
+
+
+def test_fallback_on_slo_breach():
+    """При нарушении SLO операция переключается на быструю модель до конца периода"""
+    settings = {'model_routing': {'qa': 'gpt-4o'}, 'latency_slo': {'qa': 2.0},
+                'fallback_model': 'gpt-4o-mini', 'slo_cooldown': 60}
+    router = ModelRouter(settings, min_samples=3)
+    for _ in range(3):
+        router.observe('qa', 'gpt-4o', 5.0)
+    assert router.select('qa', 'gpt-4.1') == 'gpt-4o-mini'
+    assert router.get_report()['qa']['degraded'] is True
+
+    settings['slo_cooldown'] = 0
+    router = ModelRouter(settings, min_samples=3)
+    for _ in range(3):
+        router.observe('qa', 'gpt-4o', 5.0)
+    # Период переключения истек - снова основная модель
+    assert router.select('qa', 'gpt-4.1') == 'gpt-4o'
+
+
+@pytest.mark.asyncio
+async def test_summary_uses_stage_models():
+    """Части саммари обрабатывает дешевая модель, объединение - сильная"""
+    manager = AIChatManager({'openai_api_key': 'test', 'openai_model': 'gpt-4.1', 'system_prompt': 's',
+                             'user_prompt': 'u', 'model_routing': {'map': 'gpt-4o-mini', 'reduce': 'gpt-4o'},
+                             'compaction': {'enabled': False}})
+    used = []
+
+    async def submit(request, estimated_tokens, priority, deadline):
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='итог'))], usage=None)
+
+    original = manager._create_completion
+
+    async def create_completion(client, model, *args, **kwargs):
+        used.append((kwargs['operation'], model))
+        return await original(client, model, *args, **kwargs)
+
+    manager.scheduler.submit = submit
+    manager._create_completion = create_completion
+    messages = [f'сообщение номер {i} ' + 'текст ' * 2000 for i in range(6)]
+    assert await manager.generate_summary(messages, None) == 'итог'
+    assert ('reduce', 'gpt-4o') in used
+    assert {model for op, model in used if op == 'map'} == {'gpt-4o-mini'}
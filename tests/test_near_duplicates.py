@@ -0,0 +1,96 @@
+import time
+import random
+import pytest
+from Sammaryhelper.near_duplicates import (
+    MinHasher, NearDuplicateFilter, filter_near_duplicates, dedupe_across_dialogs, estimate_similarity
+)
+from Sammaryhelper.message_compaction import compact_messages
+
+POST = ("Друзья, завтра в 19:00 проходит открытая встреча сообщества разработчиков. "
+        "Регистрация обязательна, количество мест ограничено, подробности по ссылке")
+
+
+class FakeSignatureStore:
+    def __init__(self):
+        self.rows = {}
+        self.saved = 0
+
+    async def get_message_signatures(self, keys, account_id):
+        return {key: self.rows[key] for key in keys if key in self.rows}
+
+    async def save_message_signatures(self, rows, account_id):
+        self.saved += len(rows)
+        for dialog_id, message_id, signature in rows:
+            self.rows[(dialog_id, message_id)] = signature
+        return True
+
+
+def test_signature_similarity_tracks_edits():
+    hasher = MinHasher()
+    original = hasher.signature(POST)
+    assert estimate_similarity(original, hasher.signature(POST + " https://t.me/event")) > 0.8
+    assert estimate_similarity(original, hasher.signature("Совсем другое сообщение о релизе новой версии приложения")) < 0.2
+    assert hasher.signature("ок") is None
+
+
+def test_filter_keeps_first_copy_and_counts():
+    messages = [
+        {'id': 1, 'sender_name': 'a', 'text': POST},
+        {'id': 2, 'sender_name': 'b', 'text': "Обсуждаем план работ на следующую неделю, кто готов взять задачи"},
+        {'id': 3, 'sender_name': 'c', 'text': "Репост: " + POST + "!"},
+    ]
+    kept, duplicates = filter_near_duplicates(messages)
+    assert [m['id'] for m in kept] == [1, 2]
+    assert kept[0]['duplicates'] == 1
+    assert duplicates == {(None, 3): (None, 1)}
+    # Порог 1.0 оставляет только точные совпадения
+    assert len(filter_near_duplicates(messages, threshold=1.0)[0]) == 3
+
+
+def test_compaction_stage_reports_near_dedupe():
+    messages = [{'sender_name': 'a', 'text': POST + f" #{i}"} for i in range(5)]
+    compacted, report = compact_messages(messages)
+    assert len(compacted) == 1
+    assert compacted[0]['duplicates'] == 4
+    assert any(row['stage'] == 'near_dedupe' for row in report)
+
+
+def test_across_dialogs_keeps_earliest():
+    results = {
+        10: [{'id': 5, 'date': '2024-05-02 10:00:00', 'text': POST}],
+        20: [{'id': 7, 'date': '2024-05-01 09:00:00', 'text': POST + " (перепост)"},
+             {'id': 8, 'date': '2024-05-01 09:05:00', 'text': "Отдельное сообщение без копий в других чатах"}],
+    }
+    grouped, removed = dedupe_across_dialogs(results)
+    assert removed == 1
+    assert grouped[10] == []
+    assert [m['id'] for m in grouped[20]] == [7, 8]
+
+
+@pytest.mark.asyncio
+async def test_signatures_are_persisted_and_reused():
+    store = FakeSignatureStore()
+    messages = [{'id': i, 'text': POST + f" вариант {i}"} for i in range(20)]
+    kept, _ = await NearDuplicateFilter(db_handler=store, account_id='acc').filter(messages, dialog_id=1)
+    assert len(kept) == 1
+    assert store.saved == 20
+
+    # Повторный прогон с новыми сообщениями считает подписи только для них
+    more = messages + [{'id': 100, 'text': "Новое сообщение про совсем другую тему обсуждения"}]
+    near_filter = NearDuplicateFilter(db_handler=store, account_id='acc')
+    kept, _ = await near_filter.filter(more, dialog_id=1)
+    assert store.saved == 21
+    assert [m['id'] for m in kept] == [0, 100]
+
+    # Тот же экземпляр удаляет копии, уже встреченные в другом чате
+    kept, dropped = await near_filter.filter([{'id': 1, 'text': POST}], dialog_id=2)
+    assert kept == [] and len(dropped) == 1
+
+
+def test_filter_is_fast():
+    rng = random.Random(0)
+    words = ['релиз', 'сборка', 'бюджет', 'встреча', 'отпуск', 'договор', 'проект', 'задача', 'оплата', 'версия']
+    messages = [{'id': i, 'text': ' '.join(rng.choice(words) for _ in range(15))} for i in range(3000)]
+    started = time.perf_counter()
+    filter_near_duplicates(messages)
+    assert time.perf_counter() - started < 5.0
@@ -0,0 +1,54 @@
+import random
+from Sammaryhelper import participant_stats
+from Sammaryhelper.participant_stats import compute_participant_stats, build_participants_prompt
+
+
+def make_messages():
+    return [
+        {'id': 1, 'sender_id': 10, 'sender_name': 'Анна', 'date': '2024-05-01T10:00:00', 'text': 'выкладываю релиз сервера'},
+        {'id': 2, 'sender_id': 20, 'sender_name': 'Иван', 'date': '2024-05-01 10:05:00', 'text': 'релиз проверил', 'reply_to_msg_id': 1},
+        {'id': 3, 'sender_id': 10, 'sender_name': 'Анна', 'date': '2024-05-02 18:00:00', 'text': 'спасибо', 'reply_to_msg_id': 2},
+        {'id': 4, 'sender_id': 30, 'sender_name': 'Олег', 'date': '2024-05-03 09:00:00', 'text': 'бюджет согласован', 'reply_to_msg_id': 1},
+    ]
+
+
+def test_stats_aggregate_activity_and_reply_graph():
+    """Профили содержат счетчики сообщений, часы активности и степени в графе ответов"""
+    profiles = {p['sender']: p for p in compute_participant_stats(make_messages())}
+    anna = profiles[10]
+    assert anna['messages'] == 2
+    assert anna['replies_received'] == 2
+    assert anna['replies_sent'] == 1
+    assert anna['partners'] == 2
+    assert set(anna['peak_hours']) == {10, 18}
+    assert anna['first_seen'] == '2024-05-01' and anna['last_seen'] == '2024-05-02'
+    assert profiles[30]['top_terms'][0] in ('бюджет', 'согласован')
+
+
+def test_python_fallback_matches_numpy(monkeypatch):
+    """Вариант без numpy дает те же профили"""
+    rng = random.Random(1)
+    messages = [{'id': i, 'sender_id': rng.randint(1, 20), 'date': f'2024-05-01 {rng.randint(0, 23):02d}:00:00',
+                 'text': 'сообщение ' * rng.randint(1, 5), 'reply_to_msg_id': rng.randint(0, i) or None}
+                for i in range(1, 500)]
+    expected = compute_participant_stats(messages)
+    monkeypatch.setattr(participant_stats, 'NUMPY_AVAILABLE', False)
+    assert compute_participant_stats(messages) == expected
+
+
+def test_prompt_size_is_bounded_for_large_groups():
+    """Промпт содержит только top_n профилей независимо от числа участников"""
+    messages = [{'id': i, 'sender_id': i % 5000, 'date': '2024-05-01 12:00:00', 'text': 'привет'}
+                for i in range(20000)]
+    profiles = compute_participant_stats(messages)
+    prompt = build_participants_prompt(profiles, total_members=50000, top_n=10)
+    assert prompt.count('\n- ') == 10
+    assert 'Участников в чате: 50000' in prompt
+    assert 'еще 4990' in prompt
+
+
+def test_unnamed_top_senders_limits_name_lookups():
+    """Имена запрашиваются только для самых активных отправителей без имени в сообщениях"""
+    messages = make_messages() + [{'id': 10 + i, 'sender_id': 40 + i % 3, 'text': 'x'} for i in range(9)]
+    assert participant_stats.unnamed_top_senders(messages, top_n=4) == [40, 41, 42]
+    assert participant_stats.unnamed_top_senders(messages, top_n=2) == [40, 41]
@@ -0,0 +1,112 @@
+import datetime
+import pytest
+from Sammaryhelper.telegram_client import TelegramClientManager
+
+
+class FakeUser:
+    def __init__(self, user_id):
+        self.id = user_id
+        self.username = f'user{user_id}'
+        self.first_name = f'Имя {user_id}'
+        self.last_name = None
+
+
+class FakeTelethon:
+    def __init__(self, members, fail_after=None):
+        self.members = members
+        self.fail_after = fail_after
+        self.fetches = 0
+
+    async def get_me(self):
+        return type('Me', (), {'phone': '100', 'id': 1})()
+
+    async def iter_participants(self, chat_id, limit=None):
+        self.fetches += 1
+        for number, user_id in enumerate(self.members[:limit]):
+            if self.fail_after is not None and number >= self.fail_after:
+                raise ConnectionError('обрыв соединения')
+            yield FakeUser(user_id)
+
+    async def get_participants(self, chat_id, limit=None):
+        assert limit == 0
+        return type('Participants', (list,), {'total': len(self.members)})()
+
+
+class FakeParticipantsCache:
+    """Кеш с той же семантикой, что и таблицы participants/participants_fetches"""
+
+    def __init__(self):
+        self.rows = {}
+        self.fetched_at = {}
+        self.now = datetime.datetime(2024, 5, 1, 12, 0)
+
+    async def cache_participants(self, participants, dialog_id, account_id, fetched_at):
+        for p in participants:
+            self.rows[(dialog_id, account_id, p['id'])] = (dict(p), fetched_at)
+        self.rows = {key: row for key, row in self.rows.items()
+                     if key[:2] != (dialog_id, account_id) or row[1] >= fetched_at}
+        self.fetched_at[(dialog_id, account_id)] = fetched_at
+        return True
+
+    async def get_cached_participants(self, dialog_id, account_id, max_age=None):
+        fetched_at = self.fetched_at.get((dialog_id, account_id))
+        if fetched_at is None:
+            return None
+        if max_age is not None and (self.now - fetched_at).total_seconds() > max_age:
+            return None
+        return [row[0] for key, row in sorted(self.rows.items()) if key[:2] == (dialog_id, account_id)]
+
+
+def make_manager(telegram, cache):
+    manager = TelegramClientManager({'use_cache': True, 'participants_cache_ttl': 3600})
+    manager.client = telegram
+    manager.db_handler = cache
+    return manager
+
+
+@pytest.mark.asyncio
+async def test_full_fetch_is_cached_and_reused():
+    telegram = FakeTelethon([1, 2, 3])
+    cache = FakeParticipantsCache()
+    manager = make_manager(telegram, cache)
+
+    assert [p['id'] for p in await manager.get_chat_participants(5)] == [1, 2, 3]
+    cache.now = cache.fetched_at[(5, '100')] + datetime.timedelta(minutes=30)
+    assert [p['id'] for p in await manager.get_chat_participants(5)] == [1, 2, 3]
+    assert [p['id'] for p in await manager.get_chat_participants(5, limit=2)] == [1, 2]
+    assert telegram.fetches == 1
+
+
+@pytest.mark.asyncio
+async def test_refresh_drops_members_who_left():
+    telegram = FakeTelethon([1, 2, 3])
+    cache = FakeParticipantsCache()
+    manager = make_manager(telegram, cache)
+    await manager.get_chat_participants(5)
+
+    telegram.members = [1, 3, 4]
+    assert [p['id'] for p in await manager.get_chat_participants(5, force_refresh=True)] == [1, 3, 4]
+    # После обновления кеш снова свежий, хотя участник 2 больше не обновляется
+    cache.now = cache.fetched_at[(5, '100')] + datetime.timedelta(minutes=30)
+    assert [p['id'] for p in await manager.get_chat_participants(5)] == [1, 3, 4]
+    assert telegram.fetches == 2
+
+
+@pytest.mark.asyncio
+async def test_partial_fetch_is_not_cached():
+    telegram = FakeTelethon(list(range(1, 11)), fail_after=5)
+    cache = FakeParticipantsCache()
+    manager = make_manager(telegram, cache)
+
+    with pytest.raises(Exception, match='обрыв'):
+        await manager.get_chat_participants(5)
+    assert len(await manager.get_chat_participants(5, limit=3)) == 3
+    assert cache.rows == {} and cache.fetched_at == {}
+
+
+@pytest.mark.asyncio
+async def test_participants_count_does_not_fetch_members():
+    telegram = FakeTelethon(list(range(1, 10001)))
+    manager = make_manager(telegram, FakeParticipantsCache())
+    assert await manager.get_participants_count(5) == 10000
+    assert telegram.fetches == 0
@@ -0,0 +1,88 @@
+import time
+import random
+import datetime
+from Sammaryhelper.record_store import RecordStore
+
+WORDS = ['релиз', 'бюджет', 'встреча', 'отпуск', 'договор', 'проект', 'задача', 'оплата', 'версия', 'сборка']
+
+
+def make_messages(count, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 1, 1)
+    return [{'id': i, 'sender_name': rng.choice(['Анна', 'иван', 'Олег']),
+             'date': start + datetime.timedelta(minutes=rng.randrange(100000)),
+             'text': ' '.join(rng.choice(WORDS) for _ in range(12))}
+            for i in range(count)]
+
+
+def row(message):
+    return (message['id'], message['sender_name'], message['text'][:100], str(message['date']))
+
+
+def test_lookup_filter_and_sort():
+    messages = make_messages(500)
+    store = RecordStore(messages, row_factory=row)
+    assert store.get('42') is messages[42] and store.get(42) is messages[42]
+
+    expected = [i for i, m in enumerate(messages) if 'релиз бюджет' in m['text']]
+    store.filter('рел')
+    assert store.filter('РЕЛИЗ БЮДЖЕТ') == expected
+    # Сужение запроса и возврат к более короткому дают тот же результат, что полный проход
+    assert store.filter('релиз') == [i for i, m in enumerate(messages) if 'релиз' in m['text']]
+
+    by_date = store.sort(expected, 'date')
+    assert [messages[i]['date'] for i in by_date] == sorted(messages[i]['date'] for i in expected)
+    by_sender = store.sort(store.filter(''), 'sender')
+    assert [messages[i]['sender_name'].casefold() for i in by_sender][:1] == ['анна']
+    assert store.rows(by_date[:1]) == [row(messages[by_date[0]])]
+
+
+def test_typing_is_fast_on_large_store():
+    messages = make_messages(50_000)
+    store = RecordStore(messages, row_factory=row)
+    store.rows([])
+    store.order('date')
+    queries = ('в', 'ве', 'вер', 'верс', 'верси', 'версия', 'версия с', 'версия сб')
+    # Ввод повторяется несколько раз, для каждого символа берется лучшее время,
+    # чтобы на результат не влияла загрузка машины
+    timings = [float('inf')] * len(queries)
+    for _ in range(3):
+        for i, query in enumerate(queries):
+            started = time.perf_counter()
+            indices = store.sort(store.filter(query), 'date')
+            store.rows(indices)
+            timings[i] = min(timings[i], time.perf_counter() - started)
+    # Первые символы совпадают почти со всеми сообщениями, дальше список сужается
+    assert sorted(timings)[len(timings) // 2] < 0.016
+
+
+def test_stable_multi_column_sort():
+    records = [{'id': '10', 'name': 'b', 'unread_count': 2}, {'id': '9', 'name': 'B', 'unread_count': None},
+               {'id': '100', 'name': 'a', 'unread_count': 2}, {'id': 'x', 'name': 'a', 'unread_count': 5}]
+    store = RecordStore(records)
+    # Числовые id сравниваются как числа, нечитаемые считаются нулем
+    assert store.sort_stable([0, 1, 2, 3], 'id') == [3, 1, 0, 2]
+    # Имена без учета регистра; при равенстве сохраняется порядок сортировки по id
+    by_id = store.sort_stable([0, 1, 2, 3], 'id')
+    assert store.sort_stable(by_id, 'name') == [3, 2, 1, 0]
+    assert store.sort_by([0, 1, 2, 3], [('unread', True), ('name', False)]) == [3, 2, 0, 1]
+    assert store.indices_of([records[2], {'id': '10'}]) == [2]
+
+
+def test_header_sort_is_fast_on_large_store():
+    messages = make_messages(50_000)
+    store = RecordStore(messages, row_factory=row)
+    indices = store.filter('')
+    store.keys('date')
+    store.keys('sender')
+    # Лучшее из трех измерений, чтобы на результат не влияла загрузка машины
+    elapsed = float('inf')
+    for _ in range(3):
+        started = time.perf_counter()
+        by_date = store.sort_stable(indices, 'date', reverse=True)
+        by_sender = store.sort_stable(by_date, 'sender')
+        elapsed = min(elapsed, time.perf_counter() - started)
+    assert elapsed < 0.1
+    indices = by_sender
+    pairs = [(messages[i]['sender_name'].casefold(), -messages[i]['date'].timestamp()) for i in indices]
+    assert pairs == sorted(pairs)
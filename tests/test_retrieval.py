@@ -0,0 +1,34 @@
+import pytest
+from Sammaryhelper.retrieval import rank_messages, pack_context
+from Sammaryhelper.ai_handler import AIChatManager
+
+
+MESSAGES = [
+    {'id': 1, 'dialog_id': 10, 'sender_name': 'Анна', 'date': '2024-01-01 10:00:00', 'text': 'Сервер упал ночью, логи в канале'},
+    {'id': 2, 'dialog_id': 10, 'sender_name': 'Иван', 'date': '2024-01-02 10:00:00', 'text': 'Кто идет на обед?'},
+    {'id': 3, 'dialog_id': 10, 'sender_name': 'Петр', 'date': '2024-01-03 10:00:00',
+     'text': 'Перезапустили сервера, причина падения - переполнение диска. ' * 3},
+]
+
+
+def test_rank_messages_finds_relevant():
+    """BM25 находит сообщения по словоформам запроса"""
+    hits = rank_messages('почему упал сервер?', MESSAGES)
+    assert {h['id'] for h in hits} == {1, 3}
+
+
+def test_pack_context_respects_budget():
+    """Контекст содержит полный текст и не превышает бюджет"""
+    hits = rank_messages('сервер', MESSAGES)
+    context = pack_context(hits, token_budget=30)
+    assert 'Сервер упал ночью, логи в канале' in context
+    assert 'переполнение' not in context
+
+
+@pytest.mark.asyncio
+async def test_retrieve_context_uses_candidates_without_db():
+    """Без БД контекст подбирается из загруженных сообщений"""
+    manager = AIChatManager({'openai_api_key': 'test'})
+    context = await manager.retrieve_context('падение сервера', [10], MESSAGES)
+    assert 'переполнение диска' in context
+    assert 'обед' not in context
@@ -0,0 +1,66 @@
+import time
+import random
+import datetime
+from Sammaryhelper.segmentation import segment_messages, pack_segments
+from Sammaryhelper.text_utils import estimate_tokens
+
+TOPICS = [
+    ['релиз', 'сборка', 'версия', 'тестирование', 'выкладка', 'откат'],
+    ['бюджет', 'счет', 'оплата', 'договор', 'бухгалтерия', 'расходы'],
+    ['отпуск', 'график', 'замена', 'дежурство', 'выходные', 'больничный'],
+]
+
+
+def make_conversations(sizes, gap_minutes=5, seed=0):
+    """Переписка из нескольких разговоров на разные темы без пауз между ними"""
+    rng = random.Random(seed)
+    start = datetime.datetime(2024, 5, 1, 10, 0)
+    messages = []
+    for topic, size in zip(TOPICS, sizes):
+        for _ in range(size):
+            words = rng.sample(topic, 3)
+            messages.append({
+                'id': len(messages) + 1,
+                'sender_name': rng.choice(['Анна', 'Иван', 'Олег']),
+                'date': (start + datetime.timedelta(minutes=gap_minutes * len(messages))).strftime('%Y-%m-%d %H:%M:%S'),
+                'text': ' '.join(words),
+            })
+    return messages
+
+
+def test_lexical_shift_splits_topics():
+    """Смена темы без паузы дает границу рядом с настоящей"""
+    messages = make_conversations([30, 30, 30])
+    segments = segment_messages(messages)
+    boundaries = [segment[0]['id'] for segment in segments[1:]]
+    for expected in (31, 61):
+        assert any(abs(b - expected) <= 2 for b in boundaries)
+    assert sum(len(s) for s in segments) == len(messages)
+
+
+def test_time_gap_splits_and_reply_keeps_together():
+    """Долгая пауза разделяет разговоры, но ответ через паузу удерживает сообщения вместе"""
+    messages = make_conversations([10, 10], gap_minutes=1)
+    for message in messages[10:]:
+        shifted = datetime.datetime.strptime(message['date'], '%Y-%m-%d %H:%M:%S') + datetime.timedelta(hours=5)
+        message['date'] = shifted.strftime('%Y-%m-%d %H:%M:%S')
+        message['text'] = 'релиз сборка версия'
+    assert [s[0]['id'] for s in segment_messages(messages)] == [1, 11]
+
+    messages[12]['reply_to_msg_id'] = 8
+    assert all(not (s[0]['id'] > 8 and s[0]['id'] <= 13) for s in segment_messages(messages)[1:])
+
+
+def test_packing_keeps_segments_whole():
+    """Сегменты, помещающиеся в часть, не разрезаются"""
+    segments = [[{'sender_name': 'a', 'text': 'слово ' * 40}] * 5 for _ in range(6)]
+    segment_tokens = sum(estimate_tokens(f"a: {m['text']}") for m in segments[0])
+    chunks = pack_segments(segments, max_tokens=segment_tokens * 2 + 10)
+    assert [len(chunk) for chunk in chunks] == [10, 10, 10]
+
+
+def test_segmentation_is_fast():
+    messages = make_conversations([4000, 4000, 4000])
+    started = time.perf_counter()
+    segment_messages(messages)
+    assert time.perf_counter() - started < 2.0
@@ -0,0 +1,98 @@
+import pytest
+from types import SimpleNamespace
+
+pytest.importorskip('numpy')
+
+import numpy as np
+from Sammaryhelper.semantic_cache import SemanticQueryCache, context_hash, normalize_query
+from Sammaryhelper.semantic_index import HashingEmbedder
+from Sammaryhelper.ai_handler import AIChatManager
+
+
+@pytest.mark.asyncio
+async def test_rephrased_query_hits_same_context():
+    """Перефразированный запрос по тому же контексту возвращает сохраненный ответ"""
+    cache = SemanticQueryCache(HashingEmbedder(dim=256), threshold=0.5)
+    key = context_hash('контекст', 'gpt-4o-mini', 'system')
+    await cache.store('Что обсуждали сегодня в чате?', key, 'ответ')
+
+    assert await cache.lookup('что сегодня обсуждали в чате', key) == ('ответ', pytest.approx(1.0))
+    found = await cache.lookup('Что сегодня обсуждали в чате про релиз?', key)
+    assert found is not None and found[0] == 'ответ'
+    # Другой контекст - промах
+    assert await cache.lookup('Что обсуждали сегодня в чате?', context_hash('другой', 'gpt-4o-mini', 'system')) is None
+    # Непохожий запрос - промах
+    assert await cache.lookup('Кто отправил больше всего ссылок', key) is None
+
+    stats = cache.get_stats()
+    assert stats['lookups'] == 4 and stats['hits'] == 2
+    assert stats['hit_rate'] == 0.5
+
+
+class FakeSemanticEmbedder:
+    """Смысловой векторизатор: перефразировки одного вопроса дают близкие векторы"""
+
+    def __init__(self, meanings):
+        self.meanings = {normalize_query(text): vector for text, vector in meanings.items()}
+
+    async def embed(self, texts):
+        vectors = np.array([self.meanings[text] for text in texts], dtype=np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.mark.asyncio
+async def test_default_threshold():
+    """Порог по умолчанию: с локальным векторизатором попадают только варианты записи,
+    перефразировки другими словами - со смысловым векторизатором"""
+    key = context_hash('контекст', 'gpt-4o-mini', 'system')
+    cache = SemanticQueryCache(HashingEmbedder(dim=256))
+    await cache.store('Что обсуждали сегодня?', key, 'ответ')
+    assert await cache.lookup('что сегодня обсуждали', key) == ('ответ', pytest.approx(1.0))
+    assert await cache.lookup('о чём чат сегодня', key) is None
+
+    cache = SemanticQueryCache(FakeSemanticEmbedder({
+        'Что обсуждали сегодня?': [1.0, 0.1, 0.0],
+        'о чём чат сегодня': [1.0, 0.2, 0.1],
+        'Кто отправил больше всего ссылок': [0.1, 0.0, 1.0],
+    }))
+    await cache.store('Что обсуждали сегодня?', key, 'ответ')
+    found = await cache.lookup('о чём чат сегодня', key)
+    assert found is not None and found[0] == 'ответ' and found[1] >= cache.threshold
+    assert await cache.lookup('Кто отправил больше всего ссылок', key) is None
+
+
+@pytest.mark.asyncio
+async def test_negation_and_numbers_are_not_ignored():
+    """Запросы, отличающиеся отрицанием или годом, не получают чужой ответ"""
+    cache = SemanticQueryCache(HashingEmbedder(dim=256), threshold=0.5)
+    key = context_hash('контекст', 'gpt-4o-mini', 'system')
+    await cache.store('Кто согласен с релизом?', key, 'согласны')
+    await cache.store('Какие итоги за 2023 год?', key, 'итоги 2023')
+
+    assert await cache.lookup('Кто не согласен с релизом?', key) is None
+    assert await cache.lookup('Какие итоги за 2024 год?', key) is None
+    assert await cache.lookup('за 2023 год какие итоги', key) == ('итоги 2023', pytest.approx(1.0))
+
+
+@pytest.mark.asyncio
+async def test_get_response_uses_semantic_cache():
+    """Второй вариант вопроса не вызывает модель и учитывается как попадание в кеш"""
+    manager = AIChatManager({'openai_api_key': 'test', 'openai_model': 'gpt-4o-mini',
+                             'system_prompt': 'system', 'semantic_cache_threshold': 0.5})
+    calls = []
+
+    async def get_available_models():
+        return [{'id': 'gpt-4o-mini'}]
+
+    async def submit(request, estimated_tokens, priority, deadline):
+        calls.append(request)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content='итоги дня'))],
+                               usage=SimpleNamespace(prompt_tokens=10, completion_tokens=3))
+
+    manager.get_available_models = get_available_models
+    manager.scheduler.submit = submit
+
+    assert await manager.get_response('что обсуждали сегодня', context='сообщения') == 'итоги дня'
+    assert await manager.get_response('Что сегодня обсуждали?', context='сообщения') == 'итоги дня'
+    assert len(calls) == 1
+    assert manager.usage_tracker.records[-1]['cache_hit'] is True
@@ -0,0 +1,83 @@
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from Sammaryhelper.semantic_index import SemanticIndex, HashingEmbedder
+
+
+MESSAGES = [
+    {'id': 1, 'text': 'Релиз новой версии переносим на пятницу'},
+    {'id': 2, 'text': 'Кто закажет пиццу на обед?'},
+    {'id': 3, 'text': 'Сервер базы данных перезагружен после сбоя'},
+]
+
+
+@pytest.mark.asyncio
+async def test_search_finds_similar_message(tmp_path):
+    """Поиск находит сообщение с теми же основами слов и учитывает фильтр диалогов"""
+    index = SemanticIndex(str(tmp_path), '79990000000', HashingEmbedder(dim=64), initial_capacity=2)
+    assert await index.add(MESSAGES, dialog_id=10) == 3
+    assert await index.add([{'id': 4, 'text': 'перенос релиза согласован'}], dialog_id=20) == 1
+    # Повторное добавление не создает дубликатов
+    assert await index.add(MESSAGES, dialog_id=10) == 0
+
+    hits = await index.search('когда релиз версии', k=2)
+    assert hits[0]['message_id'] == 1
+    hits = await index.search('релиз', dialog_ids=[20], k=5)
+    assert [h['dialog_id'] for h in hits] == [20]
+
+
+@pytest.mark.asyncio
+async def test_index_is_persistent(tmp_path):
+    """Индекс восстанавливается из файлов при повторном открытии"""
+    index = SemanticIndex(str(tmp_path), 'acc', HashingEmbedder(dim=32), initial_capacity=1)
+    await index.add(MESSAGES, dialog_id=10)
+    del index
+
+    reopened = SemanticIndex(str(tmp_path), 'acc', HashingEmbedder(dim=32))
+    assert len(reopened) == 3
+    assert (10, 3) in reopened
+    hits = await reopened.search('сбой сервера', k=1)
+    assert hits[0]['message_id'] == 3
+
+
+def test_batched_search_matches_bruteforce(tmp_path):
+    """Поблочный поиск top-k совпадает с полным перебором"""
+    rng = np.random.default_rng(0)
+    index = SemanticIndex(str(tmp_path), 'acc', HashingEmbedder(dim=16), initial_capacity=1000)
+    vectors = rng.normal(size=(1000, 16)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    index.vectors[:1000] = vectors
+    index.ids[:1000] = np.stack([np.arange(1000) % 3, np.arange(1000)], axis=1)
+    index.count = 1000
+
+    queries = vectors[:4]
+    results = index.search_vectors(queries, dialog_ids=[1], k=5, block_size=128)
+    for q, result in enumerate(results):
+        scores = vectors @ queries[q]
+        scores[np.arange(1000) % 3 != 1] = -np.inf
+        assert [row for row, _ in result] == list(np.argsort(-scores)[:5])
+
+
+class FlakyEmbedder(HashingEmbedder):
+    """Векторизатор, первый вызов которого завершается ошибкой (например, 429)"""
+
+    def __init__(self):
+        super().__init__(dim=64)
+        self.failures = 1
+
+    async def embed(self, texts):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError('429 Too Many Requests')
+        return await super().embed(texts)
+
+
+@pytest.mark.asyncio
+async def test_failed_embedding_does_not_mark_messages_indexed(tmp_path):
+    """После ошибки векторизации те же сообщения добавляются при следующем вызове"""
+    index = SemanticIndex(str(tmp_path), '79990000000', FlakyEmbedder())
+    with pytest.raises(RuntimeError):
+        await index.add(MESSAGES, dialog_id=10)
+    assert await index.add(MESSAGES + MESSAGES[:1], dialog_id=10) == 3
+    assert len(index) == 3
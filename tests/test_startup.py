@@ -0,0 +1,50 @@
+import sys
+import json
+import datetime
+import subprocess
+from Sammaryhelper.startup import (
+    StartupTimer, snapshot_path, save_snapshot, load_snapshot, STARTUP_FIRST_FRAME, STARTUP_INTERACTIVE)
+
+
+def test_snapshot_roundtrip(tmp_path):
+    path = snapshot_path(str(tmp_path), 'config_test')
+    dialogs = [{'id': i, 'name': f'Чат {i}', 'type': 'group', 'entity': object(), 'folder': None}
+               for i in range(3)]
+    messages = [{'id': 300 - i, 'text': f'сообщение {i}', 'sender_name': 'user',
+                 'date': datetime.datetime(2024, 5, 1, 10) - datetime.timedelta(minutes=i)} for i in range(300)]
+
+    assert save_snapshot(path, dialogs, [{'id': 1, 'name': 'Чат 1'}], 1, 'Чат 1', messages, max_messages=50)
+    snapshot = load_snapshot(path)
+    assert [d['id'] for d in snapshot['dialogs']] == [0, 1, 2]
+    assert 'entity' not in snapshot['dialogs'][0]
+    assert snapshot['dialog_id'] == 1 and snapshot['selected_dialogs'] == [{'id': 1, 'name': 'Чат 1'}]
+    # Сохраняются самые новые сообщения, даты - в ISO
+    assert len(snapshot['messages']) == 50 and snapshot['messages'][0]['id'] == 300
+    assert snapshot['messages'][0]['date'] == '2024-05-01T10:00:00'
+
+
+def test_missing_or_broken_snapshot(tmp_path):
+    path = snapshot_path(str(tmp_path), 'config_test')
+    assert load_snapshot(path) is None
+    (tmp_path / 'sessions').mkdir()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{"version": 1, "dialogs": [')
+    assert load_snapshot(path) is None
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'version': 0, 'dialogs': []}, f)
+    assert load_snapshot(path) is None
+
+
+def test_startup_timer_marks_once():
+    timer = StartupTimer()
+    first = timer.mark(STARTUP_FIRST_FRAME)
+    assert timer.mark(STARTUP_FIRST_FRAME) == first
+    timer.mark(STARTUP_INTERACTIVE)
+    assert list(timer.report()) == ['started', STARTUP_FIRST_FRAME, STARTUP_INTERACTIVE]
+
+
+def test_gui_import_does_not_load_telegram_and_openai():
+    code = ("import sys, Sammaryhelper.gui; "
+            "print([m for m in ('telethon', 'openai') if m in sys.modules])")
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
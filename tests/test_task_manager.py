@@ -0,0 +1,91 @@
+import time
+import asyncio
+import threading
+import concurrent.futures
+import pytest
+from Sammaryhelper.ai_handler import PRIORITY_BACKGROUND
+from Sammaryhelper.task_manager import TaskManager, STATUS_RUNNING
+
+
+@pytest.fixture
+def loop():
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield loop
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(timeout=1)
+    loop.close()
+
+
+def wait(info, timeout=2.0):
+    try:
+        return info.future.result(timeout)
+    except concurrent.futures.CancelledError:
+        return 'cancelled'
+
+
+def test_new_task_in_slot_cancels_previous(loop):
+    manager = TaskManager(loop)
+    events = []
+
+    def fetch(name, delay):
+        async def run():
+            try:
+                # Вызов API, в который должна прийти отмена
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                events.append(f'{name}: отменен')
+                raise
+            events.append(f'{name}: загружен')
+            return name
+        return run
+
+    first = manager.submit(fetch('A', 1.0), 'Диалог A', slot='messages')
+    time.sleep(0.05)
+    second = manager.submit(fetch('B', 0.05), 'Диалог B', slot='messages')
+    assert wait(first) == 'cancelled'
+    assert wait(second) == 'B'
+    time.sleep(0.05)
+    assert events == ['A: отменен', 'B: загружен']
+    assert manager.stats['superseded'] == 1 and manager.stats['cancelled'] == 1
+    assert manager.snapshot() == []
+
+
+def test_background_tasks_are_limited_and_interactive_are_not(loop):
+    manager = TaskManager(loop, max_background=2)
+    running = []
+    peak = [0]
+
+    def job():
+        async def run():
+            running.append(1)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.1)
+            running.pop()
+        return run
+
+    background = [manager.submit(job(), f'Фон {i}', priority=PRIORITY_BACKGROUND) for i in range(4)]
+    time.sleep(0.03)
+    statuses = [task['status'] for task in manager.snapshot()]
+    assert statuses.count(STATUS_RUNNING) == 2
+    interactive = manager.submit(job(), 'Интерактив')
+    time.sleep(0.03)
+    assert peak[0] == 3
+    for info in background + [interactive]:
+        wait(info)
+    assert peak[0] == 3
+
+
+def test_errors_are_reported(loop):
+    errors = []
+    manager = TaskManager(loop, on_error=lambda task, error: errors.append((task.title, str(error))))
+
+    async def fail():
+        raise ValueError('нет соединения')
+
+    info = manager.submit(fail, 'Загрузка')
+    with pytest.raises(ValueError):
+        info.future.result(1)
+    time.sleep(0.01)
+    assert errors == [('Загрузка', 'нет соединения')]
@@ -0,0 +1,127 @@
+import threading
+from Sammaryhelper.ui_bus import UIUpdateBus
+
+
+class FakeRoot:
+    def __init__(self):
+        self.scheduled = []
+
+    def after(self, delay, callback):
+        self.scheduled.append(callback)
+        return len(self.scheduled)
+
+    def after_cancel(self, after_id):
+        pass
+
+
+class FakeTree:
+    def __init__(self):
+        self.rows = []
+        self.calls = 0
+
+    def insert(self, parent, index, values=()):
+        self.calls += 1
+        self.rows.append(values)
+
+    def get_children(self):
+        return tuple(range(len(self.rows)))
+
+    def delete(self, *items):
+        self.calls += 1
+        self.rows = []
+
+
+class FakeText:
+    def __init__(self, state='normal'):
+        self.text = ''
+        self.state = state
+        self.inserts = 0
+
+    def cget(self, key):
+        return self.state
+
+    def config(self, state):
+        self.state = state
+
+    def insert(self, index, text):
+        assert self.state == 'normal'
+        self.inserts += 1
+        self.text += text
+
+    def see(self, index):
+        pass
+
+
+def test_log_lines_from_threads_are_coalesced():
+    bus = UIUpdateBus(FakeRoot())
+    log = FakeText(state='disabled')
+
+    def worker(n):
+        for i in range(500):
+            bus.append_text(log, f"{n}:{i}\n")
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    bus.drain(budget=10)
+
+    assert log.text.count('\n') == 2000
+    assert log.inserts == 1
+    assert log.state == 'disabled'
+    # Строки одного потока идут в исходном порядке
+    lines = [line for line in log.text.splitlines() if line.startswith('0:')]
+    assert lines == [f"0:{i}" for i in range(500)]
+
+
+def test_clear_drops_pending_rows_and_call_runs_after_updates():
+    bus = UIUpdateBus(FakeRoot())
+    tree = FakeTree()
+    seen = []
+    bus.insert_rows(tree, [(i,) for i in range(100)])
+    bus.clear(tree)
+    for i in range(10):
+        bus.insert_rows(tree, [(i,)])
+    bus.call(lambda: seen.append(len(tree.rows)))
+    bus.drain(budget=10)
+
+    assert tree.rows == [(i,) for i in range(10)]
+    assert seen == [10]
+    # Очистка пустой таблицы не вызывает delete, отмененные вставки не выполнялись
+    assert tree.calls == 10
+
+
+def test_large_insert_is_spread_over_ticks():
+    root = FakeRoot()
+    bus = UIUpdateBus(root, max_rows_per_batch=100)
+    tree = FakeTree()
+    bus.insert_rows(tree, [(i,) for i in range(1000)])
+    bus.start()
+    bus.drain(budget=0)
+    assert len(tree.rows) == 100
+
+    while len(tree.rows) < 1000:
+        root.scheduled.pop()()
+    assert tree.rows == [(i,) for i in range(1000)]
+    assert bus.stats['events'] == 1
+
+
+def test_virtual_list_receives_rows_in_one_call():
+    class FakeVirtualList:
+        def __init__(self):
+            self.calls = []
+
+        def clear(self):
+            self.calls.append('clear')
+
+        def append_rows(self, rows):
+            self.calls.append(len(rows))
+
+    bus = UIUpdateBus(FakeRoot(), max_rows_per_batch=100)
+    target = FakeVirtualList()
+    bus.clear(target)
+    for i in range(50):
+        bus.insert_rows(target, [(j,) for j in range(100)])
+    bus.drain(budget=10)
+    assert target.calls == ['clear', 5000]
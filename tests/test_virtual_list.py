@@ -0,0 +1,72 @@
+from Sammaryhelper.virtual_list import ColumnarRows, VirtualListModel
+
+
+def make_rows(count):
+    return [(i, f"user{i % 7}", f"сообщение {i}", f"2024-05-01 10:{i % 60:02d}:00") for i in range(count)]
+
+
+def test_window_scrolling_and_fractions():
+    model = VirtualListModel(4, window=10)
+    model.set_rows(make_rows(100))
+    assert [row[0] for row in model.visible_rows()] == list(range(10))
+
+    model.moveto(0.5)
+    assert model.offset == 50
+    assert model.fractions() == (0.5, 0.6)
+    model.scroll_by(1000)
+    assert model.offset == 90
+    assert [row[0] for row in model.visible_rows()][-1] == 99
+
+    model.ensure_visible(3)
+    assert model.offset == 3
+
+
+def test_sort_keeps_selection_on_same_rows():
+    model = VirtualListModel(4, window=5)
+    model.set_rows(make_rows(30))
+    model.selected = {2, 25}
+    model.sort(0, reverse=True)
+    assert [row[0] for row in model.selected_rows()] == [25, 2]
+    assert model.visible_rows()[0][0] == 29
+
+    # Числовая колонка сортируется как числа, а не как строки
+    store = ColumnarRows(1)
+    store.extend([('10',), ('9',), ('100',)])
+    store.sort(0)
+    assert store.columns[0] == ['9', '10', '100']
+
+
+def test_large_list_renders_in_constant_time():
+    model = VirtualListModel(4, window=40)
+    model.set_rows(make_rows(100_000))
+    materialized = []
+    store_rows = model.store.rows
+
+    def counting_rows(start, stop):
+        rows = store_rows(start, stop)
+        materialized.append(len(rows))
+        return rows
+
+    model.store.rows = counting_rows
+    for fraction in (0.0, 0.25, 0.5, 0.999):
+        model.moveto(fraction)
+        assert len(model.visible_rows()) == 40
+    # Прокрутка строит только строки окна, сколько бы строк ни было в списке
+    assert materialized == [40] * 4
+    model.append_rows(make_rows(10))
+    assert len(model) == 100_010
+
+
+def test_insert_and_update_keep_window_and_selection():
+    model = VirtualListModel(2, window=3)
+    model.set_rows([(i, f'r{i}') for i in range(10)])
+    model.scroll_to(4)
+    model.selected = {5}
+    model.insert_rows(0, [(100, 'a'), (101, 'b')])
+    # Вставка выше окна сдвигает окно и выделение вместе со строками
+    assert model.offset == 6 and model.selected == {7}
+    assert model.visible_rows()[0] == (4, 'r4')
+    model.insert_rows(12, [(200, 'end')])
+    assert model.store.row(12) == (200, 'end') and model.offset == 6
+    model.update_rows({7: (5, 'изменено')})
+    assert model.selected_rows() == [(5, 'изменено')]
@@ -12,6 +12,22 @@ import sys
 sys.path.append('Sammaryhelper')
 from Sammaryhelper.telegram_client import TelegramClientManager
 from Sammaryhelper.utils import load_config, get_config_files, load_settings
+from Sammaryhelper.record_store import RecordStore, make_key, KEY_INT, KEY_DATETIME, KEY_TEXT
+
+# Типизированные ключи сортировки колонок: числа, даты, остальное - строки без учета регистра
+CHAT_SORT_KEYS = {
+    column: make_key(column, KEY_INT if column == 'id' else KEY_TEXT)
+    for column in ('id', 'type', 'title', 'username', 'first_name', 'last_name', 'description')
+}
+MESSAGE_SORT_KEYS = {
+    'message_id': make_key('message_id', KEY_INT),
+    'from': make_key('from'),
+    'date': make_key('date', KEY_DATETIME),
+    'chat': make_key('chat'),
+    'reply_to_message': make_key('reply_to_message', KEY_INT),
+    'text': make_key('text'),
+    'message_thread_id': make_key('message_thread_id', KEY_INT),
+}
 
 class TelegramViewer:
     def __init__(self, root):
@@ -34,6 +50,10 @@ class TelegramViewer:
         self.chats_sort_reverse = False
         self.messages_sort_by = None
         self.messages_sort_reverse = False
+        # Отображаемые строки таблиц: (записи, элементы Treeview) в порядке отображения
+        self.chats_view = ([], [])
+        self.messages_view = ([], [])
+        self._stores = {}
         
         # Создаем UI
         self.setup_ui()
@@ -260,26 +280,11 @@ class TelegramViewer:
         direction = "▼" if self.chats_sort_reverse else "▲"
         self.chats_tree.heading(column, text=f"{column.replace('_', ' ').title()} {direction}")
         
-        # Сортировка данных
-        sorted_chats = []
-        for chat in self.chats_data:
-            sorted_chats.append(chat)
-        
-        def sort_key(chat):
-            # Особая обработка для числовых полей
-            if column == 'id':
-                try:
-                    return int(chat.get(column, 0))
-                except (ValueError, TypeError):
-                    return 0
-            else:
-                # Для текстовых полей
-                return str(chat.get(column, '')).lower()
-        
-        sorted_chats.sort(key=sort_key, reverse=self.chats_sort_reverse)
-        
-        # Обновляем отображение
-        self.display_chats(sorted_chats)
+        # Устойчивая сортировка отображаемых строк: при равных значениях сохраняется
+        # порядок предыдущей сортировки, поэтому щелчки по нескольким колонкам
+        # сортируют по нескольким ключам
+        self.chats_view = self.sort_view(self.chats_tree, 'chats', self.chats_data, CHAT_SORT_KEYS, 'id',
+                                         self.chats_view, column, self.chats_sort_reverse)
     
     def setup_messages_tab(self):
         """Настройка вкладки сообщений"""
@@ -397,29 +402,35 @@ class TelegramViewer:
         else:
             self.messages_tree.heading(column, text=f"{column.replace('_', ' ').title()} {direction}")
         
-        # Сортировка данных
-        sorted_messages = []
-        for message in self.messages_data:
-            sorted_messages.append(message)
-        
-        def sort_key(message):
-            # Особая обработка для числовых полей
-            if column in ['message_id', 'message_thread_id']:
-                try:
-                    return int(message.get(column, 0))
-                except (ValueError, TypeError):
-                    return 0
-            elif column == 'date':
-                # Для даты особая сортировка, так как это строка, но должна сортироваться как дата
-                return message.get(column, '')
-            else:
-                # Для текстовых полей
-                return str(message.get(column, '')).lower()
-        
-        sorted_messages.sort(key=sort_key, reverse=self.messages_sort_reverse)
+        # Устойчивая сортировка отображаемых строк (см. sort_chats_by)
+        self.messages_view = self.sort_view(self.messages_tree, 'messages', self.messages_data, MESSAGE_SORT_KEYS,
+                                            'message_id', self.messages_view, column, self.messages_sort_reverse)
+    
+    def get_store(self, name, records, sort_keys, id_field):
+        """Индекс записей таблицы с кешем ключей сортировки (пересоздается при смене списка)"""
+        store = self._stores.get(name)
+        if store is None or store.records is not records:
+            store = RecordStore(records, sort_keys=sort_keys, id_field=id_field)
+            self._stores[name] = store
+        return store
+    
+    def sort_view(self, tree, name, records, sort_keys, id_field, view, column, reverse):
+        """Сортировка строк таблицы по колонке без пересоздания строк
         
-        # Обновляем отображение
-        self.display_messages(sorted_messages)
+        Returns:
+            tuple: Новое отображение (записи, элементы Treeview)
+        """
+        shown, items = view
+        store = self.get_store(name, records, sort_keys, id_field)
+        indices = store.indices_of(shown)
+        if len(indices) != len(items):
+            return view
+        item_by_index = dict(zip(indices, items))
+        indices = store.sort_stable(indices, column, reverse)
+        items = [item_by_index[i] for i in indices]
+        # Перестановка всех строк одним вызовом Tk
+        tree.set_children('', *items)
+        return store.select(indices), items
     
     def start_async_loop(self):
         """Запуск асинхронного цикла в отдельном потоке"""
@@ -544,11 +555,10 @@ class TelegramViewer:
     def display_chats(self, chats):
         """Отображение списка чатов в таблице"""
         # Очищаем таблицу
-        for item in self.chats_tree.get_children():
-            self.chats_tree.delete(item)
+        self.chats_tree.delete(*self.chats_tree.get_children())
         
         # Добавляем данные
-        for chat in chats:
+        items = [
             self.chats_tree.insert('', 'end', values=(
                 chat['id'],
                 chat['type'],
@@ -558,6 +568,9 @@ class TelegramViewer:
                 chat['last_name'],
                 chat['description']
             ))
+            for chat in chats
+        ]
+        self.chats_view = (list(chats), items)
     
     def apply_chat_filters(self):
         """Применение фильтров к чатам"""
@@ -755,11 +768,10 @@ class TelegramViewer:
     def display_messages(self, messages):
         """Отображение списка сообщений в таблице"""
         # Очищаем таблицу
-        for item in self.messages_tree.get_children():
-            self.messages_tree.delete(item)
+        self.messages_tree.delete(*self.messages_tree.get_children())
         
         # Добавляем данные
-        for message in messages:
+        items = [
             self.messages_tree.insert('', 'end', values=(
                 message['message_id'],
                 message['from'],
@@ -769,6 +781,9 @@ class TelegramViewer:
                 message['text'][:50] + ('...' if len(message['text']) > 50 else ''),
                 message['message_thread_id']
             ))
+            for message in messages
+        ]
+        self.messages_view = (list(messages), items)
     
     def apply_message_filters(self):
         """Применение фильтров к сообщениям"""